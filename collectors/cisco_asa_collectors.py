@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import ansible_runner
 import pandas as pd
 
 from helpers import helpers as hp
@@ -41,14 +40,11 @@ def get_interface_ips(username: str,
 
     # Execute the command
     playbook = f'{play_path}/cisco_asa_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the results
     df_data = list()
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import ansible_runner
 import pandas as pd
 
 from helpers import helpers as hp
@@ -95,15 +94,12 @@ def gather_facts(username: str,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_ios_gather_facts.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the output, store it in 'facts', and return it
     facts = dict()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -191,15 +187,12 @@ def get_vrfs(username: str,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_ios_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the output, create the DataFrame and return it.
     data = []
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -331,7 +324,8 @@ def ios_get_arp_table(username,
                       host_group,
                       nm_path,
                       play_path,
-                      private_data_dir):
+                      private_data_dir,
+                      on_device=None):
     '''
     Gets the IOS ARP table and adds the vendor OUI.
 
@@ -343,6 +337,11 @@ def ios_get_arp_table(username,
         play_path (str):        The path to the playbooks directory
         private_data_dir (str): The path to the Ansible private data directory
         interface (str):        The interface (defaults to all interfaces)
+        on_device (function):   A function to call with each device's ARP
+                                table as soon as it is parsed (E.g., to write
+                                it to the database). If it is given, the
+                                devices' ARP tables are not kept, and an
+                                empty DataFrame is returned.
 
     Returns:
         df_arp (DataFrame):     The ARP table and vendor OUI
@@ -355,10 +354,7 @@ def ios_get_arp_table(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_ios_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Create the column headers. I do not like to hard code these, but they
     # should be modified from Cisco's format before being stored in a
@@ -372,9 +368,9 @@ def ios_get_arp_table(username,
                'inf_type',
                'interface']
 
-    # Parse the output and add it to 'data'
-    df_data = list()
-    for event in runner.events:
+    # Create a list to store the ARP table of each device
+    frames = list()
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -382,18 +378,28 @@ def ios_get_arp_table(username,
 
             output = event_data['res']['stdout'][0].split('\n')
 
+            df_data = list()
             for line in output[1:]:
                 row = [device] + line.split()
                 df_data.append(row)
 
-    # Create the DataFrame
-    df_arp = pd.DataFrame(data=df_data, columns=columns)
+            # Create the DataFrame
+            df_arp = pd.DataFrame(data=df_data, columns=columns)
+
+            # Get the vendor OUIs
+            df_vendors = hp.find_mac_vendors(df_arp['mac'], nm_path)
+
+            # Add the vendor OUIs to df_arp as a column.
+            df_arp['vendor'] = df_vendors['vendor']
 
-    # Get the vendor OUIs
-    df_vendors = hp.find_mac_vendors(df_arp['mac'], nm_path)
+            # Hand off the device's ARP table now if the caller is
+            # streaming the output. Otherwise keep it for the result.
+            if on_device:
+                on_device(df_arp)
+            else:
+                frames.append(df_arp)
 
-    # Add the vendor OUIs to df_cam as a column, and return the dataframe.
-    df_arp['vendor'] = df_vendors['vendor']
+    df_arp = hp.combine_frames(frames, columns + ['vendor'])
 
     return df_arp
 
@@ -404,7 +410,8 @@ def ios_get_cam_table(username,
                       nm_path,
                       play_path,
                       private_data_dir,
-                      interface=None):
+                      interface=None,
+                      on_device=None):
     '''
     Gets the IOS CAM table and adds the vendor OUI.
 
@@ -416,6 +423,11 @@ def ios_get_cam_table(username,
         play_path (str):        The path to the playbooks directory
         private_data_dir (str): The path to the Ansible private data directory
         interface (str):        The interface (defaults to all interfaces)
+        on_device (function):   A function to call with each device's CAM
+                                table as soon as it is parsed (E.g., to write
+                                it to the database). If it is given, the
+                                devices' CAM tables are not kept, and an
+                                empty DataFrame is returned.
 
     Returns:
         df_cam (DataFrame):     The CAM table and vendor OUI
@@ -431,10 +443,7 @@ def ios_get_cam_table(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_ios_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Create the column headers. I do not like to hard code these, but they
     # should be modified from Cisco's format before being stored in a
@@ -446,9 +455,9 @@ def ios_get_cam_table(username,
                'inf_type',
                'ports']
 
-    # Parse the output and add it to 'data'
-    df_data = list()
-    for event in runner.events:
+    # Create a list to store the CAM table of each device
+    frames = list()
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -459,18 +468,28 @@ def ios_get_cam_table(username,
             # columns.insert(0, 'device')
             # columns = [_.strip() for _ in columns]
 
+            df_data = list()
             for line in output[2:-1]:
                 row = [device] + line.split()
                 df_data.append(row)
 
-    # Create the DataFrame
-    df_cam = pd.DataFrame(data=df_data, columns=columns)
+            # Create the DataFrame
+            df_cam = pd.DataFrame(data=df_data, columns=columns)
+
+            # Get the vendor OUIs
+            df_vendors = hp.find_mac_vendors(df_cam['mac'], nm_path)
+
+            # Add the vendor OUIs to df_cam as a column.
+            df_cam['vendor'] = df_vendors['vendor']
 
-    # Get the vendor OUIs
-    df_vendors = hp.find_mac_vendors(df_cam['mac'], nm_path)
+            # Hand off the device's CAM table now if the caller is
+            # streaming the output. Otherwise keep it for the result.
+            if on_device:
+                on_device(df_cam)
+            else:
+                frames.append(df_cam)
 
-    # Add the vendor OUIs to df_cam as a column, and return the dataframe.
-    df_cam['vendor'] = df_vendors['vendor']
+    df_cam = hp.combine_frames(frames, columns + ['vendor'])
 
     return df_cam
 
@@ -504,14 +523,11 @@ def ios_get_cdp_neighbors(username,
 
     # Execute the command
     playbook = f'{play_path}/cisco_ios_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the results
     cdp_data = list()
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -562,13 +578,10 @@ def ios_get_interface_descriptions(username,
 
     # Execute 'show interface description' and parse the results
     playbook = f'{play_path}/cisco_ios_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
     # Create a list to store the rows for the dataframe
     df_data = list()
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -618,14 +631,11 @@ def ios_get_interface_ips(username,
 
     # Execute the command
     playbook = f'{play_path}/cisco_ios_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the results
     df_data = list()
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -699,13 +709,10 @@ def ios_get_vlan_db(username: str,
 
     # Execute 'show interface description' and parse the results
     playbook = f'{play_path}/cisco_ios_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
     # Create a dictionary to store the rows for the dataframe
     df_data = list()
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
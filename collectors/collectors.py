@@ -4,7 +4,6 @@
 A library of functions for collecting data from network devices.
 '''
 
-import ansible_runner
 import ipaddress
 import pandas as pd
 import re
@@ -12,6 +11,53 @@ import sqlite3 as sl
 
 from helpers import helpers as hp
 
+# The patterns for parsing 'show port-channel database' (see
+# nxos_parse_port_channel_database)
+po_member_pattern = re.compile(
+    r'(?:Ports:\s*)?(\S+)\s+\[\s*([^\]]*?)\s*\]\s*'
+    r'\[\s*([^\]]*?)\s*\](?:\s*(\*))?')
+po_total_pattern = re.compile(r'(\S+) ports in total.*,\s*(\S+)')
+po_detail_pattern = re.compile(r'(First operational|Last bundled|'
+                               r'Last unbundled|Age of the)\b.*\s(\S+)$')
+po_detail_keys = {'First operational': 'first_operational_port',
+                  'Last bundled': 'last_bundled_member',
+                  'Last unbundled': 'last_unbundled_member',
+                  'Age of the': 'age'}
+
+
+def nxos_define_commands():
+    '''
+    Defines the command that each NXOS collector runs. The collectors use
+    this to build their extravars, and run_collectors uses it to batch the
+    commands for several collectors into a single playbook run (see
+    hp.ansible_register_batch). Only collectors that run a single, fixed
+    command through 'cisco_nxos_run_commands.yml' are included.
+
+    Args:
+        None
+
+    Returns:
+        commands (dict):    The collector names are the keys, and the commands
+                            they run are the values.
+    '''
+    grep = 'Interface status:\\|IP address:\\|IP Interface Status for VRF'
+    commands = {'arp_table':
+                'show ip arp vrf all | begin "Address         Age"',
+                'bgp_neighbors': 'show ip bgp summary vrf all',
+                'cam_table': 'show mac address-table',
+                'interface_description':
+                'show interface description | grep -v "\\-\\-\\-\\-"',
+                'interface_ip_addresses':
+                f'show ip interface vrf all | grep "{grep}"',
+                'interface_status':
+                'show interface status | grep -v "\\-\\-\\-"',
+                'port_channel_data': 'show port-channel database',
+                'port_channel_members': 'show port-channel database',
+                'vpc_state': 'show vpc brief | begin "vPC domain id" | '
+                             'end "vPC Peer-link status"',
+                'vrfs': 'show vrf detail'}
+    return commands
+
 
 def nxos_diff_running_config(username,
                              password,
@@ -43,14 +89,11 @@ def nxos_diff_running_config(username,
 
     # Execute the command and parse the output
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -74,7 +117,8 @@ def nxos_get_arp_table(username,
                        nm_path,
                        play_path,
                        private_data_dir,
-                       reverse_dns=False):
+                       reverse_dns=False,
+                       on_device=None):
     '''
     Gets the ARP table for Cisco NXOS devices. Also returns the OUI (vendor)
     for the MAC address. Will also return a reverse DNS query, but only if the
@@ -92,11 +136,16 @@ def nxos_get_arp_table(username,
         reverse_dns (bool):     Whether to run a reverse DNS lookup. Defaults
                                 to False because the test can take several
                                 minutes on large ARP tables.
+        on_device (function):   A function to call with each device's ARP
+                                table as soon as it is parsed (E.g., to write
+                                it to the database). If it is given, the
+                                devices' ARP tables are not kept, and an
+                                empty DataFrame is returned.
 
     Returns:
         df_arp (DataFrame):     The ARP table
     '''
-    cmd = 'show ip arp vrf all | begin "Address         Age"'
+    cmd = nxos_define_commands()['arp_table']
     extravars = {'username': username,
                  'password': password,
                  'host_group': host_group,
@@ -104,18 +153,22 @@ def nxos_get_arp_table(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
-    # Parse the output and add it to 'data'
-    df_data = list()
+    cols = ['device',
+            'ip_address',
+            'age',
+            'mac_address',
+            'interface']
 
-    # Create a list of mac addresses (used for querying the vendor)
-    macs = list()
+    # TODO: Convert this to a standalone function
+    # if reverse_dns:
+    #     cols.append('reverse_dns')
 
-    for event in runner.events:
+    # Create a list to store the ARP table of each device
+    frames = list()
+
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -124,13 +177,13 @@ def nxos_get_arp_table(username,
             output = event_data['res']['stdout'][0].split('\n')
 
             # Parse the output and add it to 'df_data'
+            df_data = list()
             for line in output[1:]:
                 line = line.split()
                 address = line[0]
                 age = line[1]
                 mac = line[2]
                 inf = line[3]
-                macs.append(mac)
                 row = [device, address, age, mac, inf]
                 # Perform a reverse DNS lookup if requested
                 # TODO: Convert this to a standalone function
@@ -142,21 +195,20 @@ def nxos_get_arp_table(username,
                 #     row.append(rdns)
                 df_data.append(row)
 
-    cols = ['device',
-            'ip_address',
-            'age',
-            'mac_address',
-            'interface']
+            df_arp = pd.DataFrame(data=df_data, columns=cols)
 
-    # TODO: Convert this to a standalone function
-    # if reverse_dns:
-    #     cols.append('reverse_dns')
+            # Find the vendrs and add them to the dataframe
+            df_vendors = hp.find_mac_vendors(df_arp['mac_address'], nm_path)
+            df_arp['vendor'] = df_vendors['vendor']
 
-    df_arp = pd.DataFrame(data=df_data, columns=cols)
+            # Hand off the device's ARP table now if the caller is streaming
+            # the output. Otherwise keep it for the result.
+            if on_device:
+                on_device(df_arp)
+            else:
+                frames.append(df_arp)
 
-    # Find the vendrs and add them to the dataframe
-    df_vendors = hp.find_mac_vendors(macs, nm_path)
-    df_arp['vendor'] = df_vendors['vendor']
+    df_arp = hp.combine_frames(frames, cols + ['vendor'])
 
     return df_arp
 
@@ -193,10 +245,7 @@ def nxos_get_fexes_table(username,
 
     # Execute the command and parse the output
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the output and add it to 'data'
     df_data = list()
@@ -204,7 +253,7 @@ def nxos_get_fexes_table(username,
     # Create a list of mac addresses (used for querying the vendor)
     macs = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -244,8 +293,8 @@ def nxos_get_fexes_table(username,
     df_arp = pd.DataFrame(data=df_data, columns=cols)
 
     # Find the vendrs and add them to the dataframe
-    vendors = hp.find_mac_vendors(macs, nm_path)
-    df_arp['vendor'] = vendors
+    df_vendors = hp.find_mac_vendors(macs, nm_path)
+    df_arp['vendor'] = df_vendors['vendor']
 
     return df_arp
 
@@ -270,7 +319,7 @@ def nxos_get_bgp_neighbors(username,
     Returns:
         df_bgp (DataFrame):     The BGP neighbors
     '''
-    cmd = 'show ip bgp summary vrf all'
+    cmd = nxos_define_commands()['bgp_neighbors']
     extravars = {'username': username,
                  'password': password,
                  'host_group': host_group,
@@ -278,10 +327,7 @@ def nxos_get_bgp_neighbors(username,
 
     # Execute the command and parse the output
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Necessary to keep from exceeding 80-character line length
     address = ipaddress.ip_address
@@ -291,7 +337,7 @@ def nxos_get_bgp_neighbors(username,
 
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
             device = event_data['remote_addr']
@@ -346,7 +392,8 @@ def nxos_get_cam_table(username,
                        nm_path,
                        play_path,
                        private_data_dir,
-                       interface=None):
+                       interface=None,
+                       on_device=None):
     '''
     Gets the CAM table for NXOS devices and adds the vendor OUI.
 
@@ -358,6 +405,11 @@ def nxos_get_cam_table(username,
         play_path (str):        The path to the playbooks directory
         private_data_dir (str): The path to the Ansible private data directory
         interface (str):        The interface (defaults to all interfaces)
+        on_device (function):   A function to call with each device's CAM
+                                table as soon as it is parsed (E.g., to write
+                                it to the database). If it is given, the
+                                devices' CAM tables are not kept, and an
+                                empty DataFrame is returned.
 
     Returns:
         df_cam (DataFrame):     The CAM table and vendor OUI
@@ -365,7 +417,7 @@ def nxos_get_cam_table(username,
     if interface:
         cmd = f'show mac address-table interface {interface}'
     else:
-        cmd = 'show mac address-table'
+        cmd = nxos_define_commands()['cam_table']
     extravars = {'username': username,
                  'password': password,
                  'host_group': host_group,
@@ -373,22 +425,21 @@ def nxos_get_cam_table(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Define the RegEx pattern for a valid MAC address
     # pattern = '([0-9a-f]{4}\.[0-9a-f]{4}\.[0-9a-f]{4})'
     pattern = '.*[a-zA-Z0-9]{4}\\.[a-zA-Z0-9]{4}\\.[a-zA-Z0-9]{4}.*'
 
-    # Create a list to store MAC addresses
-    addresses = list()
+    cols = ['device',
+            'interface',
+            'mac',
+            'vlan']
 
-    # Parse the output and add it to 'data'
-    df_data = list()
+    # Create a list to store the CAM table of each device
+    frames = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -397,25 +448,29 @@ def nxos_get_cam_table(username,
             output = event_data['res']['stdout'][0]
 
             output = re.findall(pattern, output)
+            df_data = list()
             for line in output:
                 mac = line.split()[2]
                 interface = line.split()[-1]
                 vlan = line.split()[1]
                 df_data.append([device, interface, mac, vlan])
 
-    # Create the dataframe and return it
-    cols = ['device',
-            'interface',
-            'mac',
-            'vlan']
-    df_cam = pd.DataFrame(data=df_data, columns=cols)
+            # Create the dataframe
+            df_cam = pd.DataFrame(data=df_data, columns=cols)
 
-    # Get the OUIs and add them to df_cam
-    addresses = df_cam['mac'].to_list()
-    df_vendors = hp.find_mac_vendors(addresses, nm_path)
-    df_cam['vendor'] = df_vendors['vendor']
+            # Get the OUIs and add them to df_cam
+            df_vendors = hp.find_mac_vendors(df_cam['mac'], nm_path)
+            df_cam['vendor'] = df_vendors['vendor']
+
+            # Hand off the device's CAM table now if the caller is streaming
+            # the output. Otherwise keep it for the result.
+            if on_device:
+                on_device(df_cam)
+            else:
+                frames.append(df_cam)
 
     # Return df_cam
+    df_cam = hp.combine_frames(frames, cols + ['vendor'])
     return df_cam
 
 
@@ -449,16 +504,13 @@ def nxos_get_hostname(username,
 
     # Execute the command and parse the output
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     df_data = dict()
     df_data['device'] = list()
     df_data['hostname'] = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -496,7 +548,7 @@ def nxos_get_interface_descriptions(username,
         df_desc (DataFrame):    The interface descriptions
     '''
     # Get the interface descriptions and add them to df_cam
-    cmd = 'show interface description | grep -v "\\-\\-\\-\\-"'
+    cmd = nxos_define_commands()['interface_description']
     extravars = {'username': username,
                  'password': password,
                  'host_group': host_group,
@@ -504,13 +556,10 @@ def nxos_get_interface_descriptions(username,
 
     # Execute 'show interface description' and parse the results
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
     # Create a list to store the rows for the dataframe
     df_data = list()
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -553,8 +602,7 @@ def nxos_get_interface_ips(username,
     Returns:
         df (df):                A DataFrame containing the interfaces and IPs
     '''
-    grep = 'Interface status:\\|IP address:\\|IP Interface Status for VRF'
-    cmd = f'show ip interface vrf all | grep "{grep}"'
+    cmd = nxos_define_commands()['interface_ip_addresses']
     extravars = {'username': username,
                  'password': password,
                  'host_group': host_group,
@@ -562,14 +610,11 @@ def nxos_get_interface_ips(username,
 
     # Execute the command
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the results
     df_data = list()
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -626,7 +671,7 @@ def nxos_get_interface_status(username,
     Returns:
         df_inf_status (DataFrame): The interface statuses
     '''
-    cmd = 'show interface status | grep -v "\\-\\-\\-"'
+    cmd = nxos_define_commands()['interface_status']
     extravars = {'username': username,
                  'password': password,
                  'host_group': host_group,
@@ -634,15 +679,12 @@ def nxos_get_interface_status(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the output and add it to 'data'
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -699,86 +741,58 @@ def nxos_get_interface_summary(db_path):
     Returns:
         df_summary (DataFrame): The summaries of interfaces on the devices
     '''
-    # Get the interface statuses, descriptions and cam table
     con = sl.connect(db_path)
-    table = 'nxos_interface_status'
-    df_ts = pd.read_sql(f'select distinct timestamp from {table}', con)
-    ts = df_ts['timestamp'].to_list()[-1]
-    df_inf = pd.read_sql(f'select * from {table} where timestamp = "{ts}"',
-                         con)
-
-    df_data = dict()
-    df_data['device'] = list()
-    df_data['interface'] = list()
-    df_data['status'] = list()
-    df_data['description'] = list()
-    df_data['vendors'] = list()
-    df_data['macs'] = list()
-
-    for idx, row in df_inf.iterrows():
-        device = row['device']
-        inf = row['interface']
-        status = row['status']
-
-        query = f'''SELECT mac,vendor
-                    FROM nxos_cam_table
-                    WHERE timestamp = "{ts}"
-                       AND device = "{device}"
-                       AND interface = "{inf}"'''
-        df_macs = pd.read_sql(query, con)
-        if len(df_macs) > 0:
-            macs = df_macs['mac'].to_list()
-            macs = '|'.join(macs)
-
-            vendors = list()
-            for idx, row in df_macs.iterrows():
-                vendor = row['vendor']
-                if vendor:
-                    vendor = vendor.replace(',', str())
-                    if vendor not in vendors:
-                        vendors.append(vendor)
-
-            vendors = '|'.join(vendors)
-
-            # vendors = str()
-            # for idx, row in df_macs.iterrows():
-            #     vendor = row['vendor']
-            #     if len(vendors) == 0:
-            #         if vendor:
-            #             vendors = vendor
-            #     elif vendor:
-            #         if not vendors:
-            #             vendors = vendor
-            #         else:
-            #             vendors = vendors + f' {vendor}'
-            #     else:
-            #         pass
-
-        else:
-            macs = str()
-            vendors = str()
-
-        query = f'''SELECT description
-                    FROM nxos_interface_description
-                    WHERE timestamp = "{ts}"
-                       AND device = "{device}"
-                       AND interface = "{inf}"'''
-        desc = pd.read_sql(query, con)
-        if len(desc) > 0:
-            desc = desc['description'].to_list()[0]
-        else:
-            desc = str()
-
-        df_data['device'].append(device)
-        df_data['interface'].append(inf)
-        df_data['status'].append(status)
-        df_data['description'].append(desc)
-        df_data['vendors'].append(vendors)
-        df_data['macs'].append(macs)
+    cur = con.cursor()
+
+    # Create indexes to support the lookups, if they do not already exist
+    for table in ['nxos_interface_status',
+                  'nxos_cam_table',
+                  'nxos_interface_description']:
+        try:
+            cur.execute(f'''CREATE INDEX IF NOT EXISTS idx_{table}
+                            ON {table.upper()} (timestamp, device, interface)
+                        ''')
+        except Exception as e:
+            print(f'Caught Exception: {str(e)}')
+    con.commit()
+
+    # Get the latest timestamp of the interface statuses
+    ts = hp.get_latest_snapshot(con, 'nxos_interface_status')
 
+    # Get the interface statuses, descriptions and cam table
+    df_inf = hp.read_snapshot(con,
+                              'nxos_interface_status',
+                              ts,
+                              ['device', 'interface', 'status'])
+    df_cam = hp.read_snapshot(con,
+                              'nxos_cam_table',
+                              ts,
+                              ['device', 'interface', 'mac', 'vendor'])
+    df_desc = hp.read_snapshot(con,
+                               'nxos_interface_description',
+                               ts,
+                               ['device', 'interface', 'description'])
     con.close()
 
-    df_summary = pd.DataFrame.from_dict(df_data)
+    # Aggregate the MACs and vendors on each interface. Vendors are
+    # de-duplicated, preserving the order in which they were first seen
+    keys = ['device', 'interface']
+    df_cam['vendor'] = df_cam['vendor'].str.replace(',', str())
+    df_macs = df_cam.groupby(keys, sort=False)['mac'].agg(
+        lambda macs: '|'.join(macs.dropna()))
+    df_macs = df_macs.rename('macs')
+    df_vendors = df_cam[df_cam['vendor'].fillna(str()) != str()]
+    df_vendors = df_vendors.drop_duplicates(subset=keys+['vendor'])
+    df_vendors = df_vendors.groupby(keys, sort=False)['vendor'].agg('|'.join)
+    df_vendors = df_vendors.rename('vendors')
+
+    # Join the descriptions, vendors and MACs to the interface statuses
+    df_desc = df_desc.drop_duplicates(subset=keys)
+    df_summary = df_inf.merge(df_desc, on=keys, how='left')
+    df_summary = df_summary.merge(df_vendors, on=keys, how='left')
+    df_summary = df_summary.merge(df_macs, on=keys, how='left')
+    df_summary = df_summary.fillna(str())
+
     df_summary = df_summary[['device',
                              'interface',
                              'status',
@@ -817,15 +831,12 @@ def nxos_get_inventory(username,
     playbook = f'{play_path}/cisco_nxos_get_inventory.yml'
 
     # Execute the playbook
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Create a list for holding the inventory items
     data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
             device = event_data['remote_addr']
@@ -837,22 +848,8 @@ def nxos_get_inventory(username,
                 item['device'] = device
                 data.append(item)
 
-    # Create a dictionary for storing the output
-    df_data = dict()
-
-    # Create the dictionary keys
-    for item in data:
-        for key in item:
-            if not df_data.get(key):
-                df_data[key] = list()
-
-    # Add the inventory items to 'df_data'
-    for item in data:
-        for key in df_data:
-            df_data[key].append(item.get(key))
-
     # Create and return the dataframe
-    df_inventory = pd.DataFrame.from_dict(df_data)
+    df_inventory = hp.records_to_df(data)
 
     return df_inventory
 
@@ -884,15 +881,12 @@ def nxos_get_logs(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the output and add it to 'data'
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -924,7 +918,9 @@ def nxos_get_port_channel_data(username,
                                private_data_dir):
     '''
     Gets port-channel data (output from 'show port-channel database') for Cisco
-    NXOS devices.
+    NXOS devices. Each port-channel has one 'port_<n>' column per member.
+    There are always at least 8 of them, and more are added for larger
+    bundles. See nxos_get_port_channel_members for one row per member.
 
     Args:
         username (str):         The username to login to devices
@@ -932,12 +928,11 @@ def nxos_get_port_channel_data(username,
         host_group (str):       The inventory host group
         play_path (str):        The path to the playbooks directory
         private_data_dir (str): The path to the Ansible private data directory
-        nm_path (str):          The path to the Net-Manage repository
 
     Returns:
         df_po_data (DataFrame): The port-channel data
     '''
-    cmd = 'show port-channel database'
+    cmd = nxos_define_commands()['port_channel_data']
     extravars = {'username': username,
                  'password': password,
                  'host_group': host_group,
@@ -945,122 +940,172 @@ def nxos_get_port_channel_data(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
+
+    # Parse the output of each device
+    entries = list()
+    for event in runner:
+        if event['event'] == 'runner_on_ok':
+            event_data = event['event_data']
+
+            device = event_data['remote_addr']
+
+            output = event_data['res']['stdout'][0]
+
+            entries.extend(nxos_parse_port_channel_database(device, output))
+
+    # Create one column per member, for the largest bundle
+    num_ports = max([len(_['ports']) for _ in entries] + [8])
+    port_cols = [f'port_{str(i)}' for i in range(1, num_ports+1)]
 
     # Define the dataframe columns
     cols = ['device',
             'interface',
             'total_ports',
             'up_ports',
-            'age',
-            'port_1',
-            'port_2',
-            'port_3',
-            'port_4',
-            'port_5',
-            'port_6',
-            'port_7',
-            'port_8',
-            'first_operational_port',
-            'last_bundled_member',
-            'last_unbundled_member']
-
-    # Create a dictionary to store the data for creating the dataframe
-    df_data = dict()
-    for c in cols:
-        df_data[c] = list()
+            'age'] + port_cols + ['first_operational_port',
+                                  'last_bundled_member',
+                                  'last_unbundled_member']
 
-    # Parse the output and add it to 'data'
-    for event in runner.events:
+    df_data = list()
+    for entry in entries:
+        ports = [_['port'] for _ in entry['ports']]
+        ports += [str()] * (num_ports - len(ports))
+        row = [entry['device'],
+               entry['interface'],
+               entry['total_ports'],
+               entry['up_ports'],
+               entry['age']] + ports + [entry['first_operational_port'],
+                                        entry['last_bundled_member'],
+                                        entry['last_unbundled_member']]
+        df_data.append(row)
+
+    df_po_data = pd.DataFrame(data=df_data, columns=cols)
+
+    return df_po_data
+
+
+def nxos_get_port_channel_members(username,
+                                  password,
+                                  host_group,
+                                  play_path,
+                                  private_data_dir):
+    '''
+    Gets the members of the port-channels on Cisco NXOS devices, with one row
+    per member.
+
+    Args:
+        username (str):         The username to login to devices
+        password (str):         The password to login to devices
+        host_group (str):       The inventory host group
+        play_path (str):        The path to the playbooks directory
+        private_data_dir (str): The path to the Ansible private data directory
+
+    Returns:
+        df_members (DataFrame): The port-channel members
+    '''
+    cmd = nxos_define_commands()['port_channel_members']
+    extravars = {'username': username,
+                 'password': password,
+                 'host_group': host_group,
+                 'commands': cmd}
+
+    # Execute the command
+    playbook = f'{play_path}/cisco_nxos_run_commands.yml'
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
+
+    cols = ['device',
+            'interface',
+            'member',
+            'mode',
+            'status',
+            'operational']
+
+    # Parse the output and add a row for each member
+    df_data = list()
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
             device = event_data['remote_addr']
 
-            output = event_data['res']['stdout'][0].split('\n')
+            output = event_data['res']['stdout'][0]
 
-            # output.append(str())  # For finding the end of database entries
-            output = [_ for _ in output if _ != 'Legend:']
-            output = [_ for _ in output if '"*":' not in _]
+            for entry in nxos_parse_port_channel_database(device, output):
+                for port in entry['ports']:
+                    df_data.append([device,
+                                    entry['interface'],
+                                    port['member'],
+                                    port['mode'],
+                                    port['status'],
+                                    port['operational']])
 
-            # TODO: Re-write this using regex to 1) make it more concise, and
-            # 2) avoid iterating over 'output' twice
+    df_members = pd.DataFrame(data=df_data, columns=cols)
 
-            # Create a list to store database entries
-            entries = list()
+    return df_members
 
-            pos = 0
-            for line in output:
-                if line[:12] == 'port-channel':
-                    interface = line
-                    entry = [interface, device]
-                    counter = pos+1
-                    while output[counter][:4] == '    ':
-                        entry.append(output[counter])
-                        counter += 1
-                        if counter == len(output):
-                            break
-                    entries.append(entry)
-                pos += 1
-
-            for entry in entries:
-                entry = [_.strip() for _ in entry]
-                interface = entry[0]
-                device = entry[1]
-                # Create a counter for tracking port numbers
-                counter = 0
-                # Create an 8-element list of empty strings for ports
-                ports = list()
-                for i in range(1, 9):
-                    ports.append(str())
-                # Define empty strings for vars that might not exist
-                total_ports = str()
-                up_ports = str()
-                first_op_port = str()
-                last_bundled = str()
-                last_unbundled = str()
-                age = str()
-                for line in entry[2:]:
-                    if 'ports in total' in line:
-                        total_ports = line.split()[0]
-                        up_ports = line.split(',')[-1].split()[0]
-                    if 'First operational' in line:
-                        first_op_port = line.split()[-1]
-                    if 'Last bundled' in line:
-                        last_bundled = line.split()[-1]
-                    if 'Last unbundled' in line:
-                        last_unbundled = line.split()[-1]
-                    if 'Age of the' in line:
-                        age = line.split()[-1]
-                    if ']' in line:
-                        port = line.split('Ports:')[-1].strip()
-                        ports[counter] = port
-                        counter += 1
-
-                # Fill in ports list with ports that exist
-                port_num = 1
-                for p in ports:
-                    key = f'port_{str(port_num)}'
-                    df_data[key].append(p)
-                    port_num += 1
-                # Add remaining variables to df_data
-                df_data['interface'].append(interface)
-                df_data['device'].append(device)
-                df_data['total_ports'].append(total_ports)
-                df_data['up_ports'].append(up_ports)
-                df_data['age'].append(age)
-                df_data['first_operational_port'].append(first_op_port)
-                df_data['last_bundled_member'].append(last_bundled)
-                df_data['last_unbundled_member'].append(last_unbundled)
-
-    df_po_data = pd.DataFrame.from_dict(df_data)
-    # Set dataframe columns to desired order (from 'cols' list)
-    df_po_data = df_po_data[cols]
 
-    return df_po_data
+def nxos_parse_port_channel_database(device, output):
+    '''
+    Parses the output of 'show port-channel database' in a single pass. Each
+    line that starts with 'port-channel' starts a new entry, and the indented
+    lines that follow it are added to that entry. Entries can have any number
+    of members.
+
+    Args:
+        device (str):           The device that the output is from
+        output (str):           The output of the command
+
+    Returns:
+        entries (list):         A dictionary for each port-channel. The
+                                members are in its 'ports' list.
+    '''
+    entries = list()
+    entry = None
+    for line in output.split('\n'):
+        if line[:12] == 'port-channel':
+            entry = {'device': device,
+                     'interface': line.strip(),
+                     'total_ports': str(),
+                     'up_ports': str(),
+                     'age': str(),
+                     'ports': list(),
+                     'first_operational_port': str(),
+                     'last_bundled_member': str(),
+                     'last_unbundled_member': str()}
+            entries.append(entry)
+            continue
+
+        # Skip the legend, and end the entry at the first line that is not
+        # indented
+        if line == 'Legend:' or '"*":' in line:
+            continue
+        if entry is None or line[:4] != '    ':
+            entry = None
+            continue
+
+        line = line.strip()
+        match = po_member_pattern.match(line)
+        if match:
+            port = line.split('Ports:')[-1].strip()
+            entry['ports'].append({'port': port,
+                                   'member': match.group(1),
+                                   'mode': match.group(2),
+                                   'status': match.group(3),
+                                   'operational': bool(match.group(4))})
+            continue
+
+        match = po_total_pattern.match(line)
+        if match:
+            entry['total_ports'] = match.group(1)
+            entry['up_ports'] = match.group(2)
+            continue
+
+        match = po_detail_pattern.match(line)
+        if match:
+            entry[po_detail_keys[match.group(1)]] = match.group(2)
+
+    return entries
 
 
 def nxos_get_vlan_db(username,
@@ -1091,15 +1136,12 @@ def nxos_get_vlan_db(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the output and add it to 'data'
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -1151,7 +1193,7 @@ def nxos_get_vpc_state(username,
     Returns:
         df_vpc_state (DataFrame): The VPC state information
     '''
-    cmd = 'show vpc brief | begin "vPC domain id" | end "vPC Peer-link status"'
+    cmd = nxos_define_commands()['vpc_state']
     extravars = {'username': username,
                  'password': password,
                  'host_group': host_group,
@@ -1159,15 +1201,12 @@ def nxos_get_vpc_state(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the output and add it to 'data'
     data = dict()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
             device = event_data['remote_addr']
@@ -1184,17 +1223,7 @@ def nxos_get_vpc_state(username,
                 col_name = line.split(':')[0].strip()
                 data[device][col_name] = line.split(':')[1].strip()
 
-    df_data = dict()
-    df_data['device'] = list()
-    for key in data:
-        for k in data[key]:
-            df_data[k] = list()
-
-    for device in data:
-        for key in df_data:
-            df_data[key].append(data[device].get(key))
-
-    df_vpc_state = pd.DataFrame.from_dict(df_data)
+    df_vpc_state = hp.records_to_df(data.values(), columns=['device'])
 
     return df_vpc_state
 
@@ -1217,7 +1246,7 @@ def nxos_get_vrfs(username,
     Returns:
     df_vrfs (DataFrame):          A dataframe containing the VRFs
     '''
-    cmd = 'show vrf detail'
+    cmd = nxos_define_commands()['vrfs']
     extravars = {'username': username,
                  'password': password,
                  'host_group': host_group,
@@ -1225,15 +1254,12 @@ def nxos_get_vrfs(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/cisco_nxos_run_commands.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the output and add it to 'data'
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -1325,58 +1351,45 @@ def panos_get_security_rules(username,
                  'host_group': host_group}
 
     playbook = f'{play_path}/palo_alto_get_security_rules.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
-    # Create the 'df_data' dictionary. It will be used to create the dataframe
-    df_data = dict()
-    df_data['device'] = list()
-
-    # Create a list to store the unformatted details for each rule
+    # Create a list to store the formatted details for each rule
     rules = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
             device = event_data['remote_addr']
             output = event_data['res']['gathered']
 
             for item in output:
-                item['device'] = device
-                rules.append(item)
-                for key in item:
-                    if not df_data.get(key):
-                        df_data[key] = list()
-
-    # Iterate over the rule details, using the keys in dict_keys to create the
-    # 'df_data' dictionary, which will be used to create the dataframe
-    for item in rules:
-        for key in df_data:
-            # If a key in a rule has a value that is a list, then convert it to
-            # a string by joining it with '|' as a delimiter. We do not want to
-            # use commas a delimiter, since that can cause issues when
-            # exporting the data to CSV files.
-            if isinstance(item.get(key), list):
-                # Some keys have a value that is a list, with commas inside the
-                # list items. For example, source_user might look like this:
-                # ['cn=name,ou=firewall,ou=groups,dc=dcname,dc=local']. That
-                # creates an issue when exporting to a CSV file. Therefore,
-                # the commas inside list items will be replaced with a space
-                # before joining the list.
-                _list = item.get(key)
-                _list = [_.replace(',', ' ') for _ in _list]
-
-                # Join the list using '|' as a delimiter
-                df_data[key].append('|'.join(_list))
-            # If the key's value is not a list, then convert it to a string
-            # and append it to the key in 'df_data'
-            else:
-                df_data[key].append(str(item.get(key)))
-
-    # Create the dataframe and return it
-    df_rules = pd.DataFrame.from_dict(df_data)
+                rule = {'device': device}
+                for key, value in item.items():
+                    # If a key in a rule has a value that is a list, then
+                    # convert it to a string by joining it with '|' as a
+                    # delimiter. We do not want to use commas a delimiter,
+                    # since that can cause issues when exporting the data to
+                    # CSV files.
+                    #
+                    # Some keys have a value that is a list, with commas
+                    # inside the list items. For example, source_user might
+                    # look like this:
+                    # ['cn=name,ou=firewall,ou=groups,dc=dcname,dc=local'].
+                    # Therefore, the commas inside list items will be
+                    # replaced with a space before joining the list.
+                    if isinstance(value, list):
+                        value = '|'.join([_.replace(',', ' ') for _ in value])
+                    # If the key's value is not a list, then convert it to a
+                    # string
+                    else:
+                        value = str(value)
+                    rule[key] = value
+                rules.append(rule)
+
+    # Create the dataframe. Rules that do not have a key are set to 'None',
+    # the same as keys whose value is None.
+    df_rules = hp.records_to_df(rules, columns=['device'])
+    df_rules = df_rules.fillna(str(None))
 
     # Rename the 'destintaion_zone' column to 'destination_zone'
     df_rules.rename({'destintaion_zone': 'destination_zone'},
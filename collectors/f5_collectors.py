@@ -4,8 +4,7 @@
 Define F5 collectors
 '''
 
-import ansible_runner
-import ast
+import hashlib
 import pandas as pd
 import run_collectors as rc
 from helpers import helpers as hp
@@ -23,61 +22,252 @@ def build_pool_table(username,
     Creates a custom table that contains the F5 pools, associated VIPs (if
     applicable), and pool members (if applicable).
 
+    The tables are only rebuilt for devices whose output has changed since
+    the last time this function was run. A digest of each device's output is
+    stored in the F5_POOL_TABLE_DIGESTS table. If it matches, the device's
+    rows in the F5_POOL_SUMMARY and F5_VIP_SUMMARY tables are left as they
+    are. Otherwise they are replaced. Devices in other hostgroups are never
+    modified.
+
     Args:
         username (str):         The username to login to devices
         password (str):         The password to login to devices
         host_group (str):       The inventory host group
         play_path (str):        The path to the playbooks directory
         private_data_dir (str): Path to the Ansible private data directory
+        db_path (str):          The path to the database
+        timestamp (str):        The timestamp for rebuilt rows
         validate_certs (bool):  Whether to validate SSL certificates
 
     Returns:
-        df_members (DataFrame): The pool availability and associated data
+        df_vips (DataFrame):    The VIP summary for the devices in the
+                                hostgroup
     '''
-    # TODO: Optimize this so the table is only built for any device in the
-    #       hostgroup that does not exist in the table (or if the table is not
-    #       yet present)
-    df_pools = get_pools_and_members(username,
-                                     password,
-                                     hostgroup,
-                                     play_path,
-                                     private_data_dir)
-
-    rc.add_to_db('f5_pool_summary',
-                 df_pools,
-                 timestamp,
-                 db_path,
-                 method='replace')
-
-    df_vips = get_vip_summary(username,
-                              password,
-                              hostgroup,
-                              play_path,
-                              private_data_dir,
-                              df_pools)
-
-    rc.add_to_db('f5_vip_summary',
-                 df_vips,
-                 timestamp,
-                 db_path,
-                 method='replace')
+    # Get the pool and VIP output for each device
+    playbook = f'{play_path}/f5_get_pools_and_members.yml'
+    pool_outputs = run_summary_playbook(username,
+                                        password,
+                                        hostgroup,
+                                        playbook,
+                                        private_data_dir,
+                                        validate_certs=validate_certs)
+    playbook = f'{play_path}/f5_get_vip_summary.yml'
+    vip_outputs = run_summary_playbook(username,
+                                       password,
+                                       hostgroup,
+                                       playbook,
+                                       private_data_dir,
+                                       validate_certs=validate_certs)
+
+    # Create a digest of the output for each device
+    digests = dict()
+    for device in set(pool_outputs) | set(vip_outputs):
+        digest = hashlib.sha256()
+        for line in pool_outputs.get(device, list()):
+            digest.update(f'{line}\n'.encode())
+        digest.update(b'\0')
+        for line in vip_outputs.get(device, list()):
+            digest.update(f'{line}\n'.encode())
+        digests[device] = digest.hexdigest()
+
+    with rc.db_lock:
+        con = rc.connect_to_db_writer(db_path)
+        cur = con.cursor()
+        cur.execute('''CREATE TABLE IF NOT EXISTS F5_POOL_TABLE_DIGESTS (
+                       device TEXT PRIMARY KEY,
+                       digest TEXT,
+                       timestamp TEXT
+                       )''')
+
+        # Find the devices whose output has changed. Devices that have a
+        # digest but no rows (e.g., if the table was dropped) are rebuilt.
+        cur.execute('SELECT device, digest FROM F5_POOL_TABLE_DIGESTS')
+        stored = dict(cur.fetchall())
+        cur.execute('''SELECT name FROM sqlite_master
+                       WHERE type = "table" AND name = "F5_POOL_SUMMARY"''')
+        built = list()
+        if cur.fetchone():
+            cur.execute('SELECT DISTINCT device FROM F5_POOL_SUMMARY')
+            built = [row[0] for row in cur.fetchall()]
+        changed = [device for device, digest in digests.items()
+                   if stored.get(device) != digest or device not in built]
+
+        # Rebuild the rows for the changed devices
+        if changed:
+            df_pools = parse_pools_and_members(
+                {_: pool_outputs.get(_, list()) for _ in changed})
+            df_vips = parse_vip_summary(
+                {_: vip_outputs.get(_, list()) for _ in changed}, df_pools)
+
+            params = ', '.join(['?'] * len(changed))
+            for table_name, result in [('f5_pool_summary', df_pools),
+                                       ('f5_vip_summary', df_vips)]:
+                cur.execute(f'pragma table_info("{table_name.upper()}")')
+                if cur.fetchall():
+                    cur.execute(f'''DELETE FROM {table_name.upper()}
+                                    WHERE device IN ({params})''', changed)
+                    hp.catalog_snapshots(cur, table_name, rebuild=True)
+                result.insert(0, 'timestamp', timestamp)
+                rc.write_to_db(con,
+                               table_name,
+                               result,
+                               'append',
+                               ['device'],
+                               dict())
+
+            cur.executemany('''INSERT OR REPLACE INTO F5_POOL_TABLE_DIGESTS
+                               VALUES (?, ?, ?)''',
+                            [(device, digests[device], timestamp)
+                             for device in changed])
+        con.commit()
+
+        # Read the VIP summary for all devices in the hostgroup
+        df_vips = parse_vip_summary(dict(), pd.DataFrame())
+        devices = list(digests)
+        if devices:
+            params = ', '.join(['?'] * len(devices))
+            cols = ', '.join(df_vips.columns.to_list())
+            df_vips = pd.read_sql(f'''SELECT {cols} FROM F5_VIP_SUMMARY
+                                      WHERE device IN ({params})''',
+                                  con,
+                                  params=devices)
+        con.close()
 
     return df_vips
 
 
+def iter_tmsh_objects(lines):
+    """Parses F5 'tmsh list' output, yielding one top-level object at a time.
+
+    Parameters
+    ----------
+    lines : iterable
+        The lines of the output to parse. They can be a list, or any other
+        iterable such as an open file, so the output does not need to be held
+        in memory.
+
+    Yields
+    ----------
+    key : str
+        The name of the object (e.g., 'net vlan /Common/VLAN1').
+    value : dict
+        The object's properties, as returned by convert_tmsh_output_to_dict.
+
+    Notes
+    ----------
+    The parser keeps a stack of the blocks that are open. Each line is
+    handled once:
+
+    1. A line ending in '{ }' is an empty array.
+
+    2. A line ending in '{' opens a block. Everything before the '{' is the
+       block's key.
+
+    3. A line containing only '}' closes the block. If every line in the
+       block was a single word, then the block is an array. Otherwise it is a
+       dictionary, and any single words in it (e.g., 'disabled') are keys
+       whose value is None. Top-level objects are always dictionaries.
+
+    4. Any other line is either a single word (an array member), or a key
+       followed by a value. If the value is wrapped in quotes, then they are
+       removed.
+
+    Examples
+    ----------
+    >>> output = ['net vlan /Common/VLAN1 {',
+    ...           '    interfaces {',
+    ...           '        1.1 {',
+    ...           '            tagged',
+    ...           '        }',
+    ...           '    }',
+    ...           '    tag 100',
+    ...           '}']
+    >>> for key, value in iter_tmsh_objects(output):
+    ...     print(key, value)
+    net vlan /Common/VLAN1 {'interfaces': {'1.1': ['tagged']}, 'tag': '100'}
+    """
+    # Each item in 'stack' is a list containing the key of an open block, a
+    # dictionary of its key / value pairs, and a list of its single words.
+    stack = list()
+
+    def close_block():
+        key, items, words = stack.pop()
+        if not stack:
+            for word in words:
+                items.setdefault(word, None)
+            return key, items
+        if words and not items:
+            value = words
+        elif items:
+            for word in words:
+                items.setdefault(word, None)
+            value = items
+        else:
+            value = list()
+        stack[-1][1][key] = value
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        if line == '}':
+            if stack:
+                obj = close_block()
+                if obj:
+                    yield obj
+
+        elif line.endswith('{ }'):
+            key = line[:-3].rstrip()
+            if stack:
+                stack[-1][1][key] = list()
+            else:
+                yield key, dict()
+
+        elif line.endswith('{'):
+            stack.append([line[:-1].rstrip(), dict(), list()])
+
+        else:
+            parts = line.split(None, 1)
+            if len(parts) == 1:
+                key, value = parts[0], None
+            else:
+                key, value = parts
+                if len(value) > 1 and value[0] == '"' and value[-1] == '"':
+                    value = value[1:-1]
+            if not stack:
+                yield key, value
+            elif value is None:
+                stack[-1][2].append(key)
+            else:
+                stack[-1][1][key] = value
+
+    # Close any blocks that were left open by truncated output.
+    while stack:
+        obj = close_block()
+        if obj:
+            yield obj
+
+
 def convert_tmsh_output_to_dict(in_data):
     """Converts F5 'tmsh list' output to a Python dictionary.
 
     Parameters
     ----------
-    in_data : str
-        The output to convert to a dictionary.
+    in_data : str or list
+        The output to convert to a dictionary, either as a string or as a list
+        of lines.
 
     Returns
     ----------
     out : dict
         'in_data' formatted as a Python dictionary.
 
+    See Also
+    ----------
+    iter_tmsh_objects : The parser used by this function. It can also be used
+                        to process one top-level object at a time.
+
     Notes
     ----------
     F5 'tmsh list' output is close enough to a Python dictionary or JSON to be
@@ -94,27 +284,6 @@ def convert_tmsh_output_to_dict(in_data):
     Rule 4: If a line contains a single word followed by '{ }', then '{ }'
             indicates an empty array.
 
-    By combining these rules, we can create a relatively simple parser that
-    will convert the output to a Python dictionary. It works like this:
-
-    1. The rules listed above are used to format each line of the output into
-       a form that is a valid part of a Python dictionary. For example, the
-       line 'net vlan VLAN1 {' becomes, '"net vlan VLAN1": {'.
-
-    2. Each line is added to a list.
-
-    3. Any additional formatting is completed.
-
-    4. The list is joined to create a string.
-
-    5. A simple string.replace() inserts any commas that are missing between a
-       '}' and a '"'. (It was easier to do it this way than to embed the logic
-       inside the parser.)
-
-    6. Formatting is finalized.
-
-    7. ast.literal_eval is used to convert 'out' into a dictionary.
-
     Examples
     ----------
 >>> in_data = '''net interface 1.0 {
@@ -134,84 +303,10 @@ def convert_tmsh_output_to_dict(in_data):
 >>> assert type(output) == dict()
 
     """
-    # Convert the data to a list and strip all spaces.
-    in_data = [_.strip() for _ in in_data.split('\n')]
-
-    # Create a list to store each line of the formatted data. Begin the list
-    # with a '{'.
-    out = ['{']
-
-    for line in in_data:
-        # Format lines that look like the following:
-        # 'net interface mgmt {'
-        # 'net self BIGIQ {'
-        # 'net vlan SERVERS {'
-        if len(line.split('{')) > 1 and '}' not in line:
-            line = line.replace(' {', '": {')
-            line = f'"{line}'
-
-        # Format lines that look like the following:
-        # 'fwd-mode l3'
-        # 'vendor "F5 NETWORKS INC."'
-        # 'module-description "F5 Qualified Optic"'
-        # 'tcp:ssh'
-        # 'default'
-        if '{' not in line and '}' not in line:
-            if len(line.split()) > 1:
-                if '"' in line:
-                    line = line.split('"')
-                    line = list(filter(None, line))
-                    line = [_.strip() for _ in line]
-                else:
-                    line = line.split()
-                line = [f'"{_}"' for _ in line]
-                line = ': '.join(line)
-                line = f'{line},'
-            else:
-                line = f'"{line}",'
-
-        # Format lines that look like the following:
-        # '2.0 { }'
-        elif '{' in line and '}' in line:
-            line = f'"{line.split()[0]}": [],'
-
-        out.append(line)
-
-    # Additional formatting needs to be done, so create a dictionary to store
-    # the line numbers that require updates. Each key will be the line number
-    # and the value will be the formatted line.
-    replacements = dict()
-
-    counter = 0
-    for line in out:
-        # Check each line to find out if it is a member of an array. If it is,
-        # then do the following:
-        # 1. Convert the leading or trailing '{' or '}' to a '[' or ']'.
-        # 2. Insert a comma so ast.literal_eval can convert it to a list item.
-        if '{' in line:
-            if len(out[counter+1].split()) == 1:
-                replacements[counter] = line.replace('{', '[')
-        if '}' in line:
-            if len(out[counter-1].split()) == 1:
-                if '}' not in out[counter-1]:
-                    replacements[counter] = line.replace('}', '],')
-        counter += 1
-
-    # Update 'out' with the data from 'replacements'.
-    for key, value in replacements.items():
-        out[key] = value
-
-    # Add a trailing '}' to 'out'.
-    out.append('}')
-
-    # Convert 'out' to a string.
-    out = ''.join(out)
-
-    # Add a comma between '}' and '".
-    out = out.replace('}"', '},"')
-
-    # Convert 'out' to a dictionary
-    out = ast.literal_eval(out)
+    if isinstance(in_data, str):
+        in_data = in_data.split('\n')
+
+    out = dict(iter_tmsh_objects(in_data))
 
     return out
 
@@ -257,15 +352,12 @@ def get_arp_table(username,
 
     playbook = f'{play_path}/f5_run_adhoc_command.yml'
 
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Create a list to store the ARP data for `df`.
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
             device = event_data['remote_addr']
@@ -328,64 +420,31 @@ def get_self_ips(username,
 
     playbook = f'{play_path}/f5_run_adhoc_command.yml'
 
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Create a dictionary to store each self IP.
     data = dict()
 
-    # Create a dictionary to store the data for `df`
-    df_data = dict()
-
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
             device = event_data['remote_addr']
             data[device] = list()
             output = event_data['res']['stdout_lines'][0]
 
-            # Parse the output and add it to `data``
-            counter = 0
-            for line in output:
-                if line[:8] == 'net self':
-                    block = list()
-                    pos = counter
-                    while output[pos][0] != '}':
-                        block.append(output[pos])
-                        pos += 1
-                    block.append('}')
-
-                    # Convert the block to a dictionary then flatten it.
-                    # pprint(block)
-                    block = '\n'.join(block)
-                    block = convert_tmsh_output_to_dict(block)
-
-                    for key, value in block.items():
-                        self_name = key.split()[-1]
-                        value['name'] = self_name
-
-                    # Add the device name to `value`, then add `block` to
-                    # `data`.
-                    value['device'] = device
-                    data[device].append(value)
-
-                    # Add each key in `block` to `df_data`.
-                    for key in value:
-                        if not df_data.get(key):
-                            df_data[key] = list()
-
-                counter += 1
+            # Parse the output one object at a time and add it to `data`
+            for key, value in iter_tmsh_objects(output):
+                if key[:8] != 'net self' or not isinstance(value, dict):
+                    continue
+                value['name'] = key.split()[-1]
 
-    # Iterate over `data`, adding the values to `df_data`.
-    for key, value in data.items():
-        for item in value:
-            for k in df_data:
-                df_data[k].append(item.get(k))
+                # Add the device name to `value`, then add it to `data`.
+                value['device'] = device
+                data[device].append(value)
 
     # Create `df`.
-    df = pd.DataFrame.from_dict(df_data).astype(str)
+    records = [item for value in data.values() for item in value]
+    df = hp.records_to_df(records, columns=['device']).astype(str)
 
     # Make `device` the first column, then return `df`.
     col_1 = df.pop('device')
@@ -436,14 +495,11 @@ def get_interface_descriptions(username,
 
     # Execute the command and parse the results
     playbook = f'{play_path}/f5_get_interface_description.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Create a list to store the rows for the dataframe
     df_data = list()
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -496,15 +552,12 @@ def get_interface_status(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/f5_get_interface_status.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Parse the output and add it to 'data'
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -598,17 +651,14 @@ def get_node_availability(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/f5_get_node_availability.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     df_data = dict()
     df_data['device'] = list()
     df_data['partition'] = list()
     df_data['node'] = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -664,7 +714,8 @@ def get_pool_availability(username,
                           host_group,
                           play_path,
                           private_data_dir,
-                          validate_certs=True):
+                          validate_certs=True,
+                          on_device=None):
     '''
     Gets pool availability from F5 LTMs.
 
@@ -676,6 +727,11 @@ def get_pool_availability(username,
         private_data_dir (str): Path to the Ansible private data directory
         nm_path (str):          The path to the Net-Manage repository
         validate_certs (bool):  Whether to validate SSL certificates
+        on_device (function):   A function to call with each device's pools
+                                as soon as they are parsed (E.g., to write
+                                them to the database). If it is given, the
+                                devices' pools are not kept, and an empty
+                                DataFrame is returned.
 
     Returns:
         df_pools (DataFrame):   The pool availability and associated data
@@ -690,17 +746,28 @@ def get_pool_availability(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/f5_get_pool_availability.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
+
+    cols = ['device',
+            'partition',
+            'pool',
+            'availability',
+            'state',
+            'total',
+            'avail',
+            'cur',
+            'min',
+            'reason']
+
+    # Create a list to store the pools of each device
+    frames = list()
 
     # Parse the pool data and add it to two dictionaries--'pools' and
     # 'pool_members'. The data from those dictionaries will be used to
     # create the two dataframes
     pools = dict()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -751,42 +818,40 @@ def get_pool_availability(username,
                             break
                 pos += 1
 
-    df_pools_data = list()
-    for key, value in pools.items():
-        for k, v in value.items():
-            pool = k
-            device = v['device']
-            available = v['available']
-            availability = v['availability']
-            current_active = v['current_active']
-            minimum_active = v['minimum_active']
-            partition = v['partition']
-            reason = v['reason']
-            state = v['state']
-            total = v['total']
-            df_pools_data.append([device,
-                                  partition,
-                                  pool,
-                                  availability,
-                                  state,
-                                  total,
-                                  available,
-                                  current_active,
-                                  minimum_active,
-                                  reason])
-
-    cols = ['device',
-            'partition',
-            'pool',
-            'availability',
-            'state',
-            'total',
-            'avail',
-            'cur',
-            'min',
-            'reason']
+            # Create the rows for the device's pools
+            df_pools_data = list()
+            for k, v in pools.pop(device).items():
+                pool = k
+                device = v['device']
+                available = v['available']
+                availability = v['availability']
+                current_active = v['current_active']
+                minimum_active = v['minimum_active']
+                partition = v['partition']
+                reason = v['reason']
+                state = v['state']
+                total = v['total']
+                df_pools_data.append([device,
+                                      partition,
+                                      pool,
+                                      availability,
+                                      state,
+                                      total,
+                                      available,
+                                      current_active,
+                                      minimum_active,
+                                      reason])
+
+            df_pools = pd.DataFrame(data=df_pools_data, columns=cols)
+
+            # Hand off the device's pools now if the caller is streaming the
+            # output. Otherwise keep them for the result.
+            if on_device:
+                on_device(df_pools)
+            else:
+                frames.append(df_pools)
 
-    df_pools = pd.DataFrame(data=df_pools_data, columns=cols)
+    df_pools = hp.combine_frames(frames, cols)
 
     return df_pools
 
@@ -819,15 +884,14 @@ def get_pool_data(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/f5_get_pool_data.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True,
-                                quiet=True)
+    runner = hp.ansible_run_events(private_data_dir,
+                                   playbook,
+                                   extravars,
+                                   quiet=True)
 
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
             device = event_data['remote_addr']
@@ -919,15 +983,12 @@ def get_pool_member_availability(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/f5_get_pool_member_availability.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     df_data = list()
     # df_dict = dict()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -996,71 +1057,16 @@ def get_pools_and_members(username,
     Returns:
         df_pools (DataFrame):   The F5 pools and members
     '''
-    extravars = {'username': username,
-                 'password': password,
-                 'host_group': host_group}
-
-    if not validate_certs:
-        extravars['validate_certs'] = 'no'
-
-    # Execute the pre-checks
     playbook = f'{play_path}/f5_get_pools_and_members.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True,
-                                quiet=True)
+    outputs = run_summary_playbook(username,
+                                   password,
+                                   host_group,
+                                   playbook,
+                                   private_data_dir,
+                                   validate_certs=validate_certs)
 
-    df_data = dict()
-    df_data['device'] = list()
-    df_data['partition'] = list()
-    df_data['pool'] = list()
-    df_data['member'] = list()
-    df_data['address'] = list()
-
-    for event in runner.events:
-        if event['event'] == 'runner_on_ok':
-            event_data = event['event_data']
-
-            device = event_data['remote_addr']
-
-            output = event_data['res']['stdout_lines'][0]
+    df_pools = parse_pools_and_members(outputs)
 
-            for line in output:
-                if 'ltm pool ' in line:
-                    pos = output.index(line)+1
-                    if '/' in line:
-                        name = line.split()[-1]
-                        partition = name.split('/')[1]
-                        pool = name.split('/')[-1]
-                    else:
-                        partition = 'Common'
-                        pool = line.split()[-1]
-
-                    addresses = False
-
-                    if pos < len(output):
-                        while 'ltm pool ' not in output[pos]:
-                            if 'address' in output[pos]:
-                                addresses = True
-                                df_data['device'].append(device)
-                                df_data['partition'].append(partition)
-                                df_data['pool'].append(pool)
-                                member = output[pos-1].split()[0]
-                                address = output[pos].split()[-1]
-                                df_data['member'].append(member)
-                                df_data['address'].append(address)
-                            pos += 1
-                            if pos == len(output):
-                                break
-                    if not addresses:
-                        df_data['device'].append(device)
-                        df_data['partition'].append(partition)
-                        df_data['pool'].append(pool)
-                        df_data['member'].append(str())
-                        df_data['address'].append(str())
-
-    df_pools = pd.DataFrame.from_dict(df_data)
     return df_pools
 
 
@@ -1095,15 +1101,14 @@ def get_vip_availability(username,
 
     # Execute the pre-checks
     playbook = f'{play_path}/f5_get_vip_availability_and_destination.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True,
-                                quiet=True)
+    runner = hp.ansible_run_events(private_data_dir,
+                                   playbook,
+                                   extravars,
+                                   quiet=True)
 
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -1213,94 +1218,21 @@ def get_vip_summary(username,
         private_data_dir (str): Path to the Ansible private data directory
         df_pools (obj):         A DataFrame containing a summary of the pools
                                 and members. This is created with the
-                                'f5_build_pool_table' function.
+                                'get_pools_and_members' function.
         validate_certs (bool):  Whether to validate SSL certificates
 
     Returns:
         df_vips (DataFrame):    The F5 VIP summary
     '''
-    extravars = {'username': username,
-                 'password': password,
-                 'host_group': host_group}
-
-    if not validate_certs:
-        extravars['validate_certs'] = 'no'
-
-    # Execute the pre-checks
     playbook = f'{play_path}/f5_get_vip_summary.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True,
-                                quiet=True)
-
-    df_data = dict()
-    df_data['device'] = list()
-    df_data['partition'] = list()
-    df_data['vip'] = list()
-    df_data['destination'] = list()
-    df_data['pool'] = list()
-    df_data['member'] = list()
-    df_data['address'] = list()
-
-    for event in runner.events:
-        if event['event'] == 'runner_on_ok':
-            event_data = event['event_data']
-
-            device = event_data['remote_addr']
-
-            output = event_data['res']['stdout_lines'][0]
-
-            for line in output:
-                if 'ltm virtual ' in line:
-                    name = line.split()[-2]
-                    if '/' in name:
-                        partition = name.split('/')[1]
-                        vip = name.split('/')[-1]
-                    else:
-                        partition = 'Common'
-                        vip = name
-
-                    destination = str()
-                    pool = str()
-                    member = str()
-                    address = str()
-
-                    pos = output.index(line)+1
-                    if pos < len(output):
-                        while 'ltm virtual ' not in output[pos]:
-                            if output[pos].split()[0] == 'destination':
-                                destination = output[pos].split('/')[-1]
-                            if output[pos].split()[0] == 'pool':
-                                pool = output[pos].split('/')[-1]
-                            pos += 1
-                            if pos == len(output):
-                                break
-                    if pool:
-
-                        df_members = df_pools.loc[(df_pools['partition'] ==
-                                                   partition) &
-                                                  (df_pools['pool'] == pool)]
-                        if len(df_members) > 0:
-                            for idx, row in df_members.iterrows():
-                                member = row['member']
-                                address = row['address']
-                                df_data['device'].append(device)
-                                df_data['partition'].append(partition)
-                                df_data['vip'].append(vip)
-                                df_data['destination'].append(destination)
-                                df_data['pool'].append(pool)
-                                df_data['member'].append(member)
-                                df_data['address'].append(address)
-                    df_data['device'].append(device)
-                    df_data['partition'].append(partition)
-                    df_data['vip'].append(vip)
-                    df_data['destination'].append(destination)
-                    df_data['pool'].append(pool)
-                    df_data['member'].append(member)
-                    df_data['address'].append(address)
+    outputs = run_summary_playbook(username,
+                                   password,
+                                   host_group,
+                                   playbook,
+                                   private_data_dir,
+                                   validate_certs=validate_certs)
 
-    df_vips = pd.DataFrame.from_dict(df_data)
+    df_vips = parse_vip_summary(outputs, df_pools)
 
     return df_vips
 
@@ -1346,7 +1278,7 @@ def get_vip_summary(username,
 #     df_vip_data['port'] = list()
 #     df_vip_data['pool'] = list()
 
-#     for event in runner.events:
+#     for event in runner:
 #         if event['event'] == 'runner_on_ok':
 #             event_data = event['event_data']
 #             device = event_data['remote_addr']
@@ -1404,14 +1336,11 @@ def get_vlan_db(username,
         extravars['validate_certs'] = 'no'
 
     playbook = f'{play_path}/f5_get_vlan_database.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     df_data = list()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
 
@@ -1486,67 +1415,195 @@ def get_vlans(username,
 
     playbook = f'{play_path}/f5_run_adhoc_command.yml'
 
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     # Create a dictionary to store each self IP.
     data = dict()
 
-    # Create a dictionary to store the data for `df`
-    df_data = dict()
-
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             event_data = event['event_data']
             device = event_data['remote_addr']
             data[device] = list()
             output = event_data['res']['stdout_lines'][0]
 
-            # Parse the output and add it to `data``
-            counter = 0
-            for line in output:
-                if line[:8] == 'net vlan':
-                    block = list()
-                    pos = counter
-                    while output[pos][0] != '}':
-                        block.append(output[pos])
-                        pos += 1
-                    block.append('}')
-
-                    # Convert the block to a dictionary then flatten it.
-                    # pprint(block)
-                    block = '\n'.join(block)
-                    block = convert_tmsh_output_to_dict(block)
+            # Parse the output one object at a time and add it to `data`
+            for key, value in iter_tmsh_objects(output):
+                if key[:8] != 'net vlan' or not isinstance(value, dict):
+                    continue
+                value['name'] = key.split()[-1]
 
-                    for key, value in block.items():
-                        self_name = key.split()[-1]
-                        value['name'] = self_name
-
-                    # Add the device name to `value`, then add `block` to
-                    # `data`.
-                    value['device'] = device
-                    data[device].append(value)
-
-                    # Add each key in `block` to `df_data`.
-                    for key in value:
-                        if not df_data.get(key):
-                            df_data[key] = list()
-
-                counter += 1
-
-    # Iterate over `data`, adding the values to `df_data`.
-    for key, value in data.items():
-        for item in value:
-            for k in df_data:
-                df_data[k].append(item.get(k))
+                # Add the device name to `value`, then add it to `data`.
+                value['device'] = device
+                data[device].append(value)
 
     # Create `df`.
-    df = pd.DataFrame.from_dict(df_data).astype(str)
+    records = [item for value in data.values() for item in value]
+    df = hp.records_to_df(records, columns=['device']).astype(str)
 
     # Make `device` the first column, then return `df`.
     col_1 = df.pop('device')
     df.insert(0, 'device', col_1)
 
     return df
+
+
+def run_summary_playbook(username,
+                         password,
+                         host_group,
+                         playbook,
+                         private_data_dir,
+                         validate_certs=False):
+    '''
+    Runs one of the playbooks used to build the pool and VIP summaries.
+
+    Args:
+        username (str):         The username to login to devices
+        password (str):         The password to login to devices
+        host_group (str):       The inventory host group
+        playbook (str):         The path to the playbook
+        private_data_dir (str): Path to the Ansible private data directory
+        validate_certs (bool):  Whether to validate SSL certificates
+
+    Returns:
+        outputs (dict):         The output lines for each device
+    '''
+    extravars = {'username': username,
+                 'password': password,
+                 'host_group': host_group}
+
+    if not validate_certs:
+        extravars['validate_certs'] = 'no'
+
+    runner = hp.ansible_run_events(private_data_dir,
+                                   playbook,
+                                   extravars,
+                                   quiet=True)
+
+    outputs = dict()
+    for event in runner:
+        if event['event'] == 'runner_on_ok':
+            event_data = event['event_data']
+            device = event_data['remote_addr']
+            outputs[device] = event_data['res']['stdout_lines'][0]
+
+    return outputs
+
+
+def parse_pools_and_members(outputs):
+    '''
+    Parses the output of the 'f5_get_pools_and_members' playbook. Each line
+    is read once. A pool's members are the 'address' lines that follow it,
+    and the member name is on the line before each address.
+
+    Args:
+        outputs (dict):         The output lines for each device
+
+    Returns:
+        df_pools (DataFrame):   The F5 pools and members
+    '''
+    rows = list()
+    for device, output in outputs.items():
+        partition = str()
+        pool = None
+        addresses = False
+        previous = str()
+        for line in output:
+            if 'ltm pool ' in line:
+                # Pools without members get a row with an empty member
+                if pool is not None and not addresses:
+                    rows.append((device, partition, pool, str(), str()))
+                name = line.split()[2]
+                if '/' in name:
+                    partition = name.split('/')[1]
+                    pool = name.split('/')[-1]
+                else:
+                    partition = 'Common'
+                    pool = name
+                addresses = False
+            elif pool is not None and 'address' in line:
+                member = previous.split()[0]
+                address = line.split()[-1]
+                rows.append((device, partition, pool, member, address))
+                addresses = True
+            previous = line
+        if pool is not None and not addresses:
+            rows.append((device, partition, pool, str(), str()))
+
+    cols = ['device', 'partition', 'pool', 'member', 'address']
+    df_pools = pd.DataFrame(rows, columns=cols)
+
+    return df_pools
+
+
+def parse_vip_summary(outputs, df_pools):
+    '''
+    Parses the output of the 'f5_get_vip_summary' playbook and correlates
+    each VIP with the members of its pool. Each line is read once, and the
+    pool members are looked up in a dictionary keyed by device, partition
+    and pool.
+
+    Args:
+        outputs (dict):         The output lines for each device
+        df_pools (DataFrame):   The F5 pools and members. This is created
+                                with the 'parse_pools_and_members' function.
+
+    Returns:
+        df_vips (DataFrame):    The F5 VIP summary
+    '''
+    # Index the members of each pool
+    members = dict()
+    if len(df_pools) > 0:
+        pools = df_pools[['device', 'partition', 'pool', 'member', 'address']]
+        for row in pools.itertuples(index=False, name=None):
+            members.setdefault(row[:3], list()).append(row[3:])
+
+    rows = list()
+
+    def add_vip():
+        # VIPs with no pool, or whose pool has no members, get a single row
+        # with an empty member
+        key = (device, partition, pool)
+        for member, address in members.get(key) or [(str(), str())]:
+            rows.append((device,
+                         partition,
+                         vip,
+                         destination,
+                         pool,
+                         member,
+                         address))
+
+    for device, output in outputs.items():
+        vip = None
+        for line in output:
+            if 'ltm virtual ' in line:
+                if vip is not None:
+                    add_vip()
+                name = line.split()[2]
+                if '/' in name:
+                    partition = name.split('/')[1]
+                    vip = name.split('/')[-1]
+                else:
+                    partition = 'Common'
+                    vip = name
+                destination = str()
+                pool = str()
+            elif vip is not None:
+                words = line.split()
+                if words and words[0] == 'destination':
+                    destination = words[-1].split('/')[-1]
+                if words and words[0] == 'pool':
+                    pool = words[-1].split('/')[-1]
+        if vip is not None:
+            add_vip()
+
+    cols = ['device',
+            'partition',
+            'vip',
+            'destination',
+            'pool',
+            'member',
+            'address']
+    df_vips = pd.DataFrame(rows, columns=cols)
+
+    return df_vips
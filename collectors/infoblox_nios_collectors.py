@@ -5,9 +5,10 @@ A collection of collectors for the NIOS (Infoblox) operating system.
 '''
 
 import ipaddress as ip
-import pandas as pd
 
+from helpers import client_helpers as clh
 from helpers import helpers as hp
+from helpers import ip_helpers as iph
 
 from infoblox_client import connector
 
@@ -51,7 +52,13 @@ def create_connector(host, username, password, validate_certs=True):
             'ssl_verify': validate_certs}
     if not validate_certs:
         opts['silent_ssl_warnings'] = True
-    conn = connector.Connector(opts)
+
+    # Reuse the connector (and its session) if one was already created for
+    # the grid and credentials
+    conn = clh.get_client('infoblox',
+                          host,
+                          (username, password, validate_certs),
+                          lambda: connector.Connector(opts))
     return conn
 
 
@@ -98,19 +105,8 @@ def get_network_containers(host,
     # Get the network containers
     response = conn.get_object('networkcontainer', paging=paging)
 
-    # Create the dictionary to store the data needed to create the DataFrame,
-    # then interate over 'response' to create the keys
-    df_data = dict()
-    for item in response:
-        for key, value in item.items():
-            df_data[key] = list()
-
-    # Populate 'df_data'
-    for item in response:
-        for key in df_data:
-            df_data[key].append(item.get(key))
-
-    df = pd.DataFrame.from_dict(df_data)
+    # Create the DataFrame
+    df = hp.records_to_df(response)
 
     return df
 
@@ -148,57 +144,32 @@ def get_networks_parent_containers(db_path):
     # 'get_network_containers' collectors, so we only need the timestamp for
     # one of the tables.)
     table = 'INFOBLOX_GET_NETWORKS'
-    query = f'SELECT DISTINCT timestamp FROM {table}'
-    last_ts = pd.read_sql(query, con)['timestamp'].to_list()[-1]
+    last_ts = hp.get_latest_snapshot(con, table)
 
     # Get all the networks
-    query = ['SELECT network, network_view',
-             f'FROM {table}',
-             f'WHERE timestamp = "{last_ts}"']
-    query = ' '.join(query)
-    df = pd.read_sql(query, con)
+    cols = ['network', 'network_view']
+    df = hp.read_snapshot(con, table, last_ts, cols)
 
     # Get all the network containers
     table = 'INFOBLOX_GET_NETWORK_CONTAINERS'
-    query = ['SELECT network, network_view',
-             f'FROM {table}',
-             f'WHERE timestamp = "{last_ts}"']
-    query = ' '.join(query)
-    df_containers = pd.read_sql(query, con)
-
-    # Create a list of distinct network views
-    views = df_containers['network_view'].to_list()
-    views = [*set(views)]
-
-    # Create a dictionary of the containers, where each key is a unique view,
-    # and the value is a list of network containers, sorted from smallest to
-    # largest
-    containers = dict()
-    for view in views:
-        u_containers = df_containers.loc[df_containers['network_view'] == view]
-        u_containers = u_containers['network'].to_list()
-        u_containers = [ip.ip_network(_, strict=False) for _ in u_containers]
-        u_containers = sorted(u_containers, key=ip.ip_network, reverse=True)
-        containers[view] = u_containers
-
-    # Iterate over the networks, mapping each network to its parent container
-    # for its view. Infoblox supports nested containers, so the loop breaks
-    # when the first valid parent is reached. (That is why 'u_containers' for
-    # each view is sorted from the smallest to largest container.)
+    df_containers = hp.read_snapshot(con, table, last_ts, cols)
+
+    # Create a longest-prefix-match index of the containers in each view.
+    # Infoblox supports nested containers, so each network is mapped to the
+    # most specific container that contains it.
+    indexes = dict()
+    for view, u_containers in df_containers.groupby('network_view'):
+        indexes[view] = iph.build_prefix_index(u_containers['network'])
+
+    # Map each network to its parent container for its view
     parent_containers = list()
-    not_found = list()
-    for idx, row in df.iterrows():
-        found = False
-        network = ip.ip_network(row['network'], strict=False)
-        view = row['network_view']
-        for container in containers[view]:
-            if network.subnet_of(container):
-                parent_containers.append(str(container))
-                found = True
-                break
-        if not found:
-            parent_containers.append('orphan')
-            not_found.append(network)
+    for network, view in zip(df['network'], df['network_view']):
+        parent = iph.find_longest_prefix(indexes.get(view, dict()),
+                                         network,
+                                         default='orphan')
+        if parent != 'orphan':
+            parent = str(ip.ip_network(parent, strict=False))
+        parent_containers.append(parent)
 
     # Add the parent containers to 'df_networks'
     df['network_container'] = parent_containers
@@ -249,19 +220,8 @@ def get_networks(host,
     # Get the network containers
     response = conn.get_object('network', paging=paging)
 
-    # Create the dictionary to store the data needed to create the DataFrame,
-    # then interate over 'response' to create the keys
-    df_data = dict()
-    for item in response:
-        for key, value in item.items():
-            df_data[key] = list()
-
-    # Populate 'df_data'
-    for item in response:
-        for key in df_data:
-            df_data[key].append(item.get(key))
-
-    df = pd.DataFrame.from_dict(df_data)
+    # Create the DataFrame
+    df = hp.records_to_df(response)
 
     return df
 
@@ -309,19 +269,8 @@ def get_vlan_ranges(host,
     # Get the network containers
     response = conn.get_object('vlanrange', paging=paging)
 
-    # Create the dictionary to store the data needed to create the DataFrame,
-    # then interate over 'response' to create the keys
-    df_data = dict()
-    for item in response:
-        for key in item:
-            df_data[key] = list()
-
-    # Populate 'df_data'
-    for item in response:
-        for key in df_data:
-            df_data[key].append(item.get(key))
-
-    df = pd.DataFrame.from_dict(df_data).astype('str')
+    # Create the DataFrame
+    df = hp.records_to_df(response).astype('str')
 
     return df
 
@@ -369,18 +318,7 @@ def get_vlans(host,
     # Get the network containers
     response = conn.get_object('vlan', paging=paging)
 
-    # Create the dictionary to store the data needed to create the DataFrame,
-    # then interate over 'response' to create the keys
-    df_data = dict()
-    for item in response:
-        for key in item:
-            df_data[key] = list()
-
-    # Populate 'df_data'
-    for item in response:
-        for key in df_data:
-            df_data[key].append(item.get(key))
-
-    df = pd.DataFrame.from_dict(df_data).astype('str')
+    # Create the DataFrame
+    df = hp.records_to_df(response).astype('str')
 
     return df
@@ -5,12 +5,12 @@ Define Meraki collectors.
 '''
 
 import json
-import meraki
 import pandas as pd
 import run_collectors as rc
 import sqlite3 as sl
 
 from helpers import helpers as hp
+from helpers import meraki_helpers as mh
 from meraki.exceptions import APIError
 
 
@@ -115,90 +115,78 @@ def get_network_appliance_vlans(ansible_os: str,
         return pd.DataFrame()
 
     # If 'networks' is empty and 'orgs' is not, get all applicable networks in
-    # the orgs.
+    # the orgs. The org of each network is used to apply the rate limit.
+    org_ids = dict()
     if orgs and not networks:
-        joined_orgs = [f'"{_}"' for _ in orgs]
-        joined_orgs = ', '.join(joined_orgs)
-
         con = sl.connect(db_path)
 
-        # Get the last timestamp in the MERAKI_ORG_NETWORKS table.
-        query = '''SELECT distinct timestamp
-        FROM meraki_org_networks
-        ORDER BY timestamp desc
-        LIMIT 1
-        '''
-        result = pd.read_sql(query, con)
-        ts = result['timestamp'].to_list().pop()
-
-        # Get the unique network IDs for the most recent timestamp.
-        query = f'''SELECT distinct id
-        FROM meraki_org_networks
-        WHERE productTypes like "%appliance%"
-            AND timestamp = "{ts}"
-            AND organizationId IN ({joined_orgs})'''
-        result = pd.read_sql(query, con)
+        # Get the unique appliance network IDs from the latest snapshot of the
+        # MERAKI_ORG_NETWORKS table.
+        result = hp.read_snapshot(con,
+                                  'meraki_org_networks',
+                                  columns=['id',
+                                           'organizationId',
+                                           'productTypes'])
+        con.close()
+        result = result[
+            result['productTypes'].astype(str).str.contains('appliance') &
+            result['organizationId'].isin(orgs)]
+        result = result.drop_duplicates(subset=['id', 'organizationId'])
         networks = result['id'].to_list()
+        org_ids = dict(zip(result['id'], result['organizationId']))
 
     # Get the appliance vlans for each network. Note: if 'orgs' and 'networks'
     # are both non-empty, then 'orgs' is ignored. The list of networks takes
     # priority.
-    dashboard = meraki.DashboardAPI(api_key=api_key, suppress_logging=True)
-
+    #
     # The only way to get appliance VLANs is to iterate over a list of
-    # networks. There is not a way to gather them for an organization. I found
-    # that it takes about 1 minute per 100 networks. The Meraki API
-    # automatically throttles requests (it uses a bucket token system), so
-    # there isn't a way to speed it up.
+    # networks. There is not a way to gather them for an organization. The
+    # requests are made concurrently by mh.fetch_concurrently, which keeps
+    # each org within the Dashboard API rate limit (about 10 requests per
+    # second).
     #
-    # Therefore, we process the networks in batches of 's_len'. This has two
-    # advantages:
-    # 1. Conserves memory. This is done by adding each batch to the database
-    #    then recreating the DataFrame.
-    # 2. Display progress to the end user.
-    s_len = 50  # Set the size of each slice (batch).
-    slices = list()
-    # Create a list of slices.
-    while networks:
-        slices.append(networks[:s_len])
-        if len(networks) >= s_len:
-            networks = networks[s_len:]
-        else:
-            networks = list()
-
-    # Iterate over the slices, adding each slice to the database and displaying
-    # progress to the end user.
-    counter = 1
-    total = len(slices)
-    for slice in slices:
-        _ = len(slice)
+    # Each network is added to the database as soon as it is received, which
+    # conserves memory. Progress is displayed to the end user every 's_len'
+    # networks.
+    s_len = 50  # Set the size of each batch.
+    total = len(networks)
+    calls = mh.fetch_concurrently(api_key,
+                                  'appliance.getNetworkApplianceVlans',
+                                  networks,
+                                  org_ids=org_ids)
+    df = pd.DataFrame()
+    for count, (network, result, error) in enumerate(calls):
         # Display progress to the end user.
-        print(f'Processing {_} networks (batch {counter} of {total})...')
-
-        for network in slice:
-            df = pd.DataFrame()
-            try:
-                result = dashboard.appliance.getNetworkApplianceVlans(network)
-                # Create the DataFrame and add it to the database.
-                df = pd.DataFrame(result).astype(str)
-                # Add the subnets, network IPs, and broadcast IPs.
-                addresses = df['subnet'].to_list()
-                del df['subnet']
-                result = hp.generate_subnet_details(addresses)
-                df['subnet'] = result['subnet']
-                df['network_ip'] = result['network_ip']
-                df['broadcast_ip'] = result['broadcast_ip']
-                # Add the DataFrame to the database.
-                rc.add_to_db(collector,
-                             f'{ansible_os.split(".")[-1]}_{collector}',
-                             df,
-                             timestamp,
-                             db_path,
-                             'append',
-                             list())
-            except APIError:
-                pass
-        counter += 1
+        if count % s_len == 0:
+            _ = min(count + s_len, total)
+            print(f'Processing networks {count + 1} to {_} of {total}...')
+
+        # Networks without VLANs enabled return an APIError.
+        if isinstance(error, APIError):
+            continue
+        if error:
+            raise error
+
+        try:
+            # Create the DataFrame and add it to the database.
+            df = pd.DataFrame(result).astype(str)
+            # Add the subnets, network IPs, and broadcast IPs.
+            addresses = df['subnet'].to_list()
+            del df['subnet']
+            result = hp.generate_subnet_details(addresses)
+            df['subnet'] = result['subnet']
+            df['network_ip'] = result['network_ip']
+            df['broadcast_ip'] = result['broadcast_ip']
+            # Add the DataFrame to the database.
+            rc.add_to_db(collector,
+                         f'{ansible_os.split(".")[-1]}_{collector}',
+                         df,
+                         timestamp,
+                         db_path,
+                         'append',
+                         list())
+        except APIError:
+            pass
 
     return df
 
@@ -223,35 +211,23 @@ def meraki_get_network_clients(api_key,
     # Create a list to store the individual clients for each network.
     data = list()
 
-    # Iterate over the network(s), gathering the clients and adding them to
+    # Gather the clients for the network(s) concurrently, adding them to
     # 'data'
-    dashboard = meraki.DashboardAPI(api_key=api_key, suppress_logging=True)
-    for network in networks:
-        clients = dashboard.networks.getNetworkClients(network,
-                                                       timespan=timespan,
-                                                       perPage=per_page,
-                                                       total_pages=total_pages)
+    calls = mh.fetch_concurrently(api_key,
+                                  'networks.getNetworkClients',
+                                  networks,
+                                  timespan=timespan,
+                                  perPage=per_page,
+                                  total_pages=total_pages)
+    for network, clients, error in calls:
+        if error:
+            raise error
         for client in clients:
             data.append(client)
 
-    # Create a dictionary to store the client data. It will be used to create
-    # 'df_clients'
-    df_data = dict()
-
-    # Each client is returned as a dictionary. Iterate over the keys in the
-    # dictionary and add them to 'df_data'. This requires iterating over all
-    # the clients twice, but it ensures that all keys are added to 'df_data'.
-    for client in data:
-        for key in client:
-            df_data[key] = list()
-
-    # Iterate over the clients, adding the data to 'df_data'
-    for client in data:
-        for key in df_data:
-            df_data[key].append(client.get(key))
-
-    # Create the dataframe and convert all datatypes to strings
-    df = pd.DataFrame.from_dict(df_data)
+    # Create the dataframe and convert all datatypes to strings. Each client
+    # is returned as a dictionary, and not all clients have the same keys.
+    df = hp.records_to_df(data)
     df = df.astype('str')
 
     # Create 'df_clients'. If the user has provided a list of MACs, then only
@@ -297,10 +273,6 @@ def meraki_get_network_devices(api_key, db_path, networks=list(), orgs=list()):
     Returns:
         df_devices (DataFrame): The device statuses for the network(s)
     '''
-    # Initialize Meraki dashboard
-    dashboard = meraki.DashboardAPI(api_key=api_key, suppress_logging=True)
-    app = dashboard.networks
-
     # This list will contain all of the devices for each network. It will be
     # used to create the dataframe. This method accounts for networks that have
     # different device types, since not all device types contain the same keys.
@@ -311,33 +283,21 @@ def meraki_get_network_devices(api_key, db_path, networks=list(), orgs=list()):
         print(df_networks)
         networks = df_networks['network_id'].to_list()
 
-    for net in networks:
-        # There is no easy way to check if the user's API key has access to
-        # each network, so this is wrapped in a try/except block.
-        try:
-            devices = app.getNetworkDevices(net)
-            for item in devices:
-                data.append(item)
-        except Exception as e:
-            print(str(e))
-
-    df_data = dict()
-
-    # Get all of the keys from devices in 'data', and add them as a key to
-    # 'df_data'. The value of the key in 'df_data' will be a list.
-    for item in data:
-        for key in item:
-            if not df_data.get(key):
-                df_data[key] = list()
-
-    # Iterate over the devices, adding the data for each device to
-    # 'df_data'
-    for item in data:
-        for key in df_data:
-            df_data[key].append(item.get(key))
+    # Gather the devices for the networks concurrently. There is no easy way
+    # to check if the user's API key has access to each network, so errors
+    # are printed and the network is skipped.
+    calls = mh.fetch_concurrently(api_key,
+                                  'networks.getNetworkDevices',
+                                  networks)
+    for net, devices, error in calls:
+        if error:
+            print(str(error))
+            continue
+        for item in devices:
+            data.append(item)
 
     # Create and return the dataframe
-    df_devices = pd.DataFrame.from_dict(df_data)
+    df_devices = hp.records_to_df(data)
 
     # Convert all data to a string. This is because Pandas incorrectly detects
     # the data type for latitude / longitude, which causes the table insertion
@@ -359,25 +319,25 @@ def meraki_get_network_device_statuses(db_path, networks):
     Returns:
         df_statuses (DataFrame):    A dataframe containing the device statuses
     '''
-    df_statuses = pd.DataFrame()
-
+    # Get the last timestamp at which each network was collected
+    table = 'meraki_org_device_statuses'
+    df_stamps = hp.get_first_last_timestamp(db_path, table, 'networkId')
+    df_stamps = df_stamps[df_stamps['networkId'].isin(networks)]
+
+    # Read the statuses of each network from the snapshot of its last
+    # timestamp. The snapshots are read with hp.read_snapshot, so that the
+    # table can be stored in 'delta' mode.
     con = sl.connect(db_path)
-
-    for network in networks:
-        query = f'''SELECT *
-        FROM meraki_org_device_statuses
-        WHERE networkId = "{network}"
-        ORDER BY timestamp desc
-        LIMIT 1
-        '''
-        result = pd.read_sql(query, con)
-        df_statuses = pd.concat([df_statuses, result])
-
+    frames = list()
+    for ts, group in df_stamps.groupby('last_ts'):
+        result = hp.read_snapshot(con, table, ts)
+        frames.append(result[result['networkId'].isin(group['networkId'])])
     con.close()
+    df_statuses = pd.concat(frames) if frames else pd.DataFrame()
 
     # Delete the 'table_id' column, since it was pulled from the
     # 'meraki_org_device_statuses' table and will need to be recreated
-    del df_statuses['table_id']
+    df_statuses = df_statuses.drop(columns=['table_id'], errors='ignore')
 
     return df_statuses
 
@@ -394,7 +354,7 @@ def meraki_get_organizations(api_key):
         df_orgs (list): A dataframe containing a list of organizations the
                         user's API key has access to
     '''
-    dashboard = meraki.DashboardAPI(api_key=api_key, suppress_logging=True)
+    dashboard = mh.create_dashboard(api_key)
 
     # Get the organizations the user has access to and add them to a dataframe
     orgs = dashboard.organizations.getOrganizations()
@@ -442,7 +402,7 @@ def meraki_get_org_devices(api_key, db_path, orgs=list()):
     organizations = hp.meraki_parse_organizations(db_path, orgs, table)
 
     # Initialize Meraki dashboard
-    dashboard = meraki.DashboardAPI(api_key=api_key, suppress_logging=True)
+    dashboard = mh.create_dashboard(api_key)
     app = dashboard.organizations
 
     # This list will contain all of the devices for each org. It will then be
@@ -459,23 +419,8 @@ def meraki_get_org_devices(api_key, db_path, orgs=list()):
                 item['orgId'] = org
                 data.append(item)
 
-    df_data = dict()
-    df_data['orgId'] = list()
-
-    # Get all of the keys from devices in 'data', and add them as a key to
-    # 'df_data'. The value of the key in 'df_data' will be a list.
-    for item in data:
-        for key in item:
-            if not df_data.get(key) and key != 'orgId':
-                df_data[key] = list()
-
-    # Iterate over the devices, adding the data for each device to 'df_data'
-    for item in data:
-        for key in df_data:
-            df_data[key].append(item.get(key))
-
     # Create and return the dataframe
-    df_devices = pd.DataFrame.from_dict(df_data)
+    df_devices = hp.records_to_df(data, columns=['orgId'])
 
     # Convert all data to a string. This is because Pandas incorrectly detects
     # the data type for latitude / longitude, which causes the table insertion
@@ -509,7 +454,7 @@ def meraki_get_org_device_statuses(api_key,
                                     SQL table index.
     '''
     # Initialize Meraki dashboard
-    dashboard = meraki.DashboardAPI(api_key=api_key, suppress_logging=True)
+    dashboard = mh.create_dashboard(api_key)
     app = dashboard.organizations
 
     # If the user did not specify any organization IDs, then get them by
@@ -533,23 +478,9 @@ def meraki_get_org_device_statuses(api_key,
                 item['orgId'] = org  # Add the orgId to each device status
                 data.append(item)
 
-    # Create the dictionary 'df_data' from the device statuses in 'data'.
-    # This method adds all possible keys from the devices to 'df_data' before
-    # adding the device statuses to 'df_data'. If a device status does not
-    # contain a particular key then it will be added as None
-    df_data = dict()
-    for item in data:
-        for key in item:
-            if not df_data.get(key):
-                df_data[key] = list()
-
-    # Populate 'df_data'
-    for item in data:
-        for key in df_data:
-            df_data[key].append(item.get(key))
-
-    # Create the dataframe and return it
-    df_statuses = pd.DataFrame.from_dict(df_data)
+    # Create the dataframe and return it. If a device status does not contain
+    # a particular key then it will be added as None
+    df_statuses = hp.records_to_df(data)
 
     # Set all datatypes to string. Otherwise it will fail when adding the
     # dataframe to the database
@@ -591,7 +522,7 @@ def meraki_get_org_networks(api_key,
         organizations = orgs
 
     # Initialize Meraki dashboard
-    dashboard = meraki.DashboardAPI(api_key=api_key, suppress_logging=True)
+    dashboard = mh.create_dashboard(api_key)
     app = dashboard.organizations
 
     # Create a list to store the results for all orgs. This is necessary to
@@ -599,7 +530,6 @@ def meraki_get_org_networks(api_key,
     # networks return the same keys)
     data = list()
 
-    df_data = dict()
     for org in organizations:
         if use_db:
             # Check if API access is enabled for the org
@@ -611,18 +541,7 @@ def meraki_get_org_networks(api_key,
             for item in networks:
                 data.append(item)
 
-    # Iterate over 'data', creating the keys for the DataFrame
-    for item in data:
-        for key in item:
-            if not df_data.get(key):
-                df_data[key] = list()
-
-    # Iterate over 'data', adding the networks to 'df_data'
-    for item in data:
-        for key in df_data:
-            df_data[key].append(item.get(key))
-
-    df_networks = pd.DataFrame.from_dict(df_data).astype(str)
+    df_networks = hp.records_to_df(data).astype(str)
 
     return df_networks
 
@@ -745,21 +664,23 @@ def meraki_get_switch_port_statuses(api_key, db_path, networks):
     con = sl.connect(db_path)
     df_ports = pd.read_sql(query, con)
 
-    # Initialize the dashboard
-    dashboard = meraki.DashboardAPI(api_key=api_key, suppress_logging=True)
-    app = dashboard.switch
-
-    # Get the port statuses for the switches in df_ports
+    # Get the port statuses for the switches in df_ports concurrently
+    serials = df_ports['serial'].to_list()
+    calls = mh.fetch_concurrently(api_key,
+                                  'switch.getDeviceSwitchPortsStatuses',
+                                  serials,
+                                  org_ids=dict(zip(serials,
+                                                   df_ports['orgId'])))
     data = dict()
-    for idx, row in df_ports.iterrows():
+    for (idx, row), (serial, ports, error) in zip(df_ports.iterrows(), calls):
+        if error:
+            raise error
         orgId = row['orgId']
         networkId = row['networkId']
         name = row['name']
-        serial = row['serial']
 
         data[serial] = dict()
 
-        ports = app.getDeviceSwitchPortsStatuses(serial)
         for port in ports:
             port_id = port['portId']
             data[serial][port_id] = dict()
@@ -770,27 +691,10 @@ def meraki_get_switch_port_statuses(api_key, db_path, networks):
             for key, value in port.items():
                 data[serial][port_id][key] = value
 
-    # Create a dictionary based on the contents of 'data'. This method ensures
-    # that all arrays are of equal length when we create the dataframe.
-    df_data = dict()
-    df_data['orgId'] = list()
-    df_data['networkId'] = list()
-    df_data['name'] = list()
-    df_data['serial'] = list()
-    for item in data:
-        device = data[item]
-        for port in device:
-            for key in device[port]:
-                if not df_data.get(key):
-                    df_data[key] = list()
-
-    for item in data:
-        device = data[item]
-        for port in device:
-            for key in df_data:
-                df_data[key].append(device[port].get(key))
-
-    df_ports = pd.DataFrame.from_dict(df_data)
+    # Create the dataframe from the ports in 'data'
+    records = [port for device in data.values() for port in device.values()]
+    cols = ['orgId', 'networkId', 'name', 'serial']
+    df_ports = hp.records_to_df(records, columns=cols)
     df_ports = df_ports.astype(str)
 
     return df_ports
@@ -810,20 +714,21 @@ def meraki_get_switch_port_usages(api_key, db_path, networks, timestamp):
     Returns:
         df_usage (DataFrame):   The port statuses
     '''
-    # Query the database to get all switches in the network(s)
-    statement = f'''networkId = "{'" or networkId = "'.join(networks)}"'''
-    query = f'''SELECT distinct orgId, networkId, name, serial, portId
-    FROM MERAKI_SWITCH_PORT_STATUSES
-    WHERE {statement} and timestamp = "{timestamp}"
-    '''
-
+    # Get all switch ports in the network(s) from the port statuses that were
+    # collected at the same timestamp
+    cols = ['orgId', 'networkId', 'name', 'serial', 'portId']
     con = sl.connect(db_path)
-    df_devices = pd.read_sql(query, con)
-    dashboard = meraki.DashboardAPI(api_key=api_key, suppress_logging=True)
-    app = dashboard.switch
+    df_devices = hp.read_snapshot(con,
+                                  'MERAKI_SWITCH_PORT_STATUSES',
+                                  timestamp,
+                                  cols)
+    con.close()
+    df_devices = df_devices[df_devices['networkId'].isin(networks)]
+    df_devices = df_devices.drop_duplicates().reset_index(drop=True)
 
     # Extract the unique serials
     serials = [*set(df_devices['serial'].to_list())]
+    org_ids = dict(zip(df_devices['serial'], df_devices['orgId']))
 
     # Convert the dataframe to a list. The keys will be the column names, and
     # the values will be a list containing the column data
@@ -833,10 +738,16 @@ def meraki_get_switch_port_usages(api_key, db_path, networks, timestamp):
     df_data['sentRatePerSec'] = list()
     df_data['recvRatePerSec'] = list()
 
-    # Get the port usage for each device in the network(s), and add it to
-    # df_data
-    for serial in serials:
-        for item in app.getDeviceSwitchPortsStatusesPackets(serial):
+    # Get the port usage for each device in the network(s) concurrently, and
+    # add it to df_data
+    calls = mh.fetch_concurrently(api_key,
+                                  'switch.getDeviceSwitchPortsStatusesPackets',
+                                  serials,
+                                  org_ids=org_ids)
+    for serial, packets, error in calls:
+        if error:
+            raise error
+        for item in packets:
             ratePerSec = item['packets'][0]['ratePerSec']['total']
             sentRatePerSec = item['packets'][0]['ratePerSec']['sent']
             recvRatePerSec = item['packets'][0]['ratePerSec']['recv']
@@ -6,6 +6,16 @@
 
 import pandas as pd
 import pynetbox
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from helpers import client_helpers as clh
+
+
+# The prefixes returned by netbox_get_ipam_prefixes, keyed by the Netbox path
+# and a hash of the token. Each value is a tuple of the time the prefixes were
+# fetched and the DataFrame.
+prefix_cache = dict()
 
 
 def create_netbox_handler(nb_path: str,
@@ -31,12 +41,85 @@ def create_netbox_handler(nb_path: str,
     >>> print(nb)
     <pynetbox.core.api.Api object at 0x7fb3576a4c1990>
     """
-    nb = pynetbox.api(nb_path, token)
+    # Reuse the handler (and its session) if one was already created for the
+    # instance and token
+    nb = clh.get_client('netbox',
+                        nb_path,
+                        token,
+                        lambda: pynetbox.api(nb_path, token))
     return nb
 
 
+def netbox_get_all(nb_path: str,
+                   token: str,
+                   endpoint: str,
+                   page_size: int = 1000,
+                   max_workers: int = 8) -> list:
+    """Gets all objects from a Netbox API endpoint.
+
+    The first page is requested to get the total number of objects. The
+    remaining pages are then requested concurrently.
+
+    Parameters
+    ----------
+    nb_path : str
+        The path to the Netbox instance. Can be either an IP or a URL.
+        Must be preceded by 'http://' or 'https://'.
+    token : str
+        The API token to use for authentication.
+    endpoint : str
+        The API endpoint, without the leading '/api/'. For example,
+        'ipam/prefixes'.
+    page_size : int, optional
+        The number of objects to request per page. If Netbox returns fewer
+        than this per page (it caps the page size at its MAX_PAGE_SIZE
+        setting), then the returned page size is used.
+    max_workers : int, optional
+        The maximum number of pages to request concurrently.
+
+    Returns
+    ----------
+    results : list
+        A list of dictionaries, one per object.
+
+    Examples
+    ----------
+    >>> results = netbox_get_all(nb_path, token, 'ipam/prefixes')
+    >>> print(type(results))
+    <class 'list'>
+    """
+    url = f"{nb_path.rstrip('/')}/api/{endpoint.strip('/')}/"
+    headers = {'Authorization': f'Token {token}',
+               'Accept': 'application/json'}
+
+    # Use the keep-alive session of the shared Netbox handler
+    session = create_netbox_handler(nb_path, token).http_session
+
+    def get_page(offset, limit):
+        response = session.get(url,
+                               headers=headers,
+                               params={'limit': limit, 'offset': offset})
+        response.raise_for_status()
+        return response.json()
+
+    # Get the first page, then get the remaining pages concurrently
+    page = get_page(0, page_size)
+    results = page['results']
+    count = page['count']
+    limit = len(results)
+    if limit and count > limit:
+        offsets = range(limit, count, limit)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages = executor.map(lambda _: get_page(_, limit), offsets)
+            for page in pages:
+                results.extend(page['results'])
+
+    return results
+
+
 def netbox_get_ipam_prefixes(nb_path: str,
-                             token: str) -> pd.DataFrame:
+                             token: str,
+                             max_age: int = 300) -> pd.DataFrame:
     """Gets all prefixes from a Netbox instance.
 
     Parameters
@@ -46,6 +129,9 @@ def netbox_get_ipam_prefixes(nb_path: str,
         Must be preceded by 'http://' or 'https://'.
     token : str
         The API token to use for authentication.
+    max_age : int, optional
+        The number of seconds to reuse the prefixes from a previous call for
+        the same Netbox instance and token. Set to 0 to always query Netbox.
 
     Returns
     ----------
@@ -54,7 +140,7 @@ def netbox_get_ipam_prefixes(nb_path: str,
 
     See Also
     ----------
-    create_netbox_handler : A function to create 'nb'
+    netbox_get_all : A function to get all objects from an API endpoint.
 
     Notes
     ----------
@@ -73,16 +159,18 @@ def netbox_get_ipam_prefixes(nb_path: str,
     print(type(df))
     >>> <class 'pandas.core.frame.DataFrame'>
     """
-    # Create the netbox handler
-    nb = create_netbox_handler(nb_path, token)
+    # Return the cached prefixes if they are recent enough
+    key = clh.create_client_key('netbox', nb_path, token)
+    cached = prefix_cache.get(key)
+    if cached and time.monotonic() - cached[0] < max_age:
+        return cached[1].copy()
 
     # Query the Netbox API for all IPAM prefixes
-    result = nb.ipam.prefixes.all()
-
-    # Iterate over the prefixes, adding each one as a row for 'df'.
-    df = pd.DataFrame()
-    for _ in result:
-        _ = dict(_)
-        df = pd.concat([df, pd.DataFrame.from_dict(_, orient='index').T]).\
-            reset_index(drop=True)
-    return df
+    result = netbox_get_all(nb_path, token, 'ipam/prefixes')
+
+    # Flatten the nested dictionaries and create 'df'
+    df = pd.json_normalize(result, sep='_')
+
+    prefix_cache[key] = (time.monotonic(), df)
+
+    return df.copy()
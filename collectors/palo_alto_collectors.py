@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import ansible_runner
 import json
 import pandas as pd
 from helpers import helpers as hp
@@ -85,14 +84,11 @@ def run_adhoc_command(username,
                  'cmd_is_xml': cmd_is_xml}
 
     playbook = f'{nm_path}/playbooks/palo_alto_run_adhoc_command.yml'
-    runner = ansible_runner.run(private_data_dir=private_data_dir,
-                                playbook=playbook,
-                                extravars=extravars,
-                                suppress_env_files=True)
+    runner = hp.ansible_run_events(private_data_dir, playbook, extravars)
 
     result = dict()
 
-    for event in runner.events:
+    for event in runner:
         if event['event'] == 'runner_on_ok':
             device = event['event_data']['remote_addr']
             result[device] = event
@@ -171,18 +167,13 @@ def get_all_interfaces(username,
 
     # Use the data in 'result' to populate 'df_data', which will be used to
     # create the dataframe.
-    df_data = dict()
-    df_data['device'] = list()
+    records = list()
     for device in result:
         for item in result[device]:
-            df_data['device'].append(device)
-            for key, value in item.items():
-                if not df_data.get(key):
-                    df_data[key] = list()
-                df_data[key].append(value)
+            records.append({'device': device, **item})
 
     # Create the dataframe.
-    df = pd.DataFrame.from_dict(df_data).astype(str)
+    df = hp.records_to_df(records, columns=['device']).astype(str)
 
     return df
 
@@ -253,11 +244,10 @@ def get_arp_table(username,
                                  cmd,
                                  True)
 
-    # Create a dictionary to store the data for 'df'
-    df_data = dict()
-    df_data['device'] = list()
+    # Create a list to store the ARP entries
+    records = list()
 
-    # Populate 'df_data' from 'result'
+    # Populate 'records' from 'result'
     for device in response:
         output = json.loads(response[device]['event_data']['res']['stdout'])
         # An 'error' key indicates the interface does not exist.
@@ -265,18 +255,14 @@ def get_arp_table(username,
             if output['response']['result'].get('entries'):
                 arp_table = output['response']['result']['entries']['entry']
                 for item in arp_table:
-                    df_data['device'].append(device)
-                    for key, value in item.items():
-                        if not df_data.get(key):
-                            df_data[key] = list()
-                        df_data[key].append(value)
-
-    # Get the vendors for the MAC addresses
-    df_vendors = hp.find_mac_vendors(df_data['mac'], nm_path)
-    df_data['vendor'] = df_vendors['vendor'].to_list()
+                    records.append({'device': device, **item})
 
     # Create the dataframe
-    df = pd.DataFrame.from_dict(df_data)
+    df = hp.records_to_df(records, columns=['device', 'mac'])
+
+    # Get the vendors for the MAC addresses
+    df_vendors = hp.find_mac_vendors(df['mac'], nm_path)
+    df['vendor'] = df_vendors['vendor'].to_list()
 
     return df
 
@@ -422,18 +408,13 @@ def get_logical_interfaces(username,
 
     # Use the data in 'result' to populate 'df_data', which will be used to
     # create the dataframe.
-    df_data = dict()
-    df_data['device'] = list()
+    records = list()
     for device in result:
         for item in result[device]:
-            df_data['device'].append(device)
-            for key, value in item.items():
-                if not df_data.get(key):
-                    df_data[key] = list()
-                df_data[key].append(value)
+            records.append({'device': device, **item})
 
     # Create the dataframe.
-    df = pd.DataFrame.from_dict(df_data).astype(str)
+    df = hp.records_to_df(records, columns=['device']).astype(str)
 
     return df
 
@@ -509,19 +490,17 @@ def get_physical_interfaces(username,
 
     # Use the data in 'result' to populate 'df_data', which will be used to
     # create the dataframe.
-    df_data = dict()
-    df_data['device'] = list()
+    records = list()
     for device in result:
         interfaces = result[device]
         for item in interfaces:
-            df_data['device'].append(device)
+            record = {'device': device}
             for key, value in item.items():
                 if key != 'ae_member':  # Exclude aggregation groups.
-                    if not df_data.get(key):
-                        df_data[key] = list()
-                    df_data[key].append(value)
+                    record[key] = value
+            records.append(record)
 
     # Create the dataframe.
-    df = pd.DataFrame.from_dict(df_data)
+    df = hp.records_to_df(records, columns=['device'])
 
     return df
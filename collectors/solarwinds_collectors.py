@@ -1,9 +1,101 @@
 #!/usr/bin/env python3
 
 import pandas as pd
+import time
+
+from helpers import client_helpers as clh
 from orionsdk import SwisClient
 
 
+# The Orion.Nodes attributes returned by get_npm_node_attributes, keyed by
+# the server, the username and a hash of the password. Each value is a tuple
+# of the time the attributes were queried and the DataFrame.
+node_cache = dict()
+
+
+def get_swis_client(server: str,
+                    username: str,
+                    password: str) -> SwisClient:
+    """
+    Gets the shared SWIS client for a server and user, creating it if
+    necessary.
+
+    Parameters
+    ----------
+    server : str
+        The IP address or hostname of the Orion server.
+    username : str
+        The username to use for authentication.
+    password : str
+        The password to use for authentication.
+
+    Returns
+    -------
+    SwisClient
+        The client. It is shared by every collector in the process.
+    """
+    swis = clh.get_client('solarwinds',
+                          server,
+                          (username, password),
+                          lambda: SwisClient(server, username, password))
+    return swis
+
+
+def get_npm_node_attributes(server: str,
+                            username: str,
+                            password: str,
+                            max_age: int = 300) -> pd.DataFrame:
+    """
+    Retrieve the attributes of all nodes in Solarwinds NPM that are used by
+    the get_npm_node_* collectors, with a single query.
+
+    Parameters
+    ----------
+    server : str
+        The URL of the Solarwinds NPM server to connect to.
+    username : str
+        The username to authenticate with the Solarwinds NPM server.
+    password : str
+        The password to authenticate with the Solarwinds NPM server.
+    max_age : int, optional
+        The number of seconds to reuse the result of a previous query. Set to
+        0 to always query the server.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A dataframe with the 'Caption', 'NodeID', 'IPAddress', 'Vendor',
+        'MachineType', 'IOSImage' and 'IOSVersion' of each node. If more than
+        one node has the same caption, then only the last one is kept.
+    """
+    key = clh.create_client_key('solarwinds', server, (username, password))
+    cached = node_cache.get(key)
+    if cached and time.monotonic() - cached[0] < max_age:
+        return cached[1].copy()
+
+    swis = get_swis_client(server, username, password)
+
+    columns = ['Caption',
+               'NodeID',
+               'IPAddress',
+               'Vendor',
+               'MachineType',
+               'IOSImage',
+               'IOSVersion']
+    query = f"SELECT {', '.join(columns)} FROM Orion.Nodes"
+
+    # Execute the query and get the results
+    results = swis.query(query)
+
+    df = pd.DataFrame(results['results'], columns=columns)
+    df = df.drop_duplicates(subset=['Caption'], keep='last')
+    df = df.reset_index(drop=True)
+
+    node_cache[key] = (time.monotonic(), df)
+
+    return df.copy()
+
+
 def get_ncm_serial_numbers(server: str,
                            username: str,
                            password: str) -> pd.DataFrame:
@@ -34,7 +126,7 @@ def get_ncm_serial_numbers(server: str,
         - ContainedIn (int): The ID of the container the physical entity is
            contained within.
     """
-    swis = SwisClient(server, username, password)
+    swis = get_swis_client(server, username, password)
 
     query = """
             SELECT EntityID,
@@ -108,7 +200,7 @@ def get_npm_containers(server: str,
     >>> df = get_npm_containers(server, username, password)
     >>> print(df)
     """
-    swis = SwisClient(server, username, password)
+    swis = get_swis_client(server, username, password)
 
     schema = ['ContainerID',
               'Name',
@@ -179,7 +271,7 @@ def get_npm_group_id(server: str,
     >>> group_id = get_npm_group_id(server, username, password, group_name)
     >>> print(group_id)
     """
-    swis = SwisClient(server, username, password)
+    swis = get_swis_client(server, username, password)
 
     # Get the group ID for the specified group name
     results = swis.query(
@@ -234,43 +326,30 @@ def get_npm_group_members(server: str,
     memory usage: 312.0+ bytes
     None
     """
-    swis = SwisClient(server, username, password)
-
-    results = list()
+    swis = get_swis_client(server, username, password)
 
-    # Retrieve the devices inside the group(s)
+    # Retrieve the devices inside the group(s) with a single query
+    query = """
+            SELECT c.Name AS group_name,
+                   c.ContainerID AS group_id,
+                   m.Name AS member
+            FROM Orion.Container c
+            INNER JOIN Orion.ContainerMembers m
+                ON m.ContainerID = c.ContainerID
+            """
+    params = dict()
     if group_name != 'all':
-        # Get the group ID for the specified group name
-        g_id = get_npm_group_id(server, username, password, group_name)
-        # Get the group members
-        members = swis.query(
-            f"""SELECT Name FROM Orion.ContainerMembers
-                WHERE ContainerID='{g_id}'"""
-        )
-        members = [result["Name"] for result in members["results"]]
-        for member in members:
-            row = [group_name, g_id, member]
-            results.append(row)
-    else:
-        # Get all of the group names.
-        group_names = get_npm_group_names(server, username, password)
-        group_names = group_names['group_name'].to_list()
-        # Iterate through the groups, adding the members to 'results'.
-        for group in group_names:
-            # Get the group ID for the specified group name
-            g_id = get_npm_group_id(server, username, password, group)
-            members = swis.query(
-                f"""SELECT Name FROM Orion.ContainerMembers
-                    WHERE ContainerID='{g_id}'"""
-            )
-            members = [result["Name"] for result in members["results"]]
-            for member in members:
-                row = [group, g_id, member]
-                results.append(row)
+        query = f'{query} WHERE c.Name = @group_name'
+        params['group_name'] = group_name
+    results = swis.query(query, **params)
 
     # Convert to a DataFrame and return the results
     columns = ['group_name', 'group_id', 'member']
-    df = pd.DataFrame(data=results, columns=columns)
+    df = pd.DataFrame(data=results['results'], columns=columns)
+
+    # Raise an IndexError if the group does not exist
+    if group_name != 'all' and len(df) == 0:
+        get_npm_group_id(server, username, password, group_name)
 
     return df
 
@@ -301,7 +380,7 @@ def get_npm_group_names(server: str,
     >>> print(group_names)
     ['Switches', 'Routers', 'Servers', ...]
     """
-    swis = SwisClient(server, username, password)
+    swis = get_swis_client(server, username, password)
 
     results = swis.query("SELECT Name FROM Orion.Container")
 
@@ -352,29 +431,10 @@ def get_npm_node_ids(server: str,
     2 node3 345
     ...
     """
-    swis = SwisClient(server, username, password)
-
-    query = "SELECT Caption, NodeID FROM Orion.Nodes"
+    df = get_npm_node_attributes(server, username, password)
 
-    # Execute the query and get the results
-    results = swis.query(query)
-
-    # Store the results in a dictionary with the node name as the key
-    node_ids = {}
-    for result in results['results']:
-        node_name = result['Caption']
-        node_id = result['NodeID']
-        node_ids[node_name] = node_id
-
-    df = pd.DataFrame.from_dict(node_ids,
-                                orient='index',
-                                columns=['node_id'])
-
-    df.index.name = 'device_name'
-    df.reset_index(inplace=True)
-
-    # Add a new column for the device name
-    df.reset_index(drop=True, inplace=True)
+    df = df[['Caption', 'NodeID']]
+    df.columns = ['device_name', 'node_id']
 
     return df
 
@@ -416,7 +476,7 @@ def get_npm_node_ip(server: str,
     >>> node_ip
     '10.10.10.1'
     """
-    swis = SwisClient(server, username, password)
+    swis = get_swis_client(server, username, password)
 
     query = """
     SELECT IPAddress
@@ -468,30 +528,10 @@ def get_npm_node_ips(server: str, username: str, password: str) -> dict:
     2 node3 10.10.10.3
     ...
     """
-    swis = SwisClient(server, username, password)
-
-    query = "SELECT Caption, NodeID, IPAddress FROM Orion.Nodes"
-
-    # Execute the query and get the results
-    results = swis.query(query)
-
-    # Store the results in a dictionary with the node name as the key
-    node_ips = {}
-    for result in results['results']:
-        node_name = result['Caption']
-        node_id = result['NodeID']
-        ip_address = result['IPAddress']
-        node_ips[node_name] = [node_id, ip_address]
-
-    df = pd.DataFrame.from_dict(node_ips,
-                                orient='index',
-                                columns=['node_id', 'device_ip'])
+    df = get_npm_node_attributes(server, username, password)
 
-    df.index.name = 'device_name'
-    df.reset_index(inplace=True)
-
-    # Add a new column for the device name
-    df.reset_index(drop=True, inplace=True)
+    df = df[['Caption', 'NodeID', 'IPAddress']]
+    df.columns = ['device_name', 'node_id', 'device_ip']
 
     return df
 
@@ -536,30 +576,10 @@ def get_npm_node_machine_types(server: str,
     2 node3 Panorama Server
     ...
     """
-    swis = SwisClient(server, username, password)
-
-    query = "SELECT Caption, NodeID, MachineType FROM Orion.Nodes"
-
-    # Execute the query and get the results
-    results = swis.query(query)
-
-    # Store the results in a dictionary with the node name as the key
-    node_info = {}
-    for result in results['results']:
-        node_name = result['Caption']
-        node_id = result['NodeID']
-        machine_type = result['MachineType']
-        node_info[node_name] = [node_id, machine_type]
-
-    df = pd.DataFrame.from_dict(node_info,
-                                orient='index',
-                                columns=['node_id', 'machine_type'])
+    df = get_npm_node_attributes(server, username, password)
 
-    df.index.name = 'device_name'
-    df.reset_index(inplace=True)
-
-    # Add a new column for the device name
-    df.reset_index(drop=True, inplace=True)
+    df = df[['Caption', 'NodeID', 'MachineType']]
+    df.columns = ['device_name', 'node_id', 'machine_type']
 
     return df
 
@@ -606,31 +626,9 @@ def get_npm_node_os_versions(server: str,
     3 switch2.local
     ...
     """
-    swis = SwisClient(server, username, password)
-
-    query = """
-            SELECT Caption, NodeID, IOSImage, IOSVersion
-            FROM Orion.Nodes
-            """
-
-    # Execute the query and get the results
-    results = swis.query(query)
+    df = get_npm_node_attributes(server, username, password)
 
-    # Store the results in a dictionary with the node name as the key
-    node_info = {}
-    for result in results['results']:
-        node_name = result['Caption']
-        node_id = result['NodeID']
-        ios_image = result['IOSImage']
-        ios_version = result['IOSVersion']
-        node_info[node_name] = [node_id, ios_image, ios_version]
-
-    df = pd.DataFrame.from_dict(node_info,
-                                orient='index',
-                                columns=['NodeID', 'IOSImage', 'IOSVersion'])
-
-    df.index.name = 'Caption'
-    df.reset_index(inplace=True)
+    df = df[['Caption', 'NodeID', 'IOSImage', 'IOSVersion']]
 
     return df
 
@@ -672,7 +670,7 @@ def get_npm_node_vendor(server: str,
     >>> node_vendor
     'Cisco Systems, Inc.'
     """
-    swis = SwisClient(server, username, password)
+    swis = get_swis_client(server, username, password)
 
     query = """
             SELECT Caption, Vendor
@@ -722,30 +720,9 @@ def get_npm_node_vendors(server: str, username: str, password: str) -> dict:
     2 node3 juniper
     ...
     """
-    swis = SwisClient(server, username, password)
-
-    query = "SELECT Caption, NodeID, Vendor FROM Orion.Nodes"
-
-    # Execute the query and get the results
-    results = swis.query(query)
-
-    # Store the results in a dictionary with the node name as the key
-    node_vendors = {}
-    for result in results['results']:
-        node_name = result['Caption']
-        node_id = result['NodeID']
-        vendor = result['Vendor']
-        node_vendors[node_name] = [node_id, vendor]
-
-    df = pd.DataFrame.from_dict(node_vendors,
-                                orient='index',
-                                columns=['NodeID', 'Vendor'])
-
-    df.index.name = 'Caption'
-    df.reset_index(inplace=True)
+    df = get_npm_node_attributes(server, username, password)
 
-    # Add a new column for the device name
-    df.reset_index(drop=True, inplace=True)
+    df = df[['Caption', 'NodeID', 'Vendor']]
 
     return df
 
@@ -775,7 +752,7 @@ def get_npm_nodes(server: str,
     >>> df = get_npm_nodes(server, username, password)
     >>> print(df)
     """
-    swis = SwisClient(server, username, password)
+    swis = get_swis_client(server, username, password)
 
     schema = ['NodeID',
               'ObjectSubType',
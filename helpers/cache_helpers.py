@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+"""A cache for the raw output of the commands that collectors run.
+
+Some collectors run the same commands as others. For example,
+ios_find_uplink_by_ip runs the commands for the interface IPs and CDP
+neighbors, and build_pool_table runs the same playbooks as
+get_pools_and_members. When the cache is enabled, the output of each device
+is stored in a SQLite database, keyed by the device's address, a hash of
+the playbook and its commands, and the position of the task in the playbook.
+Until the output expires, later collectors read it from the cache instead of
+connecting to the devices again. Only the devices that are not cached (E.g.,
+because they were unreachable) are connected to.
+
+The cache is disabled by default. It is enabled by calling
+enable_output_cache, and it is only used for playbooks that do not make
+changes (see is_cacheable). When it grows larger than its size limit, the
+least recently used output is removed.
+
+"""
+
+import hashlib
+import json
+import sqlite3 as sl
+import threading
+import time
+
+
+# The cache settings (see enable_output_cache)
+cache = {'enabled': False,
+         'path': None,
+         'ttl': 300,
+         'max_bytes': 256 * 1024 ** 2}
+cache_lock = threading.Lock()
+
+# The extravars that do not change the output of a playbook
+ignored_vars = ('username', 'user', 'password', 'host_group')
+
+
+def connect_to_cache(path):
+    """Connects to the cache database, creating the table if necessary.
+
+    Parameters
+    ----------
+    path : str
+        The path to the cache database.
+
+    Returns
+    ----------
+    con : sqlite3.Connection
+        The connection to the cache database.
+    """
+    con = sl.connect(path, timeout=30)
+    con.execute('''CREATE TABLE IF NOT EXISTS OUTPUT_CACHE (
+                       device TEXT NOT NULL,
+                       command_key TEXT NOT NULL,
+                       seq INTEGER NOT NULL,
+                       task TEXT,
+                       command TEXT,
+                       res TEXT NOT NULL,
+                       size INTEGER NOT NULL,
+                       created REAL NOT NULL,
+                       accessed REAL NOT NULL,
+                       PRIMARY KEY (device, command_key, seq))''')
+    con.execute('''CREATE INDEX IF NOT EXISTS idx_output_cache_accessed
+                   ON OUTPUT_CACHE (accessed)''')
+    return con
+
+
+def enable_output_cache(path, ttl=300, max_bytes=256 * 1024 ** 2):
+    """Enables the output cache.
+
+    Parameters
+    ----------
+    path : str
+        The path to the cache database. It can be the same database that
+        the collectors write to.
+    ttl : int, optional
+        The number of seconds that output is cached for. Defaults to 300,
+        which covers the collectors in a single run.
+    max_bytes : int, optional
+        The maximum size of the cached output, in bytes. Defaults to 256 MB.
+    """
+    with cache_lock:
+        con = connect_to_cache(path)
+        con.close()
+        cache['enabled'] = True
+        cache['path'] = path
+        cache['ttl'] = ttl
+        cache['max_bytes'] = max_bytes
+
+
+def disable_output_cache():
+    """Disables the output cache. The cached output is not deleted.
+
+    """
+    cache['enabled'] = False
+
+
+def clear_output_cache():
+    """Deletes all of the cached output.
+
+    """
+    with cache_lock:
+        if cache['path']:
+            con = connect_to_cache(cache['path'])
+            with con:
+                con.execute('DELETE FROM OUTPUT_CACHE')
+            con.close()
+
+
+def is_cacheable(playbook):
+    """Determines whether the output of a playbook can be cached.
+
+    Only playbooks that collect data are cached. These are the playbooks that
+    run commands (E.g., 'cisco_ios_run_commands.yml') and the playbooks that
+    get data (E.g., 'f5_get_pools_and_members.yml').
+
+    Parameters
+    ----------
+    playbook : str
+        The path to the playbook.
+
+    Returns
+    ----------
+    cacheable : bool
+        Whether the playbook's output can be cached.
+    """
+    name = playbook.replace('\\', '/').split('/')[-1]
+    if name.startswith('rw_'):
+        return False
+    return name.endswith('_run_commands.yml') or '_get_' in name
+
+
+def use_output_cache(playbook):
+    """Determines whether the output cache should be used for a playbook.
+
+    Parameters
+    ----------
+    playbook : str
+        The path to the playbook.
+
+    Returns
+    ----------
+    use_cache : bool
+        True if the cache is enabled and the playbook can be cached.
+    """
+    return bool(cache['enabled'] and is_cacheable(playbook))
+
+
+def create_command_key(playbook, extravars):
+    """Creates the cache key for a playbook and its extra variables.
+
+    The credentials and the host group are not included, since they do not
+    change a device's output.
+
+    Parameters
+    ----------
+    playbook : str
+        The path to the playbook.
+    extravars : dict
+        The extra variables that are passed to the playbook.
+
+    Returns
+    ----------
+    key : str
+        A hash of the playbook name and the rest of the extra variables.
+    command : str
+        A readable description of the key, for troubleshooting.
+    """
+    name = playbook.replace('\\', '/').split('/')[-1]
+    variables = {k: v for k, v in extravars.items() if k not in ignored_vars}
+    command = json.dumps({'playbook': name, 'extravars': variables},
+                         sort_keys=True,
+                         default=str)
+    key = hashlib.sha256(command.encode()).hexdigest()
+    return key, command
+
+
+def get_cached_output(devices, key):
+    """Gets the cached output of a command for a list of devices.
+
+    Parameters
+    ----------
+    devices : list
+        The addresses of the devices to get the output for.
+    key : str
+        The cache key of the command (see create_command_key).
+
+    Returns
+    ----------
+    outputs : dict
+        The cached output of each address that has output that has not
+        expired, as a list of (task, res) tuples in the order that the tasks
+        ran. Devices without cached output are not included.
+    """
+    now = time.time()
+    outputs = dict()
+    with cache_lock:
+        con = connect_to_cache(cache['path'])
+        try:
+            with con:
+                for pos in range(0, len(devices), 500):
+                    chunk = devices[pos:pos+500]
+                    marks = ', '.join('?' * len(chunk))
+                    rows = con.execute(f'''SELECT device, task, res
+                                           FROM OUTPUT_CACHE
+                                           WHERE command_key = ?
+                                           AND created >= ?
+                                           AND device IN ({marks})
+                                           ORDER BY seq''',
+                                       [key, now - cache['ttl']] + chunk)
+                    for device, task, res in rows:
+                        outputs.setdefault(device, list()).append(
+                            (task, json.loads(res)))
+                # Mark the output as used, for the LRU eviction
+                con.executemany('''UPDATE OUTPUT_CACHE SET accessed = ?
+                                   WHERE device = ? AND command_key = ?''',
+                                [(now, _, key) for _ in outputs])
+        finally:
+            con.close()
+
+    return outputs
+
+
+def store_outputs(key, command, outputs):
+    """Stores the output of a playbook run in the cache.
+
+    Parameters
+    ----------
+    key : str
+        The cache key of the command (see create_command_key).
+    command : str
+        The readable description of the key.
+    outputs : list
+        The (address, seq, task, res) tuple of each event, where 'address'
+        is the device's 'remote_addr', 'seq' is the position of the event
+        among the device's events and 'res' is the serialized 'res' of the
+        event.
+    """
+    now = time.time()
+    with cache_lock:
+        con = connect_to_cache(cache['path'])
+        try:
+            with con:
+                con.executemany('''INSERT OR REPLACE INTO OUTPUT_CACHE
+                                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                                [(device, key, seq, task, command, res,
+                                  len(res), now, now)
+                                 for device, seq, task, res in outputs])
+        finally:
+            con.close()
+
+
+def evict_output():
+    """Removes expired output, then removes the least recently used output
+    until the cache is smaller than its size limit.
+
+    """
+    now = time.time()
+    with cache_lock:
+        con = connect_to_cache(cache['path'])
+        try:
+            with con:
+                con.execute('DELETE FROM OUTPUT_CACHE WHERE created < ?',
+                            (now - cache['ttl'],))
+                total = con.execute('''SELECT COALESCE(SUM(size), 0)
+                                       FROM OUTPUT_CACHE''').fetchone()[0]
+                if total <= cache['max_bytes']:
+                    return
+                rows = con.execute('''SELECT rowid, size FROM OUTPUT_CACHE
+                                      ORDER BY accessed''')
+                stale = list()
+                for rowid, size in rows:
+                    if total <= cache['max_bytes']:
+                        break
+                    stale.append((rowid,))
+                    total -= size
+                con.executemany('DELETE FROM OUTPUT_CACHE WHERE rowid = ?',
+                                stale)
+        finally:
+            con.close()
+
+
+def cached_run_events(hosts, playbook, extravars, run):
+    """Yields a playbook's events from the cache, or runs it and caches them.
+
+    The output is cached by the address of each device, which is the
+    'remote_addr' of the Ansible events. The devices with cached output that
+    has not expired are replayed from the cache. The playbook is only run for
+    the devices that are missing (E.g., because they were unreachable), and
+    the output of each device and task is cached once the run has finished.
+
+    Parameters
+    ----------
+    hosts : list
+        The (inventory hostname, address) tuple of each device in the host
+        group (see ssh_helpers.get_inventory_hosts). If it is empty, the
+        playbook is always run for the whole host group.
+    playbook : str
+        The path to the playbook.
+    extravars : dict
+        The extra variables that are passed to the playbook.
+    run : function
+        A function that takes the list of inventory hostnames to limit the
+        run to (or None for the whole host group) and returns the playbook's
+        'runner_on_ok' events (E.g., helpers.ansible_run_events).
+
+    Yields
+    ----------
+    event : dict
+        The 'runner_on_ok' events, in the same format as the Ansible events.
+    """
+    key, command = create_command_key(playbook, extravars)
+    hosts = list(dict.fromkeys(tuple(_) for _ in hosts))
+    addresses = list(dict.fromkeys(address for _, address in hosts))
+
+    # Replay the cached output one task at a time, in the same order as the
+    # playbook
+    outputs = get_cached_output(addresses, key) if hosts else dict()
+    cached = [_ for _ in hosts if _[1] in outputs]
+    tasks = max([len(outputs[_[1]]) for _ in cached] + [0])
+    for seq in range(tasks):
+        for host, address in cached:
+            if seq >= len(outputs[address]):
+                continue
+            task, res = outputs[address][seq]
+            yield {'event': 'runner_on_ok',
+                   'event_data': {'host': host,
+                                  'remote_addr': address,
+                                  'task': task,
+                                  'res': res}}
+
+    # Run the playbook for the devices that are not cached. If none of them
+    # are cached, then it is run for the whole host group.
+    missing = [host for host, address in hosts if address not in outputs]
+    if hosts and not missing:
+        return
+    limit = missing if cached else None
+
+    # The output of each event is serialized as it arrives, and the output of
+    # the run is stored once it has finished, so that a run that is
+    # interrupted is not cached. Output that cannot be serialized is not
+    # cached.
+    cacheable = True
+    stored = list()
+    counts = dict()
+    for event in run(limit):
+        event_data = event.get('event_data', dict())
+        if cacheable and event.get('event') == 'runner_on_ok' and \
+                'res' in event_data:
+            address = event_data['remote_addr']
+            seq = counts.get(address, 0)
+            counts[address] = seq + 1
+            try:
+                stored.append((address,
+                               seq,
+                               event_data.get('task'),
+                               json.dumps(event_data['res'])))
+            except (TypeError, ValueError):
+                cacheable = False
+        yield event
+
+    if cacheable and stored:
+        store_outputs(key, command, stored)
+    evict_output()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""A process-wide registry of API clients.
+
+API-based collectors get their clients (Infoblox connectors, Netbox
+handlers, Meraki dashboards and SWIS clients) from the registry instead of
+creating a new one for every call. Each client keeps its HTTP session open,
+so a collection cycle only logs in and negotiates TLS once per API endpoint
+and set of credentials.
+
+"""
+
+import hashlib
+import threading
+import time
+
+
+# The clients in the registry. Each key is a tuple of the platform, the host
+# and a hash of the credentials. Each value is a dictionary containing the
+# client and the time at which it expires (or None if it does not expire).
+clients = dict()
+clients_lock = threading.Lock()
+
+
+def create_client_key(platform, host, credentials):
+    """Creates the registry key for a client.
+
+    The credentials are hashed so that they are not stored in the key.
+
+    Parameters
+    ----------
+    platform : str
+        The name of the platform (e.g., 'infoblox', 'netbox', 'meraki').
+    host : str
+        The host, URL or other identifier of the API endpoint.
+    credentials : any
+        The credentials used to create the client. Anything with a stable
+        repr() can be used, such as a string or a tuple.
+
+    Returns
+    ----------
+    key : tuple
+        The registry key.
+    """
+    digest = hashlib.sha256(repr(credentials).encode()).hexdigest()
+    return platform, host, digest
+
+
+def get_client(platform, host, credentials, create, max_age=None):
+    """Gets a client from the registry, creating it if necessary.
+
+    Parameters
+    ----------
+    platform : str
+        The name of the platform (e.g., 'infoblox', 'netbox', 'meraki').
+    host : str
+        The host, URL or other identifier of the API endpoint.
+    credentials : any
+        The credentials used to create the client. Clients for the same
+        platform and host with different credentials are stored separately.
+    create : function
+        A function that takes no arguments and returns a new client. It is
+        only called if the registry does not have a client that is valid.
+    max_age : int, optional
+        The number of seconds after which the client expires and is replaced
+        by a new one (e.g., for authentication tokens). Defaults to None,
+        which means the client does not expire.
+
+    Returns
+    ----------
+    client : any
+        The client returned by 'create'.
+
+    Examples
+    ----------
+    >>> conn = get_client('infoblox',
+    ...                   host,
+    ...                   (username, password),
+    ...                   lambda: connector.Connector(opts))
+    """
+    key = create_client_key(platform, host, credentials)
+    with clients_lock:
+        entry = clients.get(key)
+        if entry and (entry['expires'] is None or
+                      time.monotonic() < entry['expires']):
+            return entry['client']
+
+    # Create the client outside of the lock, since it may need to log in.
+    # If two threads create a client at the same time, then the first one to
+    # finish is kept.
+    client = create()
+    expires = None
+    if max_age is not None:
+        expires = time.monotonic() + max_age
+    with clients_lock:
+        entry = clients.get(key)
+        if entry and (entry['expires'] is None or
+                      time.monotonic() < entry['expires']):
+            return entry['client']
+        clients[key] = {'client': client, 'expires': expires}
+
+    return client
+
+
+def remove_client(platform, host, credentials):
+    """Removes a client from the registry.
+
+    This should be called when a client is rejected by the API (e.g., an
+    authentication token was revoked), so that the next call to get_client
+    creates a new one.
+
+    Parameters
+    ----------
+    platform : str
+        The name of the platform.
+    host : str
+        The host, URL or other identifier of the API endpoint.
+    credentials : any
+        The credentials used to create the client.
+    """
+    key = create_client_key(platform, host, credentials)
+    with clients_lock:
+        clients.pop(key, None)
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+
+"""An embedded DuckDB analytics mode for the collected snapshots.
+
+Questions that span collectors, such as which switch port a MAC address from
+the ARP table is behind, or which interface an IP address is on, require
+large joins. SQLite is slow at these, since it reads row by row and the
+collector tables are untyped. This module opens an in-process DuckDB
+database over the SQLite database and/or the Parquet datasets (see
+parquet_helpers), and creates views that join the ARP, CAM and interface
+tables of every platform.
+
+DuckDB is optional. connect_analytics raises an ImportError if it is not
+installed.
+
+Examples
+----------
+>>> con = connect_analytics(db_path='~/output/2023-01-01.db')
+>>> query(con, 'select * from mac_locations where ip = ?', ['10.1.1.10'])
+
+"""
+
+import os
+import pandas as pd
+import sqlite3 as sl
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+# The tables in the SQLite database that are not collector tables
+tracking_tables = ('DELTA_TABLES',
+                   'FIRST_LAST_COLUMNS',
+                   'FIRST_LAST_TIMESTAMPS',
+                   'SNAPSHOTS')
+
+
+def define_analytics_sources():
+    """Defines the collector tables that the analytics views are built from.
+
+    Each platform names its columns differently, so the columns of each
+    table are mapped to a common set of columns. Every source also has the
+    'timestamp' and 'device' columns.
+
+    Returns
+    ----------
+    sources : dict
+        A dictionary where each key is the name of a view, and each value is
+        a dictionary mapping table names to their columns. The keys of each
+        column mapping are the view's columns, and the values are the
+        table's columns.
+    """
+    interface_ips = {'interface': 'interface',
+                     'ip': 'ip',
+                     'vrf': 'vrf',
+                     'subnet': 'subnet',
+                     'network_ip': 'network_ip',
+                     'broadcast_ip': 'broadcast_ip'}
+
+    sources = {'arp': {'IOS_ARP_TABLE': {'ip': 'address',
+                                         'mac': 'mac',
+                                         'interface': 'interface',
+                                         'vendor': 'vendor'},
+                       'NXOS_ARP_TABLE': {'ip': 'ip_address',
+                                          'mac': 'mac_address',
+                                          'interface': 'interface',
+                                          'vendor': 'vendor'},
+                       'PANOS_ARP_TABLE': {'ip': 'ip',
+                                           'mac': 'mac',
+                                           'interface': 'interface',
+                                           'vendor': 'vendor'}},
+               'cam': {'IOS_CAM_TABLE': {'interface': 'ports',
+                                         'mac': 'mac',
+                                         'vlan': 'vlan',
+                                         'vendor': 'vendor'},
+                       'NXOS_CAM_TABLE': {'interface': 'interface',
+                                          'mac': 'mac',
+                                          'vlan': 'vlan',
+                                          'vendor': 'vendor'}},
+               'interface_ips': {'ASA_INTERFACE_IP_ADDRESSES': interface_ips,
+                                 'IOS_INTERFACE_IP_ADDRESSES': interface_ips,
+                                 'NXOS_INTERFACE_IP_ADDRESSES': interface_ips,
+                                 'PANOS_INTERFACE_IP_ADDRESSES':
+                                 interface_ips}}
+
+    return sources
+
+
+def define_analytics_views():
+    """Defines the views that join the normalized tables.
+
+    Returns
+    ----------
+    views : dict
+        A dictionary where each key is the name of a view, and each value is
+        a tuple containing the views it depends on and its query.
+    """
+    views = {'mac_locations':
+             (['cam', 'arp'],
+              '''select c.mac,
+                        coalesce(c.vendor, a.vendor) as vendor,
+                        a.ip,
+                        a.device as arp_device,
+                        a.interface as arp_interface,
+                        c.device,
+                        c.interface,
+                        c.vlan,
+                        c.timestamp
+                 from cam c
+                 left join arp a on c.mac_key = a.mac_key'''),
+             'ip_locations':
+             (['arp', 'interface_ips'],
+              '''select a.ip,
+                        a.mac,
+                        a.vendor,
+                        a.device,
+                        a.interface,
+                        i.ip as interface_ip,
+                        i.subnet,
+                        i.vrf,
+                        a.timestamp
+                 from arp a
+                 left join interface_ips i
+                   on a.device = i.device
+                   and lower(a.interface) = lower(i.interface)''')}
+
+    return views
+
+
+def list_sqlite_tables(db_path):
+    """Lists the collector tables in a SQLite database.
+
+    Parameters
+    ----------
+    db_path : str
+        The path to the database.
+
+    Returns
+    ----------
+    tables : dict
+        A dictionary where each key is a table name, and each value is
+        whether the table is stored in 'delta' mode (see hp.diff_snapshot).
+    """
+    con = sl.connect(db_path)
+    try:
+        names = [row[0] for row in con.execute('''select name
+                                                  from sqlite_master
+                                                  where type = "table"''')]
+        delta = list()
+        if 'DELTA_TABLES' in names:
+            delta = [row[0] for row in
+                     con.execute('select table_name from DELTA_TABLES')]
+    finally:
+        con.close()
+
+    tables = {name: name in delta for name in names
+              if name not in tracking_tables and
+              not name.endswith('_DELTA_STATE') and
+              not name.startswith('sqlite_')}
+
+    return tables
+
+
+def define_delta_history_query(table, changes, snapshots):
+    """Defines the query that rebuilds every snapshot of a 'delta' mode
+    table (see hp.diff_snapshot).
+
+    Each change is valid from its timestamp until the next change to the
+    same row. Every snapshot in the catalog contains the changes that are
+    valid at its timestamp, except for deletes. This is the same as
+    hp.read_delta_snapshot, but for every snapshot at once.
+
+    Parameters
+    ----------
+    table : str
+        The table name.
+    changes : str
+        The name of the relation that contains the rows of the table.
+    snapshots : str
+        The name of the relation that contains the snapshot catalog.
+
+    Returns
+    ----------
+    query : str
+        The query. It returns the columns of the table, without the delta
+        columns, and with the 'timestamp' of each snapshot.
+    """
+    query = f'''select c.* exclude (timestamp,
+                                    change_type,
+                                    row_key,
+                                    row_hash,
+                                    next_ts),
+                       s.timestamp
+                from (select *,
+                             lead(timestamp) over (
+                                 partition by row_key
+                                 order by cast(table_id as bigint)
+                             ) as next_ts
+                      from {changes}) c
+                join (select timestamp
+                      from {snapshots}
+                      where table_name = '{table}') s
+                  on s.timestamp >= c.timestamp
+                 and (c.next_ts is null or s.timestamp < c.next_ts)
+                where c.change_type != 'delete'
+             '''
+    return query
+
+
+def attach_sqlite(con, db_path, materialize=False, exclude=list()):
+    """Adds the collector tables in a SQLite database to the analytics
+    database.
+
+    The database is attached with DuckDB's sqlite extension. If the extension
+    cannot be loaded (E.g., it cannot be downloaded), then the tables are
+    copied into DuckDB with pandas instead.
+
+    Parameters
+    ----------
+    con : duckdb.DuckDBPyConnection
+        The analytics database.
+    db_path : str
+        The path to the SQLite database.
+    materialize : bool, optional
+        Whether to copy the tables into DuckDB instead of creating views
+        over the attached database. Copying takes longer up front, but
+        queries are faster.
+    exclude : list, optional
+        Tables that should not be added (E.g., because they were already
+        added from Parquet).
+
+    Returns
+    ----------
+    tables : list
+        The tables that were added.
+    """
+    tables = {table: is_delta for table, is_delta in
+              list_sqlite_tables(db_path).items() if table not in exclude}
+    kind = 'table' if materialize else 'view'
+
+    try:
+        con.execute('set sqlite_all_varchar = true')
+        con.execute(f"attach '{db_path}' as nm (type sqlite, read_only)")
+        src = None
+    except duckdb.Error as e:
+        print(f'Caught Exception: {str(e)}')
+        print('Copying the SQLite tables with pandas instead.')
+        src = sl.connect(db_path)
+
+    for table, is_delta in tables.items():
+        # Tables in 'delta' mode only store the changes, so every snapshot
+        # is rebuilt from them. They have the same rows as a table that
+        # stores every snapshot in full.
+        query = f'select * from nm."{table}"'
+        if is_delta:
+            query = define_delta_history_query(table,
+                                               f'nm."{table}"',
+                                               'nm."SNAPSHOTS"')
+
+        if src is None:
+            con.execute(f'create or replace {kind} "{table}" as {query}')
+            continue
+
+        # Copy the table with pandas. The rows of 'delta' mode tables are
+        # read as objects, since the deleted rows would otherwise turn their
+        # integer columns into floats.
+        if is_delta:
+            cur = src.execute(f'select * from "{table}"')
+            df = pd.DataFrame(cur.fetchall(),
+                              columns=[_[0] for _ in cur.description],
+                              dtype=object)
+        else:
+            df = pd.read_sql(f'select * from "{table}"', src)
+        con.register('df_source', df)
+        if is_delta:
+            df_snapshots = pd.read_sql('''select table_name, timestamp
+                                          from SNAPSHOTS
+                                          where table_name = ?''',
+                                       src,
+                                       params=(table,))
+            con.register('df_snapshots', df_snapshots)
+            query = define_delta_history_query(table,
+                                               'df_source',
+                                               'df_snapshots')
+            con.execute(f'create or replace table "{table}" as {query}')
+            con.unregister('df_snapshots')
+        else:
+            con.execute(f'create or replace table "{table}" as '
+                        'select * from df_source')
+        con.unregister('df_source')
+
+    if src is not None:
+        src.close()
+
+    return list(tables)
+
+
+def attach_parquet(con, parquet_path, materialize=False):
+    """Adds the Parquet datasets in a directory to the analytics database.
+
+    Parameters
+    ----------
+    con : duckdb.DuckDBPyConnection
+        The analytics database.
+    parquet_path : str
+        The directory that contains the datasets (see parquet_helpers).
+    materialize : bool, optional
+        Whether to copy the datasets into DuckDB instead of creating views
+        over the files.
+
+    Returns
+    ----------
+    tables : list
+        The tables that were added.
+    """
+    kind = 'table' if materialize else 'view'
+    tables = list()
+    for table in sorted(os.listdir(parquet_path)):
+        path = os.path.join(parquet_path, table)
+        if not os.path.isdir(path):
+            continue
+        files = os.path.join(path, 'date=*', '*.parquet')
+        con.execute(f'''create or replace {kind} "{table}" as
+                        select * exclude (date)
+                        from read_parquet('{files}',
+                                          hive_partitioning = true,
+                                          union_by_name = true)''')
+        tables.append(table)
+
+    return tables
+
+
+def create_analytics_views(con, tables, materialize=False):
+    """Creates the normalized views and the views that join them.
+
+    For each view in define_analytics_sources, '{view}_history' contains
+    every snapshot of its source tables, and '{view}' contains the latest
+    snapshot of each device. Both have a 'source' column with the table that
+    each row came from. The ARP and CAM views also have a 'mac_key' column,
+    which is the MAC address without separators, so that MAC addresses in
+    different formats can be joined.
+
+    Parameters
+    ----------
+    con : duckdb.DuckDBPyConnection
+        The analytics database.
+    tables : list
+        The tables in the analytics database.
+    materialize : bool, optional
+        Whether to store the '{view}_history' views as tables, so that the
+        columns are only normalized once.
+
+    Returns
+    ----------
+    views : list
+        The views that were created. Views whose source tables do not exist
+        are not created.
+    """
+    views = list()
+    for view, sources in define_analytics_sources().items():
+        selects = list()
+        for table, columns in sources.items():
+            if table not in tables:
+                continue
+            existing = [row[0] for row in
+                        con.execute(f'describe "{table}"').fetchall()]
+            cols = ['timestamp', 'device']
+            for col, source_col in columns.items():
+                if source_col in existing:
+                    cols.append(f'cast("{source_col}" as varchar) as {col}')
+                else:
+                    cols.append(f'cast(null as varchar) as {col}')
+            if 'mac' in columns:
+                mac = f'cast("{columns["mac"]}" as varchar)'
+                for separator in ['.', ':', '-']:
+                    mac = f"replace({mac}, '{separator}', '')"
+                cols.append(f'lower({mac}) as mac_key'
+                            if columns['mac'] in existing else
+                            'cast(null as varchar) as mac_key')
+            selects.append(f'''select {', '.join(cols)},
+                                      '{table}' as source
+                               from "{table}"''')
+        if not selects:
+            continue
+
+        kind = 'table' if materialize else 'view'
+        con.execute(f'''create or replace {kind} {view}_history as
+                        {' union all '.join(selects)}''')
+        con.execute(f'''create or replace view {view} as
+                        select * from {view}_history
+                        qualify timestamp = max(timestamp)
+                            over (partition by source, device)''')
+        views.extend([f'{view}_history', view])
+
+    for view, (requires, query) in define_analytics_views().items():
+        if all(_ in views for _ in requires):
+            con.execute(f'create or replace view {view} as {query}')
+            views.append(view)
+
+    return views
+
+
+def connect_analytics(db_path=None,
+                      parquet_path=None,
+                      materialize=False,
+                      database=':memory:'):
+    """Opens a DuckDB analytics database over the collected snapshots.
+
+    If a table is in both the SQLite database and the Parquet datasets, then
+    the Parquet dataset is used.
+
+    Parameters
+    ----------
+    db_path : str, optional
+        The path to the SQLite database that the collectors write to.
+    parquet_path : str, optional
+        The directory that contains the Parquet datasets.
+    materialize : bool, optional
+        Whether to copy the tables into DuckDB instead of reading them from
+        their sources on every query. Defaults to False.
+    database : str, optional
+        The DuckDB database file. Defaults to an in-memory database.
+
+    Returns
+    ----------
+    con : duckdb.DuckDBPyConnection
+        The analytics database. Each collector table is available by its
+        name (E.g., 'NXOS_CAM_TABLE'), along with the views created by
+        create_analytics_views.
+
+    Raises
+    ----------
+    ImportError
+        If duckdb is not installed.
+    """
+    if duckdb is None:
+        raise ImportError('duckdb is not installed.')
+
+    con = duckdb.connect(database)
+    tables = list()
+    if parquet_path:
+        tables.extend(attach_parquet(con,
+                                     os.path.expanduser(parquet_path),
+                                     materialize))
+    if db_path:
+        db_path = os.path.expanduser(db_path)
+        tables.extend(attach_sqlite(con,
+                                    db_path,
+                                    materialize,
+                                    exclude=tables))
+
+    create_analytics_views(con, tables, materialize)
+
+    return con
+
+
+def query(con, sql, params=None):
+    """Runs a query on the analytics database.
+
+    Parameters
+    ----------
+    con : duckdb.DuckDBPyConnection
+        The analytics database.
+    sql : str
+        The query. Values should be passed as '?' parameters rather than
+        formatted into the query.
+    params : list, optional
+        The values of the parameters.
+
+    Returns
+    ----------
+    df : pandas.DataFrame
+        The result of the query.
+    """
+    return con.execute(sql, params or list()).df()
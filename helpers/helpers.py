@@ -6,21 +6,35 @@ A library of generic helper functions for dynamic runbooks.
 
 import ansible_runner
 import glob
-import ipaddress
 import numpy as np
 import os
 import pandas as pd
+import queue
 import re
 import requests
 import sqlite3 as sl
 import sys
+import threading
 import time
 import yaml
 from datetime import datetime as dt
 from getpass import getpass
+from helpers import cache_helpers as cah
+from helpers import ip_helpers as iph
+from helpers import parquet_helpers as pqh
+from helpers import ssh_helpers as sshh
 from tabulate import tabulate
 from typing import Dict, List
 
+# The compiled OUI index for each Net-Manage path (see update_oui_index)
+oui_index_cache = dict()
+oui_index_lock = threading.Lock()
+
+# The commands that are batched into a single playbook run for each
+# hostgroup (see ansible_register_batch)
+command_batches = dict()
+command_batches_lock = threading.Lock()
+
 
 def ansible_create_collectors_df(hostgroups, collectors):
     '''
@@ -151,6 +165,24 @@ def check_dir_existence(dir_path):
     return exists
 
 
+def combine_frames(frames, columns):
+    '''
+    Combines a list of DataFrames into one. This is used by collectors that
+    create one DataFrame per device.
+
+    Args:
+        frames (list):      A list of DataFrames with the same columns
+        columns (list):     The columns to use if 'frames' is empty
+
+    Returns:
+        df (DataFrame):     The combined DataFrame
+    '''
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True)
+    return df
+
+
 def convert_mask_to_cidr(netmask):
     '''
     Converts a subnet mask to CIDR notation.
@@ -323,6 +355,261 @@ def ansible_group_hostgroups_by_os(private_data_dir):
     return groups_by_os
 
 
+def ansible_run_events(private_data_dir,
+                       playbook,
+                       extravars,
+                       event_type='runner_on_ok',
+                       quiet=False,
+                       use_cache=True,
+                       limit=None):
+    '''
+    Runs a playbook and yields its events as they arrive. Unlike iterating
+    over 'runner.events' after ansible_runner.run() returns, the caller can
+    parse each host's output while the other hosts are still running. The
+    events are not written to the artifacts directory, so they are not read
+    back from disk either.
+
+    Args:
+        private_data_dir (str): The path to the Ansible private data directory
+        playbook (str):         The path to the playbook
+        extravars (dict):       The extra variables to pass to the playbook
+        event_type (str):       The type of event to yield. Defaults to
+                                'runner_on_ok', which is the event that
+                                contains the output of a task.
+        quiet (bool):           Whether to suppress the playbook's output.
+                                Defaults to False.
+        use_cache (bool):       Whether to use the output cache, if it is
+                                enabled (see cache_helpers). Defaults to True.
+        limit (list):           The inventory hostnames to limit the run to.
+                                Defaults to None, which runs the playbook for
+                                the whole host group.
+
+    Returns:
+        events (generator):     The events, in the order they arrive
+
+    If the output cache is enabled, then the events of the devices that have
+    cached output for the playbook and its commands are read from the cache,
+    and the playbook is only run for the other devices.
+
+    If the SSH engine is enabled (see ssh_helpers.enable_ssh_engine) and it
+    supports the playbook, then the playbook's commands are run over asyncssh
+    instead of by ansible-playbook. The events have the same structure.
+    '''
+    if use_cache and cah.use_output_cache(playbook) and \
+            event_type == 'runner_on_ok':
+        try:
+            hosts = sshh.get_inventory_hosts(extravars.get('host_group'),
+                                             private_data_dir)
+            hosts = [(host, address) for host, address, port in hosts]
+        except Exception:
+            # The inventory could not be read (E.g., it is not in YAML
+            # format), so the cache can be written to but not read from
+            hosts = list()
+        yield from cah.cached_run_events(
+            hosts,
+            playbook,
+            extravars,
+            lambda limit: ansible_run_events(private_data_dir,
+                                             playbook,
+                                             extravars,
+                                             quiet=quiet,
+                                             use_cache=False,
+                                             limit=limit))
+        return
+
+    # Batches are run for the whole host group, so they are not used when
+    # the run is limited to some of its devices
+    batch = None
+    if event_type == 'runner_on_ok' and limit is None:
+        batch = ansible_get_batch(private_data_dir, playbook, extravars)
+    if batch is not None:
+        yield from ansible_run_batch(batch,
+                                     private_data_dir,
+                                     playbook,
+                                     extravars,
+                                     quiet)
+        return
+
+    if sshh.use_ssh_engine(playbook):
+        yield from sshh.ssh_run_events(private_data_dir,
+                                       extravars,
+                                       event_type,
+                                       limit=limit)
+        return
+
+    events = queue.Queue()
+
+    def handle_event(event):
+        if event.get('event') == event_type:
+            events.put(event)
+        # Returning False keeps ansible_runner from saving the event to disk
+        return False
+
+    thread, runner = ansible_runner.run_async(
+        private_data_dir=private_data_dir,
+        playbook=playbook,
+        extravars=extravars,
+        limit=','.join(limit) if limit else None,
+        suppress_env_files=True,
+        quiet=quiet,
+        event_handler=handle_event,
+        finished_callback=lambda runner: events.put(None))
+
+    while True:
+        try:
+            event = events.get(timeout=1)
+        except queue.Empty:
+            # The playbook can stop without calling 'finished_callback' (E.g.,
+            # if it fails to start), so also stop when the thread exits
+            if not thread.is_alive() and events.empty():
+                break
+            continue
+        if event is None:
+            break
+        yield event
+
+    thread.join()
+
+
+def ansible_register_batch(private_data_dir, playbook, host_group, commands):
+    '''
+    Registers a batch of commands to run on a hostgroup with a single
+    playbook run. When a collector calls ansible_run_events for one of the
+    commands, the playbook is run once with every command in the batch, and
+    each collector is given the output of its own command. This means each
+    device is only logged into once, instead of once per collector.
+
+    The batch is removed after every command has been collected, or when
+    ansible_clear_batches is called. Note that if a device fails to run any
+    of the commands, then it is missing from the output of all of them.
+
+    Args:
+        private_data_dir (str): The path to the Ansible private data directory
+        playbook (str):         The path to the playbook. It must accept a
+                                list of commands (E.g.,
+                                'cisco_nxos_run_commands.yml').
+        host_group (str):       The inventory host group
+        commands (list):        The command of each collector. A command
+                                can be listed more than once, but it is only
+                                run once. Batches of less than two
+                                collectors are ignored.
+
+    Returns:
+        None
+    '''
+    # Count the collectors that use each command, since several collectors
+    # can parse the output of the same command
+    pending = dict()
+    for command in commands:
+        pending[command] = pending.get(command, 0) + 1
+    if len(commands) < 2:
+        return
+
+    key = (private_data_dir, playbook, host_group)
+    with command_batches_lock:
+        command_batches[key] = {'commands': list(pending),
+                                'pending': pending,
+                                'events': None,
+                                'error': None,
+                                'lock': threading.Lock()}
+
+
+def ansible_clear_batches():
+    '''
+    Removes every registered batch of commands.
+
+    Args:
+        None
+
+    Returns:
+        None
+    '''
+    with command_batches_lock:
+        command_batches.clear()
+
+
+def ansible_get_batch(private_data_dir, playbook, extravars):
+    '''
+    Gets the registered batch that contains the command in 'extravars' and
+    marks the command as collected.
+
+    Args:
+        private_data_dir (str): The path to the Ansible private data directory
+        playbook (str):         The path to the playbook
+        extravars (dict):       The extra variables to pass to the playbook
+
+    Returns:
+        batch (dict):           The batch, or None if the command is not in
+                                a batch (or it has already been collected)
+    '''
+    # Collectors pass a single command as a string. The batch itself is run
+    # with a list of commands, so it never matches its own batch.
+    commands = extravars.get('commands')
+    if not isinstance(commands, str):
+        return None
+
+    key = (private_data_dir, playbook, extravars.get('host_group'))
+    with command_batches_lock:
+        batch = command_batches.get(key)
+        if batch is None or commands not in batch['pending']:
+            return None
+        batch['pending'][commands] -= 1
+        if batch['pending'][commands] == 0:
+            del batch['pending'][commands]
+        if not batch['pending']:
+            del command_batches[key]
+
+    return batch
+
+
+def ansible_run_batch(batch, private_data_dir, playbook, extravars, quiet):
+    '''
+    Runs a batch of commands, unless it has already been run, and yields the
+    output of the command in 'extravars' for each device.
+
+    Args:
+        batch (dict):           The batch (see ansible_get_batch)
+        private_data_dir (str): The path to the Ansible private data directory
+        playbook (str):         The path to the playbook
+        extravars (dict):       The extra variables of the collector. The
+                                first collector's extravars are used to run
+                                the batch.
+        quiet (bool):           Whether to suppress the playbook's output
+
+    Returns:
+        events (generator):     The 'runner_on_ok' events, with each event's
+                                output limited to the collector's command
+    '''
+    # The first collector to get here runs the batch. The others wait for it
+    # to finish and then use its output.
+    with batch['lock']:
+        if batch['events'] is None and batch['error'] is None:
+            batch_vars = dict(extravars)
+            batch_vars['commands'] = batch['commands']
+            try:
+                batch['events'] = list(ansible_run_events(private_data_dir,
+                                                          playbook,
+                                                          batch_vars,
+                                                          quiet=quiet,
+                                                          use_cache=False))
+            except Exception as e:
+                batch['error'] = e
+    if batch['error'] is not None:
+        raise batch['error']
+
+    pos = batch['commands'].index(extravars['commands'])
+
+    for event in batch['events']:
+        event_data = event['event_data']
+        res = dict(event_data['res'])
+        res['stdout'] = [res['stdout'][pos]]
+        if 'stdout_lines' in res:
+            res['stdout_lines'] = [res['stdout_lines'][pos]]
+        event_data = dict(event_data)
+        event_data['res'] = res
+        yield {**event, 'event_data': event_data}
+
+
 def define_collectors(hostgroup):
     '''
     Creates a list of collectors.
@@ -392,6 +679,7 @@ def define_collectors(hostgroup):
                   'logical_interfaces': ['paloaltonetworks.panos'],
                   'physical_interfaces': ['paloaltonetworks.panos'],
                   'port_channel_data': ['cisco.nxos.nxos'],
+                  'port_channel_members': ['cisco.nxos.nxos'],
                   'vpc_state': ['cisco.nxos.nxos'],
                   'vrfs': ['cisco.ios.ios', 'cisco.nxos.nxos']}
 
@@ -402,6 +690,42 @@ def define_collectors(hostgroup):
     return available
 
 
+def define_collector_dependencies():
+    '''
+    Creates a dictionary of the collectors that other collectors depend on.
+    set_dependencies uses it to add missing dependencies to a selection, and
+    rc.schedule_collectors uses it to run collectors concurrently.
+
+    Args:
+        None
+
+    Returns:
+        dependencies (dict):    The collector names are the keys. The values
+                                are lists of the collectors that must finish
+                                before the key can run.
+    '''
+    dependencies = {'device_statuses': ['organizations'],
+                    'get_device_statuses': ['get_organizations'],
+                    'infoblox_get_networks_parent_containers':
+                        ['infoblox_get_networks',
+                         'infoblox_get_network_containers'],
+                    'interface_summary': ['cam_table',
+                                          'interface_description',
+                                          'interface_status'],
+                    'network_appliance_vlans': ['org_networks'],
+                    'network_device_statuses': ['org_device_statuses'],
+                    'network_devices': ['organizations'],
+                    'org_device_statuses': ['org_networks'],
+                    'org_devices': ['organizations'],
+                    'org_networks': ['organizations'],
+                    'switch_lldp_neighbors': ['switch_port_statuses'],
+                    'switch_port_statuses': ['org_devices', 'organizations'],
+                    'switch_port_usages': ['switch_port_statuses'],
+                    'vip_destinations': ['vip_availability'],
+                    'vpn_statuses': ['organizations']}
+    return dependencies
+
+
 def f5_create_authentication_token(device,
                                    username,
                                    password,
@@ -455,10 +779,12 @@ def find_mac_vendors(macs, nm_path):
     ----------
     There is a Python library to do this, but it is quite slow.
 
-    It might seem inefficient to parse the OUIs from a text file on an
-    as-needed basis. However, testing found that the operation only takes
-    about 250ms, and the size of the resulting dataframe is only
-    approximately 500KB.
+    The MAC addresses are looked up in a compiled index of the MA-L, MA-M
+    and MA-S registries (see update_oui_index). The whole list is resolved
+    with one binary search per registry, so the cost grows with the number
+    of MAC addresses, not the number of MAC addresses times the number of
+    OUIs. The most specific assignment wins, so a MAC address in an MA-S
+    block returns the MA-S vendor instead of 'IEEE Registration Authority'.
 
     Returns
     ----------
@@ -477,31 +803,77 @@ def find_mac_vendors(macs, nm_path):
     {'mac': {0: '00:50:56:bd:52:79', 1: 'c4:34:6b:b9:99:32'},
     'vendor': {0: 'VMware, Inc.', 1: 'Hewlett Packard'}}
     """
-    # Convert MAC addresses to base 16 by removing special characters.
-    addresses = [''.join(filter(str.isalnum, _)).upper() for _ in macs]
-
-    # Create a list to store vendors
-    vendors = list()
+    # Get the compiled OUI index, building it first if necessary.
+    index = update_oui_index(nm_path)
 
-    # Check if the list of OUIs exists and/or needs to be updated.
-    df_ouis = update_ouis(nm_path)
-
-    # Search df_ouis for the vendor and add it to 'vendors'.
-    for address in addresses:
-        vendor = df_ouis.loc[df_ouis['base'] == address[:6]]['vendor']
-        if len(vendor) >= 1:
-            vendors.append(vendor.squeeze())
-        else:
-            vendors.append('unknown')
+    # Convert MAC addresses to base 16 by removing special characters.
+    addresses = pd.Series(list(macs), dtype=object).astype(str)
+    addresses = addresses.str.replace('[^0-9A-Fa-f]', '', regex=True)
+    lengths = addresses.str.len().to_numpy()
+
+    # Convert the first 36 bits of each address to an integer.
+    padded = addresses.str.ljust(9, '0').str[:9].to_numpy(dtype='S9')
+    values = hex_to_int(padded)
+
+    # Search each registry, from least to most specific. The most specific
+    # match overwrites the others.
+    vendor_ids = np.full(len(values), -1, dtype=np.int64)
+    for registry, bits in [('ma_l', 24), ('ma_m', 28), ('ma_s', 36)]:
+        keys = index[f'{registry}_keys']
+        if len(keys) == 0:
+            continue
+        prefixes = values >> np.uint64(36 - bits)
+        pos = np.searchsorted(keys, prefixes)
+        pos = np.minimum(pos, len(keys) - 1)
+        found = (keys[pos] == prefixes) & (lengths >= bits // 4)
+        vendor_ids[found] = index[f'{registry}_vendors'][pos[found]]
+
+    # Create the dataframe. Addresses that were not found are 'unknown'.
+    vendors = np.array(index['vendors'] + ['unknown'], dtype=object)
 
-    # Create the dataframe.
     df = pd.DataFrame()
     df['mac'] = macs
-    df['vendor'] = vendors
+    df['vendor'] = vendors[vendor_ids]
 
     return df
 
 
+def hex_to_int(values):
+    """Converts an array of fixed-width hexadecimal strings to integers.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        An array of bytes strings (E.g., dtype 'S9') containing only
+        hexadecimal characters. All of the strings must be the same length.
+
+    Returns
+    ----------
+    result : numpy.ndarray
+        An array of unsigned 64-bit integers.
+
+    Examples
+    ----------
+    >>> hex_to_int(np.array([b'0050569', b'C4346BB'], dtype='S7'))
+    array([  5264745, 205800635], dtype=uint64)
+    """
+    width = values.dtype.itemsize
+    if len(values) == 0 or width == 0:
+        return np.zeros(len(values), dtype=np.uint64)
+
+    # Map each ASCII character to the value of its hexadecimal digit.
+    table = np.zeros(256, dtype=np.uint64)
+    for i, char in enumerate('0123456789ABCDEF'):
+        table[ord(char)] = i
+        table[ord(char.lower())] = i
+
+    digits = table[values.view(np.uint8).reshape(-1, width)]
+    powers = np.uint64(16) ** np.arange(width - 1, -1, -1, dtype=np.uint64)
+    result = (digits * powers).sum(axis=1, dtype=np.uint64)
+
+    return result
+
+
 def generate_subnet_details(addresses: List[str],
                             return_keys: List[str] = ['subnet',
                                                       'network_ip',
@@ -529,18 +901,10 @@ def generate_subnet_details(addresses: List[str],
     - network_ip : list of str
     List of network IP for each IP address in the input list
     - broadcast_ip : list of str
-    List of broadcast IP for each IP address in the input list
+    List of broadcast IP for each IP address in the input list. For IPv6,
+    this is the last address in the subnet.
     """
-    subnet = list()
-    network_ip = list()
-    broadcast_ip = list()
-
-    for ip in addresses:
-        ip_obj = ipaddress.ip_interface(ip)
-        subnet.append(str(ip_obj.network))
-        network_ip.append(str(ip_obj.network.network_address))
-        brd = str(ipaddress.IPv4Address(int(ip_obj.network.broadcast_address)))
-        broadcast_ip.append(brd)
+    subnet, network_ip, broadcast_ip = iph.calculate_subnets(addresses)
 
     return {return_keys[0]: subnet,
             return_keys[1]: network_ip,
@@ -656,6 +1020,12 @@ def get_first_last_timestamp(db_path, table, col_name):
     Gets the first and last timestamp from a database table for each unique
     entry in a column.
 
+    The timestamps are read from the FIRST_LAST_TIMESTAMPS table, which
+    add_to_db keeps up to date as collector output is inserted. If the table
+    and column have not been tracked yet, then they are added to it with one
+    grouped query over the table, or from the snapshots in the catalog if the
+    table is in 'delta' mode. After that they are maintained at insert time.
+
     Args:
         db_path (str):  The path to the database
         table (str):    The table name
@@ -666,56 +1036,983 @@ def get_first_last_timestamp(db_path, table, col_name):
         df_stamps (df): A DataFrame containing the first and last timestamp for
                         each unique device
     '''
-    df_data = dict()
-    df_data[col_name] = list()
-    df_data['first_ts'] = list()
-    df_data['last_ts'] = list()
-
-    # Get the unique entries for col_name (usually a device name, MAC address,
-    # etc). This is necessary since the first timestamp in the table won't
-    # always have all the entries for that table (devices might be added or
-    # removed, ARP tables might change, and so on)
+    table = table.upper()
+
     con = sl.connect(db_path)
-    query = f'select distinct {col_name} from {table}'
-    df_uniques = pd.read_sql(query, con)
-    uniques = df_uniques[col_name].to_list()
+    cur = con.cursor()
+    create_first_last_table(cur)
+
+    # Check whether the table and column are already being tracked. If not,
+    # then add the first and last timestamp of every unique entry, and start
+    # tracking them.
+    query = '''select 1 from FIRST_LAST_COLUMNS
+               where table_name = ? and col_name = ?'''
+    tracked = cur.execute(query, (table, col_name)).fetchone()
+    if not tracked and is_delta_table(con, table):
+        # Tables in 'delta' mode only store the changes, so every snapshot
+        # in the catalog is rebuilt to find the entries that it contains
+        for ts in get_snapshots(con, table)['timestamp']:
+            df = read_delta_snapshot(con, table, ts)
+            update_first_last_timestamps(cur, table, df, [col_name])
+        cur.execute('insert into FIRST_LAST_COLUMNS values (?, ?)',
+                    (table, col_name))
+        con.commit()
+    elif not tracked:
+        rebuild_first_last_timestamps(cur, table, [col_name])
+        cur.execute('insert into FIRST_LAST_COLUMNS values (?, ?)',
+                    (table, col_name))
+        con.commit()
+
+    query = f'''select value as "{col_name}", first_ts, last_ts
+                from FIRST_LAST_TIMESTAMPS
+                where table_name = ? and col_name = ?'''
+    df_stamps = pd.read_sql(query, con, params=(table, col_name))
+    con.close()
 
-    # Create a dictionary to store the first and last timestamps for col_name.
-    # This will be used to create df_stamps
-    # df_data = dict()
+    return df_stamps
+
+
+def create_first_last_table(cur):
+    '''
+    Creates the table that stores the first and last timestamp of each unique
+    entry in a column of a collector table (see get_first_last_timestamp),
+    and the table that stores which columns are being tracked.
+
+    Args:
+        cur (obj):  A cursor for the database connection
+
+    Returns:
+        None
+    '''
+    cur.execute('''create table if not exists FIRST_LAST_TIMESTAMPS (
+                    table_name text not null,
+                    col_name text not null,
+                    value,
+                    first_ts,
+                    last_ts,
+                    primary key (table_name, col_name, value)
+                   ) without rowid''')
+    cur.execute('''create table if not exists FIRST_LAST_COLUMNS (
+                    table_name text not null,
+                    col_name text not null,
+                    primary key (table_name, col_name)
+                   ) without rowid''')
+
+
+def define_first_last_columns():
+    '''
+    Defines the columns whose first and last timestamps are tracked from the
+    moment a table is created. Other columns are tracked as soon as
+    get_first_last_timestamp is called for them.
+
+    Args:
+        None
+
+    Returns:
+        columns (dict): The table names are the keys, and the values are
+                        lists of columns
+    '''
+    columns = {'BIGIP_NODE_AVAILABILITY': ['device'],
+               'BIGIP_POOL_AVAILABILITY': ['device'],
+               'BIGIP_POOL_MEMBER_AVAILABILITY': ['device'],
+               'BIGIP_VIP_AVAILABILITY': ['device'],
+               'MERAKI_ORG_DEVICE_STATUSES': ['mac']}
+    return columns
+
+
+def update_first_last_timestamps(cur, table, result, columns):
+    '''
+    Updates the first and last timestamps of the unique entries in a
+    collector's output. This is called by add_to_db when the output is
+    inserted, and it does not commit the transaction.
+
+    Args:
+        cur (obj):          A cursor for the database connection
+        table (str):        The table name
+        result (DataFrame): The output of the collector, including the
+                            'timestamp' column
+        columns (list):     The columns to update
+
+    Returns:
+        None
+    '''
+    query = '''insert into FIRST_LAST_TIMESTAMPS
+               values (?, ?, ?, ?, ?)
+               on conflict (table_name, col_name, value) do update set
+                   first_ts = min(first_ts, excluded.first_ts),
+                   last_ts = max(last_ts, excluded.last_ts)'''
+    for col in columns:
+        if col not in result.columns:
+            continue
+        df = result[[col, 'timestamp']].dropna()
+        df = df.groupby(col, sort=False)['timestamp'].agg(['min', 'max'])
+        rows = zip([table.upper()] * len(df),
+                   [col] * len(df),
+                   df.index.to_list(),
+                   df['min'].to_list(),
+                   df['max'].to_list())
+        cur.executemany(query, rows)
+
+
+def rebuild_first_last_timestamps(cur, table, columns=None):
+    '''
+    Recomputes the first and last timestamps of the unique entries in some
+    of the columns of a collector table, with one grouped query over the
+    table for each column. This is used to start tracking a column, and by
+    apply_retention after snapshots are deleted. It does not commit the
+    transaction.
+
+    Args:
+        cur (obj):          A cursor for the database connection
+        table (str):        The table name
+        columns (list):     The columns to recompute. Defaults to None, which
+                            recomputes every column that is tracked for the
+                            table.
+
+    Returns:
+        None
+    '''
+    table = table.upper()
+    create_first_last_table(cur)
+
+    if columns is None:
+        cur.execute('''select col_name from FIRST_LAST_COLUMNS
+                       where table_name = ?
+                       union
+                       select distinct col_name from FIRST_LAST_TIMESTAMPS
+                       where table_name = ?''', (table, table))
+        columns = [row[0] for row in cur.fetchall()]
+
+    cur.execute(f'pragma table_info("{table}")')
+    existing = [row[1] for row in cur.fetchall()]
+
+    for col in columns:
+        cur.execute('''delete from FIRST_LAST_TIMESTAMPS
+                       where table_name = ? and col_name = ?''', (table, col))
+        if col not in existing or 'timestamp' not in existing:
+            continue
+        cur.execute(f'''insert into FIRST_LAST_TIMESTAMPS
+                        select ?, ?, "{col}", min(timestamp), max(timestamp)
+                        from {table}
+                        where "{col}" is not null
+                        group by "{col}"
+                    ''', (table, col))
+
+
+def create_snapshot_table(cur):
+    '''
+    Creates the snapshot catalog. Each row is one snapshot (timestamp) of a
+    collector table, with its row count and the range of 'table_id' values
+    that its rows were inserted with. The latest snapshot and the snapshots
+    in a time range are found from the catalog's primary key, and the rows of
+    a snapshot are read with a 'table_id' range instead of scanning the whole
+    collector table.
+
+    Args:
+        cur (obj):  A cursor for the database connection
+
+    Returns:
+        None
+    '''
+    cur.execute('''create table if not exists SNAPSHOTS (
+                    table_name text not null,
+                    timestamp text not null,
+                    row_count integer not null,
+                    first_id integer,
+                    last_id integer,
+                    primary key (table_name, timestamp)
+                   ) without rowid''')
+
+
+def catalog_snapshots(cur, table, rebuild=False):
+    '''
+    Adds the snapshots of a collector table to the catalog with one grouped
+    query over the table. This is only needed for tables that were created
+    before the catalog existed, or after rows are deleted from a table
+    without going through apply_retention. It is called by add_to_db and
+    apply_retention, so that the functions that read the catalog never write
+    to the database. After that, the catalog is maintained by add_to_db.
+
+    Args:
+        cur (obj):      A cursor for the database connection
+        table (str):    The table name
+        rebuild (bool): Whether to rebuild the table's catalog even if it
+                        already has snapshots. Defaults to False.
+
+    Returns:
+        None
+    '''
+    table = table.upper()
+    create_snapshot_table(cur)
+
+    if not rebuild:
+        cur.execute('select 1 from SNAPSHOTS where table_name = ? limit 1',
+                    (table,))
+        if cur.fetchone():
+            return
+
+    cur.execute(f'pragma table_info("{table}")')
+    columns = [row[1] for row in cur.fetchall()]
+    if 'timestamp' not in columns or 'table_id' not in columns:
+        return
+
+    cur.execute('delete from SNAPSHOTS where table_name = ?', (table,))
+    cur.execute(f'''insert into SNAPSHOTS
+                    select ?, timestamp, count(*), min(table_id),
+                           max(table_id)
+                    from {table}
+                    where timestamp is not null
+                    group by timestamp''', (table,))
+
+
+def update_snapshot_catalog(cur, table, result):
+    '''
+    Adds the snapshots in a collector's output to the catalog. This is called
+    by add_to_db right after the output is inserted, and it does not commit
+    the transaction.
+
+    Args:
+        cur (obj):          A cursor for the database connection
+        table (str):        The table name
+        result (DataFrame): The output of the collector, including the
+                            'timestamp' column
+
+    Returns:
+        None
+    '''
+    if len(result) == 0 or 'timestamp' not in result.columns:
+        return
+
+    # Tables that were created without a 'table_id' column (E.g., by an
+    # earlier version of add_to_db with 'replace') are not cataloged. Their
+    # snapshots are read by timestamp instead.
+    table = table.upper()
+    cur.execute(f'pragma table_info("{table}")')
+    if 'table_id' not in [row[1] for row in cur.fetchall()]:
+        return
+
+    # The rows were inserted with consecutive IDs, ending at the largest one
+    cur.execute(f'select max(table_id) from {table}')
+    last_id = cur.fetchone()[0]
+    first_id = last_id - len(result) + 1
+
+    counts = result['timestamp'].dropna().value_counts(sort=False)
+    query = '''insert into SNAPSHOTS
+               values (?, ?, ?, ?, ?)
+               on conflict (table_name, timestamp) do update set
+                   row_count = row_count + excluded.row_count,
+                   first_id = min(first_id, excluded.first_id),
+                   last_id = max(last_id, excluded.last_id)'''
+    cur.executemany(query, [(table, ts, int(count), first_id, last_id)
+                            for ts, count in counts.items()])
+
+
+def is_cataloged(con, table):
+    '''
+    Checks whether the snapshots of a collector table are in the snapshot
+    catalog. Tables that were created before the catalog existed are added
+    to it by add_to_db the next time that they are written to.
+
+    Args:
+        con (obj):      The database connection
+        table (str):    The table name
+
+    Returns:
+        cataloged (bool):   Whether the table has snapshots in the catalog
+    '''
+    cur = con.cursor()
+    cur.execute('''select name from sqlite_master
+                   where type = "table" and name = "SNAPSHOTS"''')
+    if not cur.fetchone():
+        return False
+    cur.execute('select 1 from SNAPSHOTS where table_name = ? limit 1',
+                (table.upper(),))
+    return cur.fetchone() is not None
+
+
+def get_latest_snapshot(con, table):
+    '''
+    Gets the timestamp of the latest snapshot of a collector table from the
+    snapshot catalog. Tables that are not in the catalog are read with one
+    query over the table. This does not write to the database.
+
+    Args:
+        con (obj):      The database connection
+        table (str):    The table name
+
+    Returns:
+        timestamp (str):    The latest timestamp, or None if the table does
+                            not have any snapshots
+    '''
+    table = table.upper()
+    cur = con.cursor()
+    if is_cataloged(con, table):
+        cur.execute('''select max(timestamp) from SNAPSHOTS
+                       where table_name = ?''', (table,))
+        return cur.fetchone()[0]
+
+    cur.execute(f'pragma table_info("{table}")')
+    if 'timestamp' not in [row[1] for row in cur.fetchall()]:
+        return None
+    cur.execute(f'select max(timestamp) from {table}')
+    return cur.fetchone()[0]
+
+
+def get_snapshots(con, table, start=None, end=None):
+    '''
+    Gets the snapshots of a collector table in a time range from the snapshot
+    catalog. Tables that are not in the catalog are read with one grouped
+    query over the table. This does not write to the database.
+
+    Args:
+        con (obj):      The database connection
+        table (str):    The table name
+        start (str):    The first timestamp to include. Defaults to None,
+                        which includes every snapshot before 'end'.
+        end (str):      The last timestamp to include. Defaults to None,
+                        which includes every snapshot after 'start'.
+
+    Returns:
+        df_snapshots (DataFrame):   The timestamp, row count and ID range of
+                                    each snapshot, from oldest to newest
+    '''
+    table = table.upper()
+    columns = ['timestamp', 'row_count', 'first_id', 'last_id']
+    cur = con.cursor()
+    cataloged = is_cataloged(con, table)
+    if cataloged:
+        query = ['select timestamp, row_count, first_id, last_id',
+                 'from SNAPSHOTS',
+                 'where table_name = ?']
+        params = [table]
+    else:
+        cur.execute(f'pragma table_info("{table}")')
+        schema = [row[1] for row in cur.fetchall()]
+        if 'timestamp' not in schema:
+            return pd.DataFrame(columns=columns)
+        ids = 'min(table_id), max(table_id)' if 'table_id' in schema \
+            else 'null, null'
+        query = [f'select timestamp, count(*) as row_count, {ids}',
+                 f'from {table}',
+                 'where timestamp is not null']
+        params = list()
+    if start is not None:
+        query.append('and timestamp >= ?')
+        params.append(start)
+    if end is not None:
+        query.append('and timestamp <= ?')
+        params.append(end)
+    if not cataloged:
+        query.append('group by timestamp')
+    query.append('order by timestamp')
+
+    df_snapshots = pd.read_sql(' '.join(query), con, params=params)
+    df_snapshots.columns = columns
+    return df_snapshots
+
+
+def read_snapshot(con, table, timestamp=None, columns=list()):
+    '''
+    Reads the rows of one snapshot of a collector table. The rows are found
+    with the snapshot's 'table_id' range from the catalog, or by their
+    timestamp if the table is not in the catalog.
+
+    Args:
+        con (obj):          The database connection
+        table (str):        The table name
+        timestamp (str):    The timestamp of the snapshot. Defaults to None,
+                            which reads the latest snapshot.
+        columns (list):     The columns to read. Defaults to all columns.
+
+    Returns:
+        df (DataFrame):     The rows of the snapshot
+    '''
+    # Tables in 'delta' mode only store the changes, so the snapshot has to
+    # be rebuilt
+    if is_delta_table(con, table):
+        df = read_delta_snapshot(con, table, timestamp)
+        if columns:
+            df = df[columns]
+        return df
+
+    cols = ', '.join([f'"{c}"' for c in columns]) if columns else '*'
+    if timestamp is None:
+        timestamp = get_latest_snapshot(con, table)
+
+    ids = None
+    if is_cataloged(con, table):
+        cur = con.cursor()
+        cur.execute('''select first_id, last_id from SNAPSHOTS
+                       where table_name = ? and timestamp = ?''',
+                    (table.upper(), timestamp))
+        ids = cur.fetchone()
+    if ids is None or ids[0] is None:
+        query = f'select {cols} from {table} where timestamp = ?'
+        return pd.read_sql(query, con, params=(timestamp,))
+
+    query = f'''select {cols} from {table}
+                where table_id between ? and ?
+                and timestamp = ?'''
+    df = pd.read_sql(query, con, params=(ids[0], ids[1], timestamp))
+    return df
+
+
+def apply_retention(db_path,
+                    max_age_days=None,
+                    downsample_after_days=None,
+                    downsample_format='%Y-%m-%d',
+                    tables=list(),
+                    policies=dict(),
+                    now=None):
+    '''
+    Deletes old snapshots from the collector tables. Snapshots older than
+    'max_age_days' are deleted. Snapshots older than 'downsample_after_days'
+    are downsampled, so only the latest snapshot in each period (by default,
+    each day) is kept. The latest snapshot of a table is never deleted. The
+    first and last timestamps of the table's tracked columns (see
+    get_first_last_timestamp) are recomputed from the snapshots that remain.
+
+    Args:
+        db_path (str):               The path to the database
+        max_age_days (int):          The number of days to keep snapshots for.
+                                     Defaults to None, which keeps them
+                                     forever.
+        downsample_after_days (int): The number of days after which snapshots
+                                     are downsampled. Defaults to None, which
+                                     does not downsample.
+        downsample_format (str):     The strftime format that defines the
+                                     downsampling periods. Snapshots with the
+                                     same formatted timestamp are in the same
+                                     period. Defaults to one period per day.
+        tables (list):               The tables to apply the retention to.
+                                     Defaults to every table in the catalog.
+        policies (dict):             Settings for specific tables. The table
+                                     names are the keys, and the values are
+                                     dictionaries that override
+                                     'max_age_days', 'downsample_after_days'
+                                     and 'downsample_format' for that table.
+                                     For example:
+                                     {'NXOS_CAM_TABLE': {'max_age_days': 7}}
+        now (datetime):              The time to calculate the age of the
+                                     snapshots from. Defaults to now.
+
+    Returns:
+        df_deleted (DataFrame):      The table name, timestamp and row count
+                                     of each snapshot that was deleted
+    '''
+    now = now or dt.now()
+    policies = {k.upper(): v for k, v in policies.items()}
+
+    con = sl.connect(db_path)
+    cur = con.cursor()
+    create_snapshot_table(cur)
+
+    if tables:
+        tables = [_.upper() for _ in tables]
+    else:
+        cur.execute('select distinct table_name from SNAPSHOTS')
+        tables = [row[0] for row in cur.fetchall()]
+        tables = list(dict.fromkeys(tables + list(policies)))
+
+    deleted = list()
+    for table in tables:
+        policy = {'max_age_days': max_age_days,
+                  'downsample_after_days': downsample_after_days,
+                  'downsample_format': downsample_format}
+        policy.update(policies.get(table, dict()))
+
+        # Snapshots of 'delta' mode tables depend on the changes in the
+        # snapshots before them, so they cannot be deleted individually
+        if is_delta_table(con, table):
+            continue
+
+        catalog_snapshots(cur, table)
+        cur.execute('''select timestamp, row_count, first_id, last_id
+                       from SNAPSHOTS where table_name = ?
+                       order by timestamp desc''', (table,))
+        snapshots = cur.fetchall()
+
+        # Find the snapshots to delete. They are sorted from newest to
+        # oldest, so the first snapshot in each period is the one to keep.
+        periods = set()
+        stale = list()
+        for pos, (ts, row_count, first_id, last_id) in enumerate(snapshots):
+            try:
+                age = (now - dt.strptime(ts, '%Y-%m-%d_%H%M')).days
+            except (TypeError, ValueError):
+                continue
+            if pos == 0:
+                periods.add(dt.strptime(ts, '%Y-%m-%d_%H%M').strftime(
+                    policy['downsample_format']))
+                continue
+            if policy['max_age_days'] is not None and \
+                    age > policy['max_age_days']:
+                stale.append((ts, row_count, first_id, last_id))
+                continue
+            if policy['downsample_after_days'] is not None and \
+                    age > policy['downsample_after_days']:
+                period = dt.strptime(ts, '%Y-%m-%d_%H%M').strftime(
+                    policy['downsample_format'])
+                if period in periods:
+                    stale.append((ts, row_count, first_id, last_id))
+                    continue
+                periods.add(period)
+
+        for ts, row_count, first_id, last_id in stale:
+            cur.execute(f'''delete from {table}
+                            where table_id between ? and ?
+                            and timestamp = ?''', (first_id, last_id, ts))
+            cur.execute('''delete from SNAPSHOTS
+                           where table_name = ? and timestamp = ?''',
+                        (table, ts))
+            deleted.append([table, ts, row_count])
+
+        # The first and last timestamps can refer to the deleted snapshots,
+        # so they are recomputed in the same transaction
+        if stale:
+            rebuild_first_last_timestamps(cur, table)
+        con.commit()
 
-    query = f'select distinct timestamp from {table}'
-    timestamps = pd.read_sql(query, con)['timestamp'].to_list()
-
-    for unique in uniques:
-        stamps = list()
-        for ts in timestamps:
-            query = f'''select timestamp from {table}
-                        where timestamp = "{ts}" and {col_name} = "{unique}"'''
-            for item in pd.read_sql(query, con)['timestamp'].to_list():
-                stamps.append(item)
-        df_data[col_name].append(unique)
-        df_data['first_ts'].append(stamps[0])
-        df_data['last_ts'].append(stamps[-1])
-
-    # This is an alternative way to collect the first and last timestamps for
-    # each col_name. It does not utilize an index (assuming the table has one),
-    # but the speed was about the same. I am leaving it here to do more
-    # testing with in the future.
-
-    # for unique in uniques:
-    #     query = f'''select distinct timestamp from {table}
-    #                 where {col_name} = "{unique}"'''
-    #     df_stamps = pd.read_sql(query, con)
-    #     stamps = df_stamps['timestamp'].to_list()
-    #     df_data[col_name].append(unique)
-    #     df_data['first_ts'].append(stamps[0])
-    #     df_data['last_ts'].append(stamps[-1])
     con.close()
 
-    df_stamps = pd.DataFrame.from_dict(df_data)
+    df_deleted = pd.DataFrame(data=deleted,
+                              columns=['table_name', 'timestamp', 'row_count'])
+    return df_deleted
 
-    return df_stamps
+
+def define_table_schemas():
+    '''
+    Defines the schemas of collector tables. Each schema can contain:
+
+    - columns:  The types of the columns that are not text. add_to_db
+                converts these columns to their types (see
+                coerce_table_types), and the table is created with them.
+                The types are 'integer', 'real', 'boolean' and 'text'.
+    - keys:     The natural key of a row. It is used by 'delta' mode (see
+                diff_snapshot).
+    - scope:    The column that each write covers (see define_delta_keys).
+    - indexes:  Lists of columns to index. The indexes are created when the
+                table is written to.
+
+    Columns that are not defined are stored the same way as before, without
+    a type.
+
+    Args:
+        None
+
+    Returns:
+        schemas (dict): The table names are the keys, and the values are
+                        dictionaries containing the schemas
+    '''
+    schemas = {'BIGIP_ARP_TABLE':
+               {'columns': {'Expire-in-sec': 'integer'},
+                'indexes': [['Address'], ['HWaddress']]},
+               'BIGIP_POOL_MEMBER_AVAILABILITY':
+               {'keys': ['device', 'partition', 'pool_name', 'pool_member'],
+                'scope': 'device',
+                'indexes': [['pool_name'], ['pool_member']]},
+               'IOS_ARP_TABLE':
+               {'columns': {'age': 'integer'},
+                'indexes': [['address'], ['mac']]},
+               'IOS_CAM_TABLE':
+               {'columns': {'vlan': 'integer'},
+                'keys': ['device', 'vlan', 'mac', 'ports'],
+                'scope': 'device',
+                'indexes': [['mac']]},
+               'IOS_VLANS':
+               {'columns': {'vlan': 'integer'}},
+               'MERAKI_NETWORK_CLIENTS':
+               {'indexes': [['mac'], ['ip']]},
+               'MERAKI_ORG_DEVICES':
+               {'columns': {'lat': 'real', 'lng': 'real'},
+                'indexes': [['serial'], ['mac']]},
+               'MERAKI_ORG_DEVICE_STATUSES':
+               {'keys': ['serial'],
+                'scope': 'orgId'},
+               'MERAKI_SWITCH_PORT_STATUSES':
+               {'columns': {'enabled': 'boolean',
+                            'isUplink': 'boolean',
+                            'clientCount': 'integer',
+                            'powerUsageInWh': 'real'},
+                'indexes': [['serial', 'portId']]},
+               'MERAKI_SWITCH_PORT_USAGES':
+               {'columns': {'ratePerSec': 'real',
+                            'sentRatePerSec': 'real',
+                            'recvRatePerSec': 'real'},
+                'indexes': [['serial', 'portId']]},
+               'NXOS_ARP_TABLE':
+               {'indexes': [['ip_address'], ['mac_address']]},
+               'NXOS_CAM_TABLE':
+               {'columns': {'vlan': 'integer'},
+                'keys': ['device', 'interface', 'mac', 'vlan'],
+                'scope': 'device',
+                'indexes': [['mac']]},
+               'NXOS_INTERFACE_IP_ADDRESSES':
+               {'indexes': [['device', 'interface']]}}
+    return schemas
+
+
+def define_delta_keys():
+    '''
+    Defines the natural key and the scope of the tables that are stored in
+    'delta' mode (see diff_snapshot). The key identifies a row across
+    snapshots. The scope is the column that each write covers, so rows are
+    only marked as deleted if their scope is in the new output (E.g., the
+    output of one hostgroup does not delete the rows of another). The keys
+    are defined in define_table_schemas.
+
+    Only the tables that are defined here can be stored in 'delta' mode.
+    Their readers read snapshots with read_snapshot, which rebuilds the rows
+    that did not change. Other tables have readers that query the raw table
+    (E.g., by timestamp or across its history), so create_delta_tables
+    rejects them.
+
+    Args:
+        None
+
+    Returns:
+        delta_keys (dict):  The table names are the keys. The values are
+                            dictionaries containing the 'keys' and 'scope'.
+    '''
+    delta_keys = {table: {'keys': schema['keys'],
+                          'scope': schema.get('scope', 'device')}
+                  for table, schema in define_table_schemas().items()
+                  if schema.get('keys')}
+    return delta_keys
+
+
+def define_column_types():
+    '''
+    Defines the SQLite column type of each type in define_table_schemas.
+    Booleans are stored as integers.
+
+    Args:
+        None
+
+    Returns:
+        types (dict):   The schema types are the keys, and the SQLite types
+                        are the values
+    '''
+    types = {'boolean': 'INTEGER',
+             'integer': 'INTEGER',
+             'real': 'REAL',
+             'text': 'TEXT'}
+    return types
+
+
+def coerce_table_types(table, result):
+    '''
+    Converts the columns of a collector's output to the types in its schema
+    (see define_table_schemas). Many collectors convert their output to
+    strings, so missing values ('None', 'nan' and empty strings) are
+    converted to NULL. Values that cannot be converted are kept as they are,
+    so no data is lost.
+
+    Args:
+        table (str):        The table name
+        result (DataFrame): The output of the collector
+
+    Returns:
+        result (DataFrame): The output, with the columns converted. It is
+                            only copied if a column is converted.
+    '''
+    schema = define_table_schemas().get(table.upper(), dict())
+    columns = {c: t for c, t in schema.get('columns', dict()).items()
+               if c in result.columns and t != 'text'}
+    if not columns or len(result) == 0:
+        return result
+
+    result = result.copy()
+    for col, col_type in columns.items():
+        values = result[col]
+        text = values.astype(str).str.strip()
+        missing = values.isna().to_numpy() | \
+            text.isin(['', 'None', 'nan', 'NaN', '<NA>']).to_numpy()
+
+        if col_type == 'boolean':
+            booleans = {'true': 1, 'false': 0, '1': 1, '0': 0}
+            converted = text.str.lower().map(booleans)
+            valid = converted.notna().to_numpy()
+            dtype = 'Int64'
+        else:
+            converted = pd.to_numeric(text.where(~missing), errors='coerce')
+            valid = converted.notna().to_numpy()
+            dtype = 'Float64'
+            if col_type == 'integer':
+                valid = valid & (converted.fillna(0) % 1 == 0).to_numpy()
+                dtype = 'Int64'
+
+        # If every value was converted, then the column gets the type.
+        # Otherwise the values that could not be converted are kept.
+        if (valid | missing).all():
+            result[col] = converted.where(valid).astype(dtype)
+        else:
+            numbers = converted[valid]
+            if dtype == 'Int64':
+                numbers = numbers.astype('int64')
+            values = values.astype(object).where(~missing, None)
+            values[valid] = numbers.to_numpy(dtype=object)
+            result[col] = values
+
+    return result
+
+
+def create_delta_tables(cur, table, exists):
+    '''
+    Creates the tables that track a 'delta' mode table. DELTA_TABLES lists
+    the tables that are stored in 'delta' mode, and '{table}_DELTA_STATE'
+    stores the key, row hash, scope and latest 'table_id' of every row in the
+    current state of the table.
+
+    Args:
+        cur (obj):      A cursor for the database connection
+        table (str):    The table name
+        exists (bool):  Whether the collector table already exists
+
+    Returns:
+        None
+
+    Raises:
+        ValueError:     If the table does not have a natural key in
+                        define_delta_keys, or if the table already exists,
+                        but it was not created in 'delta' mode
+    '''
+    table = table.upper()
+    if table not in define_delta_keys():
+        raise ValueError(f'Table {table} cannot be stored in delta mode.')
+    cur.execute('''create table if not exists DELTA_TABLES (
+                    table_name text primary key
+                   ) without rowid''')
+    cur.execute('select 1 from DELTA_TABLES where table_name = ?', (table,))
+    if not cur.fetchone():
+        if exists:
+            raise ValueError(f'Table {table} was not created in delta mode.')
+        cur.execute('insert into DELTA_TABLES values (?)', (table,))
+    cur.execute(f'''create table if not exists {table}_DELTA_STATE (
+                     row_key integer primary key,
+                     row_hash integer,
+                     scope,
+                     table_id integer
+                    )''')
+
+
+def is_delta_table(con, table):
+    '''
+    Checks whether a table is stored in 'delta' mode.
+
+    Args:
+        con (obj):      The database connection
+        table (str):    The table name
+
+    Returns:
+        is_delta (bool):    Whether the table is stored in 'delta' mode
+    '''
+    cur = con.cursor()
+    cur.execute('''select name from sqlite_master
+                   where type = "table" and name = "DELTA_TABLES"''')
+    if not cur.fetchone():
+        return False
+    cur.execute('select 1 from DELTA_TABLES where table_name = ?',
+                (table.upper(),))
+    return cur.fetchone() is not None
+
+
+def hash_rows(df, columns):
+    '''
+    Hashes the values in some of the columns of each row of a DataFrame.
+
+    Args:
+        df (DataFrame):     The DataFrame
+        columns (list):     The columns to hash
+
+    Returns:
+        hashes (ndarray):   The 64-bit hash of each row, as signed integers so
+                            that they can be stored in SQLite
+    '''
+    values = df[columns].astype(str)
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    return hashes.view(np.int64)
+
+
+def diff_snapshot(cur, table, result):
+    '''
+    Compares the output of a collector to the current state of a 'delta'
+    mode table, and returns only the rows that changed. Each row is
+    identified by a hash of its natural key (see define_delta_keys) and
+    compared by a hash of all of its values.
+
+    Args:
+        cur (obj):          A cursor for the database connection
+        table (str):        The table name
+        result (DataFrame): The output of the collector, including the
+                            'timestamp' column
+
+    Returns:
+        changes (DataFrame):    The rows to insert. Each row has a
+                                'change_type' of 'insert', 'update' or
+                                'delete', and its 'row_key' and 'row_hash'.
+                                Deleted rows only have a key.
+    '''
+    table = table.upper()
+    data_cols = [c for c in result.columns if c != 'timestamp']
+    definition = define_delta_keys().get(table, dict())
+    key_cols = [c for c in definition.get('keys', data_cols)
+                if c in data_cols] or data_cols
+    scope_col = definition.get('scope', 'device')
+    if scope_col not in data_cols:
+        scope_col = None
+
+    # Hash the keys and the rows. If a key appears more than once, then its
+    # later occurrences are numbered so that each one has its own key.
+    keys = hash_rows(result, key_cols)
+    occurrence = pd.Series(keys).groupby(keys, sort=False).cumcount()
+    repeated = (occurrence > 0).to_numpy()
+    if repeated.any():
+        numbered = pd.DataFrame({'key': keys[repeated],
+                                 'occurrence': occurrence[repeated]})
+        keys = keys.copy()
+        keys[repeated] = hash_rows(numbered, ['key', 'occurrence'])
+    hashes = hash_rows(result, data_cols)
+
+    cur.execute(f'select row_key, row_hash, scope from {table}_DELTA_STATE')
+    df_state = pd.DataFrame(cur.fetchall(),
+                            columns=['row_key', 'previous_hash', 'scope'])
+
+    # Look up each row's previous hash. The hashes are compared as int64, so
+    # they are not merged (a merge would convert them to float).
+    previous = pd.Series(df_state['previous_hash'].to_numpy(dtype=np.int64),
+                         index=df_state['row_key'].to_numpy(dtype=np.int64))
+    position = previous.index.get_indexer(keys)
+    inserted = position < 0
+    updated = np.zeros(len(keys), dtype=bool)
+    updated[~inserted] = previous.to_numpy()[position[~inserted]] != \
+        hashes[~inserted]
+
+    changes = result[inserted | updated].copy()
+    changes.insert(1, 'change_type',
+                   np.where(inserted[inserted | updated], 'insert', 'update'))
+    changes.insert(2, 'row_key', keys[inserted | updated])
+    changes.insert(3, 'row_hash', hashes[inserted | updated])
+
+    # Rows that are in the state, but not in the output, are deleted. Only
+    # rows in the scopes that the output covers can be deleted.
+    df_deleted = df_state[~df_state['row_key'].isin(keys)]
+    if scope_col:
+        scopes = result[scope_col].astype(str).unique()
+        df_deleted = df_deleted[df_deleted['scope'].isin(scopes)]
+    if len(df_deleted) > 0 and len(result) > 0:
+        deletes = pd.DataFrame({'timestamp': result['timestamp'].iloc[0],
+                                'change_type': 'delete',
+                                'row_key': df_deleted['row_key'].to_numpy(),
+                                'row_hash': None})
+        changes = pd.concat([changes, deletes], ignore_index=True)
+
+    if scope_col:
+        scope_values = result[scope_col].astype(str).to_numpy()
+        changes['_scope'] = None
+        changes.loc[changes['change_type'] != 'delete', '_scope'] = \
+            scope_values[inserted | updated]
+    else:
+        changes['_scope'] = None
+
+    return changes
+
+
+def update_delta_state(cur, table, changes, result):
+    '''
+    Applies the changes that were inserted into a 'delta' mode table to its
+    state, and adds the snapshot to the snapshot catalog. This is called by
+    add_to_db right after the changes are inserted, and it does not commit
+    the transaction.
+
+    Args:
+        cur (obj):              A cursor for the database connection
+        table (str):            The table name
+        changes (DataFrame):    The changes returned by diff_snapshot,
+                                including the '_scope' column
+        result (DataFrame):     The full output of the collector
+
+    Returns:
+        None
+    '''
+    table = table.upper()
+    first_id = None
+    last_id = None
+    if len(changes) > 0:
+        cur.execute(f'select max(table_id) from {table}')
+        last_id = cur.fetchone()[0]
+        first_id = last_id - len(changes) + 1
+        ids = range(first_id, last_id + 1)
+
+        deleted = (changes['change_type'] == 'delete').to_numpy()
+        rows = zip(changes['row_key'].to_numpy()[~deleted].tolist(),
+                   changes['row_hash'].to_numpy()[~deleted].tolist(),
+                   changes['_scope'].to_numpy()[~deleted].tolist(),
+                   [i for i, d in zip(ids, deleted) if not d])
+        cur.executemany(f'''insert or replace into {table}_DELTA_STATE
+                            values (?, ?, ?, ?)''', rows)
+        cur.executemany(f'delete from {table}_DELTA_STATE where row_key = ?',
+                        [(int(_),) for _ in
+                         changes['row_key'].to_numpy()[deleted]])
+
+    # The catalog stores the number of rows in the full snapshot, since the
+    # snapshot still has to be found when none of its rows changed
+    if len(result) == 0:
+        return
+    query = '''insert into SNAPSHOTS
+               values (?, ?, ?, ?, ?)
+               on conflict (table_name, timestamp) do update set
+                   row_count = row_count + excluded.row_count,
+                   first_id = coalesce(min(first_id, excluded.first_id),
+                                       first_id, excluded.first_id),
+                   last_id = coalesce(max(last_id, excluded.last_id),
+                                      last_id, excluded.last_id)'''
+    cur.execute(query, (table,
+                        result['timestamp'].iloc[0],
+                        len(result),
+                        first_id,
+                        last_id))
+
+
+def read_delta_snapshot(con, table, timestamp=None):
+    '''
+    Rebuilds a snapshot of a 'delta' mode table. Each row's latest change at
+    or before the timestamp is read, and deleted rows are removed. Rows in
+    scopes that were not collected at the timestamp (E.g., the devices in
+    another host group) are carried forward from their last change.
+
+    Args:
+        con (obj):          The database connection
+        table (str):        The table name
+        timestamp (str):    The timestamp of the snapshot. Defaults to None,
+                            which reads the latest snapshot from the state.
+
+    Returns:
+        df (DataFrame):     The rows of the snapshot, with the 'timestamp' of
+                            the snapshot
+    '''
+    table = table.upper()
+    if timestamp is None:
+        timestamp = get_latest_snapshot(con, table)
+        query = f'''select t.* from {table} t
+                    join {table}_DELTA_STATE s on t.table_id = s.table_id
+                    order by t.table_id'''
+        df = pd.read_sql(query, con)
+    else:
+        query = f'''select t.* from {table} t
+                    join (select max(table_id) as table_id
+                          from {table}
+                          where timestamp <= ?
+                          group by row_key) l
+                      on t.table_id = l.table_id
+                    where t.change_type != 'delete'
+                    order by t.table_id'''
+        df = pd.read_sql(query, con, params=(timestamp,))
+
+    df = df.drop(columns=['change_type', 'row_key', 'row_hash'],
+                 errors='ignore')
+    df['timestamp'] = timestamp
+    return df
 
 
 def get_username(prompt=str()):
@@ -814,22 +2111,79 @@ def move_cols_to_end(df, cols):
     return df
 
 
-def read_table(db_path, table):
+def read_table(db_path, table, columns=list(), filters=dict()):
     '''
-    Reads all columns for the latest timestamp from a database table.
+    Reads the latest timestamp from a database table. If the table has a
+    Parquet dataset (see parquet_helpers.enable_parquet_backend), then it is
+    read from the dataset instead, with the columns and filters pushed down
+    to the Parquet files.
 
     Args:
         db_path (str):  The full path to the database
         table (str):    The table name
+        columns (list): The columns to read. Defaults to all columns.
+        filters (dict): The rows to read. Each key is a column, and each
+                        value is the value or list of values to match.
+                        Defaults to all rows.
 
     Returns:
         df (df):        A Pandas dataframe containing the data
     '''
+    if pqh.has_dataset(table):
+        return pqh.read_snapshot(table, columns=columns, filters=filters)
+
     con = connect_to_db(db_path)
-    df_ts = pd.read_sql(f'select timestamp from {table} limit 1', con)
-    ts = df_ts['timestamp'].to_list()[-1]
-    df = pd.read_sql(f'select * from {table} where timestamp = "{ts}"', con)
+    df = read_snapshot(con, table, columns=columns)
     con.close()
+
+    for col, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            df = df[df[col].isin(list(value))]
+        else:
+            df = df[df[col] == value]
+
+    return df
+
+
+def records_to_df(records, columns=list()):
+    '''
+    Creates a DataFrame from a list of dictionaries in a single pass. Not all
+    records need to have the same keys. When a key appears for the first
+    time, its column is back-filled with None for the earlier records, and
+    records that are missing a key get None for that column.
+
+    This replaces the pattern of iterating over the records once to find all
+    of the keys and again to add the values for each key.
+
+    Args:
+        records (iter):     The records to add to the DataFrame. This can be
+                            a generator, so the records do not all need to be
+                            in memory at once.
+        columns (list):     Columns to create before any keys in 'records'.
+                            They are created even if 'records' is empty.
+
+    Returns:
+        df (DataFrame):     The DataFrame. The columns are in the order in
+                            which their keys first appeared.
+    '''
+    data = {col: list() for col in columns}
+    count = 0
+    for record in records:
+        for key, value in record.items():
+            col = data.get(key)
+            if col is None:
+                col = data[key] = [None] * count
+            elif len(col) < count:
+                col.extend([None] * (count - len(col)))
+            col.append(value)
+        count += 1
+
+    # Pad the columns for keys that were missing from the last records
+    for col in data.values():
+        if len(col) < count:
+            col.extend([None] * (count - len(col)))
+
+    df = pd.DataFrame(data, columns=list(data))
     return df
 
 
@@ -853,127 +2207,24 @@ def set_dependencies(selected):
     Returns:
         selected (list): The updated list of selected collectors
     '''
-    s = selected
-    if 'interface_summary' in s:
-        pos = s.index('interface_summary')
-        if 'cam_table' not in s:
-            s.insert(pos, 'cam_table')
-        if 'interface_description' not in s:
-            s.insert(pos, 'interface_description')
-        if 'interface_status' not in s:
-            s.insert(pos, 'interface_status')
-    if 'get_device_statuses' in s:
-        pos1 = s.index('get_device_statuses')
-        if 'get_organizations' in s:
-            pos2 = s.index('get_organizations')
-            if pos2 > pos1:
-                del s[pos2]
-                s.insert(pos1, 'get_organizations')
-        else:
-            s.insert(pos1, 'get_organizations')
-
-    if 'interface_summary' in s:
-        if 'cam_table' in s:
-            pos = s.index('cam_table')
-            del s[pos]
-        s.insert(0, 'cam_table')
-
-    if 'vip_destinations' in s:
-        if 'vip_availability' in s:
-            pos = s.index('vip_availability')
-            del s[pos]
-        s.insert(0, 'vip_availability')
-
-    if 'infoblox_get_networks_parent_containers' in s:
-        if 'infoblox_get_networks' in s:
-            pos = s.index('infoblox_get_networks')
-            del s[pos]
-        pos = s.insert(0, 'infoblox_get_networks')
-        if 'infoblox_get_network_containers' in s:
-            pos = s.index('infoblox_get_network_containers')
-            del s[pos]
-        pos = s.insert(0, 'infoblox_get_network_containers')
-
-    if 'device_statuses' in s:
-        if 'organizations' in s:
-            pos = s.index('organizations')
-            del s[pos]
-        s.insert(0, 'organizations')
-
-    if 'network_appliance_vlans' in s:
-        if 'org_networks' in s:
-            pos = s.index('org_networks')
-            del s[pos]
-        s.insert(0, 'org_networks')
-
-    if 'network_device_statuses' in s:
-        if 'org_device_statuses' in s:
-            pos = s.index('org_device_statuses')
-            del s[pos]
-        s.insert(0, 'org_device_statuses')
-
-    if 'network_devices' in s:
-        if 'organizations' in s:
-            pos = s.index('organizations')
-            del s[pos]
-        s.insert(0, 'organizations')
-
-    if 'org_devices' in s:
-        if 'organizations' in s:
-            pos = s.index('organizations')
-            del s[pos]
-        s.insert(0, 'organizations')
-
-    if 'org_device_statuses' in s:
-        if 'org_networks' in s:
-            pos = s.index('org_networks')
-            del s[pos]
-        s.insert(0, 'org_networks')
-
-    if 'org_networks' in s:
-        if 'organizations' in s:
-            pos = s.index('organizations')
-            del s[pos]
-        s.insert(0, 'organizations')
-
-    if 'switch_lldp_neighbors' in s:
-        dependencies = ['switch_port_statuses']
-        for d in dependencies:
-            if d in s:
-                pos = s.index(d)
-                del s[pos]
-        for d in dependencies:
-            s.insert(0, d)
-
-    if 'switch_port_usages' in s:
-        if 'switch_port_statuses' in s:
-            pos = s.index('switch_port_statuses')
-            del s[pos]
-        s.insert(0, 'switch_port_statuses')
-
-    if 'switch_port_statuses' in s:
-        if 'org_devices' in s:
-            pos = s.index('org_devices')
-            del s[pos]
-        s.insert(0, 'org_devices')
-        if 'organizations' in s:
-            del s[pos]
-        s.insert(0, 'organizations')
-
-    if 'vpn_statuses' in s:
-        if 'organizations' in s:
-            pos = s.index('organizations')
-            del s[pos]
-        s.insert(0, 'organizations')
-
-    # Remove duplicate collectors from 's'
-    non_dups = list()
-    for item in s:
-        if item not in non_dups:
-            non_dups.append(item)
-    s = non_dups
-
-    selected = s
+    # Add each collector after the collectors that it depends on (see
+    # define_collector_dependencies). The dependencies of a dependency are
+    # added before it, so the collectors can be run in the returned order.
+    dependencies = define_collector_dependencies()
+    s = list()
+    for collector in selected:
+        stack = [collector]
+        while stack:
+            current = stack[-1]
+            missing = [d for d in dependencies.get(current, list())
+                       if d not in s and d not in stack]
+            if missing:
+                stack.append(missing[0])
+                continue
+            stack.pop()
+            if current not in s:
+                s.append(current)
+
     return s
 
 
@@ -1292,7 +2543,7 @@ def sql_get_table_schema(db_path, table):
     return df_schema
 
 
-def download_ouis(path):
+def download_ouis(path, url='https://standards-oui.ieee.org/'):
     """Downloads vendor OUIs from https://standards-oui.ieee.org/.
 
     The results will be stored in a text file located at 'path'.
@@ -1301,6 +2552,9 @@ def download_ouis(path):
     ----------
     path : str
         The full path to the filename to store the results.
+    url : str, optional
+        The URL of the registry to download. Defaults to the MA-L registry.
+        See define_oui_registries for the others.
 
     Raises
     ----------
@@ -1314,7 +2568,6 @@ def download_ouis(path):
     >>> path = '/tmp/ouis.txt'
     >>> download_ouis(path)
     """
-    url = 'https://standards-oui.ieee.org/'
     response = requests.get(url, stream=True)
     with open(path, 'wb') as txt:
         for chunk in response.iter_content(chunk_size=1024):
@@ -1405,6 +2658,175 @@ def update_ouis(nm_path):
     return df
 
 
+def define_oui_registries():
+    """Defines the IEEE registries that are used to look up MAC vendors.
+
+    Returns
+    ----------
+    registries : dict
+        The filename that each registry is saved to is the key, and the URL
+        to download it from is the value.
+    """
+    registries = {'ouis.txt': 'https://standards-oui.ieee.org/',
+                  'ouis_mam.txt':
+                      'https://standards-oui.ieee.org/oui28/mam.txt',
+                  'ouis_oui36.txt':
+                      'https://standards-oui.ieee.org/oui36/oui36.txt'}
+    return registries
+
+
+def build_oui_index(nm_path):
+    """Compiles the downloaded OUI registries into an index on disk.
+
+    The MA-L (24-bit), MA-M (28-bit) and MA-S (36-bit) assignments are each
+    stored as a sorted array of integer prefixes and a matching array of
+    vendor IDs, so they can be memory-mapped and searched with
+    numpy.searchsorted. The vendor names are stored once in 'vendors.txt'.
+
+    Parameters
+    ----------
+    nm_path : str
+        The path to the Net-Manage repository. The index is saved to the
+        'oui_index' folder inside it.
+
+    Returns
+    ----------
+    None
+    """
+    # Each assignment is a '(hex)' line followed by a '(base 16)' line. For
+    # MA-M and MA-S assignments, the '(base 16)' line contains the range of
+    # addresses in the block, which determines the length of the prefix.
+    pattern = re.compile(r'^\s*([0-9A-Fa-f]{2}(?:-[0-9A-Fa-f]{1,2})+)'
+                         r'\s+\(hex\)[^\n]*\n'
+                         r'\s*([0-9A-Fa-f]{6})(?:-([0-9A-Fa-f]{6}))?'
+                         r'\s+\(base 16\)[ \t]*([^\r\n]*)',
+                         re.M)
+
+    prefixes = {24: dict(), 28: dict(), 36: dict()}
+    vendor_ids = dict()
+    for name in define_oui_registries():
+        path = f'{nm_path}{name}'
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', errors='replace') as txt:
+            data = txt.read()
+        for match in pattern.finditer(data):
+            base = match.group(1).replace('-', '')[:6]
+            start, end = match.group(2), match.group(3)
+            vendor = match.group(4).strip()
+            # Determine the prefix length from the size of the block
+            if end:
+                size = int(end, 16) - int(start, 16) + 1
+                bits = 48 - (size.bit_length() - 1)
+            else:
+                bits = 24
+            if bits not in prefixes:
+                continue
+            prefix = int(base + start, 16) >> (48 - bits)
+            if vendor not in vendor_ids:
+                vendor_ids[vendor] = len(vendor_ids)
+            prefixes[bits][prefix] = vendor_ids[vendor]
+
+    # Save the index. 'vendors.txt' is written last, because its timestamp is
+    # used to determine whether the index is up to date.
+    index_path = f'{nm_path}oui_index'
+    if not check_dir_existence(index_path):
+        create_dir(index_path)
+    for registry, bits in [('ma_l', 24), ('ma_m', 28), ('ma_s', 36)]:
+        keys = sorted(prefixes[bits])
+        np.save(f'{index_path}/{registry}_keys.npy',
+                np.array(keys, dtype=np.uint64))
+        np.save(f'{index_path}/{registry}_vendors.npy',
+                np.array([prefixes[bits][k] for k in keys], dtype=np.int64))
+    with open(f'{index_path}/vendors.txt', 'w') as txt:
+        txt.write('\n'.join(vendor_ids))
+
+
+def load_oui_index(nm_path):
+    """Loads the compiled OUI index from disk.
+
+    The arrays are memory-mapped, so only the pages that are searched are
+    read from disk.
+
+    Parameters
+    ----------
+    nm_path : str
+        The path to the Net-Manage repository.
+
+    Returns
+    ----------
+    index : dict
+        The sorted prefixes ('ma_l_keys', 'ma_m_keys', 'ma_s_keys'), the
+        vendor ID of each prefix ('ma_l_vendors', 'ma_m_vendors',
+        'ma_s_vendors') and the list of vendor names ('vendors').
+    """
+    index_path = f'{nm_path}oui_index'
+    index = dict()
+    for registry in ['ma_l', 'ma_m', 'ma_s']:
+        for item in ['keys', 'vendors']:
+            index[f'{registry}_{item}'] = \
+                np.load(f'{index_path}/{registry}_{item}.npy', mmap_mode='r')
+    with open(f'{index_path}/vendors.txt', 'r') as txt:
+        index['vendors'] = txt.read().split('\n')
+    return index
+
+
+def update_oui_index(nm_path):
+    """Download the OUI registries and compile them into an index, if needed.
+
+    A registry is downloaded if it does not exist or is more than one week
+    old. The index is rebuilt whenever a registry is newer than the index,
+    and it is cached in memory for the life of the process.
+
+    Parameters
+    ----------
+    nm_path : str
+        The path to the Net-Manage repository.
+
+    Returns
+    ----------
+    index : dict
+        The compiled OUI index. See load_oui_index.
+
+    Examples
+    ----------
+    >>> index = update_oui_index(nm_path)
+    >>> print(index['vendors'][index['ma_l_vendors'][0]])
+    XEROX CORPORATION
+    """
+    # Collectors can run concurrently, so only let one thread download and
+    # compile the registries.
+    with oui_index_lock:
+        sources = list()
+        for name, url in define_oui_registries().items():
+            path = f'{nm_path}{name}'
+            download = True
+            if os.path.exists(path):
+                age = time.time() - os.path.getmtime(path)
+                download = age > 7 * 86400
+            if download:
+                try:
+                    download_ouis(path, url)
+                except Exception as e:
+                    print(f'Caught Exception: {str(e)}')
+            if os.path.exists(path):
+                sources.append(os.path.getmtime(path))
+
+        # Rebuild the index if any of the registries are newer than it.
+        marker = f'{nm_path}oui_index/vendors.txt'
+        if not os.path.exists(marker) or \
+                max(sources, default=0) > os.path.getmtime(marker):
+            build_oui_index(nm_path)
+        built = os.path.getmtime(marker)
+
+        # Load the index, unless it has already been loaded.
+        cached = oui_index_cache.get(nm_path)
+        if not cached or cached[0] != built:
+            oui_index_cache[nm_path] = (built, load_oui_index(nm_path))
+
+        return oui_index_cache[nm_path][1]
+
+
 def validate_table(table, db_path, diff_col):
     '''
     Validates a table, based on the columns that the user passes to the
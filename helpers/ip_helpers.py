@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+
+"""A collection of helper functions for IP address and prefix operations.
+
+"""
+
+import ipaddress as ip
+import numpy as np
+import socket
+
+from bisect import bisect_right
+
+
+def prefix_to_range(prefix):
+    """Converts a prefix to the integer range of addresses that it covers.
+
+    Parameters
+    ----------
+    prefix : str
+        The prefix to convert, in CIDR notation. Host bits are ignored, and an
+        address without a prefix length is treated as a host route.
+
+    Returns
+    ----------
+    version : int
+        The IP version of the prefix (4 or 6).
+    start : int
+        The first address in the prefix, as an integer.
+    end : int
+        The last address in the prefix, as an integer.
+
+    Examples
+    ----------
+    >>> prefix_to_range('10.0.0.0/24')
+    (4, 167772160, 167772415)
+    """
+    network = ip.ip_network(prefix, strict=False)
+    start = int(network.network_address)
+    end = start + network.num_addresses - 1
+
+    return network.version, start, end
+
+
+def build_prefix_index(prefixes):
+    """Builds an index for longest-prefix-match lookups.
+
+    The prefixes are stored per IP version as integer ranges in sorted
+    arrays, ordered by their first address and then from largest to smallest.
+    Each prefix also stores the position of its most specific parent prefix,
+    so a lookup is a binary search followed by a short walk up the parents.
+
+    Parameters
+    ----------
+    prefixes : list
+        A list of prefixes in CIDR notation. IPv4 and IPv6 prefixes can be
+        mixed, and duplicates are ignored.
+
+    Returns
+    ----------
+    index : dict
+        A dictionary where each key is an IP version, and each value is a
+        dictionary containing the 'starts', 'ends', 'parents' and 'prefixes'
+        arrays for that version.
+
+    See Also
+    ----------
+    find_longest_prefix : A function to find the most specific prefix in the
+                          index that contains a network or address.
+
+    Examples
+    ----------
+    >>> index = build_prefix_index(['10.0.0.0/8', '10.1.0.0/16'])
+    >>> find_longest_prefix(index, '10.1.2.0/24')
+    '10.1.0.0/16'
+    """
+    # Convert the prefixes to integer ranges, grouped by IP version
+    ranges = dict()
+    for prefix in set(prefixes):
+        version, start, end = prefix_to_range(prefix)
+        ranges.setdefault(version, list()).append((start, -end, prefix))
+
+    # Sort the ranges and find the parent of each one. Prefixes never
+    # partially overlap, so the parent is the closest range on the stack that
+    # has not ended before the current range starts.
+    index = dict()
+    for version, entries in ranges.items():
+        entries.sort()
+        starts = list()
+        ends = list()
+        parents = list()
+        stack = list()
+        for pos, (start, end, prefix) in enumerate(entries):
+            end = -end
+            while stack and ends[stack[-1]] < start:
+                stack.pop()
+            parents.append(stack[-1] if stack else -1)
+            stack.append(pos)
+            starts.append(start)
+            ends.append(end)
+        index[version] = {'starts': starts,
+                          'ends': ends,
+                          'parents': parents,
+                          'prefixes': [entry[2] for entry in entries]}
+
+    return index
+
+
+def find_longest_prefix(index, prefix, default=None):
+    """Finds the most specific prefix in an index that contains a prefix.
+
+    Parameters
+    ----------
+    index : dict
+        An index created by build_prefix_index.
+    prefix : str
+        The network or address to look up. A prefix is contained by itself,
+        so an exact match is returned if it is in the index.
+    default : any, optional
+        The value to return if no prefix in the index contains 'prefix'.
+
+    Returns
+    ----------
+    parent : str
+        The most specific prefix that contains 'prefix', in the same format
+        that it was given to build_prefix_index, or 'default'.
+
+    Examples
+    ----------
+    >>> index = build_prefix_index(['10.0.0.0/8', '2001:db8::/32'])
+    >>> find_longest_prefix(index, '2001:db8:1::1')
+    '2001:db8::/32'
+    >>> find_longest_prefix(index, '192.168.0.0/24', default='orphan')
+    'orphan'
+    """
+    version, start, end = prefix_to_range(prefix)
+    if version not in index:
+        return default
+    arrays = index[version]
+
+    # Find the last prefix that starts at or before 'prefix', then walk up
+    # its parents until one of them ends at or after 'prefix'. Any prefix
+    # that contains 'prefix' must be that prefix or one of its parents.
+    pos = bisect_right(arrays['starts'], start) - 1
+    while pos != -1 and arrays['ends'][pos] < end:
+        pos = arrays['parents'][pos]
+    if pos == -1:
+        return default
+
+    return arrays['prefixes'][pos]
+
+
+def map_longest_prefixes(networks, prefixes, default=None):
+    """Maps each network to the most specific prefix that contains it.
+
+    Parameters
+    ----------
+    networks : list
+        The networks or addresses to map.
+    prefixes : list
+        The candidate parent prefixes.
+    default : any, optional
+        The value to use for networks that are not contained by any prefix.
+
+    Returns
+    ----------
+    parents : list
+        The parent prefix of each network, in the same order as 'networks'.
+
+    Examples
+    ----------
+    >>> map_longest_prefixes(['10.1.1.0/24', '172.16.0.0/24'],
+    ...                      ['10.0.0.0/8', '10.1.0.0/16'],
+    ...                      default='orphan')
+    ['10.1.0.0/16', 'orphan']
+    """
+    index = build_prefix_index(prefixes)
+    return [find_longest_prefix(index, _, default=default) for _ in networks]
+
+
+def parse_ipv4_interfaces(addresses):
+    """Parses IPv4 interface addresses into integers with NumPy.
+
+    The addresses are converted to a matrix of characters with one column
+    per address. The rows are read in order, and every address is parsed at
+    the same time with array operations, instead of a Python loop over the
+    addresses.
+
+    Parameters
+    ----------
+    addresses : list
+        The addresses in the format {ip}/{prefix_length}, as strings. An
+        address without a prefix length is treated as a host address.
+
+    Returns
+    ----------
+    valid : numpy.ndarray
+        A boolean array that is True for the addresses that were parsed.
+        Anything else (E.g., an IPv6 address, a netmask, or an invalid
+        address) must be handled by the ipaddress module.
+    ints : numpy.ndarray
+        The addresses, as unsigned 64-bit integers.
+    prefixes : numpy.ndarray
+        The prefix length of each address.
+    """
+    # The longest IPv4 interface is 18 characters ('255.255.255.255/32').
+    # One more character is added, so every address ends with a null.
+    width = 19
+    count = len(addresses)
+    chars = np.asarray(addresses, dtype=f'<U{width}')
+    chars = chars.view(np.int32).reshape(count, width).T.copy()
+
+    valid = np.ones(count, dtype=bool)
+    ended = np.zeros(count, dtype=bool)
+    ints = np.zeros(count, dtype=np.int64)
+    prefixes = np.full(count, 32, dtype=np.int32)
+    dots = np.zeros(count, dtype=np.int32)
+    slashes = np.zeros(count, dtype=np.int32)
+
+    # The value, number of digits and whether the first digit is a zero for
+    # the octet or prefix length that is being read
+    value = np.zeros(count, dtype=np.int64)
+    digits = np.zeros(count, dtype=np.int32)
+    leading_zero = np.zeros(count, dtype=bool)
+
+    for row in chars:
+        is_digit = (row >= 48) & (row <= 57)
+        is_dot = row == 46
+        is_slash = row == 47
+        is_end = row == 0
+        valid &= is_digit | is_dot | is_slash | is_end
+        valid &= ~(ended & ~is_end)
+
+        # A dot, a slash or the end of the address closes the current field.
+        # Octets must have 1-3 digits without leading zeros (the same as the
+        # ipaddress module), and the prefix length must be 0-32.
+        closes = is_dot | is_slash | (is_end & ~ended)
+        octet = closes & (slashes == 0)
+        prefix = closes & (slashes == 1)
+        valid &= ~(octet & ((digits == 0) | (digits > 3) | (value > 255) |
+                            (leading_zero & (digits > 1))))
+        valid &= ~(prefix & ((digits == 0) | (value > 32)))
+        ints = np.where(octet, (ints << 8) | (value & 255), ints)
+        prefixes = np.where(prefix, value, prefixes)
+
+        # The slash must come after the third dot, and only once
+        valid &= ~(is_dot & (slashes > 0))
+        valid &= ~(is_slash & ((dots != 3) | (slashes > 0)))
+        dots += is_dot
+        slashes += is_slash
+        ended |= is_end
+
+        leading_zero = np.where(is_digit & (digits == 0),
+                                row == 48,
+                                leading_zero)
+        value = np.where(closes, 0, np.where(is_digit,
+                                             value * 10 + row - 48,
+                                             value))
+        digits = np.where(closes, 0, digits + is_digit)
+
+    valid &= dots == 3
+    ints = np.where(valid, ints, 0).astype(np.uint64)
+
+    return valid, ints, prefixes
+
+
+def parse_ipv6_interfaces(addresses):
+    """Parses IPv6 interface addresses into packed addresses.
+
+    Parameters
+    ----------
+    addresses : list
+        The addresses in the format {ip}/{prefix_length}, as strings. An
+        address without a prefix length is treated as a host address.
+
+    Returns
+    ----------
+    positions : list
+        The positions in 'addresses' of the addresses that were parsed.
+    packed : list
+        The addresses, as packed bytes (see socket.inet_pton).
+    prefixes : list
+        The prefix length of each address.
+    """
+    positions = list()
+    packed = list()
+    prefixes = list()
+    for pos, address in enumerate(addresses):
+        address, _, prefix = address.partition('/')
+        try:
+            address = socket.inet_pton(socket.AF_INET6, address)
+        except OSError:
+            continue
+        if not prefix:
+            prefix = 128
+        elif prefix.isdigit() and int(prefix) <= 128:
+            prefix = int(prefix)
+        else:
+            continue
+        positions.append(pos)
+        packed.append(address)
+        prefixes.append(prefix)
+
+    return positions, packed, prefixes
+
+
+def calculate_ipv4_networks(ints, prefixes):
+    """Calculates the network and broadcast addresses of IPv4 interfaces.
+
+    Parameters
+    ----------
+    ints : numpy.ndarray
+        The addresses, as unsigned 64-bit integers.
+    prefixes : numpy.ndarray
+        The prefix length of each address.
+
+    Returns
+    ----------
+    networks : numpy.ndarray
+        The network addresses, as unsigned 64-bit integers.
+    broadcasts : numpy.ndarray
+        The broadcast addresses, as unsigned 64-bit integers.
+    """
+    # Shifting a 64-bit integer by 32 bits is safe, so a /0 has a mask of 0
+    all_ones = np.uint64(0xFFFFFFFF)
+    shifts = (32 - np.asarray(prefixes)).astype(np.uint64)
+    masks = np.left_shift(all_ones, shifts) & all_ones
+    networks = ints & masks
+    broadcasts = networks | (masks ^ all_ones)
+
+    return networks, broadcasts
+
+
+def calculate_ipv6_networks(packed, prefixes):
+    """Calculates the network and broadcast addresses of IPv6 interfaces.
+
+    Each address is split into its upper and lower 64 bits, so the masks can
+    be applied with 64-bit integer operations.
+
+    Parameters
+    ----------
+    packed : list
+        The addresses, as packed bytes (see socket.inet_pton).
+    prefixes : list
+        The prefix length of each address.
+
+    Returns
+    ----------
+    networks : numpy.ndarray
+        The network addresses, as an array with one row per address and a
+        column for the upper and lower 64 bits.
+    broadcasts : numpy.ndarray
+        The broadcast addresses, in the same format as 'networks'.
+    """
+    addresses = np.frombuffer(b''.join(packed), dtype='>u8').reshape(-1, 2)
+    addresses = addresses.astype(np.uint64)
+    prefixes = np.asarray(prefixes, dtype=np.int64)
+
+    # Find the number of network bits in each half. Shifting by 64 bits is
+    # not defined, so those masks are set to 0 separately.
+    all_ones = np.uint64(0xFFFFFFFFFFFFFFFF)
+    masks = np.empty_like(addresses)
+    for col, bits in enumerate([np.clip(prefixes, 0, 64),
+                                np.clip(prefixes - 64, 0, 64)]):
+        shifts = np.minimum(64 - bits, 63).astype(np.uint64)
+        masks[:, col] = np.where(bits == 0,
+                                 np.uint64(0),
+                                 np.left_shift(all_ones, shifts))
+    networks = addresses & masks
+    broadcasts = networks | (masks ^ all_ones)
+
+    return networks, broadcasts
+
+
+def format_ipv4_addresses(ints):
+    """Converts integer IPv4 addresses to strings.
+
+    Interface tables have many addresses in the same subnets, so only the
+    unique addresses are formatted.
+
+    Parameters
+    ----------
+    ints : numpy.ndarray
+        The addresses, as unsigned integers.
+
+    Returns
+    ----------
+    addresses : numpy.ndarray
+        The addresses in dotted-quad notation, as an object array.
+    """
+    uniques, inverse = np.unique(ints, return_inverse=True)
+    octets = np.array([str(_) for _ in range(256)], dtype=object)
+    strings = octets[(uniques >> np.uint64(24)) & np.uint64(255)]
+    for shift in [16, 8, 0]:
+        strings = strings + '.' + \
+            octets[(uniques >> np.uint64(shift)) & np.uint64(255)]
+
+    return strings[inverse.reshape(-1)]
+
+
+def format_ipv6_addresses(halves):
+    """Converts integer IPv6 addresses to strings.
+
+    Parameters
+    ----------
+    halves : numpy.ndarray
+        The addresses, as an array with one row per address and a column for
+        the upper and lower 64 bits.
+
+    Returns
+    ----------
+    addresses : numpy.ndarray
+        The addresses in the same format as the ipaddress module, as an
+        object array.
+    """
+    uniques, inverse = np.unique(halves, axis=0, return_inverse=True)
+    packed = uniques.astype('>u8').tobytes()
+    strings = np.empty(len(uniques), dtype=object)
+    for pos in range(len(uniques)):
+        address = packed[pos*16:pos*16+16]
+        string = socket.inet_ntop(socket.AF_INET6, address)
+        # inet_ntop writes IPv4-mapped addresses in dotted-quad notation,
+        # but the ipaddress module does not
+        if '.' in string:
+            string = str(ip.IPv6Address(address))
+        strings[pos] = string
+
+    return strings[inverse.reshape(-1)]
+
+
+def calculate_subnets(addresses):
+    """Calculates the subnet, network address and broadcast address of each
+    interface address.
+
+    The addresses are parsed into integer arrays, and the network and
+    broadcast addresses are calculated with NumPy bit operations. Addresses
+    that cannot be parsed that way (E.g., they use a netmask instead of a
+    prefix length) are calculated with the ipaddress module.
+
+    Parameters
+    ----------
+    addresses : list
+        The addresses in the format {ip}/{prefix_length}. IPv4 and IPv6
+        addresses can be mixed.
+
+    Returns
+    ----------
+    subnets : list
+        The subnet of each address, in CIDR notation.
+    network_ips : list
+        The network address of each address.
+    broadcast_ips : list
+        The broadcast address of each address. For IPv6, this is the last
+        address in the subnet.
+
+    Raises
+    ----------
+    ValueError
+        If an address is not a valid IPv4 or IPv6 interface address.
+
+    Examples
+    ----------
+    >>> calculate_subnets(['10.1.1.5/24', '2001:db8::1/64'])
+    (['10.1.1.0/24', '2001:db8::/64'],
+     ['10.1.1.0', '2001:db8::'],
+     ['10.1.1.255', '2001:db8::ffff:ffff:ffff:ffff'])
+    """
+    addresses = [str(_) for _ in addresses]
+    count = len(addresses)
+    subnets = np.empty(count, dtype=object)
+    network_ips = np.empty(count, dtype=object)
+    broadcast_ips = np.empty(count, dtype=object)
+    prefix_strings = np.array([f'/{_}' for _ in range(129)], dtype=object)
+
+    # Parse the IPv4 addresses with NumPy. Anything longer than the longest
+    # IPv4 interface can be skipped.
+    lengths = np.fromiter(map(len, addresses), dtype=np.int64, count=count)
+    candidates = np.flatnonzero(lengths <= 18)
+    valid, ints, prefixes = parse_ipv4_interfaces([addresses[_]
+                                                   for _ in candidates])
+    positions = candidates[valid]
+    if len(positions) > 0:
+        networks, broadcasts = calculate_ipv4_networks(ints[valid],
+                                                       prefixes[valid])
+        network_ips[positions] = format_ipv4_addresses(networks)
+        broadcast_ips[positions] = format_ipv4_addresses(broadcasts)
+        subnets[positions] = network_ips[positions] + \
+            prefix_strings[prefixes[valid]]
+
+    # Parse the IPv6 addresses
+    parsed = np.zeros(count, dtype=bool)
+    parsed[positions] = True
+    remaining = np.flatnonzero(~parsed)
+    positions, packed, prefixes = parse_ipv6_interfaces([addresses[_]
+                                                         for _ in remaining])
+    positions = remaining[positions]
+    if len(positions) > 0:
+        networks, broadcasts = calculate_ipv6_networks(packed, prefixes)
+        network_ips[positions] = format_ipv6_addresses(networks)
+        broadcast_ips[positions] = format_ipv6_addresses(broadcasts)
+        subnets[positions] = network_ips[positions] + \
+            prefix_strings[prefixes]
+    parsed[positions] = True
+
+    # Calculate anything else with the ipaddress module. This raises a
+    # ValueError if an address is not valid.
+    for pos in np.flatnonzero(~parsed):
+        network = ip.ip_interface(addresses[pos]).network
+        subnets[pos] = str(network)
+        network_ips[pos] = str(network.network_address)
+        broadcast_ips[pos] = str(network.broadcast_address)
+
+    return subnets.tolist(), network_ips.tolist(), broadcast_ips.tolist()
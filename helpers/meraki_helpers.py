@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+"""A collection of helper functions for Meraki Dashboard API operations.
+
+"""
+
+import meraki
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from helpers import client_helpers as clh
+from meraki.exceptions import APIError
+
+
+# The token buckets for each organization. They are shared by every collector
+# in the process, since the Dashboard API rate limit is applied per org.
+buckets = dict()
+buckets_lock = threading.Lock()
+
+
+def create_token_bucket(rate, capacity=None):
+    """Creates a token bucket.
+
+    Parameters
+    ----------
+    rate : int
+        The number of tokens that are added to the bucket each second.
+    capacity : int, optional
+        The maximum number of tokens in the bucket. Defaults to 'rate'.
+
+    Returns
+    ----------
+    bucket : dict
+        A dictionary containing the state of the bucket.
+    """
+    capacity = capacity or rate
+    bucket = {'rate': rate,
+              'capacity': capacity,
+              'tokens': capacity,
+              'updated': time.monotonic(),
+              'lock': threading.Lock()}
+
+    return bucket
+
+
+def get_token_bucket(org_id, rate=10):
+    """Gets the token bucket for an organization, creating it if necessary.
+
+    Parameters
+    ----------
+    org_id : str
+        The organization ID. Requests that are not tied to a known
+        organization share the bucket for 'None'.
+    rate : int, optional
+        The number of requests per second to allow for the organization. The
+        Dashboard API allows 10 requests per second per organization.
+
+    Returns
+    ----------
+    bucket : dict
+        The token bucket for the organization.
+    """
+    with buckets_lock:
+        if org_id not in buckets:
+            buckets[org_id] = create_token_bucket(rate)
+        return buckets[org_id]
+
+
+def take_token(bucket):
+    """Takes a token from a bucket, waiting until one is available.
+
+    Parameters
+    ----------
+    bucket : dict
+        A token bucket created by create_token_bucket.
+    """
+    while True:
+        with bucket['lock']:
+            # Refill the bucket for the time that has passed since it was
+            # last updated
+            now = time.monotonic()
+            elapsed = now - bucket['updated']
+            bucket['tokens'] = min(bucket['capacity'],
+                                   bucket['tokens'] + elapsed * bucket['rate'])
+            bucket['updated'] = now
+
+            if bucket['tokens'] >= 1:
+                bucket['tokens'] -= 1
+                return
+            wait = (1 - bucket['tokens']) / bucket['rate']
+        time.sleep(wait)
+
+
+def pause_token_bucket(bucket, seconds):
+    """Empties a bucket so no tokens are available for a number of seconds.
+
+    Parameters
+    ----------
+    bucket : dict
+        A token bucket created by create_token_bucket.
+    seconds : float
+        The number of seconds to wait before the next token is available.
+    """
+    with bucket['lock']:
+        bucket['tokens'] = min(bucket['tokens'], -seconds * bucket['rate'])
+
+
+def get_retry_after(error, default=1):
+    """Gets the number of seconds to wait after a 429 response.
+
+    Parameters
+    ----------
+    error : meraki.exceptions.APIError
+        The exception raised by the Meraki SDK.
+    default : int, optional
+        The number of seconds to return if the response does not have a
+        valid 'Retry-After' header.
+
+    Returns
+    ----------
+    seconds : float
+        The number of seconds to wait.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or dict()
+    try:
+        return max(float(headers.get('Retry-After', default)), 0)
+    except (TypeError, ValueError):
+        return default
+
+
+def create_dashboard(api_key):
+    """Gets the shared Dashboard API session for an API key.
+
+    The session is created once per process, and it is shared by the
+    collectors that make their requests one at a time. (Concurrent requests
+    use get_dashboard instead.)
+
+    Parameters
+    ----------
+    api_key : str
+        A valid Meraki Dashboard API key.
+
+    Returns
+    ----------
+    dashboard : meraki.DashboardAPI
+        The Dashboard API session.
+    """
+    dashboard = clh.get_client('meraki',
+                               'api.meraki.com',
+                               api_key,
+                               lambda: meraki.DashboardAPI(
+                                   api_key=api_key,
+                                   suppress_logging=True))
+    return dashboard
+
+
+def get_dashboard(api_key):
+    """Gets the shared Dashboard API session for concurrent requests.
+
+    The session is created once per process from the client registry, and
+    it is shared by the threads of fetch_concurrently. It is created with
+    'wait_on_rate_limit' disabled, so 429 responses are raised to
+    call_dashboard and applied to the org's bucket instead of each thread
+    retrying on its own. (The session from create_dashboard retries on its
+    own, so it is stored separately.)
+
+    Parameters
+    ----------
+    api_key : str
+        A valid Meraki Dashboard API key.
+
+    Returns
+    ----------
+    dashboard : meraki.DashboardAPI
+        The Dashboard API session.
+    """
+    dashboard = clh.get_client('meraki',
+                               'api.meraki.com',
+                               (api_key, 'wait_on_rate_limit=False'),
+                               lambda: meraki.DashboardAPI(
+                                   api_key=api_key,
+                                   suppress_logging=True,
+                                   wait_on_rate_limit=False))
+    return dashboard
+
+
+def call_dashboard(api_key, method, bucket, *args, max_retries=5, **kwargs):
+    """Calls a Dashboard API method, honoring the org's rate limit.
+
+    Parameters
+    ----------
+    api_key : str
+        A valid Meraki Dashboard API key.
+    method : str
+        The API method to call, prefixed with its section. For example,
+        'appliance.getNetworkApplianceVlans'.
+    bucket : dict
+        The token bucket to take a token from before each request.
+    *args
+        The positional arguments to pass to the method.
+    max_retries : int, optional
+        The number of times to retry a request after a 429 response.
+    **kwargs
+        The keyword arguments to pass to the method.
+
+    Returns
+    ----------
+    result : list or dict
+        The result returned by the Meraki SDK.
+
+    Raises
+    ----------
+    meraki.exceptions.APIError
+        If the request fails for any reason other than a 429 response, or if
+        it is still rate limited after 'max_retries' retries.
+    """
+    section, name = method.split('.')
+    for attempt in range(max_retries + 1):
+        take_token(bucket)
+        dashboard = get_dashboard(api_key)
+        try:
+            return getattr(getattr(dashboard, section), name)(*args, **kwargs)
+        except APIError as e:
+            if getattr(e, 'status', None) != 429 or attempt == max_retries:
+                raise
+            pause_token_bucket(bucket, get_retry_after(e))
+
+
+def fetch_concurrently(api_key,
+                       method,
+                       items,
+                       org_ids=dict(),
+                       max_workers=8,
+                       rate=10,
+                       max_retries=5,
+                       **kwargs):
+    """Calls a Dashboard API method for each item in a list concurrently.
+
+    Many Dashboard API endpoints only accept a single network or device, so
+    collectors have to make one request per network or device. This function
+    makes those requests from a thread pool. Each request takes a token from
+    the bucket for its organization, so the requests for each organization
+    stay within the Dashboard API rate limit. If a 429 response is received,
+    the organization's bucket is paused for the 'Retry-After' period and the
+    request is retried.
+
+    Parameters
+    ----------
+    api_key : str
+        A valid Meraki Dashboard API key.
+    method : str
+        The API method to call, prefixed with its section. For example,
+        'appliance.getNetworkApplianceVlans'.
+    items : list
+        The network IDs or serials to pass to the method, one per request.
+    org_ids : dict, optional
+        A dictionary mapping each item to its organization ID. Items that are
+        not in the dictionary share a single bucket.
+    max_workers : int, optional
+        The maximum number of concurrent requests.
+    rate : int, optional
+        The number of requests per second to allow for each organization.
+    max_retries : int, optional
+        The number of times to retry a request after a 429 response.
+    **kwargs
+        Keyword arguments to pass to the method for every item.
+
+    Yields
+    ----------
+    item : str
+        The network ID or serial.
+    result : list or dict
+        The result returned by the Meraki SDK, or None if the request failed.
+    error : Exception
+        The exception raised by the request, or None if it succeeded.
+
+    Examples
+    ----------
+    >>> calls = fetch_concurrently(api_key,
+    ...                            'appliance.getNetworkApplianceVlans',
+    ...                            networks)
+    >>> for network, vlans, error in calls:
+    ...     print(network, error or len(vlans))
+    """
+    def submit(item):
+        bucket = get_token_bucket(org_ids.get(item), rate=rate)
+        future = executor.submit(call_dashboard,
+                                 api_key,
+                                 method,
+                                 bucket,
+                                 item,
+                                 max_retries=max_retries,
+                                 **kwargs)
+        return item, future
+
+    # Only a bounded number of requests are submitted ahead of the results
+    # that have been yielded. If the caller stops early (E.g., it raises an
+    # exception for a failed request), then the requests that have not
+    # started are cancelled, instead of being waited for.
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    items = iter(items)
+    pending = deque(submit(_) for _ in islice(items, max_workers * 2))
+    try:
+        # Yield the results in the same order as 'items'
+        while pending:
+            item, future = pending.popleft()
+            for _ in islice(items, 1):
+                pending.append(submit(_))
+            try:
+                result = future.result()
+            except Exception as e:
+                yield item, None, e
+            else:
+                yield item, result, None
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
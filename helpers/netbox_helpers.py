@@ -7,7 +7,7 @@
 from collectors import netbox_collectors as nbc
 
 
-def get_prefix_custom_field_states(nb_path, token, f_name):
+def get_prefix_custom_field_states(nb_path, token, f_name, max_age=300):
     """Gets the values of a single custom field for all prefixes.
 
     Queries the API to get the value of a custom field for all prefixes.
@@ -24,6 +24,10 @@ def get_prefix_custom_field_states(nb_path, token, f_name):
         The API token to use for authentication.
     f_name : str
         The name of the custom field to query.
+    max_age : int, optional
+        The number of seconds to reuse the prefixes from a previous query
+        (e.g., by the 'netbox_get_ipam_prefixes' collector). Set to 0 to
+        always query Netbox.
 
     Returns
     ----------
@@ -43,8 +47,10 @@ def get_prefix_custom_field_states(nb_path, token, f_name):
     print(type(df))
     >>> <class 'pandas.core.frame.DataFrame'>
     """
-    # Get the IPAM prefixes from Netbox
-    result = nbc.netbox_get_ipam_prefixes(nb_path, token)
+    # Get the IPAM prefixes from Netbox. They are cached by
+    # netbox_get_ipam_prefixes, so they are only downloaded once when this
+    # is run for several custom fields.
+    result = nbc.netbox_get_ipam_prefixes(nb_path, token, max_age=max_age)
 
     # Create a dataframe containing the prefix IDs and 'f_name' values
     df = result[['id', f'custom_fields_{f_name}']].copy()
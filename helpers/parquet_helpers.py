@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+
+"""A Parquet storage backend for the output of collectors.
+
+When the backend is enabled, add_to_db writes each collector snapshot to a
+Parquet dataset, in addition to the SQLite database. Each table has its own
+dataset, partitioned by date:
+
+    {path}/{TABLE}/date={YYYY-MM-DD}/{timestamp}.{token}.parquet
+
+Each snapshot is a single file, so the snapshots in a date range are found
+from the directory and file names without opening any files. The files are
+then read with column projection, and row filters are pushed down to the
+Parquet row groups. This is much faster than reading months of ARP or CAM
+history from SQLite with pd.read_sql, and the files are a fraction of the
+size.
+
+The backend is optional. It is only used if pyarrow is installed and
+enable_parquet_backend has been called.
+
+"""
+
+import os
+import pandas as pd
+import shutil
+import threading
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# The backend settings (see enable_parquet_backend)
+backend = {'enabled': False,
+           'path': None,
+           'compression': 'zstd'}
+
+# Serializes the writes to each dataset, so that a snapshot is not written to
+# a directory that is being deleted by a 'replace' (see get_table_lock)
+table_locks = dict()
+table_locks_lock = threading.Lock()
+
+
+def enable_parquet_backend(path, compression='zstd'):
+    """Enables the Parquet backend.
+
+    Parameters
+    ----------
+    path : str
+        The directory to store the datasets in. It is created if it does not
+        exist.
+    compression : str, optional
+        The Parquet compression codec. Defaults to 'zstd'.
+
+    Returns
+    ----------
+    enabled : bool
+        Whether the backend was enabled. It is not enabled if pyarrow is not
+        installed, in which case only SQLite is used.
+    """
+    if pa is None:
+        print('pyarrow is not installed. Output will only be written to '
+              'SQLite.')
+        return False
+
+    os.makedirs(path, exist_ok=True)
+    backend['enabled'] = True
+    backend['path'] = path
+    backend['compression'] = compression
+
+    return True
+
+
+def disable_parquet_backend():
+    """Disables the Parquet backend. The datasets are not deleted.
+
+    """
+    backend['enabled'] = False
+
+
+def use_parquet():
+    """Determines whether snapshots should be written to Parquet.
+
+    Returns
+    ----------
+    use_parquet : bool
+        True if the backend is enabled and pyarrow is installed.
+    """
+    return bool(backend['enabled'] and pa is not None)
+
+
+def get_dataset_path(table):
+    """Gets the path to a table's dataset.
+
+    Parameters
+    ----------
+    table : str
+        The table name.
+
+    Returns
+    ----------
+    path : str
+        The path to the dataset.
+    """
+    return os.path.join(backend['path'], table.upper())
+
+
+def has_dataset(table):
+    """Checks whether a table has a Parquet dataset.
+
+    Parameters
+    ----------
+    table : str
+        The table name.
+
+    Returns
+    ----------
+    exists : bool
+        True if the backend is enabled and the table has a dataset.
+    """
+    return use_parquet() and os.path.isdir(get_dataset_path(table))
+
+
+def get_table_lock(table):
+    """Gets the lock that serializes the writes to a table's dataset.
+
+    Parameters
+    ----------
+    table : str
+        The table name.
+
+    Returns
+    ----------
+    lock : threading.Lock
+        The table's lock. Writes to other tables do not wait on it.
+    """
+    with table_locks_lock:
+        return table_locks.setdefault(table.upper(), threading.Lock())
+
+
+def to_arrow(result):
+    """Converts the output of a collector to an Arrow table.
+
+    Columns that contain a mix of types (E.g., strings and integers) cannot
+    be stored in Parquet, so they are converted to strings. Missing values
+    are kept.
+
+    Parameters
+    ----------
+    result : pandas.DataFrame
+        The output of the collector.
+
+    Returns
+    ----------
+    table : pyarrow.Table
+        The Arrow table.
+    """
+    try:
+        return pa.Table.from_pandas(result, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        result = result.copy()
+        for col in result.columns:
+            if result[col].dtype == object:
+                result[col] = result[col].where(result[col].isna(),
+                                                result[col].astype(str))
+        return pa.Table.from_pandas(result, preserve_index=False)
+
+
+def write_snapshot(table, result, method='append'):
+    """Writes a collector snapshot to its table's dataset.
+
+    The file is written under a hidden name and then renamed, so readers
+    never see a partial file. The table's lock is held for the whole write,
+    so a concurrent 'replace' cannot delete the partition while the file is
+    being written.
+
+    Parameters
+    ----------
+    table : str
+        The table name.
+    result : pandas.DataFrame
+        The output of the collector, including the 'timestamp' column.
+    method : str, optional
+        What to do if the dataset already exists. Options are 'append',
+        'fail', 'replace' and 'delta'. The snapshots are always stored in
+        full, so 'delta' is the same as 'append'.
+
+    Raises
+    ----------
+    ValueError
+        If the method is 'fail' and the dataset already exists.
+    """
+    if len(result) == 0:
+        return
+
+    # Convert the output before taking the lock, since it does not touch the
+    # dataset
+    arrow_table = to_arrow(result)
+
+    path = get_dataset_path(table)
+    with get_table_lock(table):
+        if os.path.isdir(path):
+            if method == 'fail':
+                raise ValueError(f'Dataset {table.upper()} already exists.')
+            if method == 'replace':
+                shutil.rmtree(path)
+
+        timestamp = str(result['timestamp'].iloc[0])
+        partition = os.path.join(path, f'date={timestamp.split("_")[0]}')
+        os.makedirs(partition, exist_ok=True)
+
+        name = f'{timestamp}.{uuid.uuid4().hex[:8]}.parquet'
+        tmp = os.path.join(partition, f'.{name}.tmp')
+        pq.write_table(arrow_table,
+                       tmp,
+                       compression=backend['compression'])
+        os.replace(tmp, os.path.join(partition, name))
+
+
+def list_snapshot_files(table, start=None, end=None):
+    """Lists the files of the snapshots in a time range.
+
+    The files are pruned by their partition and file names, so no files are
+    opened.
+
+    Parameters
+    ----------
+    table : str
+        The table name.
+    start : str, optional
+        The first timestamp to include. Defaults to None, which includes
+        every snapshot before 'end'.
+    end : str, optional
+        The last timestamp to include. Defaults to None, which includes every
+        snapshot after 'start'.
+
+    Returns
+    ----------
+    files : dict
+        A dictionary where each key is a timestamp, and each value is a list
+        of the files for that snapshot. The keys are sorted.
+    """
+    path = get_dataset_path(table)
+    if not os.path.isdir(path):
+        return dict()
+
+    files = dict()
+    for partition in sorted(os.listdir(path)):
+        if not partition.startswith('date='):
+            continue
+        date = partition[5:]
+        if (start and date < start[:10]) or (end and date > end[:10]):
+            continue
+        for name in os.listdir(os.path.join(path, partition)):
+            if name.startswith('.') or not name.endswith('.parquet'):
+                continue
+            timestamp = name.split('.')[0]
+            if (start and timestamp < start) or (end and timestamp > end):
+                continue
+            files.setdefault(timestamp, list()).append(
+                os.path.join(path, partition, name))
+
+    return dict(sorted(files.items()))
+
+
+def get_snapshots(table, start=None, end=None):
+    """Gets the timestamps of a table's snapshots.
+
+    Parameters
+    ----------
+    table : str
+        The table name.
+    start : str, optional
+        The first timestamp to include.
+    end : str, optional
+        The last timestamp to include.
+
+    Returns
+    ----------
+    timestamps : list
+        The timestamps, from oldest to newest.
+    """
+    return list(list_snapshot_files(table, start, end))
+
+
+def create_filter(filters):
+    """Creates a row filter that can be pushed down to the Parquet files.
+
+    Parameters
+    ----------
+    filters : dict or pyarrow.dataset.Expression
+        A dictionary where each key is a column, and each value is the value
+        to match or a list of values to match. All of the conditions must
+        match. An Expression is returned as it is.
+
+    Returns
+    ----------
+    expression : pyarrow.dataset.Expression
+        The filter, or None if there are no filters.
+    """
+    if filters is None or isinstance(filters, ds.Expression):
+        return filters
+
+    expression = None
+    for col, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            condition = ds.field(col).isin(list(value))
+        else:
+            condition = ds.field(col) == value
+        expression = condition if expression is None else \
+            expression & condition
+
+    return expression
+
+
+def read_files(files, columns=list(), filters=None):
+    """Reads Parquet files into a DataFrame.
+
+    Parameters
+    ----------
+    files : list
+        The files to read.
+    columns : list, optional
+        The columns to read. Defaults to every column.
+    filters : dict or pyarrow.dataset.Expression, optional
+        The rows to read (see create_filter).
+
+    Returns
+    ----------
+    df : pandas.DataFrame
+        The rows that match the filters. Columns that are missing from some
+        of the files are filled with nulls.
+    """
+    # Snapshots can have different columns, or a column can be null in one
+    # snapshot and typed in another, so the schemas are merged. If a column
+    # has conflicting types (E.g., a number that could not be converted in
+    # one snapshot), then the files are read one at a time.
+    try:
+        schema = pa.unify_schemas([pq.read_schema(f) for f in files])
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        frames = [read_files([f], columns, filters) for f in files]
+        return pd.concat(frames, ignore_index=True)
+    columns = [c for c in columns if c in schema.names] or None
+    dataset = ds.dataset(files, schema=schema, format='parquet')
+    table = dataset.to_table(columns=columns, filter=create_filter(filters))
+
+    return table.to_pandas()
+
+
+def read_snapshot(table, timestamp=None, columns=list(), filters=None):
+    """Reads a single snapshot of a table.
+
+    Parameters
+    ----------
+    table : str
+        The table name.
+    timestamp : str, optional
+        The timestamp of the snapshot. Defaults to None, which reads the
+        latest snapshot.
+    columns : list, optional
+        The columns to read. Defaults to every column.
+    filters : dict or pyarrow.dataset.Expression, optional
+        The rows to read (see create_filter).
+
+    Returns
+    ----------
+    df : pandas.DataFrame
+        The rows of the snapshot. It is empty if the snapshot does not
+        exist.
+    """
+    if timestamp is None:
+        snapshots = list_snapshot_files(table)
+        if not snapshots:
+            return pd.DataFrame(columns=columns)
+        files = snapshots[list(snapshots)[-1]]
+    else:
+        files = list_snapshot_files(table, timestamp, timestamp).get(
+            timestamp, list())
+        if not files:
+            return pd.DataFrame(columns=columns)
+
+    return read_files(files, columns, filters)
+
+
+def read_history(table, start=None, end=None, columns=list(), filters=None):
+    """Reads every snapshot of a table in a time range.
+
+    Parameters
+    ----------
+    table : str
+        The table name.
+    start : str, optional
+        The first timestamp to include.
+    end : str, optional
+        The last timestamp to include.
+    columns : list, optional
+        The columns to read. Defaults to every column. The 'timestamp'
+        column should be included to tell the snapshots apart.
+    filters : dict or pyarrow.dataset.Expression, optional
+        The rows to read (see create_filter).
+
+    Returns
+    ----------
+    df : pandas.DataFrame
+        The rows of the snapshots, from oldest to newest.
+
+    Examples
+    ----------
+    >>> df = read_history('NXOS_ARP_TABLE',
+    ...                   start='2023-01-01_0000',
+    ...                   columns=['timestamp', 'device', 'address', 'mac'],
+    ...                   filters={'mac': '0050.5680.0001'})
+    """
+    snapshots = list_snapshot_files(table, start, end)
+    files = [f for timestamp in snapshots for f in snapshots[timestamp]]
+    if not files:
+        return pd.DataFrame(columns=columns)
+
+    return read_files(files, columns, filters)
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+
+"""An asyncio SSH engine for running show commands on network devices.
+
+Running a playbook starts an ansible-playbook process, which forks a worker
+for each host and negotiates a new SSH session for every task. For the
+'run_commands' playbooks, which only run a list of commands and return their
+output, this engine runs the same commands over asyncssh from a single event
+loop instead. The commands for a device are sent through one interactive
+session, the same as Ansible's network_cli connection, since many network
+devices (E.g., IOS) only accept one command per exec request. Connections are
+pooled per device, so they are reused by later collectors in the same process
+when the device allows it.
+
+The engine is optional. It is only used if asyncssh is installed and
+enable_ssh_engine has been called, and only for the playbooks returned by
+define_ssh_playbooks. Everything else still runs through Ansible.
+
+"""
+
+import asyncio
+import json
+import queue
+import re
+import threading
+import yaml
+
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+
+# The engine settings (see enable_ssh_engine)
+engine = {'enabled': False,
+          'max_concurrency': 20,
+          'timeout': 30,
+          'known_hosts': ()}
+
+# The event loop that the engine runs in, and the pooled connections. The
+# loop runs in its own thread so that the connections outlive each call to
+# ssh_run_events, and so that it does not conflict with a loop that is
+# already running in the caller's thread (e.g., in a Jupyter notebook).
+loop_state = dict()
+loop_lock = threading.Lock()
+connections = dict()
+
+# The pattern for a device prompt at the end of the output (E.g., 'switch#',
+# 'switch>' or 'switch(config)#')
+prompt_pattern = re.compile(r'([^\n]*[>#])\s*$')
+
+# The commands that are run at the start of each session, so that the output
+# is not paged or wrapped
+session_commands = ['terminal length 0', 'terminal width 511']
+
+
+def define_ssh_playbooks():
+    """Defines the playbooks that the SSH engine can run.
+
+    Returns
+    ----------
+    playbooks : dict
+        A dictionary where each key is the file name of a playbook, and each
+        value is the network OS that it runs commands on.
+    """
+    playbooks = {'cisco_ios_run_commands.yml': 'cisco.ios.ios',
+                 'cisco_nxos_run_commands.yml': 'cisco.nxos.nxos'}
+    return playbooks
+
+
+def enable_ssh_engine(max_concurrency=20, timeout=30, known_hosts=()):
+    """Enables the SSH engine for the supported playbooks.
+
+    Parameters
+    ----------
+    max_concurrency : int, optional
+        The maximum number of devices to run commands on at the same time.
+    timeout : int, optional
+        The number of seconds to wait for a connection or a command. This is
+        overridden by 'ansible_timeout' if it is in a playbook's extravars.
+    known_hosts : str or None, optional
+        The known hosts file to validate host keys against. Defaults to the
+        asyncssh default (~/.ssh/known_hosts). Set it to None to disable host
+        key validation.
+
+    Returns
+    ----------
+    enabled : bool
+        Whether the engine was enabled. It is not enabled if asyncssh is not
+        installed, in which case Ansible continues to be used.
+    """
+    if asyncssh is None:
+        print('asyncssh is not installed. Commands will be run with Ansible.')
+        return False
+
+    engine['enabled'] = True
+    engine['max_concurrency'] = max_concurrency
+    engine['timeout'] = timeout
+    engine['known_hosts'] = known_hosts
+
+    return True
+
+
+def disable_ssh_engine():
+    """Disables the SSH engine, so that every playbook is run by Ansible.
+
+    """
+    engine['enabled'] = False
+
+
+def use_ssh_engine(playbook):
+    """Determines whether a playbook should be run by the SSH engine.
+
+    Parameters
+    ----------
+    playbook : str
+        The path to the playbook.
+
+    Returns
+    ----------
+    use_engine : bool
+        True if the engine is enabled, asyncssh is installed and the engine
+        supports the playbook. Otherwise False.
+    """
+    name = playbook.replace('\\', '/').split('/')[-1]
+    return bool(engine['enabled'] and asyncssh is not None and
+                name in define_ssh_playbooks())
+
+
+def get_inventory_hosts(host_group, private_data_dir):
+    """Gets the hosts in an inventory group and the addresses to connect to.
+
+    Parameters
+    ----------
+    host_group : str
+        The name of the host group. Its child groups are included.
+    private_data_dir : str
+        The path to the Ansible private_data_dir. This is the path that the
+        'inventory' folder is in.
+
+    Returns
+    ----------
+    hosts : list
+        A list of tuples containing the inventory hostname, the address
+        ('ansible_host', or the hostname if it is not set) and the port
+        ('ansible_port', or 22 if it is not set) of each host.
+    """
+    with open(f'{private_data_dir}/inventory/hosts') as f:
+        inventory = yaml.load(f, Loader=yaml.FullLoader)
+
+    hosts = dict()
+    groups = [host_group]
+    seen = set()
+    while groups:
+        group = groups.pop()
+        if group in seen or not isinstance(inventory.get(group), dict):
+            continue
+        seen.add(group)
+        group_vars = inventory[group].get('vars') or dict()
+        for host, host_vars in (inventory[group].get('hosts') or
+                                dict()).items():
+            host_vars = host_vars or dict()
+            address = host_vars.get('ansible_host', host)
+            port = host_vars.get('ansible_port',
+                                 group_vars.get('ansible_port', 22))
+            hosts.setdefault(host, (host, address, int(port)))
+        groups.extend(inventory[group].get('children') or dict())
+
+    return list(hosts.values())
+
+
+def get_event_loop():
+    """Gets the engine's event loop, starting it if necessary.
+
+    Returns
+    ----------
+    loop : asyncio.AbstractEventLoop
+        The event loop. It runs forever in a daemon thread.
+    """
+    with loop_lock:
+        loop = loop_state.get('loop')
+        if loop is None or not loop_state['thread'].is_alive():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, daemon=True)
+            thread.start()
+            loop_state['loop'] = loop
+            loop_state['thread'] = thread
+            connections.clear()
+
+    return loop
+
+
+async def get_connection(address, port, username, password, timeout):
+    """Gets the pooled connection to a device, connecting if necessary.
+
+    Parameters
+    ----------
+    address : str
+        The address of the device.
+    port : int
+        The SSH port of the device.
+    username : str
+        The username to log in with.
+    password : str
+        The password to log in with.
+    timeout : int
+        The number of seconds to wait for the connection.
+
+    Returns
+    ----------
+    conn : asyncssh.SSHClientConnection
+        The connection to the device.
+    """
+    key = (address, port, username, hash(password))
+    conn = connections.get(key)
+    if conn is not None and not conn.is_closed():
+        return conn
+
+    conn = await asyncssh.connect(address,
+                                  port=port,
+                                  username=username,
+                                  password=password,
+                                  known_hosts=engine['known_hosts'],
+                                  connect_timeout=timeout)
+    connections[key] = conn
+
+    return conn
+
+
+def drop_connection(address, port, username, password):
+    """Removes a device's connection from the pool and closes it.
+
+    Parameters
+    ----------
+    address : str
+        The address of the device.
+    port : int
+        The SSH port of the device.
+    username : str
+        The username that the connection was created with.
+    password : str
+        The password that the connection was created with.
+    """
+    conn = connections.pop((address, port, username, hash(password)), None)
+    if conn is not None:
+        conn.close()
+
+
+async def open_session(address, port, username, password, timeout):
+    """Opens an interactive session on a device.
+
+    The pooled connection is used if there is one. Some devices (E.g., IOS)
+    close the connection when a session ends, so if the session cannot be
+    opened on the pooled connection, then it is replaced once.
+
+    Parameters
+    ----------
+    address : str
+        The address of the device.
+    port : int
+        The SSH port of the device.
+    username : str
+        The username to log in with.
+    password : str
+        The password to log in with.
+    timeout : int
+        The number of seconds to wait for the connection and the session.
+
+    Returns
+    ----------
+    process : asyncssh.SSHClientProcess
+        The interactive session.
+    """
+    for attempt in range(2):
+        conn = await get_connection(address,
+                                    port,
+                                    username,
+                                    password,
+                                    timeout)
+        try:
+            process = await asyncio.wait_for(
+                conn.create_process(term_type='vt100', term_size=(511, 24)),
+                timeout)
+            return process
+        except (asyncssh.ChannelOpenError, asyncssh.ConnectionLost):
+            drop_connection(address, port, username, password)
+            if attempt > 0:
+                raise
+
+
+async def read_until_prompt(process, prompt, timeout):
+    """Reads the output of an interactive session until the device prompts
+    for the next command.
+
+    Parameters
+    ----------
+    process : asyncssh.SSHClientProcess
+        The interactive session.
+    prompt : str or None
+        The prompt to wait for. If it is None, then any prompt that matches
+        prompt_pattern is accepted (E.g., after logging in).
+    timeout : int
+        The number of seconds to wait for the prompt.
+
+    Returns
+    ----------
+    output : str
+        The output, including the prompt. Carriage returns are removed.
+    prompt : str
+        The prompt.
+    """
+    output = str()
+    while True:
+        chunk = await asyncio.wait_for(process.stdout.read(65536), timeout)
+        if not chunk:
+            raise ConnectionError('The device closed the session.')
+        output += chunk.replace('\r', str())
+        if prompt is None:
+            match = prompt_pattern.search(output)
+            if match:
+                return output, match.group(1).strip()
+        elif output.rstrip().endswith(prompt):
+            return output, prompt
+
+
+async def run_session_commands(process, commands, timeout):
+    """Runs a list of commands in an interactive session.
+
+    Parameters
+    ----------
+    process : asyncssh.SSHClientProcess
+        The interactive session.
+    commands : list
+        The commands to run, in order.
+    timeout : int
+        The number of seconds to wait for each command.
+
+    Returns
+    ----------
+    stdout : list
+        The raw output of each command, without the echoed command and the
+        prompt.
+    """
+    _, prompt = await read_until_prompt(process, None, timeout)
+
+    stdout = list()
+    for command in session_commands + commands:
+        process.stdin.write(f'{command}\n')
+        output, _ = await read_until_prompt(process, prompt, timeout)
+        # The first line is the echoed command, and the last is the prompt
+        stdout.append('\n'.join(output.split('\n')[1:-1]))
+
+    return stdout[len(session_commands):]
+
+
+def parse_command_output(command, output):
+    """Formats a command's output the same way as the Ansible modules.
+
+    The output is stripped, and the output of commands that are piped to
+    'json' is parsed into a dictionary, the same as nxos_command.
+
+    Parameters
+    ----------
+    command : str
+        The command that was run.
+    output : str
+        The raw output of the command.
+
+    Returns
+    ----------
+    output : str or dict
+        The formatted output.
+    """
+    output = (output or str()).strip()
+    if command.replace(' ', '').endswith('|json') and output:
+        output = json.loads(output)
+
+    return output
+
+
+async def run_host_commands(host,
+                            address,
+                            port,
+                            username,
+                            password,
+                            commands,
+                            timeout,
+                            semaphore):
+    """Runs a list of commands on a device and creates an event for it.
+
+    Parameters
+    ----------
+    host : str
+        The inventory hostname of the device.
+    address : str
+        The address of the device.
+    port : int
+        The SSH port of the device.
+    username : str
+        The username to log in with.
+    password : str
+        The password to log in with.
+    commands : list
+        The commands to run, in order.
+    timeout : int
+        The number of seconds to wait for the connection and each command.
+    semaphore : asyncio.Semaphore
+        The semaphore that limits the number of concurrent devices.
+
+    Returns
+    ----------
+    event : dict
+        An event in the same format as the Ansible events. Its type is
+        'runner_on_ok' if every command succeeded, 'runner_on_unreachable'
+        if the device could not be reached, or 'runner_on_failed' otherwise.
+        Its 'host' is the inventory hostname and its 'remote_addr' is the
+        address, the same as Ansible.
+    """
+    async with semaphore:
+        try:
+            process = await open_session(address,
+                                         port,
+                                         username,
+                                         password,
+                                         timeout)
+            try:
+                outputs = await run_session_commands(process,
+                                                     commands,
+                                                     timeout)
+            finally:
+                process.close()
+            stdout = [parse_command_output(command, output)
+                      for command, output in zip(commands, outputs)]
+            event_type = 'runner_on_ok'
+            res = {'changed': False,
+                   'stdout': stdout,
+                   'stdout_lines': [_.split('\n') if isinstance(_, str)
+                                    else _ for _ in stdout]}
+        except (OSError, asyncio.TimeoutError, asyncssh.Error) as e:
+            drop_connection(address, port, username, password)
+            event_type = 'runner_on_unreachable'
+            res = {'unreachable': True, 'msg': str(e)}
+        except Exception as e:
+            event_type = 'runner_on_failed'
+            res = {'failed': True, 'msg': str(e)}
+
+    event = {'event': event_type,
+             'event_data': {'host': host,
+                            'remote_addr': address,
+                            'res': res}}
+
+    return event
+
+
+def ssh_run_events(private_data_dir,
+                   extravars,
+                   event_type='runner_on_ok',
+                   limit=None):
+    """Runs a 'run_commands' playbook's commands and yields its events.
+
+    This is a drop-in replacement for helpers.ansible_run_events for the
+    playbooks returned by define_ssh_playbooks. It yields events with the
+    same structure, so the collectors parse them the same way.
+
+    Parameters
+    ----------
+    private_data_dir : str
+        The path to the Ansible private data directory.
+    extravars : dict
+        The extra variables that would be passed to the playbook. It must
+        contain 'host_group', 'commands', 'username' and 'password'. It can
+        also contain 'ansible_timeout'.
+    event_type : str, optional
+        The type of event to yield. Defaults to 'runner_on_ok'.
+    limit : list, optional
+        The inventory hostnames to limit the run to. Defaults to None, which
+        runs the commands on every host in the host group.
+
+    Yields
+    ----------
+    event : dict
+        The events, in the order that the devices finish.
+    """
+    hosts = get_inventory_hosts(extravars['host_group'], private_data_dir)
+    if limit is not None:
+        hosts = [_ for _ in hosts if _[0] in limit]
+    commands = extravars['commands']
+    if isinstance(commands, str):
+        commands = [commands]
+    timeout = int(extravars.get('ansible_timeout', engine['timeout']))
+    events = queue.Queue()
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(engine['max_concurrency'])
+        tasks = [run_host_commands(host,
+                                   address,
+                                   port,
+                                   extravars['username'],
+                                   extravars['password'],
+                                   commands,
+                                   timeout,
+                                   semaphore) for host, address, port in hosts]
+        try:
+            for task in asyncio.as_completed(tasks):
+                events.put(await task)
+        finally:
+            events.put(None)
+
+    future = asyncio.run_coroutine_threadsafe(run_all(), get_event_loop())
+
+    while True:
+        event = events.get()
+        if event is None:
+            break
+        if event.get('event') == event_type:
+            yield event
+
+    future.result()
@@ -8,7 +8,9 @@ import argparse
 import datetime as dt
 import os
 import pandas as pd
+import queue
 import readline
+import threading
 from collectors import cisco_asa_collectors as cac
 from collectors import cisco_ios_collectors as cic
 from collectors import collectors as cl
@@ -18,12 +20,23 @@ from collectors import meraki_collectors as mc
 from collectors import netbox_collectors as nbc
 from collectors import palo_alto_collectors as pac
 from collectors import solarwinds_collectors as swc
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import wait
+from helpers import cache_helpers as cah
 from helpers import helpers as hp
+from helpers import parquet_helpers as pqh
+from helpers import ssh_helpers as sshh
 # from tabulate import tabulate
 
 # Protect creds by not writing history to .python_history
 readline.write_history_file = lambda *args: None
 
+# Serialize database writes when collectors run concurrently
+db_lock = threading.Lock()
+
+# The state of the database writer thread (see start_db_writer)
+db_writer = dict()
+
 
 def collect(collector,
             nm_path,
@@ -56,7 +69,8 @@ def collect(collector,
             method=str(),
             macs=list(),
             per_page=1000,
-            timespan=86400):
+            timespan=86400,
+            stream=False):
     '''
     This function calls the test that the user requested.
 
@@ -97,11 +111,41 @@ def collect(collector,
         timespan (int):         The lookback time in seconds. Meraki's default
                                 timespan is 1 day (86400 seconds), so the same
                                 default value is used in this function.
+        stream (bool):          Whether to write each device's output to the
+                                database as soon as it is parsed, instead of
+                                after every device has responded. This is
+                                only supported by the larger collectors (E.g.,
+                                ARP and CAM tables). When the output is
+                                streamed, the returned DataFrame is empty.
 
     '''
     # Create an empty DataFrame for when collectors return no resolts.
     result = pd.DataFrame()
 
+    # If the output is streamed, the collector passes each device's output to
+    # 'on_device', which adds it to the database. The output cannot be
+    # streamed if the table is being replaced, since each device would replace
+    # the previous one, or if it is stored in 'delta' mode, since the changes
+    # are found by comparing the whole output to the previous snapshot. It is
+    # not streamed to Parquet either, so that each snapshot is a single file.
+    # The writes are kept, so that the collector fails if one of them fails.
+    table_name = f'{ansible_os.split(".")[-1]}_{collector}'
+    writes = list()
+
+    def write_device(df):
+        writes.append(add_to_db(collector,
+                                table_name,
+                                df,
+                                timestamp,
+                                db_path,
+                                method,
+                                idx_cols))
+
+    on_device = None
+    if stream and method not in ['replace', 'delta'] and \
+            not pqh.use_parquet():
+        on_device = write_device
+
     # Set the number of pages to return (for Meraki collectors).
     if total_pages == -1:
         total_pages = 'all'
@@ -170,7 +214,8 @@ def collect(collector,
                                                hostgroup,
                                                play_path,
                                                private_data_dir,
-                                               validate_certs=validate_certs)
+                                               validate_certs=validate_certs,
+                                               on_device=on_device)
 
         if collector == 'pool_summary':
             result = f5c.get_pool_data(username,
@@ -239,7 +284,8 @@ def collect(collector,
                                            hostgroup,
                                            nm_path,
                                            play_path,
-                                           private_data_dir)
+                                           private_data_dir,
+                                           on_device=on_device)
 
         if ansible_os == 'cisco.nxos.nxos':
             result = cl.nxos_get_cam_table(username,
@@ -247,7 +293,11 @@ def collect(collector,
                                            hostgroup,
                                            nm_path,
                                            play_path,
-                                           private_data_dir)
+                                           private_data_dir,
+                                           on_device=on_device)
+            # Index the columns used by nxos_get_interface_summary
+            if not idx_cols:
+                idx_cols = ['timestamp', 'device', 'interface']
 
     if collector == 'config':
         if ansible_os == 'cisco.ios.ios':
@@ -264,7 +314,8 @@ def collect(collector,
                                            hostgroup,
                                            nm_path,
                                            play_path,
-                                           private_data_dir)
+                                           private_data_dir,
+                                           on_device=on_device)
 
         if ansible_os == 'cisco.nxos.nxos':
             result = cl.nxos_get_arp_table(username,
@@ -272,7 +323,8 @@ def collect(collector,
                                            hostgroup,
                                            nm_path,
                                            play_path,
-                                           private_data_dir)
+                                           private_data_dir,
+                                           on_device=on_device)
 
         if ansible_os == 'paloaltonetworks.panos':
             result = pac.get_arp_table(username,
@@ -304,6 +356,8 @@ def collect(collector,
                                                         hostgroup,
                                                         play_path,
                                                         private_data_dir)
+            if not idx_cols:
+                idx_cols = ['timestamp', 'device', 'interface']
 
     if collector == 'infoblox_get_network_containers':
         result = nc.get_network_containers(infoblox_host,
@@ -379,6 +433,8 @@ def collect(collector,
                                                   hostgroup,
                                                   play_path,
                                                   private_data_dir)
+            if not idx_cols:
+                idx_cols = ['timestamp', 'device', 'interface']
 
     if collector == 'interface_summary':
         if ansible_os == 'cisco.nxos.nxos':
@@ -548,6 +604,14 @@ def collect(collector,
                                                    play_path,
                                                    private_data_dir)
 
+    if collector == 'port_channel_members':
+        if ansible_os == 'cisco.nxos.nxos':
+            result = cl.nxos_get_port_channel_members(username,
+                                                      password,
+                                                      hostgroup,
+                                                      play_path,
+                                                      private_data_dir)
+
     if collector == 'vpc_state':
         if ansible_os == 'cisco.nxos.nxos':
             result = cl.nxos_get_vpc_state(username,
@@ -588,18 +652,274 @@ def collect(collector,
 
     # Write the result to the database
     if len(result.columns.to_list()) > 0:
-        table_name = f'{ansible_os.split(".")[-1]}_{collector}'
-        add_to_db(collector,
-                  table_name,
-                  result,
-                  timestamp,
-                  db_path,
-                  method,
-                  idx_cols)
+        writes.append(add_to_db(collector,
+                                table_name,
+                                result,
+                                timestamp,
+                                db_path,
+                                method,
+                                idx_cols))
+
+    # Wait for the database writer to write the output. If it could not be
+    # written, then the exception is raised here so the collector fails.
+    flush_db_writer([future for future in writes if future])
 
     return result
 
 
+def schedule_collectors(df_collectors,
+                        nm_path,
+                        private_data_dir,
+                        timestamp,
+                        max_workers=8,
+                        os_limits=None,
+                        batch_commands=False,
+                        cache_output=True,
+                        ssh_engine=False,
+                        stream=False,
+                        parquet=False,
+                        **kwargs):
+    '''
+    Runs the collectors in 'df_collectors' concurrently. Each row is a node
+    in a dependency graph. A node only starts after every collector it
+    depends on (see hp.define_collector_dependencies) has finished for the
+    same ansible_os, so the whole run takes as long as the slowest chain of
+    collectors instead of the sum of all of them.
+
+    Args:
+        df_collectors (DataFrame):  The collectors to run. It must contain the
+                                    'ansible_os', 'hostgroup' and 'collector'
+                                    columns (see create_collectors_df in
+                                    setup.py).
+        nm_path (str):              The path to the Net-Manage repository
+        private_data_dir (str):     The path to the Ansible private data
+                                    directory
+        timestamp (str):            The timestamp. It is the same for all
+                                    collectors.
+        max_workers (int):          The maximum number of collectors to run
+                                    at the same time. Defaults to 8.
+        os_limits (dict):           The maximum number of collectors to run
+                                    at the same time for an ansible_os. For
+                                    example, {'meraki': 1} prevents Meraki
+                                    collectors from competing for the same
+                                    API rate limit. Any ansible_os that is
+                                    not in the dictionary is only limited by
+                                    'max_workers'. Defaults to None, which
+                                    does not limit any ansible_os.
+        batch_commands (bool):      Whether to batch the commands of the NXOS
+                                    collectors for each hostgroup into a
+                                    single playbook run, so each device is
+                                    only logged into once. Defaults to False.
+        cache_output (bool):        Whether to cache the output of the
+                                    commands that the collectors run, so
+                                    collectors that run the same commands
+                                    only connect to each device once (see
+                                    cache_helpers). The cache is stored next
+                                    to the database, and the output of
+                                    earlier runs is never reused. Defaults to
+                                    True.
+        ssh_engine (bool):          Whether to run the commands of the IOS
+                                    and NXOS 'run_commands' playbooks over
+                                    asyncssh instead of ansible-playbook (see
+                                    ssh_helpers). It requires asyncssh.
+                                    Defaults to False.
+        stream (bool):              Whether the collectors that support it
+                                    (E.g., ARP and CAM tables) write each
+                                    device's output to the database as soon
+                                    as it is parsed (see collect). Their
+                                    results are empty DataFrames. Defaults to
+                                    False.
+        parquet (bool):             Whether to also write the output of the
+                                    collectors to Parquet datasets (see
+                                    parquet_helpers). The datasets are stored
+                                    in a 'parquet' directory next to the
+                                    database. It requires pyarrow. Defaults
+                                    to False.
+        kwargs:                     Any other arguments are passed to
+                                    collect() for every collector.
+
+    Returns:
+        results (dict):             The output of each collector. The keys
+                                    are (ansible_os, hostgroup, collector)
+                                    tuples.
+    '''
+    if os_limits is None:
+        os_limits = dict()
+
+    # Create the list of nodes, removing duplicates but keeping the order
+    cols = ['ansible_os', 'hostgroup', 'collector']
+    nodes = list(dict.fromkeys(df_collectors[cols].itertuples(index=False,
+                                                              name=None)))
+
+    # Group the nodes by ansible_os and collector, so that the dependencies
+    # of a node can be found without searching every node
+    by_collector = dict()
+    for node in nodes:
+        by_collector.setdefault((node[0], node[2]), list()).append(node)
+
+    # Map each node to the nodes it is waiting on, and map each node to the
+    # nodes that are waiting on it. Dependencies are shared across
+    # hostgroups, because every hostgroup of an ansible_os writes to the
+    # same table.
+    dependencies = hp.define_collector_dependencies()
+    waiting_on = dict()
+    dependents = {node: list() for node in nodes}
+    for node in nodes:
+        waiting_on[node] = set()
+        for dep in dependencies.get(node[2], list()):
+            for parent in by_collector.get((node[0], dep), list()):
+                waiting_on[node].add(parent)
+                dependents[parent].append(node)
+
+    # Write the output of the collectors from a single background thread,
+    # unless the caller already started the writer
+    db_path = kwargs.get('db_path')
+    started_writer = False
+    if db_path and db_writer.get('db_path') != db_path:
+        start_db_writer(db_path)
+        started_writer = True
+
+    # Cache the output of the commands for this run, unless the caller already
+    # enabled the cache. The output of earlier runs is cleared, since it may
+    # be out of date.
+    started_cache = False
+    if cache_output and db_path and not cah.cache['enabled']:
+        cah.enable_output_cache(os.path.join(os.path.dirname(db_path),
+                                             'output_cache.db'))
+        cah.clear_output_cache()
+        started_cache = True
+
+    # Run the commands of the supported playbooks with the SSH engine, unless
+    # the caller already enabled it
+    started_engine = False
+    if ssh_engine and not sshh.engine['enabled']:
+        started_engine = sshh.enable_ssh_engine()
+
+    # Write the output to the Parquet datasets as well, unless the caller
+    # already enabled the backend
+    started_parquet = False
+    if parquet and db_path and not pqh.backend['enabled']:
+        started_parquet = pqh.enable_parquet_backend(
+            os.path.join(os.path.dirname(db_path), 'parquet'))
+
+    # Batch the NXOS commands for each hostgroup. Each collector still parses
+    # its own output; the first one to run executes the whole batch.
+    if batch_commands:
+        plan_command_batches(nodes,
+                             private_data_dir,
+                             kwargs.get('play_path', str()))
+
+    ready = [node for node in nodes if not waiting_on[node]]
+    running = dict()
+    active = dict()
+    failed = set()
+    results = dict()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while ready or running:
+            # Start every ready node whose ansible_os is below its limit
+            for node in list(ready):
+                if len(running) >= max_workers:
+                    break
+                ansible_os, hostgroup, collector = node
+                limit = os_limits.get(ansible_os, max_workers)
+                if active.get(ansible_os, 0) >= limit:
+                    continue
+                ready.remove(node)
+                active[ansible_os] = active.get(ansible_os, 0) + 1
+                future = executor.submit(collect,
+                                         collector,
+                                         nm_path,
+                                         private_data_dir,
+                                         timestamp,
+                                         ansible_os=ansible_os,
+                                         hostgroup=hostgroup,
+                                         stream=stream,
+                                         **kwargs)
+                running[future] = node
+
+            # If nothing could be started (E.g., an ansible_os has a limit
+            # of 0), then stop
+            if not running:
+                break
+
+            # Wait for at least one collector to finish
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                active[node[0]] -= 1
+                try:
+                    results[node] = future.result()
+                except Exception as e:
+                    print(f'Caught Exception: {str(e)}')
+                    failed.add(node)
+
+                # Dependent collectors read this collector's output from the
+                # database, so it must be written before they start
+                if dependents[node]:
+                    flush_db_writer()
+
+                # Release the nodes that were waiting on this one. If it
+                # failed, then its dependents are never started.
+                for child in dependents[node]:
+                    if node in failed:
+                        failed.add(child)
+                        continue
+                    waiting_on[child].discard(node)
+                    if not waiting_on[child] and child not in failed:
+                        ready.append(child)
+
+    if started_writer:
+        stop_db_writer()
+    if started_cache:
+        cah.disable_output_cache()
+    if started_engine:
+        sshh.disable_ssh_engine()
+    if started_parquet:
+        pqh.disable_parquet_backend()
+
+    # Remove any batches that were not fully collected (E.g., because a
+    # collector failed)
+    if batch_commands:
+        hp.ansible_clear_batches()
+
+    # Let the user know about collectors that did not complete
+    for node in nodes:
+        if node not in results:
+            print(f'Collector did not complete: {" ".join(node)}')
+
+    return results
+
+
+def plan_command_batches(nodes, private_data_dir, play_path):
+    '''
+    Registers a batch of commands for each NXOS hostgroup that is running
+    more than one collector that can be batched (see cl.nxos_define_commands).
+
+    Args:
+        nodes (list):           The (ansible_os, hostgroup, collector) tuples
+                                that are being run
+        private_data_dir (str): The path to the Ansible private data directory
+        play_path (str):        The path to the playbooks directory
+
+    Returns:
+        batches (dict):         The commands that were batched for each
+                                hostgroup
+    '''
+    commands = cl.nxos_define_commands()
+
+    batches = dict()
+    for ansible_os, hostgroup, collector in nodes:
+        if ansible_os == 'cisco.nxos.nxos' and collector in commands:
+            batches.setdefault(hostgroup, list()).append(commands[collector])
+
+    playbook = f'{play_path}/cisco_nxos_run_commands.yml'
+    for hostgroup, cmds in batches.items():
+        hp.ansible_register_batch(private_data_dir, playbook, hostgroup, cmds)
+
+    return batches
+
+
 def add_to_db(collector,
               table_name,
               result,
@@ -608,7 +928,12 @@ def add_to_db(collector,
               method='append',
               idx_cols=list()):
     '''
-    Adds the output of a collector to the database
+    Adds the output of a collector to the database. If the database writer is
+    running for 'db_path' (see start_db_writer), then the output is queued
+    and written in the background, and a future is returned that is resolved
+    once it has been written. Otherwise it is written immediately. If
+    the Parquet backend is enabled (see parquet_helpers), then the output is
+    also written to its Parquet dataset.
 
     Args:
         collector (str):    The name of the collector
@@ -616,53 +941,163 @@ def add_to_db(collector,
         timestamp (str):    The timestamp
         db_path (str):      The path to the database
         method (str):       What to do if the database already exists. Options
-                            are 'append', 'fail', 'replace'. Defaults to
-                            'append'.
+                            are 'append', 'fail', 'replace' and 'delta'.
+                            Defaults to 'append'. In 'delta' mode, only the
+                            rows that changed since the previous snapshot are
+                            stored, and read_snapshot rebuilds the snapshots.
         idx_cols (list):    The list of columns to use for indexing the table.
                             Note that this is NOT related to the dataframe
                             index; it is for indexing the sqlite database table
 
     Returns:
-        None
+        future (obj):       A concurrent.futures.Future for the queued output
+                            (see flush_db_writer), or None if the output was
+                            written immediately
     '''
-    # Set the timestamp as the index of the dataframe (this is unrelated to
-    # the 'idx_cols' arg)
-    new_idx = list()
-    for i in range(0, len(result)):
-        new_idx.append(timestamp)
+    # Add the timestamp to the dataframe. Copy it first so that the caller's
+    # dataframe is not modified after it has been queued.
+    result = result.copy()
+    result.insert(0, 'timestamp', timestamp)
+
+    # The table ID is auto-incremented by the database
+    if 'table_id' in result.columns.to_list():
+        del result['table_id']
 
-    # Display the output to the console
-    result['timestamp'] = new_idx
-    result = result.set_index('timestamp')
+    if not method:
+        method = 'append'
+
+    # Convert the columns that have a type in the table's schema, so that
+    # they are stored as numbers instead of text
+    result = hp.coerce_table_types(table_name, result)
+
+    # Write the snapshot to its Parquet dataset, if the backend is enabled
+    if pqh.use_parquet():
+        pqh.write_snapshot(table_name, result, method)
+
+    # Queue the output if the database writer is running
+    if db_writer.get('db_path') == db_path:
+        future = Future()
+        db_writer['queue'].put((table_name, result, method, idx_cols, future))
+        return future
 
     # Check if the output directory exists. If it does not, then create it.
     exists = hp.check_dir_existence('/'.join(db_path.split('/')[:-1]))
     if not exists:
         hp.create_dir('/'.join(db_path.split('/')[:-1]))
 
-    # Connect to the database
+    # Only one thread can write to the database at a time. Without the lock,
+    # concurrent collectors would fail with 'database is locked' errors.
+    with db_lock:
+        con = connect_to_db_writer(db_path)
+        write_to_db(con, table_name, result, method, idx_cols, dict())
+        con.commit()
+        con.close()
+
+    return None
+
+
+def connect_to_db_writer(db_path):
+    '''
+    Opens a connection to the database that is used for writing. The
+    database is put in WAL mode so that collectors can read from it while it
+    is being written to.
+
+    Args:
+        db_path (str):  The path to the database
+
+    Returns:
+        con (obj):      Connection to the database
+    '''
     con = hp.connect_to_db(db_path)
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('PRAGMA synchronous=NORMAL')
+    return con
+
+
+def write_to_db(con, table_name, result, method, idx_cols, schemas):
+    '''
+    Writes a dataframe to a table. This does not commit the transaction.
+
+    Args:
+        con (obj):          Connection to the database
+        table_name (str):   The name of the table
+        result (DataFrame): The output of a collector, including the
+                            'timestamp' column
+        method (str):       What to do if the table already exists. Options
+                            are 'append', 'fail', 'replace' and 'delta'. In
+                            'delta' mode, only the rows that changed since
+                            the previous snapshot are stored (see
+                            hp.diff_snapshot).
+        idx_cols (list):    The list of columns to use for indexing the table
+        schemas (dict):     A cache of the columns in each table. It is
+                            updated when tables are created or altered.
+
+    Returns:
+        None
+    '''
+    table = table_name.upper()
     cur = con.cursor()
 
     # Get the table schema. This also checks if the table exists, because the
     # length of 'schema' will be 0 if it hasn't been created yet.
-    schema = hp.sql_get_table_schema(db_path, table_name)
-
-    # If the table doesn't exist, create it. (Pandas will automatically create
-    # the table, but doing it manually allows us to create an auto-incrementing
-    # ID column))
+    schema = schemas.get(table)
+    if schema is None:
+        cur.execute(f'pragma table_info("{table}")')
+        schema = [row[1] for row in cur.fetchall()]
+        schemas[table] = schema
+
+    if len(schema) > 0 and method == 'fail':
+        raise ValueError(f'Table {table} already exists.')
+
+    # The first and last timestamps are tracked for the table (see
+    # hp.get_first_last_timestamp), so they must be removed if the table is
+    # replaced
+    hp.create_first_last_table(cur)
+    hp.create_snapshot_table(cur)
+    if len(schema) > 0 and method == 'replace':
+        cur.execute(f'DROP TABLE "{table}"')
+        for tracking_table in ['FIRST_LAST_TIMESTAMPS',
+                               'FIRST_LAST_COLUMNS',
+                               'SNAPSHOTS']:
+            cur.execute(f'DELETE FROM {tracking_table} WHERE table_name = ?',
+                        (table,))
+        if hp.is_delta_table(con, table):
+            cur.execute('DELETE FROM DELTA_TABLES WHERE table_name = ?',
+                        (table,))
+            cur.execute(f'DROP TABLE IF EXISTS "{table}_DELTA_STATE"')
+        schema = list()
+        schemas[table] = schema
+
+    # In 'delta' mode, only the inserted, updated and deleted rows are
+    # written. The full output is still used for the first and last
+    # timestamps.
+    full_result = result
+    changes = None
+    if method == 'delta':
+        hp.create_delta_tables(cur, table, len(schema) > 0)
+        changes = hp.diff_snapshot(cur, table, result)
+        result = changes.drop(columns=['_scope'])
+
+    # Add the existing snapshots of tables that were created before the
+    # snapshot catalog to it
+    if len(schema) > 0 and changes is None:
+        hp.catalog_snapshots(cur, table)
+
+    # If the table doesn't exist, create it with an auto-incrementing ID
+    # column. Columns that have a type in the table's schema (see
+    # hp.define_table_schemas) are created with it.
     column_list = result.columns.to_list()
-    if 'table_id' in column_list:
-        column_list.remove('table_id')
-        del result['table_id']
-    columns = [f'"{c}"' for c in column_list]
-    if len(schema) == 0 and len(result) > 0:
-        fields = ',\n'.join(columns)
-        cur.execute(f'''CREATE TABLE {table_name.upper()} (
+    table_schema = hp.define_table_schemas().get(table, dict())
+    types = {c: hp.define_column_types()[t] for c, t in
+             table_schema.get('columns', dict()).items()}
+    if len(schema) == 0:
+        fields = ',\n'.join([f'"{c}" {types.get(c, str())}'.rstrip()
+                             for c in column_list])
+        cur.execute(f'''CREATE TABLE {table} (
                     table_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp,
                     {fields}
                     )''')
+        schema.extend(['table_id'] + column_list)
 
     # Check if all of the columns in 'result' are in the table schema and add
     # them if they are not. This accounts for a common scenario that happens
@@ -675,32 +1110,196 @@ def add_to_db(collector,
     #
     # This scenario is very common, and it's not always possible to
     # future-proof collectors to account for it,
-    if len(schema) >= 1:
-        for col in column_list:
-            if col not in schema['name'].to_list():
-                cur.execute(f'ALTER TABLE {table_name} ADD COLUMN "{col}"')
-
-    # from tabulate import tabulate
-    # print(tabulate(result, headers='keys', tablefmt='psql'))
-
-    # Add the dataframe to the database
-    table = table_name.upper()
-    result.to_sql(table, con, if_exists=method)
+    for col in column_list:
+        if col not in schema:
+            cur.execute(f'''ALTER TABLE {table}
+                            ADD COLUMN "{col}" {types.get(col, str())}''')
+            schema.append(col)
+
+    # Add the dataframe to the table. Missing values are stored as NULL.
+    if len(result) > 0:
+        fields = ', '.join([f'"{c}"' for c in column_list])
+        params = ', '.join(['?'] * len(column_list))
+        values = result.astype(object).where(result.notna(), None)
+        cur.executemany(f'INSERT INTO {table} ({fields}) VALUES ({params})',
+                        values.itertuples(index=False, name=None))
+
+    # Add the snapshot to the catalog
+    if changes is None:
+        hp.update_snapshot_catalog(cur, table, result)
+    else:
+        hp.update_delta_state(cur, table, changes, full_result)
+
+    # Update the first and last timestamps of the tracked columns. Columns
+    # are tracked if they are defined in hp.define_first_last_columns, or if
+    # hp.get_first_last_timestamp has been called for them.
+    cur.execute('SELECT col_name FROM FIRST_LAST_COLUMNS WHERE table_name = ?',
+                (table,))
+    tracked = [row[0] for row in cur.fetchall()]
+    for col in hp.define_first_last_columns().get(table, list()):
+        if col not in tracked:
+            tracked.append(col)
+    hp.update_first_last_timestamps(cur, table, full_result, tracked)
 
     # Create the SQL table index, if applicable
     if idx_cols:
         idx_name = f'idx_{table_name.lower()}'
         try:
-            cur.execute(f'''CREATE INDEX {idx_name}
-                            ON {table_name.upper()} ({','.join(idx_cols)})
+            cur.execute(f'''CREATE INDEX IF NOT EXISTS {idx_name}
+                            ON {table} ({','.join(idx_cols)})
                         ''')
         except Exception as e:
             print(f'Caught Exception: {str(e)}')
 
-    con.commit()
+    # Create the indexes in the table's schema once their columns exist
+    for cols in table_schema.get('indexes', list()):
+        if all(c in schema for c in cols):
+            idx_name = f'idx_{table.lower()}_{"_".join(cols).lower()}'
+            idx_name = ''.join(_ if _.isalnum() else '_' for _ in idx_name)
+            fields = ', '.join([f'"{c}"' for c in cols])
+            cur.execute(f'''CREATE INDEX IF NOT EXISTS {idx_name}
+                            ON {table} ({fields})''')
+
+
+def start_db_writer(db_path, batch_size=100):
+    '''
+    Starts a thread that writes the output of collectors to the database.
+    While it is running, add_to_db puts collector output on a queue instead
+    of writing to the database, so collectors never wait on disk. The thread
+    reuses one connection, caches the table schemas and groups the queued
+    outputs into one transaction.
+
+    Args:
+        db_path (str):      The path to the database
+        batch_size (int):   The maximum number of queued outputs to write in
+                            one transaction. Defaults to 100.
+
+    Returns:
+        None
+    '''
+    if db_writer:
+        stop_db_writer()
+
+    # Check if the output directory exists. If it does not, then create it.
+    exists = hp.check_dir_existence('/'.join(db_path.split('/')[:-1]))
+    if not exists:
+        hp.create_dir('/'.join(db_path.split('/')[:-1]))
+
+    db_queue = queue.Queue()
+    thread = threading.Thread(target=run_db_writer,
+                              args=(db_path, db_queue, batch_size),
+                              daemon=True)
+    thread.start()
+
+    db_writer['db_path'] = db_path
+    db_writer['queue'] = db_queue
+    db_writer['thread'] = thread
+
+
+def run_db_writer(db_path, db_queue, batch_size):
+    '''
+    The target of the database writer thread (see start_db_writer). It runs
+    until it receives None from the queue.
+
+    Args:
+        db_path (str):      The path to the database
+        db_queue (obj):     The queue of (table_name, result, method,
+                            idx_cols, future) tuples to write. Each future is
+                            resolved once its output has been written, or
+                            is given the exception if it could not be.
+        batch_size (int):   The maximum number of queued outputs to write in
+                            one transaction
+
+    Returns:
+        None
+    '''
+    con = connect_to_db_writer(db_path)
+    schemas = dict()
+    stop = False
+
+    while not stop:
+        # Wait for the next output, then take whatever else is already
+        # waiting so it can be written in the same transaction
+        batch = [db_queue.get()]
+        while len(batch) < batch_size:
+            try:
+                batch.append(db_queue.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:
+            stop = True
+        items = [item for item in batch if item is not None]
+
+        with db_lock:
+            try:
+                con.execute('BEGIN')
+                for item in items:
+                    write_to_db(con, *item[:4], schemas)
+                con.commit()
+                for item in items:
+                    item[4].set_result(None)
+            except Exception:
+                # Roll back and write the outputs one at a time, so that a
+                # single bad output does not discard the others. The
+                # exception is passed to the collector that queued it.
+                con.rollback()
+                schemas.clear()
+                for item in items:
+                    try:
+                        write_to_db(con, *item[:4], schemas)
+                        con.commit()
+                        item[4].set_result(None)
+                    except Exception as e:
+                        con.rollback()
+                        schemas.clear()
+                        item[4].set_exception(e)
+
+        for _ in batch:
+            db_queue.task_done()
+
     con.close()
 
 
+def flush_db_writer(futures=None):
+    '''
+    Waits until everything queued for the database writer has been written.
+    If the writer is not running, this does nothing.
+
+    Args:
+        futures (list):     The futures returned by add_to_db. If they are
+                            given, then this only waits for their outputs,
+                            and raises the exception of the first output
+                            that could not be written. Defaults to None.
+
+    Returns:
+        None
+    '''
+    if futures is not None:
+        for future in futures:
+            future.result()
+        return
+
+    if db_writer:
+        db_writer['queue'].join()
+
+
+def stop_db_writer():
+    '''
+    Writes everything that is queued for the database writer, then stops it.
+    If the writer is not running, this does nothing.
+
+    Args:
+        None
+
+    Returns:
+        None
+    '''
+    if db_writer:
+        db_writer['queue'].put(None)
+        db_writer['thread'].join()
+        db_writer.clear()
+
+
 def create_parser():
     '''
     Create command line arguments.
@@ -766,6 +1365,37 @@ def create_parser():
                         required=True,
                         action='store'
                         )
+    parser.add_argument('-w', '--max_workers',
+                        help='''The maximum number of collectors to run at
+                                the same time. Defaults to 8.''',
+                        default=8,
+                        type=int,
+                        action='store'
+                        )
+    parser.add_argument('-b', '--batch_commands',
+                        help='''Batch the commands of the NXOS collectors for
+                                each hostgroup into a single playbook run.''',
+                        action='store_true'
+                        )
+    parser.add_argument('-S', '--stream',
+                        help='''Write the output of the ARP and CAM table
+                                collectors to the database as each device
+                                responds, instead of after every device has
+                                responded.''',
+                        action='store_true'
+                        )
+    parser.add_argument('-s', '--ssh_engine',
+                        help='''Run the commands of the IOS and NXOS collectors
+                                over asyncssh instead of ansible-playbook.
+                                Requires asyncssh.''',
+                        action='store_true'
+                        )
+    parser.add_argument('-q', '--parquet',
+                        help='''Also write the output of the collectors to
+                                Parquet datasets in a 'parquet' directory
+                                next to the database. Requires pyarrow.''',
+                        action='store_true'
+                        )
     args = parser.parse_args()
     return args
 
@@ -808,3 +1438,64 @@ def arg_parser(args):
 
     return collectors, db, hostgroups, nm_path, out_dir, username, password,\
         private_data_dir
+
+
+def main():
+    '''
+    Runs the collectors that were passed on the command line for each
+    hostgroup. The collectors that they depend on are added (see
+    hp.set_dependencies), and they are run with schedule_collectors.
+
+    Args:
+        None
+
+    Returns:
+        None
+    '''
+    args = create_parser()
+    collectors, db_path, hostgroups, nm_path, out_dir, username, password, \
+        private_data_dir = arg_parser(args)
+    hostgroups = [h for h in hostgroups if h]
+
+    # Create a row for each collector that the OS of each hostgroup supports.
+    # If no hostgroups were passed, then every hostgroup is used.
+    df_data = dict()
+    df_data['ansible_os'] = list()
+    df_data['hostgroup'] = list()
+    df_data['collector'] = list()
+    groups = hp.ansible_group_hostgroups_by_os(private_data_dir)
+    for ansible_os, os_hostgroups in groups.items():
+        available = hp.define_collectors(ansible_os)
+        to_run = hp.set_dependencies([c for c in collectors
+                                      if c in available])
+        for hostgroup in os_hostgroups:
+            if hostgroups and hostgroup not in hostgroups:
+                continue
+            for collector in to_run:
+                if collector in available:
+                    df_data['ansible_os'].append(ansible_os)
+                    df_data['hostgroup'].append(hostgroup)
+                    df_data['collector'].append(collector)
+    df_collectors = pd.DataFrame.from_dict(df_data)
+
+    # Set the timestamp so it will be consistent for all collectors
+    timestamp = dt.datetime.now().strftime('%Y-%m-%d_%H%M')
+
+    schedule_collectors(df_collectors,
+                        nm_path,
+                        private_data_dir,
+                        timestamp,
+                        max_workers=args.max_workers,
+                        batch_commands=args.batch_commands,
+                        ssh_engine=args.ssh_engine,
+                        stream=args.stream,
+                        parquet=args.parquet,
+                        username=username,
+                        password=password,
+                        play_path=f'{nm_path}/playbooks',
+                        db_path=db_path,
+                        method='append')
+
+
+if __name__ == '__main__':
+    main()
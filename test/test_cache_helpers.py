@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import threading
+import yaml
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from helpers import cache_helpers as cah  # noqa
+from helpers import helpers as hp  # noqa
+
+
+# An inventory where the devices are connected to by 'ansible_host', so the
+# 'remote_addr' of their events is not their inventory hostname
+INVENTORY = {'nxos': {'hosts': {'sw1': {'ansible_host': '10.0.0.1'},
+                                'sw2': {'ansible_host': '10.0.0.2'}},
+                      'vars': {'ansible_network_os': 'cisco.nxos.nxos'}}}
+ADDRESSES = {'sw1': '10.0.0.1', 'sw2': '10.0.0.2'}
+PLAYBOOK = 'playbooks/cisco_nxos_run_commands.yml'
+EXTRAVARS = {'username': 'username',
+             'password': 'password',
+             'host_group': 'nxos',
+             'commands': 'show vrf'}
+
+
+def create_private_data_dir(tmp):
+    """Creates a private data directory containing INVENTORY.
+    """
+    os.makedirs(f'{tmp}/inventory')
+    with open(f'{tmp}/inventory/hosts', 'w') as f:
+        yaml.dump(INVENTORY, f)
+    return tmp
+
+
+def create_event(host, task='run commands', output=None):
+    """Creates a 'runner_on_ok' event the same way that Ansible does.
+    """
+    output = output or f'output of {host}'
+    return {'event': 'runner_on_ok',
+            'event_data': {'host': host,
+                           'remote_addr': ADDRESSES[host],
+                           'task': task,
+                           'res': {'stdout': [output]}}}
+
+
+def create_run_async(responsive, calls):
+    """Creates a replacement for 'ansible_runner.run_async' that sends an
+    event for each responsive device and records the 'limit' of each run.
+    """
+    def run_async(**kwargs):
+        limit = kwargs.get('limit')
+        calls.append(limit)
+        hosts = limit.split(',') if limit else list(ADDRESSES)
+        for host in hosts:
+            if host in responsive:
+                kwargs['event_handler'](create_event(host))
+        kwargs['finished_callback'](None)
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        return thread, None
+    return run_async
+
+
+def run_playbook(private_data_dir, responsive, calls):
+    """Runs the playbook with the output cache and the replacement for
+    'ansible_runner.run_async'.
+    """
+    run_async = hp.ansible_runner.run_async
+    hp.ansible_runner.run_async = create_run_async(responsive, calls)
+    try:
+        return list(hp.ansible_run_events(private_data_dir,
+                                          PLAYBOOK,
+                                          EXTRAVARS,
+                                          quiet=True))
+    finally:
+        hp.ansible_runner.run_async = run_async
+
+
+def test_create_command_key():
+    """Test that the credentials and the host group do not change the key,
+    but the commands do.
+    """
+    key, command = cah.create_command_key(PLAYBOOK, EXTRAVARS)
+
+    other_vars = dict(EXTRAVARS, username='other', user='other',
+                      password='other', host_group='other')
+    assert cah.create_command_key(PLAYBOOK, other_vars)[0] == key
+
+    other_vars = dict(EXTRAVARS, commands='show version')
+    assert cah.create_command_key(PLAYBOOK, other_vars)[0] != key
+
+    assert 'password' not in command
+
+
+def test_is_cacheable():
+    """Test that only playbooks that collect data are cached.
+    """
+    assert cah.is_cacheable('playbooks/cisco_ios_run_commands.yml')
+    assert cah.is_cacheable('playbooks/f5_get_pools_and_members.yml')
+    assert not cah.is_cacheable('playbooks/rw_get_config.yml')
+    assert not cah.is_cacheable('playbooks/cisco_ios_set_vlan.yml')
+
+
+def test_cache_uses_addresses():
+    """Test that output is cached by the device's address, and that replayed
+    events have the same 'host' and 'remote_addr' as the Ansible events.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        private_data_dir = create_private_data_dir(tmp)
+        cah.enable_output_cache(f'{tmp}/cache.db')
+        try:
+            calls = list()
+            events = run_playbook(private_data_dir, ['sw1', 'sw2'], calls)
+            assert calls == [None]
+
+            cached = run_playbook(private_data_dir, ['sw1', 'sw2'], calls)
+            assert calls == [None]
+        finally:
+            cah.disable_output_cache()
+
+    def sort_events(events):
+        return sorted([(_['event_data']['host'],
+                        _['event_data']['remote_addr'],
+                        _['event_data']['res']['stdout'][0])
+                       for _ in events])
+
+    assert sort_events(cached) == sort_events(events)
+    assert sort_events(cached) == [('sw1', '10.0.0.1', 'output of sw1'),
+                                   ('sw2', '10.0.0.2', 'output of sw2')]
+
+
+def test_cache_runs_missing_devices():
+    """Test that the cached devices are replayed, and that the playbook is
+    only run for the devices that are not cached.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        private_data_dir = create_private_data_dir(tmp)
+        cah.enable_output_cache(f'{tmp}/cache.db')
+        try:
+            # 'sw2' is unreachable the first time
+            calls = list()
+            run_playbook(private_data_dir, ['sw1'], calls)
+            events = run_playbook(private_data_dir, ['sw1', 'sw2'], calls)
+            assert calls == [None, 'sw2']
+
+            # Both devices are cached now
+            run_playbook(private_data_dir, ['sw1', 'sw2'], calls)
+            assert calls == [None, 'sw2']
+        finally:
+            cah.disable_output_cache()
+
+    remote_addrs = sorted([_['event_data']['remote_addr'] for _ in events])
+    assert remote_addrs == ['10.0.0.1', '10.0.0.2']
+
+
+def test_cached_run_events_task_order():
+    """Test that the tasks of multi-task playbooks are replayed in order.
+    """
+    def run(limit):
+        for task in ['first', 'second']:
+            for host in ['sw1', 'sw2']:
+                yield create_event(host, task, f'{task} of {host}')
+
+    hosts = [('sw1', '10.0.0.1'), ('sw2', '10.0.0.2')]
+    with tempfile.TemporaryDirectory() as tmp:
+        cah.enable_output_cache(f'{tmp}/cache.db')
+        try:
+            events = list(cah.cached_run_events(hosts, PLAYBOOK, EXTRAVARS,
+                                                run))
+            cached = list(cah.cached_run_events(hosts, PLAYBOOK, EXTRAVARS,
+                                                None))
+        finally:
+            cah.disable_output_cache()
+
+    def tasks(events):
+        return [(_['event_data']['remote_addr'], _['event_data']['task'],
+                 _['event_data']['res']['stdout'][0]) for _ in events]
+
+    assert tasks(cached) == tasks(events)
+
+
+def main():
+    # Execute tests
+    test_create_command_key()
+    test_is_cacheable()
+    test_cache_uses_addresses()
+    test_cache_runs_missing_devices()
+    test_cached_run_events_task_order()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from collectors import collectors  # noqa
+
+
+# Sample output of 'show port-channel database'. port-channel20 has more
+# members than the 8 'port_<n>' columns that the collector always creates.
+PO_DATABASE = '''Legend:
+  "*": denotes the operational port.
+port-channel1
+    Last membership update is successful
+    2 ports in total, 2 ports up
+    First operational port is Ethernet1/1
+    Age of the port-channel is 0d:02h:31m:22s
+    Time since last bundle is 0d:02h:31m:18s
+    Last bundled member is Ethernet1/2
+    Ports:   Ethernet1/1     [active ] [up] *
+             Ethernet1/2     [active ] [up]
+
+port-channel20
+    Last membership update is successful
+    10 ports in total, 9 ports up
+    First operational port is Ethernet2/1
+    Age of the port-channel is 1d:00h:00m:05s
+    Time since last bundle is 0d:01h:10m:00s
+    Last bundled member is Ethernet2/10
+    Time since last unbundle is 0d:01h:12m:00s
+    Last unbundled member is Ethernet2/10
+    Ports:   Ethernet2/1     [active ] [up] *
+             Ethernet2/2     [active ] [up]
+             Ethernet2/3     [active ] [up]
+             Ethernet2/4     [active ] [up]
+             Ethernet2/5     [active ] [up]
+             Ethernet2/6     [active ] [up]
+             Ethernet2/7     [active ] [up]
+             Ethernet2/8     [active ] [up]
+             Ethernet2/9     [on] [up]
+             Ethernet2/10    [passive] [down]
+'''
+
+
+def sample_run_events(private_data_dir, playbook, extravars):
+    """Replaces 'hp.ansible_run_events' with the events of a playbook that
+    ran 'show port-channel database' on one device.
+    """
+    yield {'event': 'playbook_on_start', 'event_data': dict()}
+    yield {'event': 'runner_on_ok',
+           'event_data': {'remote_addr': 'nxos-1',
+                          'res': {'stdout': [PO_DATABASE]}}}
+
+
+def run_collector(collector):
+    """Runs a port-channel collector with the sample output.
+    """
+    ansible_run_events = collectors.hp.ansible_run_events
+    collectors.hp.ansible_run_events = sample_run_events
+    try:
+        return collector('username',
+                         'password',
+                         'host_group',
+                         'play_path',
+                         'private_data_dir')
+    finally:
+        collectors.hp.ansible_run_events = ansible_run_events
+
+
+def test_parse_port_channel_database():
+    """Test the 'nxos_parse_port_channel_database' parser.
+    """
+    entries = collectors.nxos_parse_port_channel_database('nxos-1',
+                                                          PO_DATABASE)
+
+    assert [_['interface'] for _ in entries] == ['port-channel1',
+                                                 'port-channel20']
+
+    po1 = entries[0]
+    assert po1['device'] == 'nxos-1'
+    assert po1['total_ports'] == '2'
+    assert po1['up_ports'] == '2'
+    assert po1['age'] == '0d:02h:31m:22s'
+    assert po1['first_operational_port'] == 'Ethernet1/1'
+    assert po1['last_bundled_member'] == 'Ethernet1/2'
+    assert po1['last_unbundled_member'] == str()
+    assert po1['ports'] == [{'port': 'Ethernet1/1     [active ] [up] *',
+                             'member': 'Ethernet1/1',
+                             'mode': 'active',
+                             'status': 'up',
+                             'operational': True},
+                            {'port': 'Ethernet1/2     [active ] [up]',
+                             'member': 'Ethernet1/2',
+                             'mode': 'active',
+                             'status': 'up',
+                             'operational': False}]
+
+    po20 = entries[1]
+    assert po20['total_ports'] == '10'
+    assert po20['up_ports'] == '9'
+    assert po20['last_unbundled_member'] == 'Ethernet2/10'
+    assert len(po20['ports']) == 10
+    assert po20['ports'][8]['mode'] == 'on'
+    assert po20['ports'][9]['mode'] == 'passive'
+    assert po20['ports'][9]['status'] == 'down'
+
+
+def test_parse_port_channel_database_empty():
+    """Test that output without port-channels returns no entries.
+    """
+    assert collectors.nxos_parse_port_channel_database('nxos-1', str()) == []
+
+
+def test_get_port_channel_data():
+    """Test the 'nxos_get_port_channel_data' collector. It must keep all of
+    the members of bundles with more than 8 members.
+    """
+    df_po_data = run_collector(collectors.nxos_get_port_channel_data)
+
+    port_cols = [f'port_{str(i)}' for i in range(1, 11)]
+    expected = ['device',
+                'interface',
+                'total_ports',
+                'up_ports',
+                'age'] + port_cols + ['first_operational_port',
+                                      'last_bundled_member',
+                                      'last_unbundled_member']
+    assert df_po_data.columns.to_list() == expected
+
+    assert len(df_po_data) == 2
+
+    po1 = df_po_data.iloc[0]
+    assert po1['port_2'] == 'Ethernet1/2     [active ] [up]'
+    assert [po1[_] for _ in port_cols[2:]] == [str()] * 8
+
+    po20 = df_po_data.iloc[1]
+    assert po20['port_10'] == 'Ethernet2/10    [passive] [down]'
+
+
+def test_get_port_channel_members():
+    """Test the 'nxos_get_port_channel_members' collector.
+    """
+    df_members = run_collector(collectors.nxos_get_port_channel_members)
+
+    expected = ['device',
+                'interface',
+                'member',
+                'mode',
+                'status',
+                'operational']
+    assert df_members.columns.to_list() == expected
+
+    assert len(df_members) == 12
+
+    operational = df_members[df_members['operational']]
+    assert operational['member'].to_list() == ['Ethernet1/1', 'Ethernet2/1']
+
+    po20 = df_members[df_members['interface'] == 'port-channel20']
+    assert po20['member'].to_list()[-1] == 'Ethernet2/10'
+    assert po20['status'].to_list()[-1] == 'down'
+
+
+def main():
+    # Execute tests
+    test_parse_port_channel_database()
+    test_parse_port_channel_database_empty()
+    test_get_port_channel_data()
+    test_get_port_channel_members()
+
+
+if __name__ == '__main__':
+    main()
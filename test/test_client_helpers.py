@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from helpers import client_helpers as clh  # noqa
+
+
+def create_counter():
+    """Creates a 'create' function that returns a new client number each
+    time it is called.
+    """
+    created = list()
+
+    def create():
+        created.append(len(created) + 1)
+        return created[-1]
+    return create, created
+
+
+def test_get_client_reuses_client():
+    """Test that a client is only created once for a platform, host and set
+    of credentials.
+    """
+    clh.clients.clear()
+    create, created = create_counter()
+
+    assert clh.get_client('netbox', 'nb1', 'token', create) == 1
+    assert clh.get_client('netbox', 'nb1', 'token', create) == 1
+    assert clh.get_client('netbox', 'nb1', 'other', create) == 2
+    assert clh.get_client('netbox', 'nb2', 'token', create) == 3
+    assert created == [1, 2, 3]
+
+    # The credentials are not stored in the key
+    assert all('token' not in key for key in clh.clients)
+    clh.clients.clear()
+
+
+def test_get_client_expires():
+    """Test that a client is replaced after 'max_age' seconds.
+    """
+    clh.clients.clear()
+    create, created = create_counter()
+    now = [100.0]
+    monotonic = clh.time.monotonic
+    clh.time.monotonic = lambda: now[0]
+    try:
+        assert clh.get_client('meraki', 'api', 'key', create, 60) == 1
+        now[0] = 159.0
+        assert clh.get_client('meraki', 'api', 'key', create, 60) == 1
+        now[0] = 160.0
+        assert clh.get_client('meraki', 'api', 'key', create, 60) == 2
+    finally:
+        clh.time.monotonic = monotonic
+        clh.clients.clear()
+
+
+def test_remove_client():
+    """Test that the next call to get_client creates a new client after it is
+    removed.
+    """
+    clh.clients.clear()
+    create, created = create_counter()
+
+    assert clh.get_client('infoblox', 'ib1', ('user', 'pass'), create) == 1
+    clh.remove_client('infoblox', 'ib1', ('user', 'pass'))
+    assert clh.get_client('infoblox', 'ib1', ('user', 'pass'), create) == 2
+
+    # Removing a client that is not in the registry does nothing
+    clh.remove_client('infoblox', 'ib2', ('user', 'pass'))
+    clh.clients.clear()
+
+
+def main():
+    # Execute tests
+    test_get_client_reuses_client()
+    test_get_client_expires()
+    test_remove_client()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from collectors import collectors as cl  # noqa
+from helpers import helpers as hp  # noqa
+
+
+PRIVATE_DATA_DIR = 'private_data_dir'
+PLAYBOOK = 'playbooks/cisco_nxos_run_commands.yml'
+
+
+class FakePlaybook:
+    """A fake of ansible_run_events for the batch's playbook run. Each
+    device's output for a command is '<device>: <command>'. If 'error' is
+    set, then it is raised instead.
+    """
+    def __init__(self, devices, error=None):
+        self.devices = devices
+        self.error = error
+        self.runs = list()
+
+    def __call__(self, private_data_dir, playbook, extravars, quiet=False,
+                 use_cache=True):
+        self.runs.append(dict(extravars))
+        if self.error:
+            raise self.error
+        for device in self.devices:
+            stdout = [f'{device}: {cmd}' for cmd in extravars['commands']]
+            res = {'stdout': stdout,
+                   'stdout_lines': [[line] for line in stdout]}
+            yield {'event': 'runner_on_ok',
+                   'event_data': {'host': device, 'res': res}}
+
+
+def collect(command, host_group='nxos'):
+    """Gets the events of a collector's command from its batch, or None if
+    the command is not in a batch.
+    """
+    extravars = {'host_group': host_group, 'commands': command}
+    batch = hp.ansible_get_batch(PRIVATE_DATA_DIR, PLAYBOOK, extravars)
+    if batch is None:
+        return None
+    return list(hp.ansible_run_batch(batch, PRIVATE_DATA_DIR, PLAYBOOK,
+                                     extravars, True))
+
+
+def run_with_playbook(playbook, function, *args):
+    """Runs a function with ansible_run_events replaced by 'playbook'.
+    """
+    ansible_run_events = hp.ansible_run_events
+    hp.ansible_run_events = playbook
+    hp.ansible_clear_batches()
+    try:
+        return function(*args)
+    finally:
+        hp.ansible_run_events = ansible_run_events
+        hp.ansible_clear_batches()
+
+
+def test_plan_command_batches():
+    """Test that only the NXOS hostgroups with more than one batched
+    collector are registered.
+    """
+    commands = cl.nxos_define_commands()
+    nodes = [('cisco.nxos.nxos', 'nxos-1', 'cam_table'),
+             ('cisco.nxos.nxos', 'nxos-1', 'interface_status'),
+             ('cisco.nxos.nxos', 'nxos-1', 'inventory_nxos'),
+             ('cisco.nxos.nxos', 'nxos-2', 'cam_table'),
+             ('cisco.ios.ios', 'ios-1', 'cam_table'),
+             ('cisco.ios.ios', 'ios-1', 'interface_description')]
+
+    hp.ansible_clear_batches()
+    try:
+        batches = rc.plan_command_batches(nodes, PRIVATE_DATA_DIR,
+                                          'playbooks')
+        assert batches == {'nxos-1': [commands['cam_table'],
+                                      commands['interface_status']],
+                           'nxos-2': [commands['cam_table']]}
+        assert list(hp.command_batches) == [(PRIVATE_DATA_DIR, PLAYBOOK,
+                                             'nxos-1')]
+    finally:
+        hp.ansible_clear_batches()
+
+
+def test_output_routing():
+    """Test that the playbook is run once for the batch, and that each
+    collector only gets the output of its own command.
+    """
+    playbook = FakePlaybook(['sw1', 'sw2'])
+
+    def run():
+        hp.ansible_register_batch(PRIVATE_DATA_DIR, PLAYBOOK, 'nxos',
+                                  ['cmd a', 'cmd b', 'cmd a'])
+        events = {'cmd b': collect('cmd b'),
+                  'cmd a': collect('cmd a')}
+
+        # 'cmd a' is used by two collectors, so the batch is kept until the
+        # second one collects it
+        assert list(hp.command_batches) == [(PRIVATE_DATA_DIR, PLAYBOOK,
+                                             'nxos')]
+        events['cmd a (2)'] = collect('cmd a')
+        assert hp.command_batches == dict()
+        return events
+
+    events = run_with_playbook(playbook, run)
+
+    assert playbook.runs == [{'host_group': 'nxos',
+                              'commands': ['cmd a', 'cmd b']}]
+    for name, command in [('cmd a', 'cmd a'),
+                          ('cmd b', 'cmd b'),
+                          ('cmd a (2)', 'cmd a')]:
+        res = [event['event_data']['res'] for event in events[name]]
+        assert [r['stdout'] for r in res] == [[f'sw1: {command}'],
+                                              [f'sw2: {command}']]
+        assert [r['stdout_lines'] for r in res] == [[[f'sw1: {command}']],
+                                                    [[f'sw2: {command}']]]
+
+
+def test_unbatched_commands():
+    """Test that commands that are not in a batch, or are in another
+    hostgroup's batch, are not run from a batch, and that batches of one
+    collector are not registered.
+    """
+    playbook = FakePlaybook(['sw1'])
+
+    def run():
+        hp.ansible_register_batch(PRIVATE_DATA_DIR, PLAYBOOK, 'single',
+                                  ['cmd a'])
+        assert hp.command_batches == dict()
+
+        hp.ansible_register_batch(PRIVATE_DATA_DIR, PLAYBOOK, 'nxos',
+                                  ['cmd a', 'cmd b'])
+        assert collect('cmd c') is None
+        assert collect('cmd a', host_group='other') is None
+        assert collect(['cmd a', 'cmd b']) is None
+
+    run_with_playbook(playbook, run)
+    assert playbook.runs == list()
+
+
+def test_batch_error():
+    """Test that an error running the batch is raised for every collector,
+    and that the playbook is not run again.
+    """
+    playbook = FakePlaybook(['sw1'], error=RuntimeError('unreachable'))
+
+    def run():
+        hp.ansible_register_batch(PRIVATE_DATA_DIR, PLAYBOOK, 'nxos',
+                                  ['cmd a', 'cmd b'])
+        errors = list()
+        for command in ['cmd a', 'cmd b']:
+            try:
+                collect(command)
+            except RuntimeError as e:
+                errors.append(str(e))
+        return errors
+
+    assert run_with_playbook(playbook, run) == ['unreachable',
+                                                'unreachable']
+    assert len(playbook.runs) == 1
+
+
+def main():
+    # Execute tests
+    test_plan_command_batches()
+    test_output_routing()
+    test_unbatched_commands()
+    test_batch_error()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+import os
+import queue
+import sys
+import tempfile
+import pandas as pd
+from concurrent.futures import Future
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from helpers import helpers as hp  # noqa
+
+
+TIMESTAMP = '2023-01-01_0000'
+
+
+def create_item(table_name, device, method='append'):
+    """Creates an output the same way that add_to_db queues it.
+    """
+    result = pd.DataFrame({'timestamp': [TIMESTAMP],
+                           'device': [device],
+                           'name': ['default']})
+    return (table_name, result, method, list(), Future())
+
+
+def run_writer(db_path, items, batch_size=100):
+    """Runs the database writer until it has written 'items', and returns
+    the SQL statements that it executed.
+    """
+    statements = list()
+    connect_to_db_writer = rc.connect_to_db_writer
+
+    def connect(db_path):
+        con = connect_to_db_writer(db_path)
+        con.set_trace_callback(statements.append)
+        return con
+
+    db_queue = queue.Queue()
+    for item in items:
+        db_queue.put(item)
+    db_queue.put(None)
+
+    rc.connect_to_db_writer = connect
+    try:
+        rc.run_db_writer(db_path, db_queue, batch_size)
+    finally:
+        rc.connect_to_db_writer = connect_to_db_writer
+
+    return statements
+
+
+def read_devices(db_path, table):
+    """Reads the devices that were written to a table.
+    """
+    con = hp.connect_to_db(db_path)
+    df = pd.read_sql(f'select device from {table}', con)
+    con.close()
+    return sorted(df['device'].to_list())
+
+
+def test_writer_batches_outputs():
+    """Test that the queued outputs are written in one transaction, and that
+    each output's future is resolved.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        items = [create_item('NXOS_VRFS', 'sw1'),
+                 create_item('NXOS_VRFS', 'sw2'),
+                 create_item('IOS_VRFS', 'rtr1')]
+        statements = run_writer(db_path, items)
+
+        assert statements.count('COMMIT') == 1
+        assert [item[4].result(timeout=0) for item in items] == [None] * 3
+        assert read_devices(db_path, 'NXOS_VRFS') == ['sw1', 'sw2']
+        assert read_devices(db_path, 'IOS_VRFS') == ['rtr1']
+
+
+def test_writer_batch_size():
+    """Test that no more than 'batch_size' outputs are written in one
+    transaction.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        items = [create_item('NXOS_VRFS', f'sw{i}') for i in range(5)]
+        statements = run_writer(db_path, items, batch_size=2)
+
+        assert statements.count('COMMIT') == 3
+        assert len(read_devices(db_path, 'NXOS_VRFS')) == 5
+
+
+def test_writer_retries_outputs():
+    """Test that an output that cannot be written does not discard the other
+    outputs in its transaction, and that its future has the exception.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        run_writer(db_path, [create_item('NXOS_VRFS', 'sw1')])
+
+        items = [create_item('IOS_VRFS', 'rtr1'),
+                 create_item('NXOS_VRFS', 'sw2', method='fail'),
+                 create_item('IOS_VRFS', 'rtr2')]
+        run_writer(db_path, items)
+
+        assert items[0][4].result(timeout=0) is None
+        assert isinstance(items[1][4].exception(timeout=0), ValueError)
+        assert items[2][4].result(timeout=0) is None
+        assert read_devices(db_path, 'IOS_VRFS') == ['rtr1', 'rtr2']
+        assert read_devices(db_path, 'NXOS_VRFS') == ['sw1']
+
+
+def test_add_to_db_returns_future():
+    """Test that add_to_db returns a future while the writer is running, and
+    that flush_db_writer raises the exception of a failed output.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        result = pd.DataFrame({'device': ['sw1'], 'name': ['default']})
+        assert rc.add_to_db('vrfs', 'nxos_vrfs', result, TIMESTAMP,
+                            db_path) is None
+
+        rc.start_db_writer(db_path)
+        try:
+            future = rc.add_to_db('vrfs', 'nxos_vrfs', result, TIMESTAMP,
+                                  db_path, method='fail')
+            try:
+                rc.flush_db_writer([future])
+                raised = False
+            except ValueError:
+                raised = True
+        finally:
+            rc.stop_db_writer()
+
+        assert raised
+        assert read_devices(db_path, 'NXOS_VRFS') == ['sw1']
+
+
+def test_failed_write_fails_collector():
+    """Test that a collector fails if its output cannot be written, and that
+    the collectors that depend on it are not started.
+    """
+    output = 'Address  Age  MAC Address  Interface\n' \
+             '10.1.1.1  00:01:02  0000.1111.aaaa  Vlan10'
+
+    def ansible_run_events(private_data_dir, playbook, extravars, **kwargs):
+        yield {'event': 'runner_on_ok',
+               'event_data': {'host': 'sw1',
+                              'remote_addr': 'sw1',
+                              'res': {'stdout': [output]}}}
+
+    def find_mac_vendors(macs, nm_path):
+        return pd.DataFrame({'mac': list(macs), 'vendor': 'Cisco'})
+
+    started = list()
+    collect = rc.collect
+
+    def collect_node(collector, *args, **kwargs):
+        started.append(collector)
+        if collector == 'arp_table':
+            return collect(collector, *args, **kwargs)
+        return pd.DataFrame()
+
+    df_collectors = pd.DataFrame({'ansible_os': ['cisco.nxos.nxos'] * 2,
+                                  'hostgroup': ['nxos'] * 2,
+                                  'collector': ['arp_table', 'cam_table']})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+
+        # The table already exists, so writing it in 'fail' mode fails
+        con = hp.connect_to_db(db_path)
+        pd.DataFrame({'device': ['sw0']}).to_sql('NXOS_ARP_TABLE', con,
+                                                 index=False)
+        con.close()
+
+        original = (hp.ansible_run_events,
+                    hp.find_mac_vendors,
+                    hp.define_collector_dependencies)
+        hp.ansible_run_events = ansible_run_events
+        hp.find_mac_vendors = find_mac_vendors
+        hp.define_collector_dependencies = \
+            lambda: {'cam_table': ['arp_table']}
+        rc.collect = collect_node
+        try:
+            results = rc.schedule_collectors(df_collectors,
+                                             nm_path,
+                                             tmp,
+                                             TIMESTAMP,
+                                             cache_output=False,
+                                             db_path=db_path,
+                                             play_path='playbooks',
+                                             method='fail')
+        finally:
+            (hp.ansible_run_events,
+             hp.find_mac_vendors,
+             hp.define_collector_dependencies) = original
+            rc.collect = collect
+
+    assert results == dict()
+    assert started == ['arp_table']
+
+
+def main():
+    # Execute tests
+    test_writer_batches_outputs()
+    test_writer_batch_size()
+    test_writer_retries_outputs()
+    test_add_to_db_returns_future()
+    test_failed_write_fails_collector()
+
+
+if __name__ == '__main__':
+    main()
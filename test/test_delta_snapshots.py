@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from helpers import helpers as hp  # noqa
+
+
+TABLE = 'nxos_cam_table'
+COLS = ['device', 'interface', 'mac', 'vlan', 'vendor']
+
+# The output of three collection cycles. In the second one, a row changes, a
+# row is removed, a row is added and 'nxos-2' is not collected (so its rows
+# are carried forward). In the third one, 'nxos-2' has a duplicate row and a
+# row is removed from it.
+SNAPSHOTS = [('2023-01-01_0000',
+              [['nxos-1', 'Ethernet1/1', '0000.1111.aaaa', '10', 'Cisco'],
+               ['nxos-1', 'Ethernet1/2', '0000.1111.bbbb', '10', 'Dell'],
+               ['nxos-2', 'Ethernet1/1', '0000.2222.aaaa', '20', 'HP'],
+               ['nxos-2', 'Ethernet1/3', '0000.2222.bbbb', '20', 'HP']]),
+             ('2023-01-02_0000',
+              [['nxos-1', 'Ethernet1/1', '0000.1111.aaaa', '10', 'Unknown'],
+               ['nxos-1', 'Ethernet1/3', '0000.1111.cccc', '30', 'Cisco']]),
+             ('2023-01-03_0000',
+              [['nxos-1', 'Ethernet1/1', '0000.1111.aaaa', '10', 'Unknown'],
+               ['nxos-1', 'Ethernet1/3', '0000.1111.cccc', '30', 'Cisco'],
+               ['nxos-2', 'Ethernet1/1', '0000.2222.aaaa', '20', 'HP'],
+               ['nxos-2', 'Ethernet1/1', '0000.2222.aaaa', '20', 'HP']])]
+
+# The rows that each snapshot contains
+EXPECTED = [SNAPSHOTS[0][1],
+            SNAPSHOTS[1][1] + SNAPSHOTS[0][1][2:],
+            SNAPSHOTS[2][1]]
+
+
+def sort_rows(df):
+    """Sorts the rows of a snapshot so that they can be compared.
+    """
+    df = df[['timestamp'] + COLS].copy()
+    df['vlan'] = df['vlan'].astype(str)
+    return df.sort_values(COLS).reset_index(drop=True)
+
+
+def write_snapshots(db_path, method):
+    """Writes the snapshots to a database.
+    """
+    for timestamp, rows in SNAPSHOTS:
+        result = pd.DataFrame(rows, columns=COLS)
+        rc.add_to_db('cam_table', TABLE, result, timestamp, db_path,
+                     method=method)
+
+
+def test_delta_round_trip():
+    """Test that 'read_delta_snapshot' rebuilds every snapshot that was
+    stored with 'diff_snapshot'.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/delta.db'
+        write_snapshots(db_path, 'delta')
+
+        con = hp.connect_to_db(db_path)
+        assert hp.is_delta_table(con, TABLE)
+
+        for (timestamp, _), rows in zip(SNAPSHOTS, EXPECTED):
+            expected = pd.DataFrame(rows, columns=COLS)
+            expected.insert(0, 'timestamp', timestamp)
+            df = hp.read_delta_snapshot(con, TABLE, timestamp)
+            pd.testing.assert_frame_equal(sort_rows(df),
+                                          sort_rows(expected))
+
+        # The latest snapshot is read from the state
+        df = hp.read_delta_snapshot(con, TABLE)
+        assert (df['timestamp'] == SNAPSHOTS[-1][0]).all()
+        pd.testing.assert_frame_equal(sort_rows(df), sort_rows(expected))
+
+        # Only the changes are stored: 4 inserts, then 1 update, 1 insert
+        # and 1 delete, then 1 insert (the duplicate) and 1 delete
+        cur = con.cursor()
+        cur.execute(f'''select change_type, count(*) from {TABLE}
+                        group by change_type''')
+        assert dict(cur.fetchall()) == {'insert': 6,
+                                        'update': 1,
+                                        'delete': 2}
+        con.close()
+
+
+def test_delta_matches_append():
+    """Test that 'read_snapshot' returns the same snapshots for a table in
+    'delta' mode as for the same table in 'append' mode. The second snapshot
+    is skipped, since 'delta' mode carries the rows of 'nxos-2' forward.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        write_snapshots(f'{tmp}/delta.db', 'delta')
+        write_snapshots(f'{tmp}/append.db', 'append')
+
+        con_delta = hp.connect_to_db(f'{tmp}/delta.db')
+        con_append = hp.connect_to_db(f'{tmp}/append.db')
+        for timestamp, _ in [SNAPSHOTS[0], SNAPSHOTS[2]]:
+            df_delta = hp.read_snapshot(con_delta, TABLE, timestamp)
+            df_append = hp.read_snapshot(con_append, TABLE, timestamp)
+            pd.testing.assert_frame_equal(sort_rows(df_delta),
+                                          sort_rows(df_append))
+        con_delta.close()
+        con_append.close()
+
+
+def test_diff_snapshot_unchanged():
+    """Test that 'diff_snapshot' returns no changes when the output did not
+    change.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/delta.db'
+        timestamp, rows = SNAPSHOTS[0]
+        result = pd.DataFrame(rows, columns=COLS)
+        rc.add_to_db('cam_table', TABLE, result, timestamp, db_path,
+                     method='delta')
+
+        con = hp.connect_to_db(db_path)
+        result = hp.coerce_table_types(TABLE, result)
+        result.insert(0, 'timestamp', '2023-01-02_0000')
+        changes = hp.diff_snapshot(con.cursor(), TABLE, result)
+        assert len(changes) == 0
+        con.close()
+
+
+def main():
+    # Execute tests
+    test_delta_round_trip()
+    test_delta_matches_append()
+    test_diff_snapshot_unchanged()
+
+
+if __name__ == '__main__':
+    main()
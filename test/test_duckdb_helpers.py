@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from helpers import duckdb_helpers as ddh  # noqa
+from helpers import parquet_helpers as pqh  # noqa
+
+
+OLD = '2023-01-01_0000'
+NEW = '2023-01-02_0000'
+
+# The MAC addresses are in a different format on each platform
+CAM = [['sw1', 'Eth1/1', '0000.1111.aaaa', '10', 'Dell Inc.'],
+       ['sw1', 'Eth1/2', '0000.1111.bbbb', '20', None],
+       ['sw2', 'Eth1/1', '0000.2222.aaaa', '10', None]]
+CAM_COLS = ['device', 'interface', 'mac', 'vlan', 'vendor']
+ARP = [['rtr1', '10.0.0.10', '0000.1111.AAAA', 'Vlan10', 'Dell Inc.'],
+       ['rtr1', '10.0.0.20', '0000.1111.BBBB', 'Vlan20', 'Cisco']]
+ARP_COLS = ['device', 'address', 'mac', 'interface', 'vendor']
+INTERFACE_IPS = [['rtr1', 'vlan10', '10.0.0.1', 'default', '10.0.0.0/24'],
+                 ['rtr1', 'vlan20', '10.0.0.129', 'default',
+                  '10.0.0.128/25']]
+INTERFACE_IP_COLS = ['device', 'interface', 'ip', 'vrf', 'subnet']
+
+
+def write_tables(db_path):
+    """Writes an NXOS CAM table, an IOS ARP table and the IOS interface IP
+    addresses to a database. The older CAM table snapshot has a MAC address
+    that must not be in the latest views.
+    """
+    df_old = pd.DataFrame([['sw1', 'Eth1/9', '0000.9999.9999', '10', None]],
+                          columns=CAM_COLS)
+    rc.add_to_db('cam_table', 'NXOS_CAM_TABLE', df_old, OLD, db_path)
+    rc.add_to_db('cam_table', 'NXOS_CAM_TABLE',
+                 pd.DataFrame(CAM, columns=CAM_COLS), NEW, db_path)
+    rc.add_to_db('arp_table', 'IOS_ARP_TABLE',
+                 pd.DataFrame(ARP, columns=ARP_COLS), NEW, db_path)
+    rc.add_to_db('interface_ip_addresses', 'IOS_INTERFACE_IP_ADDRESSES',
+                 pd.DataFrame(INTERFACE_IPS, columns=INTERFACE_IP_COLS),
+                 NEW, db_path)
+
+
+def test_mac_locations():
+    """Test that the CAM and ARP tables are joined by MAC address, and that
+    only the latest snapshot of each device is used.
+    """
+    if ddh.duckdb is None:
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_tables(db_path)
+        con = ddh.connect_analytics(db_path=db_path)
+        df = ddh.query(con, '''select mac, vendor, ip, arp_device, device,
+                                      interface, vlan
+                               from mac_locations order by mac''')
+        df_history = ddh.query(con, 'select * from cam_history')
+        con.close()
+
+    # Null values are returned as NaN
+    assert df.fillna('').values.tolist() == \
+        [['0000.1111.aaaa', 'Dell Inc.', '10.0.0.10', 'rtr1', 'sw1',
+          'Eth1/1', '10'],
+         ['0000.1111.bbbb', 'Cisco', '10.0.0.20', 'rtr1', 'sw1', 'Eth1/2',
+          '20'],
+         ['0000.2222.aaaa', '', '', '', 'sw2', 'Eth1/1', '10']]
+    assert len(df_history) == 4
+    assert set(df_history['source']) == {'NXOS_CAM_TABLE'}
+
+
+def test_ip_locations():
+    """Test that the ARP entries are joined to the interface IP addresses of
+    the same device, ignoring the case of the interface names, and that
+    missing columns are null.
+    """
+    if ddh.duckdb is None:
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_tables(db_path)
+        con = ddh.connect_analytics(db_path=db_path)
+        df = ddh.query(con, '''select ip, interface, interface_ip, subnet
+                               from ip_locations
+                               where ip = ?''', ['10.0.0.20'])
+        df_ips = ddh.query(con, 'select * from interface_ips')
+        con.close()
+
+    assert df.values.tolist() == [['10.0.0.20', 'Vlan20', '10.0.0.129',
+                                   '10.0.0.128/25']]
+    assert df_ips['network_ip'].isna().all()
+
+
+def test_missing_sources():
+    """Test that views are only created if their source tables exist.
+    """
+    if ddh.duckdb is None:
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        rc.add_to_db('cam_table', 'NXOS_CAM_TABLE',
+                     pd.DataFrame(CAM, columns=CAM_COLS), NEW, db_path)
+        con = ddh.connect_analytics(db_path=db_path)
+        tables = [row[0] for row in con.execute('show tables').fetchall()]
+        con.close()
+
+    assert 'cam' in tables
+    assert 'cam_history' in tables
+    for view in ['arp', 'interface_ips', 'mac_locations', 'ip_locations']:
+        assert view not in tables
+
+
+def test_delta_table_history():
+    """Test that every snapshot of a 'delta' mode table is rebuilt, with the
+    same rows as storing every snapshot in full.
+    """
+    if ddh.duckdb is None:
+        return
+
+    snapshots = [(OLD, CAM),
+                 (NEW, CAM[:1] + [['sw1', 'Eth1/2', '0000.1111.bbbb', '30',
+                                   None],
+                                  ['sw2', 'Eth1/1', '0000.2222.bbbb', '10',
+                                   None]])]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        for timestamp, rows in snapshots:
+            rc.add_to_db('cam_table', 'NXOS_CAM_TABLE',
+                         pd.DataFrame(rows, columns=CAM_COLS), timestamp,
+                         db_path, method='delta')
+        for materialize in [False, True]:
+            con = ddh.connect_analytics(db_path=db_path,
+                                        materialize=materialize)
+            df = ddh.query(con, '''select timestamp, device, interface, mac,
+                                          cast(vlan as varchar) as vlan,
+                                          vendor
+                                   from NXOS_CAM_TABLE
+                                   order by timestamp, device, interface''')
+            con.close()
+
+            expected = [[timestamp] + [_ or '' for _ in row]
+                        for timestamp, rows in snapshots
+                        for row in sorted(rows, key=lambda r: r[:2])]
+            assert df.fillna('').values.tolist() == expected
+
+
+def test_parquet_preferred():
+    """Test that a table in both the SQLite database and the Parquet
+    datasets is read from Parquet.
+    """
+    if ddh.duckdb is None or pqh.pa is None:
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_tables(db_path)
+
+        pqh.enable_parquet_backend(f'{tmp}/parquet')
+        try:
+            df_cam = pd.DataFrame(CAM[:1], columns=CAM_COLS)
+            df_cam.insert(0, 'timestamp', NEW)
+            pqh.write_snapshot('NXOS_CAM_TABLE', df_cam)
+        finally:
+            pqh.disable_parquet_backend()
+
+        con = ddh.connect_analytics(db_path=db_path,
+                                    parquet_path=f'{tmp}/parquet')
+        df = ddh.query(con, 'select mac, ip from mac_locations')
+        df_arp = ddh.query(con, 'select * from arp')
+        con.close()
+
+    assert df.values.tolist() == [['0000.1111.aaaa', '10.0.0.10']]
+    assert len(df_arp) == 2
+
+
+def main():
+    # Execute tests
+    test_mac_locations()
+    test_ip_locations()
+    test_missing_sources()
+    test_delta_table_history()
+    test_parquet_preferred()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from collectors import f5_collectors as f5c  # noqa
+from helpers import helpers as hp  # noqa
+
+
+# The output of the 'f5_get_pools_and_members' playbook. 'pool_empty' has no
+# members, and 'pool_app' is in a partition.
+POOLS = {'lb-1': ['ltm pool /Common/pool_web {',
+                  '    members {',
+                  '        /Common/web-1:80 {',
+                  '            address 10.0.0.1',
+                  '        }',
+                  '        /Common/web-2:80 {',
+                  '            address 10.0.0.2',
+                  '        }',
+                  '    }',
+                  '}',
+                  'ltm pool /Common/pool_empty {',
+                  '    monitor /Common/http',
+                  '}',
+                  'ltm pool /Tenant/pool_app {',
+                  '    members {',
+                  '        /Tenant/app-1:8080 {',
+                  '            address 10.0.1.1',
+                  '        }',
+                  '    }',
+                  '}'],
+         'lb-2': ['ltm pool pool_web {',
+                  '    members {',
+                  '        web-9:80 {',
+                  '            address 10.9.0.1',
+                  '        }',
+                  '    }',
+                  '}']}
+
+# The output of the 'f5_get_vip_summary' playbook. 'vip_none' has no pool.
+VIPS = {'lb-1': ['ltm virtual /Common/vip_web {',
+                 '    destination /Common/10.1.1.1:443',
+                 '    pool /Common/pool_web',
+                 '}',
+                 'ltm virtual /Common/vip_empty {',
+                 '    destination /Common/10.1.1.2:80',
+                 '    pool /Common/pool_empty',
+                 '}',
+                 'ltm virtual /Common/vip_none {',
+                 '    destination /Common/10.1.1.3:80',
+                 '}',
+                 'ltm virtual /Tenant/vip_app {',
+                 '    destination /Tenant/10.1.2.1:443',
+                 '    pool /Tenant/pool_app',
+                 '}'],
+        'lb-2': ['ltm virtual vip_web {',
+                 '    destination 10.9.1.1:443',
+                 '    pool pool_web',
+                 '}']}
+
+
+def test_parse_pools_and_members():
+    """Test that each pool member is a row, and that pools without members
+    get a row with an empty member.
+    """
+    df_pools = f5c.parse_pools_and_members(POOLS)
+
+    assert df_pools.values.tolist() == \
+        [['lb-1', 'Common', 'pool_web', '/Common/web-1:80', '10.0.0.1'],
+         ['lb-1', 'Common', 'pool_web', '/Common/web-2:80', '10.0.0.2'],
+         ['lb-1', 'Common', 'pool_empty', '', ''],
+         ['lb-1', 'Tenant', 'pool_app', '/Tenant/app-1:8080', '10.0.1.1'],
+         ['lb-2', 'Common', 'pool_web', 'web-9:80', '10.9.0.1']]
+
+
+def test_parse_vip_summary():
+    """Test that each VIP is correlated with the members of its pool on the
+    same device and partition.
+    """
+    df_pools = f5c.parse_pools_and_members(POOLS)
+    df_vips = f5c.parse_vip_summary(VIPS, df_pools)
+
+    assert df_vips.columns.to_list() == ['device',
+                                         'partition',
+                                         'vip',
+                                         'destination',
+                                         'pool',
+                                         'member',
+                                         'address']
+    assert df_vips.values.tolist() == \
+        [['lb-1', 'Common', 'vip_web', '10.1.1.1:443', 'pool_web',
+          '/Common/web-1:80', '10.0.0.1'],
+         ['lb-1', 'Common', 'vip_web', '10.1.1.1:443', 'pool_web',
+          '/Common/web-2:80', '10.0.0.2'],
+         ['lb-1', 'Common', 'vip_empty', '10.1.1.2:80', 'pool_empty',
+          '', ''],
+         ['lb-1', 'Common', 'vip_none', '10.1.1.3:80', '', '', ''],
+         ['lb-1', 'Tenant', 'vip_app', '10.1.2.1:443', 'pool_app',
+          '/Tenant/app-1:8080', '10.0.1.1'],
+         ['lb-2', 'Common', 'vip_web', '10.9.1.1:443', 'pool_web',
+          'web-9:80', '10.9.0.1']]
+
+
+def run_build_pool_table(db_path, pools, vips, timestamp):
+    """Runs build_pool_table with the output of the playbooks replaced.
+    """
+    def run_summary_playbook(username, password, hostgroup, playbook,
+                             private_data_dir, validate_certs=False):
+        if playbook.endswith('f5_get_pools_and_members.yml'):
+            return pools
+        return vips
+
+    original = f5c.run_summary_playbook
+    f5c.run_summary_playbook = run_summary_playbook
+    try:
+        return f5c.build_pool_table('username',
+                                    'password',
+                                    'f5',
+                                    'playbooks',
+                                    'private_data_dir',
+                                    db_path,
+                                    timestamp)
+    finally:
+        f5c.run_summary_playbook = original
+
+
+def read_timestamps(db_path, table):
+    """Reads the timestamps of each device's rows in a summary table.
+    """
+    con = hp.connect_to_db(db_path)
+    df = pd.read_sql(f'''select device, timestamp, count(*) as count
+                         from {table} group by device, timestamp''', con)
+    con.close()
+    return {row['device']: (row['timestamp'], row['count'])
+            for _, row in df.iterrows()}
+
+
+def test_build_pool_table_only_rebuilds_changes():
+    """Test that only the devices whose output changed are rebuilt, and that
+    the VIP summary is returned for every device.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        df_vips = run_build_pool_table(db_path, POOLS, VIPS,
+                                       '2023-01-01_0000')
+        assert len(df_vips) == 6
+
+        # Nothing changed, so nothing is rebuilt
+        df_vips = run_build_pool_table(db_path, POOLS, VIPS,
+                                       '2023-01-02_0000')
+        assert len(df_vips) == 6
+        assert read_timestamps(db_path, 'F5_VIP_SUMMARY') == \
+            {'lb-1': ('2023-01-01_0000', 5), 'lb-2': ('2023-01-01_0000', 1)}
+
+        # A member was added to 'lb-2', so only it is rebuilt
+        pools = dict(POOLS, **{'lb-2': POOLS['lb-2'][:5] +
+                               ['        web-10:80 {',
+                                '            address 10.9.0.2',
+                                '        }'] +
+                               POOLS['lb-2'][5:]})
+        df_vips = run_build_pool_table(db_path, pools, VIPS,
+                                       '2023-01-03_0000')
+        assert len(df_vips) == 7
+        assert read_timestamps(db_path, 'F5_VIP_SUMMARY') == \
+            {'lb-1': ('2023-01-01_0000', 5), 'lb-2': ('2023-01-03_0000', 2)}
+        assert read_timestamps(db_path, 'F5_POOL_SUMMARY') == \
+            {'lb-1': ('2023-01-01_0000', 4), 'lb-2': ('2023-01-03_0000', 2)}
+
+
+def test_build_pool_table_other_hostgroups():
+    """Test that the devices that are not in the output are not modified or
+    returned.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        run_build_pool_table(db_path, POOLS, VIPS, '2023-01-01_0000')
+
+        pools = {'lb-2': POOLS['lb-2']}
+        vips = {'lb-2': VIPS['lb-2'][:1] +
+                ['    destination 10.9.1.2:443'] + VIPS['lb-2'][2:]}
+        df_vips = run_build_pool_table(db_path, pools, vips,
+                                       '2023-01-02_0000')
+
+        assert df_vips['device'].to_list() == ['lb-2']
+        assert df_vips['destination'].to_list() == ['10.9.1.2:443']
+        assert read_timestamps(db_path, 'F5_VIP_SUMMARY') == \
+            {'lb-1': ('2023-01-01_0000', 5), 'lb-2': ('2023-01-02_0000', 1)}
+
+
+def main():
+    # Execute tests
+    test_parse_pools_and_members()
+    test_parse_vip_summary()
+    test_build_pool_table_only_rebuilds_changes()
+    test_build_pool_table_other_hostgroups()
+
+
+if __name__ == '__main__':
+    main()
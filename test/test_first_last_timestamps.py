@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from helpers import helpers as hp  # noqa
+
+
+TABLE = 'BIGIP_NODE_AVAILABILITY'
+COLS = ['device', 'node', 'availability']
+
+# The nodes that each device has at each timestamp. 'lb-2' is not collected
+# at the second timestamp, and 'node-c' is added at the third.
+SNAPSHOTS = [('2023-01-01_0000', [['lb-1', 'node-a', 'available'],
+                                  ['lb-2', 'node-b', 'available']]),
+             ('2023-01-02_0000', [['lb-1', 'node-a', 'offline']]),
+             ('2023-01-03_0000', [['lb-1', 'node-a', 'available'],
+                                  ['lb-2', 'node-b', 'available'],
+                                  ['lb-2', 'node-c', None]])]
+
+
+def write_snapshots(db_path, snapshots=SNAPSHOTS, method='append'):
+    """Writes the snapshots to a database.
+    """
+    for timestamp, rows in snapshots:
+        result = pd.DataFrame(rows, columns=COLS)
+        rc.add_to_db('node_availability', TABLE, result, timestamp, db_path,
+                     method=method)
+
+
+def to_dict(df_stamps, col_name):
+    """Converts the first and last timestamps to a dictionary.
+    """
+    return {row[col_name]: (row['first_ts'], row['last_ts'])
+            for _, row in df_stamps.iterrows()}
+
+
+def query_first_last(db_path, col_name):
+    """Finds the first and last timestamps by scanning the whole table.
+    """
+    con = hp.connect_to_db(db_path)
+    df = pd.read_sql(f'select timestamp, {col_name} from {TABLE}', con)
+    con.close()
+    df = df.dropna().groupby(col_name)['timestamp'].agg(['min', 'max'])
+    return {value: (row['min'], row['max']) for value, row in df.iterrows()}
+
+
+def read_tracked(db_path, col_name):
+    """Reads the tracked timestamps of a column without starting to track it.
+    """
+    con = hp.connect_to_db(db_path)
+    df = pd.read_sql('''select value, first_ts, last_ts
+                        from FIRST_LAST_TIMESTAMPS
+                        where table_name = ? and col_name = ?''',
+                     con, params=(TABLE, col_name))
+    con.close()
+    return {row['value']: (row['first_ts'], row['last_ts'])
+            for _, row in df.iterrows()}
+
+
+def test_defined_columns_tracked_at_insert():
+    """Test that the columns in define_first_last_columns are tracked as the
+    output is inserted.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path)
+
+        assert 'device' in hp.define_first_last_columns()[TABLE]
+        assert read_tracked(db_path, 'device') == \
+            {'lb-1': ('2023-01-01_0000', '2023-01-03_0000'),
+             'lb-2': ('2023-01-01_0000', '2023-01-03_0000')}
+        assert read_tracked(db_path, 'node') == dict()
+
+
+def test_untracked_column():
+    """Test that a column is added from the table the first time it is
+    requested, and that it is then updated at insert time.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path, SNAPSHOTS[:2])
+
+        df_stamps = hp.get_first_last_timestamp(db_path, TABLE, 'node')
+        assert df_stamps.columns.to_list() == ['node', 'first_ts', 'last_ts']
+        assert to_dict(df_stamps, 'node') == query_first_last(db_path, 'node')
+
+        write_snapshots(db_path, SNAPSHOTS[2:])
+        assert read_tracked(db_path, 'node') == \
+            query_first_last(db_path, 'node')
+        assert read_tracked(db_path, 'node')['node-c'] == \
+            ('2023-01-03_0000', '2023-01-03_0000')
+
+
+def test_out_of_order_insert():
+    """Test that inserting an older snapshot updates the first timestamp but
+    not the last one.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path, SNAPSHOTS[1:])
+        write_snapshots(db_path, SNAPSHOTS[:1])
+
+        df_stamps = hp.get_first_last_timestamp(db_path, TABLE, 'device')
+        assert to_dict(df_stamps, 'device') == \
+            query_first_last(db_path, 'device')
+
+
+def test_replace_resets_timestamps():
+    """Test that the timestamps are reset when the table is replaced.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path)
+        hp.get_first_last_timestamp(db_path, TABLE, 'node')
+        write_snapshots(db_path, SNAPSHOTS[1:2], method='replace')
+
+        df_stamps = hp.get_first_last_timestamp(db_path, TABLE, 'device')
+        assert to_dict(df_stamps, 'device') == \
+            {'lb-1': ('2023-01-02_0000', '2023-01-02_0000')}
+        df_stamps = hp.get_first_last_timestamp(db_path, TABLE, 'node')
+        assert to_dict(df_stamps, 'node') == \
+            {'node-a': ('2023-01-02_0000', '2023-01-02_0000')}
+
+
+def test_delta_table():
+    """Test that a table in 'delta' mode has the same timestamps as the same
+    table in 'append' mode.
+    """
+    cols = ['device', 'interface', 'mac', 'vlan']
+    snapshots = [('2023-01-01_0000',
+                  [['sw1', 'Ethernet1/1', '0000.1111.aaaa', '10'],
+                   ['sw2', 'Ethernet1/1', '0000.2222.aaaa', '20']]),
+                 ('2023-01-02_0000',
+                  [['sw1', 'Ethernet1/2', '0000.1111.bbbb', '10'],
+                   ['sw2', 'Ethernet1/1', '0000.2222.aaaa', '20']]),
+                 ('2023-01-03_0000',
+                  [['sw1', 'Ethernet1/2', '0000.1111.bbbb', '10'],
+                   ['sw2', 'Ethernet1/2', '0000.2222.bbbb', '20']])]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for method in ['append', 'delta']:
+            for timestamp, rows in snapshots:
+                result = pd.DataFrame(rows, columns=cols)
+                rc.add_to_db('cam_table', 'NXOS_CAM_TABLE', result, timestamp,
+                             f'{tmp}/{method}.db', method=method)
+
+        for col_name in ['device', 'mac']:
+            df_append = hp.get_first_last_timestamp(f'{tmp}/append.db',
+                                                    'NXOS_CAM_TABLE',
+                                                    col_name)
+            df_delta = hp.get_first_last_timestamp(f'{tmp}/delta.db',
+                                                   'NXOS_CAM_TABLE',
+                                                   col_name)
+            assert to_dict(df_delta, col_name) == \
+                to_dict(df_append, col_name)
+
+        df_stamps = hp.get_first_last_timestamp(f'{tmp}/delta.db',
+                                                'NXOS_CAM_TABLE',
+                                                'mac')
+        stamps = to_dict(df_stamps, 'mac')
+        assert stamps['0000.1111.aaaa'] == ('2023-01-01_0000',
+                                            '2023-01-01_0000')
+        assert stamps['0000.2222.aaaa'] == ('2023-01-01_0000',
+                                            '2023-01-02_0000')
+
+
+def main():
+    # Execute tests
+    test_defined_columns_tracked_at_insert()
+    test_untracked_column()
+    test_out_of_order_insert()
+    test_replace_resets_timestamps()
+    test_delta_table()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import ipaddress as ip
+import os
+import sys
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from helpers import ip_helpers as iph  # noqa
+
+
+def test_calculate_subnets_ipv4():
+    """Test 'calculate_subnets' with IPv4 addresses.
+    """
+    addresses = ['10.1.1.5/24', '192.168.0.1/32', '172.16.5.9/12',
+                 '10.0.0.1/31', '0.0.0.0/0']
+    subnets, network_ips, broadcast_ips = iph.calculate_subnets(addresses)
+
+    assert subnets == ['10.1.1.0/24', '192.168.0.1/32', '172.16.0.0/12',
+                       '10.0.0.0/31', '0.0.0.0/0']
+    assert network_ips == ['10.1.1.0', '192.168.0.1', '172.16.0.0',
+                           '10.0.0.0', '0.0.0.0']
+    assert broadcast_ips == ['10.1.1.255', '192.168.0.1', '172.31.255.255',
+                             '10.0.0.1', '255.255.255.255']
+
+
+def test_calculate_subnets_ipv6_broadcast():
+    """Test that the IPv6 'broadcast' is the last address in the subnet.
+    """
+    addresses = ['2001:db8::1/64', '2001:db8:0:1::5/127', 'fe80::1/128',
+                 '2001:db8:abcd:12::/56']
+    subnets, network_ips, broadcast_ips = iph.calculate_subnets(addresses)
+
+    assert subnets == ['2001:db8::/64', '2001:db8:0:1::4/127',
+                       'fe80::1/128', '2001:db8:abcd::/56']
+    assert network_ips == ['2001:db8::', '2001:db8:0:1::4', 'fe80::1',
+                           '2001:db8:abcd::']
+    assert broadcast_ips == ['2001:db8::ffff:ffff:ffff:ffff',
+                             '2001:db8:0:1::5',
+                             'fe80::1',
+                             '2001:db8:abcd:ff:ffff:ffff:ffff:ffff']
+
+
+def test_calculate_subnets_matches_ipaddress():
+    """Test 'calculate_subnets' against the ipaddress module, with mixed IPv4
+    and IPv6 addresses and an address that uses a netmask.
+    """
+    addresses = ['10.20.30.40/22', '2001:db8:1:2:3:4:5:6/100',
+                 '10.1.1.1/255.255.255.0', '::ffff:10.1.1.1/120',
+                 '198.51.100.200/29']
+    subnets, network_ips, broadcast_ips = iph.calculate_subnets(addresses)
+
+    for pos, address in enumerate(addresses):
+        network = ip.ip_interface(address).network
+        assert subnets[pos] == str(network)
+        assert network_ips[pos] == str(network.network_address)
+        assert broadcast_ips[pos] == str(network.broadcast_address)
+
+
+def test_calculate_subnets_invalid():
+    """Test that 'calculate_subnets' raises a ValueError for invalid
+    addresses.
+    """
+    try:
+        iph.calculate_subnets(['10.1.1.300/24'])
+    except ValueError:
+        return
+    raise AssertionError('Expected a ValueError')
+
+
+def main():
+    # Execute tests
+    test_calculate_subnets_ipv4()
+    test_calculate_subnets_ipv6_broadcast()
+    test_calculate_subnets_matches_ipaddress()
+    test_calculate_subnets_invalid()
+
+
+if __name__ == '__main__':
+    main()
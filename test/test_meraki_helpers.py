@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+import time
+import types
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from helpers import meraki_helpers as mh  # noqa
+
+
+def create_api_error(status, retry_after=None):
+    """Creates the exception that the Meraki SDK raises for an error
+    response.
+    """
+    error = mh.APIError.__new__(mh.APIError)
+    headers = dict()
+    if retry_after is not None:
+        headers['Retry-After'] = retry_after
+    error.status = status
+    error.response = types.SimpleNamespace(status_code=status,
+                                           headers=headers)
+    return error
+
+
+class FakeAppliance:
+    """A fake 'appliance' section of the Dashboard API. Networks in
+    'rate_limited' return a 429 response the first time they are requested,
+    and networks in 'errors' always return a 400 response.
+    """
+    def __init__(self, rate_limited=list(), errors=list()):
+        self.rate_limited = set(rate_limited)
+        self.errors = set(errors)
+        self.calls = list()
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def getNetworkApplianceVlans(self, network, **kwargs):
+        with self.lock:
+            self.calls.append(network)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        if network in self.rate_limited:
+            self.rate_limited.discard(network)
+            raise create_api_error(429, retry_after='0')
+        if network in self.errors:
+            raise create_api_error(400)
+        return [{'id': 1, 'networkId': network, **kwargs}]
+
+
+def run_fetch(appliance, networks, **kwargs):
+    """Runs fetch_concurrently with a fake Dashboard API session.
+    """
+    get_dashboard = mh.get_dashboard
+    mh.get_dashboard = \
+        lambda api_key: types.SimpleNamespace(appliance=appliance)
+    mh.buckets.clear()
+    try:
+        return list(mh.fetch_concurrently('api_key',
+                                          'appliance.getNetworkApplianceVlans',
+                                          networks,
+                                          **kwargs))
+    finally:
+        mh.get_dashboard = get_dashboard
+        mh.buckets.clear()
+
+
+def test_results_in_order():
+    """Test that the results are yielded in the same order as the networks,
+    and that the requests are made concurrently.
+    """
+    networks = [f'N_{i}' for i in range(20)]
+    appliance = FakeAppliance()
+    results = run_fetch(appliance, networks, max_workers=4, rate=1000)
+
+    assert [item for item, _, _ in results] == networks
+    assert [result[0]['networkId'] for _, result, _ in results] == networks
+    assert all(error is None for _, _, error in results)
+    assert 1 < appliance.peak <= 4
+
+
+def test_errors_are_yielded():
+    """Test that a failed request is yielded with its exception, and that it
+    does not stop the other requests.
+    """
+    appliance = FakeAppliance(errors=['N_1'])
+    results = run_fetch(appliance, ['N_0', 'N_1', 'N_2'], rate=1000)
+
+    assert [result is None for _, result, _ in results] == [False, True,
+                                                            False]
+    assert results[1][2].status == 400
+    assert sorted(appliance.calls) == ['N_0', 'N_1', 'N_2']
+
+
+def test_rate_limited_requests_are_retried():
+    """Test that a request that receives a 429 response is retried, and that
+    the keyword arguments are passed to every request.
+    """
+    appliance = FakeAppliance(rate_limited=['N_1'])
+    results = run_fetch(appliance, ['N_0', 'N_1'], rate=1000, perPage=5)
+
+    assert [error for _, _, error in results] == [None, None]
+    assert results[1][1] == [{'id': 1, 'networkId': 'N_1', 'perPage': 5}]
+    assert appliance.calls.count('N_1') == 2
+
+
+def test_rate_limit_retries_exhausted():
+    """Test that the 429 error is yielded after 'max_retries' retries.
+    """
+    appliance = FakeAppliance(rate_limited=['N_0'])
+    results = run_fetch(appliance, ['N_0'], rate=1000, max_retries=0)
+
+    assert results[0][2].status == 429
+    assert appliance.calls == ['N_0']
+
+
+def test_token_bucket_rate():
+    """Test that a bucket does not allow more than its rate after its
+    capacity is used.
+    """
+    bucket = mh.create_token_bucket(50, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        mh.take_token(bucket)
+    assert time.monotonic() - start >= 0.09
+
+
+def test_org_buckets():
+    """Test that each organization has its own bucket, and that networks
+    without an organization share one.
+    """
+    mh.buckets.clear()
+    try:
+        assert mh.get_token_bucket('org_1') is mh.get_token_bucket('org_1')
+        assert mh.get_token_bucket('org_1') is not \
+            mh.get_token_bucket('org_2')
+        assert mh.get_token_bucket(None) is mh.get_token_bucket(None)
+    finally:
+        mh.buckets.clear()
+
+
+def test_get_retry_after():
+    """Test that the 'Retry-After' header is used, and that the default is
+    used if it is missing or invalid.
+    """
+    assert mh.get_retry_after(create_api_error(429, '3')) == 3
+    assert mh.get_retry_after(create_api_error(429)) == 1
+    assert mh.get_retry_after(create_api_error(429, 'soon')) == 1
+    assert mh.get_retry_after(create_api_error(429, '-2')) == 0
+
+
+def main():
+    # Execute tests
+    test_results_in_order()
+    test_errors_are_yielded()
+    test_rate_limited_requests_are_retried()
+    test_rate_limit_retries_exhausted()
+    test_token_bucket_rate()
+    test_org_buckets()
+    test_get_retry_after()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+import types
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from collectors import netbox_collectors as nbc  # noqa
+from helpers import netbox_helpers as nbh  # noqa
+
+
+NB_PATH = 'https://netbox.example.com/'
+
+
+def create_prefixes(count):
+    """Creates the prefixes that the fake Netbox API returns.
+    """
+    return [{'id': i,
+             'prefix': f'10.{i // 256}.{i % 256}.0/24',
+             'tenant': {'id': i % 3, 'name': f'tenant-{i % 3}'},
+             'vlan': None,
+             'custom_fields': {'ib_ref': f'network/{i}'}}
+            for i in range(count)]
+
+
+class FakeSession:
+    """A fake HTTP session for the 'ipam/prefixes' endpoint. Like Netbox, it
+    returns at most 'max_page_size' objects per page.
+    """
+    def __init__(self, prefixes, max_page_size=1000):
+        self.prefixes = prefixes
+        self.max_page_size = max_page_size
+        self.requests = list()
+        self.lock = threading.Lock()
+
+    def get(self, url, headers, params):
+        with self.lock:
+            self.requests.append((url, params['offset'], params['limit']))
+        limit = min(params['limit'], self.max_page_size)
+        offset = params['offset']
+        page = {'count': len(self.prefixes),
+                'results': self.prefixes[offset:offset + limit]}
+        return types.SimpleNamespace(raise_for_status=lambda: None,
+                                     json=lambda: page)
+
+
+def run_with_session(session, function, *args, **kwargs):
+    """Runs a function with the Netbox handler replaced by one that uses
+    'session'.
+    """
+    create_netbox_handler = nbc.create_netbox_handler
+    nbc.create_netbox_handler = \
+        lambda nb_path, token: types.SimpleNamespace(http_session=session)
+    nbc.prefix_cache.clear()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        nbc.create_netbox_handler = create_netbox_handler
+        nbc.prefix_cache.clear()
+
+
+def test_get_all_pages():
+    """Test that every page is requested once, using the page size that
+    Netbox returns, and that the objects are returned in order.
+    """
+    prefixes = create_prefixes(25)
+    session = FakeSession(prefixes, max_page_size=10)
+    results = run_with_session(session, nbc.netbox_get_all, NB_PATH,
+                               'token', '/ipam/prefixes/', page_size=100)
+
+    assert results == prefixes
+    assert sorted(session.requests) == \
+        [('https://netbox.example.com/api/ipam/prefixes/', 0, 100),
+         ('https://netbox.example.com/api/ipam/prefixes/', 10, 10),
+         ('https://netbox.example.com/api/ipam/prefixes/', 20, 10)]
+
+
+def test_get_all_single_page():
+    """Test that only one page is requested if every object is on it, or if
+    there are no objects.
+    """
+    for count in [0, 5]:
+        session = FakeSession(create_prefixes(count))
+        results = run_with_session(session, nbc.netbox_get_all, NB_PATH,
+                                   'token', 'ipam/prefixes')
+        assert len(results) == count
+        assert len(session.requests) == 1
+
+
+def test_ipam_prefixes_columns():
+    """Test that the nested dictionaries are flattened into columns.
+    """
+    session = FakeSession(create_prefixes(3))
+    df = run_with_session(session, nbc.netbox_get_ipam_prefixes, NB_PATH,
+                          'token')
+
+    assert df['prefix'].to_list() == ['10.0.0.0/24',
+                                      '10.0.1.0/24',
+                                      '10.0.2.0/24']
+    assert df['tenant_id'].to_list() == [0, 1, 2]
+    assert df['tenant_name'].to_list() == ['tenant-0',
+                                           'tenant-1',
+                                           'tenant-2']
+    assert df['custom_fields_ib_ref'].to_list() == ['network/0',
+                                                    'network/1',
+                                                    'network/2']
+    assert df['vlan'].isna().all()
+
+
+def test_ipam_prefixes_cache():
+    """Test that the prefixes are reused by later calls for the same
+    instance and token, and by get_prefix_custom_field_states.
+    """
+    session = FakeSession(create_prefixes(3))
+
+    def run():
+        df = nbc.netbox_get_ipam_prefixes(NB_PATH, 'token')
+        # Changes to the returned DataFrame must not change the cache
+        df.drop(columns=['prefix'], inplace=True)
+        df_states = nbh.get_prefix_custom_field_states(NB_PATH,
+                                                       'token',
+                                                       'ib_ref')
+        assert len(session.requests) == 1
+        assert df_states.columns.to_list() == ['id', 'custom_fields_ib_ref']
+        assert 'prefix' in nbc.netbox_get_ipam_prefixes(NB_PATH, 'token')
+
+        # Another token, or a 'max_age' of 0, queries Netbox again
+        nbc.netbox_get_ipam_prefixes(NB_PATH, 'other')
+        nbc.netbox_get_ipam_prefixes(NB_PATH, 'token', max_age=0)
+        assert len(session.requests) == 3
+
+    run_with_session(session, run)
+
+
+def main():
+    # Execute tests
+    test_get_all_pages()
+    test_get_all_single_page()
+    test_ipam_prefixes_columns()
+    test_ipam_prefixes_cache()
+
+
+if __name__ == '__main__':
+    main()
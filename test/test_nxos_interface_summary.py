@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from collectors import collectors as cl  # noqa
+
+
+OLD = '2023-01-01_0000'
+NEW = '2023-01-02_0000'
+
+STATUS = [['sw1', 'Eth1/1', 'connected'],
+          ['sw1', 'Eth1/2', 'notconnect'],
+          ['sw2', 'Eth1/1', 'connected']]
+DESCRIPTIONS = [['sw1', 'Eth1/1', 'server-1'],
+                ['sw2', 'Eth1/1', 'uplink']]
+CAM = [['sw1', 'Eth1/1', '0000.1111.aaaa', 'Dell Inc.'],
+       ['sw1', 'Eth1/1', '0000.1111.bbbb', 'Cisco Systems, Inc'],
+       ['sw1', 'Eth1/1', '0000.1111.cccc', 'Dell Inc.'],
+       ['sw2', 'Eth1/1', '0000.2222.aaaa', None]]
+
+
+def write_tables(db_path):
+    """Writes the interface statuses, descriptions and CAM table to a
+    database. The older snapshots have different values, which must not be
+    in the summary.
+    """
+    tables = [('interface_status', STATUS,
+               ['device', 'interface', 'status']),
+              ('interface_description', DESCRIPTIONS,
+               ['device', 'interface', 'description']),
+              ('cam_table', CAM,
+               ['device', 'interface', 'mac', 'vendor'])]
+    for collector, rows, cols in tables:
+        df_old = pd.DataFrame([rows[0][:2] + ['old'] * (len(cols) - 2)],
+                              columns=cols)
+        rc.add_to_db(collector, f'nxos_{collector}', df_old, OLD, db_path)
+        rc.add_to_db(collector, f'nxos_{collector}',
+                     pd.DataFrame(rows, columns=cols), NEW, db_path)
+
+
+def test_interface_summary():
+    """Test that the latest status, description, MACs and vendors are
+    returned for every interface.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_tables(db_path)
+        df_summary = cl.nxos_get_interface_summary(db_path)
+
+    assert df_summary.columns.to_list() == ['device',
+                                            'interface',
+                                            'status',
+                                            'description',
+                                            'vendors',
+                                            'macs']
+    assert df_summary.values.tolist() == \
+        [['sw1', 'Eth1/1', 'connected', 'server-1',
+          'Dell Inc.|Cisco Systems Inc',
+          '0000.1111.aaaa|0000.1111.bbbb|0000.1111.cccc'],
+         ['sw1', 'Eth1/2', 'notconnect', '', '', ''],
+         ['sw2', 'Eth1/1', 'connected', 'uplink', '', '0000.2222.aaaa']]
+
+
+def test_interface_summary_indexes():
+    """Test that the indexes that support the summary are created.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_tables(db_path)
+        cl.nxos_get_interface_summary(db_path)
+
+        con = cl.sl.connect(db_path)
+        cur = con.cursor()
+        cur.execute('''select name from sqlite_master
+                       where type = 'index' and name like 'idx_nxos_%' ''')
+        indexes = sorted(row[0] for row in cur.fetchall())
+        con.close()
+
+    for table in ['cam_table', 'interface_description', 'interface_status']:
+        assert f'idx_nxos_{table}' in indexes
+
+
+def main():
+    # Execute tests
+    test_interface_summary()
+    test_interface_summary_indexes()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import time
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from helpers import helpers as hp  # noqa
+
+
+# Excerpts of the IEEE registries, in the format they are downloaded in
+REGISTRIES = {'ouis.txt': '''OUI/MA-L\t\t\tOrganization
+company_id\t\t\tOrganization
+\t\t\t\tAddress
+
+00-50-56   (hex)\t\tVMware, Inc.
+005056     (base 16)\t\tVMware, Inc.
+\t\t\t\t3401 Hillview Avenue
+\t\t\t\tPALO ALTO  CA  94304
+\t\t\t\tUS
+
+C4-34-6B   (hex)\t\tHewlett Packard
+C4346B     (base 16)\t\tHewlett Packard
+\t\t\t\t11445 Compaq Center Drive
+\t\t\t\tHouston    77070
+\t\t\t\tUS
+
+70-B3-D5   (hex)\t\tIEEE Registration Authority
+70B3D5     (base 16)\t\tIEEE Registration Authority
+\t\t\t\t445 Hoes Lane
+\t\t\t\tPiscataway  NJ  08554
+\t\t\t\tUS
+''',
+              'ouis_mam.txt': '''OUI/MA-M\t\t\tOrganization
+
+70-B3-D5-8   (hex)\t\tBlock Vendor M
+800000-8FFFFF     (base 16)\t\tBlock Vendor M
+\t\t\t\t1 Main Street
+\t\t\t\tSpringfield    00001
+\t\t\t\tUS
+''',
+              'ouis_oui36.txt': '''OUI/MA-S\t\t\tOrganization
+
+70-B3-D5-F2-F   (hex)\t\tBlock Vendor S
+F2F000-F2FFFF     (base 16)\t\tBlock Vendor S
+\t\t\t\t2 Main Street
+\t\t\t\tSpringfield    00002
+\t\t\t\tUS
+'''}
+
+
+def create_registries(tmp, registries=REGISTRIES):
+    """Saves the registries to a directory, so they are not downloaded.
+    """
+    path = f'{tmp}/'
+    for name, data in registries.items():
+        with open(f'{path}{name}', 'w') as txt:
+            txt.write(data)
+    return path
+
+
+def test_build_oui_index():
+    """Test that each assignment is added to the index of its registry.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = create_registries(tmp)
+        hp.build_oui_index(path)
+        index = hp.load_oui_index(path)
+
+        def vendors(registry):
+            return [index['vendors'][_] for _ in index[f'{registry}_vendors']]
+
+        assert list(index['ma_l_keys']) == [0x005056, 0x70B3D5, 0xC4346B]
+        assert vendors('ma_l') == ['VMware, Inc.',
+                                   'IEEE Registration Authority',
+                                   'Hewlett Packard']
+        assert list(index['ma_m_keys']) == [0x70B3D58]
+        assert vendors('ma_m') == ['Block Vendor M']
+        assert list(index['ma_s_keys']) == [0x70B3D5F2F]
+        assert vendors('ma_s') == ['Block Vendor S']
+
+
+def test_find_mac_vendors():
+    """Test that the most specific assignment is returned for each MAC
+    address, regardless of its format.
+    """
+    macs = ['00:50:56:bd:52:79',
+            'C434.6BB9.9932',
+            '70-B3-D5-8A-BC-DE',
+            '70:b3:d5:f2:f1:23',
+            '70:b3:d5:f3:00:01',
+            'aa:bb:cc:dd:ee:ff',
+            '00:50']
+    with tempfile.TemporaryDirectory() as tmp:
+        df = hp.find_mac_vendors(macs, create_registries(tmp))
+
+    assert df['mac'].to_list() == macs
+    assert df['vendor'].to_list() == ['VMware, Inc.',
+                                      'Hewlett Packard',
+                                      'Block Vendor M',
+                                      'Block Vendor S',
+                                      'IEEE Registration Authority',
+                                      'unknown',
+                                      'unknown']
+
+
+def test_find_mac_vendors_empty():
+    """Test that an empty list of MAC addresses returns an empty DataFrame.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        df = hp.find_mac_vendors(list(), create_registries(tmp))
+
+    assert len(df) == 0
+    assert df.columns.to_list() == ['mac', 'vendor']
+
+
+def test_index_is_rebuilt():
+    """Test that the index is rebuilt when a registry is newer than it.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = create_registries(tmp)
+        df = hp.find_mac_vendors(['00:50:56:00:00:01'], path)
+        assert df['vendor'].to_list() == ['VMware, Inc.']
+
+        registries = dict(REGISTRIES)
+        registries['ouis.txt'] = registries['ouis.txt'].replace(
+            'VMware, Inc.', 'Broadcom Inc.')
+        create_registries(tmp, registries)
+        newer = time.time() + 10
+        os.utime(f'{path}ouis.txt', (newer, newer))
+
+        df = hp.find_mac_vendors(['00:50:56:00:00:01'], path)
+        assert df['vendor'].to_list() == ['Broadcom Inc.']
+
+
+def main():
+    # Execute tests
+    test_build_oui_index()
+    test_find_mac_vendors()
+    test_find_mac_vendors_empty()
+    test_index_is_rebuilt()
+
+
+if __name__ == '__main__':
+    main()
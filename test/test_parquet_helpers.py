@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import threading
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from helpers import parquet_helpers as pqh  # noqa
+
+
+TABLE = 'NXOS_ARP_TABLE'
+TIMESTAMPS = ['2023-01-01_0000', '2023-01-01_1200', '2023-01-02_0000']
+
+
+def create_snapshot(timestamp, devices=('sw1', 'sw2')):
+    """Creates the output of a collector at a timestamp.
+    """
+    return pd.DataFrame({'timestamp': timestamp,
+                         'device': list(devices),
+                         'ip_address': ['10.0.0.1'] * len(devices)})
+
+
+def test_write_and_read_snapshots():
+    """Test that each snapshot is written to its date partition, and that
+    the snapshots are read by their timestamps.
+    """
+    if pqh.pa is None:
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pqh.enable_parquet_backend(tmp)
+        try:
+            for timestamp in TIMESTAMPS:
+                pqh.write_snapshot(TABLE, create_snapshot(timestamp))
+
+            assert sorted(os.listdir(pqh.get_dataset_path(TABLE))) == \
+                ['date=2023-01-01', 'date=2023-01-02']
+            assert pqh.get_snapshots(TABLE) == TIMESTAMPS
+            assert pqh.get_snapshots(TABLE, start='2023-01-01_0600') == \
+                TIMESTAMPS[1:]
+
+            df = pqh.read_snapshot(TABLE)
+            assert (df['timestamp'] == TIMESTAMPS[-1]).all()
+
+            df = pqh.read_snapshot(TABLE, TIMESTAMPS[0], columns=['device'],
+                                   filters={'device': 'sw2'})
+            assert df.to_dict('list') == {'device': ['sw2']}
+        finally:
+            pqh.disable_parquet_backend()
+
+
+def test_write_snapshot_methods():
+    """Test that 'replace' deletes the previous snapshots, and that 'fail'
+    raises an exception if the dataset exists.
+    """
+    if pqh.pa is None:
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pqh.enable_parquet_backend(tmp)
+        try:
+            pqh.write_snapshot(TABLE, create_snapshot(TIMESTAMPS[0]))
+            pqh.write_snapshot(TABLE, create_snapshot(TIMESTAMPS[1], ['sw3']),
+                               method='replace')
+            assert pqh.get_snapshots(TABLE) == [TIMESTAMPS[1]]
+
+            try:
+                pqh.write_snapshot(TABLE, create_snapshot(TIMESTAMPS[2]),
+                                   method='fail')
+                raised = False
+            except ValueError:
+                raised = True
+            assert raised
+        finally:
+            pqh.disable_parquet_backend()
+
+
+def test_write_holds_table_lock():
+    """Test that the file is written while the table's lock is held, so a
+    concurrent 'replace' cannot delete its partition, and that other tables
+    are not blocked.
+    """
+    if pqh.pa is None:
+        return
+
+    locked = list()
+    write_table = pqh.pq.write_table
+
+    def record_lock(table, where, **kwargs):
+        locked.append((pqh.get_table_lock(TABLE).locked(),
+                       pqh.get_table_lock('IOS_ARP_TABLE').locked()))
+        write_table(table, where, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pqh.enable_parquet_backend(tmp)
+        pqh.pq.write_table = record_lock
+        try:
+            pqh.write_snapshot(TABLE, create_snapshot(TIMESTAMPS[0]))
+        finally:
+            pqh.pq.write_table = write_table
+            pqh.disable_parquet_backend()
+
+    assert locked == [(True, False)]
+
+
+def test_concurrent_replace():
+    """Test that concurrent writes in 'replace' mode leave exactly one
+    complete snapshot.
+    """
+    if pqh.pa is None:
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pqh.enable_parquet_backend(tmp)
+        errors = list()
+
+        def write(timestamp):
+            try:
+                pqh.write_snapshot(TABLE, create_snapshot(timestamp),
+                                   method='replace')
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            threads = [threading.Thread(target=write, args=(timestamp,))
+                       for timestamp in TIMESTAMPS * 5]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            assert errors == list()
+            assert len(pqh.get_snapshots(TABLE)) == 1
+            assert len(pqh.read_snapshot(TABLE)) == 2
+        finally:
+            pqh.disable_parquet_backend()
+
+
+def test_schedule_collectors_enables_backend():
+    """Test that schedule_collectors enables the backend next to the
+    database for the run when 'parquet' is True.
+    """
+    if pqh.pa is None:
+        return
+
+    enabled = list()
+    collect = rc.collect
+
+    def collect_node(collector, *args, **kwargs):
+        enabled.append((pqh.use_parquet(), pqh.backend['path']))
+        return pd.DataFrame()
+
+    df_collectors = pd.DataFrame({'ansible_os': ['cisco.nxos.nxos'],
+                                  'hostgroup': ['nxos'],
+                                  'collector': ['arp_table']})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rc.collect = collect_node
+        try:
+            rc.schedule_collectors(df_collectors,
+                                   nm_path,
+                                   tmp,
+                                   TIMESTAMPS[0],
+                                   cache_output=False,
+                                   parquet=True,
+                                   db_path=f'{tmp}/test.db')
+        finally:
+            rc.collect = collect
+
+    assert enabled == [(True, f'{tmp}/parquet')]
+    assert not pqh.use_parquet()
+
+
+def main():
+    # Execute tests
+    test_write_and_read_snapshots()
+    test_write_snapshot_methods()
+    test_write_holds_table_lock()
+    test_concurrent_replace()
+    test_schedule_collectors_enables_backend()
+
+
+if __name__ == '__main__':
+    main()
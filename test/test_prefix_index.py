@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import ipaddress as ip
+import os
+import random
+import sys
+import tempfile
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from collectors import infoblox_nios_collectors as nc  # noqa
+from helpers import ip_helpers as iph  # noqa
+
+
+CONTAINERS = ['10.0.0.0/8',
+              '10.1.0.0/16',
+              '10.1.2.0/24',
+              '10.2.0.0/16',
+              '192.168.0.0/16',
+              '2001:db8::/32',
+              '2001:db8:1::/48']
+
+
+def find_parent(network, prefixes):
+    """Finds the most specific prefix that contains a network by comparing it
+    to every prefix.
+    """
+    network = ip.ip_network(network, strict=False)
+    parents = [ip.ip_network(p) for p in prefixes
+               if ip.ip_network(p).version == network.version and
+               network.subnet_of(ip.ip_network(p))]
+    if not parents:
+        return 'orphan'
+    return str(max(parents, key=lambda p: p.prefixlen))
+
+
+def test_find_longest_prefix():
+    """Test that the most specific prefix is found for nested prefixes,
+    exact matches, addresses and IPv6.
+    """
+    index = iph.build_prefix_index(CONTAINERS)
+    lookups = {'10.1.2.128/25': '10.1.2.0/24',
+               '10.1.3.0/24': '10.1.0.0/16',
+               '10.3.0.0/24': '10.0.0.0/8',
+               '10.1.0.0/16': '10.1.0.0/16',
+               '10.1.2.5': '10.1.2.0/24',
+               '172.16.0.0/24': 'orphan',
+               '10.0.0.0/7': 'orphan',
+               '2001:db8:1:2::/64': '2001:db8:1::/48',
+               '2001:db8:2::1': '2001:db8::/32',
+               '2001:db9::/48': 'orphan'}
+    for network, parent in lookups.items():
+        assert iph.find_longest_prefix(index, network, 'orphan') == parent
+
+
+def test_find_longest_prefix_empty():
+    """Test that the default is returned if the index has no prefixes of the
+    same IP version.
+    """
+    index = iph.build_prefix_index(['10.0.0.0/8'])
+    assert iph.find_longest_prefix(index, '2001:db8::/64', 'orphan') == \
+        'orphan'
+    assert iph.find_longest_prefix(dict(), '10.0.0.0/24') is None
+
+
+def test_map_longest_prefixes_matches_ipaddress():
+    """Test 'map_longest_prefixes' against comparing every network to every
+    prefix with the ipaddress module.
+    """
+    rand = random.Random(0)
+    prefixes = set()
+    while len(prefixes) < 200:
+        length = rand.choice([8, 12, 16, 20, 24])
+        address = ip.ip_address(rand.getrandbits(32) & 0x0AFFFFFF)
+        prefixes.add(str(ip.ip_network(f'{address}/{length}', strict=False)))
+    networks = [str(ip.ip_network(f'{ip.ip_address(rand.getrandbits(32))}'
+                                  f'/{rand.choice([24, 28, 32])}',
+                                  strict=False))
+                for _ in range(500)]
+    networks += [str(ip.ip_network(f'{p.split("/")[0]}/30', strict=False))
+                 for p in list(prefixes)[:50]]
+
+    parents = iph.map_longest_prefixes(networks, prefixes, 'orphan')
+    assert parents == [find_parent(n, prefixes) for n in networks]
+
+
+def test_get_networks_parent_containers():
+    """Test that each network is mapped to the most specific container in
+    its own network view.
+    """
+    cols = ['network', 'network_view']
+    networks = [['10.1.2.0/25', 'default'],
+                ['10.1.3.0/24', 'default'],
+                ['10.1.2.0/25', 'lab'],
+                ['172.16.0.0/24', 'default'],
+                ['2001:db8:1:2::/64', 'default'],
+                ['10.9.0.0/24', 'empty']]
+    containers = [['10.0.0.0/8', 'default'],
+                  ['10.1.0.0/16', 'default'],
+                  ['10.1.2.0/24', 'default'],
+                  ['10.0.0.0/8', 'lab'],
+                  ['2001:db8::/32', 'default']]
+    timestamp = '2023-01-01_0000'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        rc.add_to_db('get_networks', 'infoblox_get_networks',
+                     pd.DataFrame(networks, columns=cols), timestamp, db_path)
+        rc.add_to_db('get_network_containers',
+                     'infoblox_get_network_containers',
+                     pd.DataFrame(containers, columns=cols), timestamp,
+                     db_path)
+        df = nc.get_networks_parent_containers(db_path)
+
+    assert df['network_container'].to_list() == ['10.1.2.0/24',
+                                                 '10.1.0.0/16',
+                                                 '10.0.0.0/8',
+                                                 'orphan',
+                                                 '2001:db8::/32',
+                                                 'orphan']
+
+
+def main():
+    # Execute tests
+    test_find_longest_prefix()
+    test_find_longest_prefix_empty()
+    test_map_longest_prefixes_matches_ipaddress()
+    test_get_networks_parent_containers()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+import time
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from helpers import helpers as hp  # noqa
+
+
+TIMESTAMP = '2023-01-01_0000'
+
+# Meraki collectors with a chain of dependencies, and NXOS collectors that do
+# not depend on anything
+NODES = [('meraki', 'meraki', 'network_appliance_vlans'),
+         ('meraki', 'meraki', 'org_networks'),
+         ('meraki', 'meraki', 'organizations'),
+         ('meraki', 'meraki', 'org_devices'),
+         ('cisco.nxos.nxos', 'nxos', 'arp_table'),
+         ('cisco.nxos.nxos', 'nxos', 'vrfs')]
+
+
+def run_schedule(nodes=NODES, fail=list(), **kwargs):
+    """Runs schedule_collectors with a replacement for 'collect' that records
+    when each collector starts and finishes, and how many collectors of each
+    ansible_os were running at the same time.
+    """
+    log = list()
+    active = dict()
+    peak = dict()
+    lock = threading.Lock()
+
+    def collect(collector, nm_path, private_data_dir, timestamp,
+                ansible_os=str(), hostgroup=str(), **kwargs):
+        with lock:
+            log.append(('start', collector))
+            active[ansible_os] = active.get(ansible_os, 0) + 1
+            peak[ansible_os] = max(peak.get(ansible_os, 0),
+                                   active[ansible_os])
+        time.sleep(0.01)
+        with lock:
+            active[ansible_os] -= 1
+            log.append(('finish', collector))
+        if collector in fail:
+            raise RuntimeError(f'{collector} failed')
+        return pd.DataFrame({'collector': [collector]})
+
+    df_collectors = pd.DataFrame(nodes,
+                                 columns=['ansible_os',
+                                          'hostgroup',
+                                          'collector'])
+    original = rc.collect
+    rc.collect = collect
+    try:
+        results = rc.schedule_collectors(df_collectors,
+                                         nm_path,
+                                         'private_data_dir',
+                                         TIMESTAMP,
+                                         **kwargs)
+    finally:
+        rc.collect = original
+
+    return results, log, peak
+
+
+def test_dependencies_run_first():
+    """Test that each collector only starts after the collectors it depends
+    on have finished.
+    """
+    results, log, _ = run_schedule()
+
+    assert sorted(results) == sorted(NODES)
+    dependencies = hp.define_collector_dependencies()
+    for node in NODES:
+        start = log.index(('start', node[2]))
+        for dep in dependencies.get(node[2], list()):
+            assert log.index(('finish', dep)) < start
+
+
+def test_failure_skips_dependents():
+    """Test that the collectors that depend on a failed collector, directly
+    or indirectly, are not started, and that the others still run.
+    """
+    results, log, _ = run_schedule(fail=['organizations'])
+
+    started = [collector for event, collector in log if event == 'start']
+    assert sorted(started) == ['arp_table', 'organizations', 'vrfs']
+    assert sorted(results) == [('cisco.nxos.nxos', 'nxos', 'arp_table'),
+                               ('cisco.nxos.nxos', 'nxos', 'vrfs')]
+
+
+def test_os_limits():
+    """Test that no more than the limit of an ansible_os run at the same
+    time, and that the other ansible_os are not limited.
+    """
+    nodes = [('meraki', 'meraki', 'organizations'),
+             ('meraki', 'meraki', 'appliance_uplink_statuses'),
+             ('meraki', 'meraki', 'network_clients'),
+             ('cisco.nxos.nxos', 'nxos', 'arp_table'),
+             ('cisco.nxos.nxos', 'nxos', 'cam_table'),
+             ('cisco.nxos.nxos', 'nxos', 'vrfs')]
+    results, _, peak = run_schedule(nodes, os_limits={'meraki': 1})
+
+    assert len(results) == 6
+    assert peak['meraki'] == 1
+    assert peak['cisco.nxos.nxos'] > 1
+
+
+def test_set_dependencies():
+    """Test that the dependencies of the selected collectors are added before
+    them, including the dependencies of dependencies.
+    """
+    selected = hp.set_dependencies(['switch_lldp_neighbors', 'vrfs'])
+
+    assert selected == ['organizations',
+                        'org_devices',
+                        'switch_port_statuses',
+                        'switch_lldp_neighbors',
+                        'vrfs']
+
+
+def main():
+    # Execute tests
+    test_dependencies_run_first()
+    test_failure_skips_dependents()
+    test_os_limits()
+    test_set_dependencies()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import pandas as pd
+from datetime import datetime as dt
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from helpers import helpers as hp  # noqa
+
+
+TABLE = 'BIGIP_VIP_AVAILABILITY'
+COLS = ['device', 'vip', 'availability']
+
+# One snapshot every 6 hours for 4 days. 'lb-old' is only in the first one.
+TIMESTAMPS = [f'2023-01-0{day}_{hour:02d}00' for day in range(1, 5)
+              for hour in range(0, 24, 6)]
+NOW = dt(2023, 1, 5)
+
+
+def create_snapshot(timestamp):
+    """Creates the output of a collector at a timestamp.
+    """
+    rows = [['lb-1', 'vip-a', 'available'],
+            ['lb-1', 'vip-b', 'offline']]
+    if timestamp == TIMESTAMPS[0]:
+        rows.append(['lb-old', 'vip-c', 'available'])
+    return pd.DataFrame(rows, columns=COLS)
+
+
+def write_snapshots(db_path, timestamps=TIMESTAMPS):
+    """Writes a snapshot for each timestamp to a database.
+    """
+    for timestamp in timestamps:
+        rc.add_to_db('vip_availability', TABLE, create_snapshot(timestamp),
+                     timestamp, db_path)
+
+
+def test_catalog():
+    """Test that add_to_db adds each snapshot to the catalog, and that the
+    snapshots are read from it.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path)
+
+        con = hp.connect_to_db(db_path)
+        assert hp.is_cataloged(con, TABLE)
+        assert hp.get_latest_snapshot(con, TABLE) == TIMESTAMPS[-1]
+
+        df = hp.get_snapshots(con, TABLE)
+        assert df['timestamp'].to_list() == TIMESTAMPS
+        assert df['row_count'].to_list() == [3] + [2] * 15
+
+        df = hp.get_snapshots(con, TABLE, start='2023-01-02_0000',
+                              end='2023-01-02_2359')
+        assert df['timestamp'].to_list() == TIMESTAMPS[4:8]
+
+        df = hp.read_snapshot(con, TABLE, TIMESTAMPS[0], columns=['device'])
+        assert sorted(df['device'].to_list()) == ['lb-1', 'lb-1', 'lb-old']
+        con.close()
+
+
+def test_readers_are_read_only():
+    """Test that reading a table that is not in the catalog does not add it
+    to the catalog.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        con = hp.connect_to_db(db_path)
+        df = create_snapshot(TIMESTAMPS[0])
+        df.insert(0, 'timestamp', TIMESTAMPS[0])
+        df.to_sql(TABLE, con, index=False)
+
+        assert not hp.is_cataloged(con, TABLE)
+        assert hp.get_latest_snapshot(con, TABLE) == TIMESTAMPS[0]
+        assert len(hp.read_snapshot(con, TABLE)) == 3
+        assert not hp.is_cataloged(con, TABLE)
+        assert con.in_transaction is False
+        con.close()
+
+
+def test_table_without_table_id():
+    """Test that output can be appended to a table that was created without
+    a 'table_id' column, and that its snapshots are read by timestamp.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        con = hp.connect_to_db(db_path)
+        df = create_snapshot(TIMESTAMPS[0])
+        df.insert(0, 'timestamp', TIMESTAMPS[0])
+        df.to_sql(TABLE, con, index=False)
+        con.close()
+
+        write_snapshots(db_path, TIMESTAMPS[1:2])
+
+        con = hp.connect_to_db(db_path)
+        assert not hp.is_cataloged(con, TABLE)
+        assert hp.get_latest_snapshot(con, TABLE) == TIMESTAMPS[1]
+        assert len(hp.read_snapshot(con, TABLE, TIMESTAMPS[1])) == 2
+        con.close()
+
+
+def test_retention_max_age():
+    """Test that snapshots older than 'max_age_days' are deleted, along with
+    their rows.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path)
+
+        # The snapshots of the first day, and the first snapshot of the
+        # second day, are more than 2 days old
+        df_deleted = hp.apply_retention(db_path, max_age_days=2, now=NOW)
+        assert sorted(df_deleted['timestamp'].to_list()) == TIMESTAMPS[:5]
+        assert df_deleted['row_count'].sum() == 11
+
+        con = hp.connect_to_db(db_path)
+        df = hp.get_snapshots(con, TABLE)
+        assert df['timestamp'].to_list() == TIMESTAMPS[5:]
+
+        cur = con.cursor()
+        cur.execute(f'select distinct timestamp from {TABLE}')
+        assert sorted(row[0] for row in cur.fetchall()) == TIMESTAMPS[5:]
+        con.close()
+
+
+def test_retention_downsample():
+    """Test that snapshots older than 'downsample_after_days' are downsampled
+    to the latest snapshot of each day.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path)
+
+        hp.apply_retention(db_path, downsample_after_days=0, now=NOW)
+
+        # The latest snapshot is kept, so the first snapshot of its day is
+        # downsampled too
+        con = hp.connect_to_db(db_path)
+        df = hp.get_snapshots(con, TABLE)
+        assert df['timestamp'].to_list() == ['2023-01-01_1800',
+                                             '2023-01-02_1800',
+                                             '2023-01-03_1800',
+                                             '2023-01-04_0600',
+                                             '2023-01-04_1200',
+                                             '2023-01-04_1800']
+        con.close()
+
+
+def test_retention_keeps_latest_snapshot():
+    """Test that the latest snapshot is kept, even if it is too old.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path, TIMESTAMPS[:2])
+
+        df_deleted = hp.apply_retention(db_path, max_age_days=1, now=NOW)
+        assert df_deleted['timestamp'].to_list() == [TIMESTAMPS[0]]
+
+        con = hp.connect_to_db(db_path)
+        assert hp.get_snapshots(con, TABLE)['timestamp'].to_list() == \
+            [TIMESTAMPS[1]]
+        con.close()
+
+
+def test_retention_rebuilds_first_last_timestamps():
+    """Test that the first and last timestamps only refer to snapshots that
+    were not deleted.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path)
+
+        df_stamps = hp.get_first_last_timestamp(db_path, TABLE, 'device')
+        stamps = df_stamps.set_index('device')
+        assert stamps.loc['lb-old', 'first_ts'] == TIMESTAMPS[0]
+        assert stamps.loc['lb-1', 'first_ts'] == TIMESTAMPS[0]
+
+        hp.apply_retention(db_path, max_age_days=2, now=NOW)
+
+        df_stamps = hp.get_first_last_timestamp(db_path, TABLE, 'device')
+        stamps = df_stamps.set_index('device')
+        assert 'lb-old' not in stamps.index
+        assert stamps.loc['lb-1', 'first_ts'] == TIMESTAMPS[5]
+        assert stamps.loc['lb-1', 'last_ts'] == TIMESTAMPS[-1]
+
+
+def main():
+    # Execute tests
+    test_catalog()
+    test_readers_are_read_only()
+    test_table_without_table_id()
+    test_retention_max_age()
+    test_retention_downsample()
+    test_retention_keeps_latest_snapshot()
+    test_retention_rebuilds_first_last_timestamps()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from collectors import solarwinds_collectors as sw  # noqa
+
+
+NODES = [{'Caption': 'sw1', 'NodeID': 1, 'IPAddress': '10.0.0.1',
+          'Vendor': 'Cisco', 'MachineType': 'Nexus 9000',
+          'IOSImage': 'nxos', 'IOSVersion': '9.3(8)'},
+         {'Caption': 'fw1', 'NodeID': 2, 'IPAddress': '10.0.0.2',
+          'Vendor': 'Palo Alto', 'MachineType': 'PA-3220',
+          'IOSImage': '', 'IOSVersion': '10.1.6'},
+         {'Caption': 'sw1', 'NodeID': 3, 'IPAddress': '10.0.0.3',
+          'Vendor': 'Cisco', 'MachineType': 'Nexus 9000',
+          'IOSImage': 'nxos', 'IOSVersion': '10.2(3)'}]
+
+GROUPS = [{'group_name': 'Switches', 'group_id': 10, 'member': 'sw1'},
+          {'group_name': 'Switches', 'group_id': 10, 'member': 'sw2'},
+          {'group_name': 'Firewalls', 'group_id': 20, 'member': 'fw1'}]
+
+
+class FakeSwisClient:
+    """A fake SWIS client that records each query. It returns the nodes for
+    Orion.Nodes queries, the members of the groups for Orion.ContainerMembers
+    queries, and the group ID for Orion.Container queries.
+    """
+    def __init__(self):
+        self.queries = list()
+
+    def query(self, query, **params):
+        self.queries.append((query, params))
+        if 'Orion.Nodes' in query:
+            return {'results': NODES}
+        if 'Orion.ContainerMembers' in query:
+            rows = [row for row in GROUPS
+                    if row['group_name'] ==
+                    params.get('group_name', row['group_name'])]
+            return {'results': rows}
+        ids = [{'ContainerID': row['group_id']} for row in GROUPS
+               if f"Name='{row['group_name']}'" in query]
+        return {'results': ids}
+
+
+def run_with_client(swis, function, *args, **kwargs):
+    """Runs a collector with the SWIS client replaced by 'swis'.
+    """
+    get_swis_client = sw.get_swis_client
+    sw.get_swis_client = lambda server, username, password: swis
+    sw.node_cache.clear()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        sw.get_swis_client = get_swis_client
+        sw.node_cache.clear()
+
+
+def test_group_members_single_query():
+    """Test that the members of every group are retrieved with one query.
+    """
+    swis = FakeSwisClient()
+    df = run_with_client(swis, sw.get_npm_group_members,
+                         'server', 'username', 'password')
+
+    assert df.columns.to_list() == ['group_name', 'group_id', 'member']
+    assert df.values.tolist() == [['Switches', 10, 'sw1'],
+                                  ['Switches', 10, 'sw2'],
+                                  ['Firewalls', 20, 'fw1']]
+    assert len(swis.queries) == 1
+    assert swis.queries[0][1] == dict()
+
+
+def test_group_members_one_group():
+    """Test that the group name is passed as a query parameter, and that an
+    IndexError is raised if the group does not exist.
+    """
+    swis = FakeSwisClient()
+    df = run_with_client(swis, sw.get_npm_group_members,
+                         'server', 'username', 'password', 'Firewalls')
+
+    assert df.values.tolist() == [['Firewalls', 20, 'fw1']]
+    assert swis.queries == [(swis.queries[0][0],
+                             {'group_name': 'Firewalls'})]
+    assert '@group_name' in swis.queries[0][0]
+
+    try:
+        run_with_client(swis, sw.get_npm_group_members,
+                        'server', 'username', 'password', 'Routers')
+    except IndexError:
+        pass
+    else:
+        assert False, 'IndexError was not raised'
+
+
+def test_node_collectors_share_query():
+    """Test that the node collectors share one Orion.Nodes query, keep the
+    columns they returned before, and keep the last node for each caption.
+    """
+    swis = FakeSwisClient()
+
+    def run():
+        df_ids = sw.get_npm_node_ids('server', 'username', 'password')
+        df_ips = sw.get_npm_node_ips('server', 'username', 'password')
+        df_vendors = sw.get_npm_node_vendors('server', 'username',
+                                             'password')
+        return df_ids, df_ips, df_vendors
+
+    df_ids, df_ips, df_vendors = run_with_client(swis, run)
+
+    assert len(swis.queries) == 1
+    assert df_ids.values.tolist() == [['fw1', 2], ['sw1', 3]]
+    assert df_ids.columns.to_list() == ['device_name', 'node_id']
+    assert df_ips.values.tolist() == [['fw1', 2, '10.0.0.2'],
+                                      ['sw1', 3, '10.0.0.3']]
+    assert df_ips.columns.to_list() == ['device_name',
+                                        'node_id',
+                                        'device_ip']
+    assert df_vendors.columns.to_list() == ['Caption', 'NodeID', 'Vendor']
+
+
+def test_node_attributes_cache():
+    """Test that the cached node attributes are not changed by the caller,
+    and that a 'max_age' of 0 queries the server again.
+    """
+    swis = FakeSwisClient()
+
+    def run():
+        df = sw.get_npm_node_attributes('server', 'username', 'password')
+        df.drop(columns=['Vendor'], inplace=True)
+        df = sw.get_npm_node_attributes('server', 'username', 'password')
+        assert 'Vendor' in df
+        sw.get_npm_node_attributes('server', 'username', 'password',
+                                   max_age=0)
+
+    run_with_client(swis, run)
+    assert len(swis.queries) == 2
+
+
+def main():
+    # Execute tests
+    test_group_members_single_query()
+    test_group_members_one_group()
+    test_node_collectors_share_query()
+    test_node_attributes_cache()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import yaml
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from helpers import ssh_helpers as sshh  # noqa
+
+
+# An inventory where the devices are connected to by 'ansible_host'
+INVENTORY = {'nxos': {'hosts': {'sw1': {'ansible_host': '10.0.0.1'},
+                                'sw2': {'ansible_host': '10.0.0.2',
+                                        'ansible_port': 2222}},
+                      'vars': {'ansible_network_os': 'cisco.nxos.nxos'}}}
+OUTPUTS = {'show vrf': 'VRF-Name    VRF-ID State\ndefault     1      Up',
+           'show version | json': '{"host_name": "sw1"}'}
+
+
+class FakeStdout:
+    """The output of a fake interactive session. Each read returns the next
+    chunk, and an empty string when there are no more chunks.
+    """
+    def __init__(self):
+        self.chunks = list()
+
+    async def read(self, size):
+        return self.chunks.pop(0) if self.chunks else str()
+
+
+class FakeSession:
+    """A fake interactive session on a network device. It echoes each
+    command, and then sends its output and the prompt in separate chunks.
+    """
+    def __init__(self, hostname):
+        self.prompt = f'{hostname}#'
+        self.commands = list()
+        self.closed = False
+        self.stdin = self
+        self.stdout = FakeStdout()
+        self.stdout.chunks.append(f'\r\nUser Access Verification\r\n'
+                                  f'\r\n{self.prompt} ')
+
+    def write(self, data):
+        command = data.strip()
+        self.commands.append(command)
+        output = OUTPUTS.get(command, str()).replace('\n', '\r\n')
+        self.stdout.chunks.append(f'{command}\r\n{output}')
+        self.stdout.chunks.append(f'\r\n{self.prompt} ')
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    """A fake connection to a network device.
+    """
+    def __init__(self, hostname):
+        self.hostname = hostname
+        self.sessions = list()
+
+    async def create_process(self, **kwargs):
+        session = FakeSession(self.hostname)
+        self.sessions.append(session)
+        return session
+
+
+def run_events(private_data_dir, commands, unreachable=list(),
+               event_type='runner_on_ok'):
+    """Runs 'ssh_run_events' with fake connections to the devices.
+    """
+    fake_connections = dict()
+
+    async def get_connection(address, port, username, password, timeout):
+        if address in unreachable:
+            raise OSError(f'Connect call failed {address}')
+        hostname = {'10.0.0.1': 'sw1', '10.0.0.2': 'sw2'}[address]
+        return fake_connections.setdefault(address, FakeConnection(hostname))
+
+    extravars = {'username': 'username',
+                 'password': 'password',
+                 'host_group': 'nxos',
+                 'commands': commands}
+    original = sshh.get_connection
+    sshh.get_connection = get_connection
+    try:
+        events = list(sshh.ssh_run_events(private_data_dir,
+                                          extravars,
+                                          event_type))
+    finally:
+        sshh.get_connection = original
+
+    return events, fake_connections
+
+
+def create_private_data_dir(tmp):
+    """Creates a private data directory containing INVENTORY.
+    """
+    os.makedirs(f'{tmp}/inventory')
+    with open(f'{tmp}/inventory/hosts', 'w') as f:
+        yaml.dump(INVENTORY, f)
+    return tmp
+
+
+def test_get_inventory_hosts():
+    """Test that the addresses and ports are read from the inventory.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        hosts = sshh.get_inventory_hosts('nxos', create_private_data_dir(tmp))
+
+    assert sorted(hosts) == [('sw1', '10.0.0.1', 22),
+                             ('sw2', '10.0.0.2', 2222)]
+
+
+def test_event_payload():
+    """Test that the events have the same structure as the Ansible events,
+    including the device address in 'remote_addr'.
+    """
+    commands = ['show vrf', 'show version | json']
+    with tempfile.TemporaryDirectory() as tmp:
+        events, connections = run_events(create_private_data_dir(tmp),
+                                         commands)
+
+    events = sorted(events, key=lambda _: _['event_data']['host'])
+    assert [_['event'] for _ in events] == ['runner_on_ok'] * 2
+    assert [(_['event_data']['host'], _['event_data']['remote_addr'])
+            for _ in events] == [('sw1', '10.0.0.1'), ('sw2', '10.0.0.2')]
+
+    res = events[0]['event_data']['res']
+    assert res['changed'] is False
+    assert res['stdout'] == [OUTPUTS['show vrf'], {'host_name': 'sw1'}]
+    assert res['stdout_lines'] == [OUTPUTS['show vrf'].split('\n'),
+                                   {'host_name': 'sw1'}]
+
+
+def test_commands_share_one_session():
+    """Test that every command for a device is sent through one interactive
+    session, after the commands that disable paging.
+    """
+    commands = ['show vrf', 'show version | json']
+    with tempfile.TemporaryDirectory() as tmp:
+        events, connections = run_events(create_private_data_dir(tmp),
+                                         commands)
+
+    for conn in connections.values():
+        assert len(conn.sessions) == 1
+        assert conn.sessions[0].commands == sshh.session_commands + commands
+        assert conn.sessions[0].closed
+
+
+def test_unreachable_event():
+    """Test that an unreachable device creates a 'runner_on_unreachable'
+    event, and that it is not yielded with the 'runner_on_ok' events.
+    """
+    if sshh.asyncssh is None:
+        # The engine is only used when asyncssh is installed
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        private_data_dir = create_private_data_dir(tmp)
+        events, _ = run_events(private_data_dir, 'show vrf', ['10.0.0.2'])
+        unreachable, _ = run_events(private_data_dir, 'show vrf',
+                                    ['10.0.0.2'], 'runner_on_unreachable')
+
+    assert [_['event_data']['remote_addr'] for _ in events] == ['10.0.0.1']
+    assert len(unreachable) == 1
+    event_data = unreachable[0]['event_data']
+    assert event_data['host'] == 'sw2'
+    assert event_data['remote_addr'] == '10.0.0.2'
+    assert event_data['res']['unreachable'] is True
+
+
+def test_reconnects_closed_connection():
+    """Test that the pooled connection is replaced if the device closed it
+    after the previous session (E.g., IOS).
+    """
+    if sshh.asyncssh is None:
+        # The engine is only used when asyncssh is installed
+        return
+
+    class ClosedConnection(FakeConnection):
+        async def create_process(self, **kwargs):
+            raise sshh.asyncssh.ChannelOpenError(2, 'Connection closed')
+
+    connections = [ClosedConnection('sw1'), FakeConnection('sw1')]
+    dropped = list()
+
+    async def get_connection(address, port, username, password, timeout):
+        return connections[len(dropped)]
+
+    original = (sshh.get_connection, sshh.drop_connection)
+    sshh.get_connection = get_connection
+    sshh.drop_connection = lambda *args: dropped.append(args)
+    try:
+        event = sshh.asyncio.run(
+            sshh.run_host_commands('sw1',
+                                   '10.0.0.1',
+                                   22,
+                                   'username',
+                                   'password',
+                                   ['show vrf'],
+                                   5,
+                                   sshh.asyncio.Semaphore(1)))
+    finally:
+        sshh.get_connection, sshh.drop_connection = original
+
+    assert len(dropped) == 1
+    assert event['event'] == 'runner_on_ok'
+    assert event['event_data']['res']['stdout'] == [OUTPUTS['show vrf']]
+
+
+def test_limit():
+    """Test that the commands are only run on the hosts in the limit.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        extravars = {'username': 'username',
+                     'password': 'password',
+                     'host_group': 'nxos',
+                     'commands': 'show vrf'}
+        original = sshh.get_connection
+
+        async def get_connection(address, port, username, password, timeout):
+            return FakeConnection('sw2')
+
+        sshh.get_connection = get_connection
+        try:
+            events = list(sshh.ssh_run_events(create_private_data_dir(tmp),
+                                              extravars,
+                                              limit=['sw2']))
+        finally:
+            sshh.get_connection = original
+
+    assert [_['event_data']['host'] for _ in events] == ['sw2']
+
+
+def main():
+    # Execute tests
+    test_get_inventory_hosts()
+    test_event_payload()
+    test_commands_share_one_session()
+    test_unreachable_event()
+    test_reconnects_closed_connection()
+    test_limit()
+
+
+if __name__ == '__main__':
+    main()
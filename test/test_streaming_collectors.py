@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+from helpers import helpers as hp  # noqa
+
+
+TIMESTAMP = '2023-01-01_0000'
+
+# The output of 'show ip arp' on two devices. The first line is the header.
+OUTPUTS = {'10.0.0.1': ['Address         Age       MAC Address     Interface',
+                        '10.1.1.1        00:01:02  0000.1111.aaaa  Vlan10',
+                        '10.1.1.2        00:03:04  0000.1111.bbbb  Vlan10'],
+           '10.0.0.2': ['Address         Age       MAC Address     Interface',
+                        '10.2.2.1        00:05:06  0000.2222.aaaa  Vlan20']}
+
+
+def count_rows(db_path):
+    """Counts the rows of each device in the ARP table.
+    """
+    if not os.path.exists(db_path):
+        return dict()
+    con = hp.connect_to_db(db_path)
+    cur = con.cursor()
+    cur.execute('''select name from sqlite_master
+                   where type = 'table' and name = 'NXOS_ARP_TABLE' ''')
+    if not cur.fetchall():
+        con.close()
+        return dict()
+    cur.execute('''select device, count(*) from NXOS_ARP_TABLE
+                   group by device''')
+    rows = dict(cur.fetchall())
+    con.close()
+    return rows
+
+
+def create_run_events(db_path, seen):
+    """Creates a replacement for 'hp.ansible_run_events' that yields an event
+    for each device. Before each event, it records the rows that are already
+    in the database.
+    """
+    def ansible_run_events(private_data_dir, playbook, extravars, **kwargs):
+        for address, output in OUTPUTS.items():
+            seen.append(count_rows(db_path))
+            yield {'event': 'runner_on_ok',
+                   'event_data': {'host': address,
+                                  'remote_addr': address,
+                                  'res': {'stdout': ['\n'.join(output)]}}}
+        seen.append(count_rows(db_path))
+    return ansible_run_events
+
+
+def find_mac_vendors(macs, nm_path):
+    """Replaces 'hp.find_mac_vendors', so the OUI registry is not needed.
+    """
+    return pd.DataFrame({'mac': list(macs), 'vendor': 'Cisco'})
+
+
+def run_collect(db_path, seen, stream, method='append'):
+    """Runs the NXOS ARP table collector with the fake event stream.
+    """
+    original = (hp.ansible_run_events, hp.find_mac_vendors)
+    hp.ansible_run_events = create_run_events(db_path, seen)
+    hp.find_mac_vendors = find_mac_vendors
+    try:
+        return rc.collect('arp_table',
+                          nm_path,
+                          'private_data_dir',
+                          TIMESTAMP,
+                          ansible_os='cisco.nxos.nxos',
+                          hostgroup='nxos',
+                          play_path='playbooks',
+                          db_path=db_path,
+                          method=method,
+                          stream=stream)
+    finally:
+        hp.ansible_run_events, hp.find_mac_vendors = original
+
+
+def test_stream_writes_each_device():
+    """Test that each device's output is written to the database before the
+    next device's event is read, and that the returned DataFrame is empty.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        seen = list()
+        result = run_collect(db_path, seen, stream=True)
+
+        assert len(result) == 0
+        assert seen == [dict(),
+                        {'10.0.0.1': 2},
+                        {'10.0.0.1': 2, '10.0.0.2': 1}]
+
+
+def test_no_stream_writes_once():
+    """Test that the output is only written after the last device when it is
+    not streamed.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        seen = list()
+        result = run_collect(db_path, seen, stream=False)
+
+        assert len(result) == 3
+        assert seen == [dict(), dict(), dict()]
+        assert count_rows(db_path) == {'10.0.0.1': 2, '10.0.0.2': 1}
+
+
+def test_stream_matches_no_stream():
+    """Test that the streamed rows are the same as the rows that are written
+    after the last device.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        run_collect(f'{tmp}/stream.db', list(), stream=True)
+        run_collect(f'{tmp}/batch.db', list(), stream=False)
+
+        frames = list()
+        for db_path in [f'{tmp}/stream.db', f'{tmp}/batch.db']:
+            con = hp.connect_to_db(db_path)
+            df = pd.read_sql('''select device, ip_address, age, mac_address,
+                                interface, vendor from NXOS_ARP_TABLE''', con)
+            con.close()
+            frames.append(df.sort_values('ip_address', ignore_index=True))
+
+        pd.testing.assert_frame_equal(frames[0], frames[1])
+
+
+def test_replace_is_not_streamed():
+    """Test that the output is not streamed when the table is replaced.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        seen = list()
+        result = run_collect(db_path, seen, stream=True, method='replace')
+
+        assert len(result) == 3
+        assert seen == [dict(), dict(), dict()]
+        assert count_rows(db_path) == {'10.0.0.1': 2, '10.0.0.2': 1}
+
+
+def main():
+    # Execute tests
+    test_stream_writes_each_device()
+    test_no_stream_writes_once()
+    test_stream_matches_no_stream()
+    test_replace_is_not_streamed()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+from helpers import helpers as hp  # noqa
+
+
+def test_coerce_integer():
+    """Test that integer columns are converted, and that missing values are
+    converted to NULL.
+    """
+    result = pd.DataFrame({'device': ['a', 'b', 'c', 'd', 'e'],
+                           'vlan': ['10', ' 20 ', '', 'None', 'nan']})
+    df = hp.coerce_table_types('nxos_cam_table', result)
+
+    assert str(df['vlan'].dtype) == 'Int64'
+    assert df['vlan'].tolist()[:2] == [10, 20]
+    assert df['vlan'].isna().tolist() == [False, False, True, True, True]
+    assert df['device'].tolist() == result['device'].tolist()
+
+    # The caller's DataFrame is not modified
+    assert result['vlan'].tolist() == ['10', ' 20 ', '', 'None', 'nan']
+
+
+def test_coerce_keeps_invalid_values():
+    """Test that values that cannot be converted are kept as they are.
+    """
+    result = pd.DataFrame({'vlan': ['10', 'All', '1.5', None]})
+    df = hp.coerce_table_types('NXOS_CAM_TABLE', result)
+
+    assert df['vlan'].dtype == object
+    assert df['vlan'].tolist() == [10, 'All', '1.5', None]
+    assert isinstance(df['vlan'][0], int)
+
+
+def test_coerce_boolean_and_real():
+    """Test that boolean and real columns are converted.
+    """
+    result = pd.DataFrame({'enabled': ['True', 'false', '1', ''],
+                           'isUplink': [True, False, None, True],
+                           'clientCount': ['3', '0', '', '12'],
+                           'powerUsageInWh': ['1.5', '2', 'None', '0.25']})
+    df = hp.coerce_table_types('MERAKI_SWITCH_PORT_STATUSES', result)
+
+    assert str(df['enabled'].dtype) == 'Int64'
+    assert df['enabled'].tolist()[:3] == [1, 0, 1]
+    assert df['enabled'].isna().tolist() == [False, False, False, True]
+    assert df['isUplink'].isna().tolist() == [False, False, True, False]
+    assert str(df['clientCount'].dtype) == 'Int64'
+    assert str(df['powerUsageInWh'].dtype) == 'Float64'
+    assert df['powerUsageInWh'].tolist()[:2] == [1.5, 2.0]
+    assert df['powerUsageInWh'].isna().tolist() == [False, False, True,
+                                                    False]
+
+
+def test_coerce_without_schema():
+    """Test that the output is returned as it is if the table has no column
+    types, or if it is empty.
+    """
+    result = pd.DataFrame({'device': ['a'], 'vlan': ['10']})
+    assert hp.coerce_table_types('NXOS_VLANS_UNDEFINED', result) is result
+
+    result = pd.DataFrame({'device': ['a'], 'interface': ['Ethernet1/1']})
+    assert hp.coerce_table_types('NXOS_CAM_TABLE', result) is result
+
+    result = pd.DataFrame(columns=['device', 'vlan'])
+    assert hp.coerce_table_types('NXOS_CAM_TABLE', result) is result
+
+
+def test_delta_keys_have_schemas():
+    """Test that every table that can be stored in 'delta' mode has its keys
+    in its schema.
+    """
+    schemas = hp.define_table_schemas()
+    for table, definition in hp.define_delta_keys().items():
+        assert definition['keys'] == schemas[table]['keys']
+        assert definition['scope'] == schemas[table].get('scope', 'device')
+
+
+def main():
+    # Execute tests
+    test_coerce_integer()
+    test_coerce_keeps_invalid_values()
+    test_coerce_boolean_and_real()
+    test_coerce_without_schema()
+    test_delta_keys_have_schemas()
+
+
+if __name__ == '__main__':
+    main()
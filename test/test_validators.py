@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import pandas as pd
+
+# Change to the Net-Manage repository so imports will work
+nm_path = os.environ.get('NM_PATH')
+os.chdir(f'{nm_path}/test')
+sys.path.append('..')
+import run_collectors as rc  # noqa
+import validators as vl  # noqa
+
+
+TABLE = 'BIGIP_POOL_AVAILABILITY'
+COLS = ['device', 'partition', 'pool', 'availability', 'state']
+
+# 'pool-a' on 'lb-1' goes offline and then comes back in another partition,
+# 'pool-b' does not change, 'pool-c' is added after the first snapshot and
+# 'lb-2' is only collected once.
+SNAPSHOTS = [('2023-01-01_0000',
+              [['lb-1', 'Common', 'pool-a', 'available', 'enabled'],
+               ['lb-1', 'Common', 'pool-b', 'available', 'enabled'],
+               ['lb-1', 'Tenant', 'pool-a', 'offline', 'enabled'],
+               ['lb-2', 'Common', 'pool-a', 'available', 'enabled']]),
+             ('2023-01-02_0000',
+              [['lb-1', 'Common', 'pool-a', 'offline', 'enabled'],
+               ['lb-1', 'Common', 'pool-b', 'available', 'enabled'],
+               ['lb-1', 'Tenant', 'pool-a', 'offline', 'enabled']]),
+             ('2023-01-03_0000',
+              [['lb-1', 'Common', 'pool-a', 'offline', 'disabled'],
+               ['lb-1', 'Common', 'pool-b', 'available', 'enabled'],
+               ['lb-1', 'Common', 'pool-c', 'offline', 'enabled'],
+               ['lb-1', 'Tenant', 'pool-a', 'available', 'enabled']])]
+
+
+def write_snapshots(db_path, snapshots=SNAPSHOTS):
+    """Writes the snapshots to a database.
+    """
+    for timestamp, rows in snapshots:
+        result = pd.DataFrame(rows, columns=COLS)
+        rc.add_to_db('pool_availability', TABLE, result, timestamp, db_path)
+
+
+def test_pool_availability():
+    """Test that every row whose availability changed between the first and
+    last snapshots of its device is returned.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path)
+        df_diff = vl.f5_pool_availability(db_path, TABLE)
+
+    # The 'reason' column is not in the table, so it is not returned
+    assert df_diff.columns.to_list() == ['device',
+                                         'partition',
+                                         'pool',
+                                         'state',
+                                         'original_availability',
+                                         'new_availability']
+    df_diff = df_diff.sort_values('partition', ignore_index=True)
+    assert df_diff.values.tolist() == \
+        [['lb-1', 'Common', 'pool-a', 'enabled', 'available', 'offline'],
+         ['lb-1', 'Tenant', 'pool-a', 'enabled', 'offline', 'available']]
+
+
+def test_no_changes():
+    """Test that an empty DataFrame is returned if nothing changed, or if
+    every device was only collected once.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path, SNAPSHOTS[:1])
+        assert len(vl.f5_pool_availability(db_path, TABLE)) == 0
+
+        write_snapshots(db_path, [('2023-01-02_0000', SNAPSHOTS[0][1])])
+        assert len(vl.f5_pool_availability(db_path, TABLE)) == 0
+
+
+def test_missing_values():
+    """Test that a value that becomes missing is a change, but a value that
+    is missing in both snapshots is not.
+    """
+    snapshots = [('2023-01-01_0000',
+                  [['lb-1', 'Common', 'pool-a', 'available', 'enabled'],
+                   ['lb-1', 'Common', 'pool-b', None, 'enabled']]),
+                 ('2023-01-02_0000',
+                  [['lb-1', 'Common', 'pool-a', None, 'enabled'],
+                   ['lb-1', 'Common', 'pool-b', None, 'enabled']])]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f'{tmp}/test.db'
+        write_snapshots(db_path, snapshots)
+        df_diff = vl.f5_pool_availability(db_path, TABLE)
+
+    assert df_diff['pool'].to_list() == ['pool-a']
+    assert df_diff['original_availability'].to_list() == ['available']
+    assert df_diff['new_availability'].isna().all()
+
+
+def main():
+    # Execute tests
+    test_pool_availability()
+    test_no_changes()
+    test_missing_values()
+
+
+if __name__ == '__main__':
+    main()
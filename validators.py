@@ -29,13 +29,17 @@ def f5_node_availability(db_path, table):
             'monitor-rule',
             'monitor-status']
 
+    # Define the columns that identify a row
+    key_cols = ['device', 'partition', 'node']
+
     validation_col = 'monitor-status'
     df_diff = validator_single_col(cols,
                                    db_path,
                                    'up',
                                    'device',
                                    table,
-                                   validation_col)
+                                   validation_col,
+                                   key_cols=key_cols)
 
     return df_diff
 
@@ -59,13 +63,17 @@ def f5_pool_availability(db_path, table):
             'state',
             'reason']
 
+    # Define the columns that identify a row
+    key_cols = ['device', 'partition', 'pool']
+
     validation_col = 'availability'
     df_diff = validator_single_col(cols,
                                    db_path,
                                    'available',
                                    'device',
                                    table,
-                                   validation_col)
+                                   validation_col,
+                                   key_cols=key_cols)
 
     return df_diff
 
@@ -88,13 +96,20 @@ def f5_pool_member_availability(db_path, table):
             'pool_member',
             'pool_member_state']
 
+    # Define the columns that identify a row
+    key_cols = ['device',
+                'partition',
+                'pool_name',
+                'pool_member']
+
     validation_col = 'pool_member_state'
     df_diff = validator_single_col(cols,
                                    db_path,
                                    'available',
                                    'device',
                                    table,
-                                   validation_col)
+                                   validation_col,
+                                   key_cols=key_cols)
 
     return df_diff
 
@@ -119,13 +134,17 @@ def f5_vip_availability(db_path, table):
             'availability',
             'reason']
 
+    # Define the columns that identify a row
+    key_cols = ['device', 'partition', 'vip']
+
     validation_col = 'availability'
     df_diff = validator_single_col(cols,
                                    db_path,
                                    'available',
                                    'device',
                                    table,
-                                   validation_col)
+                                   validation_col,
+                                   key_cols=key_cols)
 
     return df_diff
 
@@ -151,13 +170,17 @@ def meraki_device_statuses_availability(db_path, table):
             'mac',
             'status']
 
+    # Define the columns that identify a row
+    key_cols = ['mac']
+
     validation_col = 'status'
     df_diff = validator_single_col(cols,
                                    db_path,
                                    'online',
                                    'mac',
                                    table,
-                                   validation_col)
+                                   validation_col,
+                                   key_cols=key_cols)
 
     return df_diff
 
@@ -167,7 +190,8 @@ def validator_single_col(columns,
                          expected,
                          identifier_col,
                          table,
-                         validation_col):
+                         validation_col,
+                         key_cols=list()):
     '''
     A generic validator for collectors that can be validated with the state of
     a single column--e.g., 'status', 'availability', etc.
@@ -184,103 +208,66 @@ def validator_single_col(columns,
                                 mac, etc)
         table (str):            The name of the table
         validation_col (str):   The column name to use for validation
+        key_cols (list):        The columns that identify a row within an
+                                entity (e.g., device, partition and pool).
+                                Rows from the first and last timestamps are
+                                matched on these columns. Defaults to every
+                                column in 'columns' except 'validation_col'.
 
     Returns:
         df_diff (obj):  A DataFrame containing any differences
     '''
-    # Wrap 'columns' in quotes
-    columns = [f'"{_}"' for _ in columns]
-    return_cols = ',\n'.join(columns)
+    if not key_cols:
+        key_cols = [c for c in columns if c != validation_col]
 
-    # Get the first and last timestamp for each unique device in the table
-    df_stamps = hp.get_first_last_timestamp(db_path, table, identifier_col)
-
-    # Create an empty dataframe to store the devices that have changed status
-    df_diff = pd.DataFrame(data=list(), columns=columns)
-
-    # Create the database connection
     con = sl.connect(db_path)
 
-    # For each device, compare the most recent status to the original status.
-    # This method deserves some explanation.
-    #
-    # I experimented with many ways to compare the original status to the most
-    # recent status. Out of all of them, this method was the fastest, even
-    # though it requires running two queries for each device.
-    #
-    # The reason two queries are necessary is because a comparison done with
-    # 'except' only returns the left side of the query (e.g., the first
-    # timestamp). In other words, the comparison actually happens, but the
-    # output only shows what the original status was.
-    #
-    # That is why two queries are needed. The first query compares the first
-    # timestamp to the last timestamp, and the second query compares the last
-    # timestamp to the first timestamp. That way we can see exactly what
-    # changed--e.g., 'online' to 'alerting', 'dormant' to 'online', etc.
-    for idx, row in df_stamps.iterrows():
-        unique = row[identifier_col]
-        first_ts = row['first_ts']
-        last_ts = row['last_ts']
-
-        # This query compares the status of the device in the first timestamp
-        # to the status in the second timestamp, and stores the results in a
-        # dataframe.
-        query = f'''select {return_cols} from {table}
-                    where ("{validation_col}" = "{expected}"
-                        or "{validation_col}" != "{expected}")
-                      and timestamp = "{first_ts}"
-                      and {identifier_col} = "{unique}"
-                    except
-                    select {return_cols} from {table}
-                    where ("{validation_col}" = "{expected}"
-                        or "{validation_col}" != "{expected}")
-                      and timestamp = "{last_ts}"
-                      and {identifier_col} = "{unique}"
-                '''
-        df_left = pd.read_sql(query, con)
-
-        # If any results were returned, then we know that data in one of the
-        # 'return_cols' has changed.
-        if len(df_left) > 0:
-            # This query compares the status of the device in the last
-            # timestamp to the status in the first timestamp, then stores the
-            # result in a dataframe.
-            query = f'''select {return_cols} from {table}
-                        where ("{validation_col}" = "{expected}"
-                            or "{validation_col}" != "{expected}")
-                        and timestamp = "{last_ts}"
-                        and {identifier_col} = "{unique}"
-                        except
-                        select {return_cols} from {table}
-                        where ("{validation_col}" = "{expected}"
-                            or "{validation_col}" != "{expected}")
-                        and timestamp = "{first_ts}"
-                        and {identifier_col} = "{unique}"
-                    '''
-            df_right = pd.read_sql(query, con)
-
-            # 'except' will return results if the data in any of the columns
-            # changed, so it is necessary to compare the two statuses.
-            original = df_left[validation_col].to_list()
-            new = df_right[validation_col].to_list()
-
-            # If the expected value changed, then add the new value to
-            # 'df_left' as a new column, then add'df_left' to 'df_diff' as a
-            # new row.
-            if original != new:
-                df_left[f'new_{validation_col}'] = new
-                df_diff = pd.concat([df_diff, df_left])
+    # Only query the columns that exist in the table
+    schema = pd.read_sql(f'pragma table_info("{table}")', con)
+    columns = [c for c in columns if c in schema['name'].to_list()]
+    key_cols = [c for c in key_cols if c in columns]
+    read_cols = list(dict.fromkeys(columns + [identifier_col]))
+
+    # Get the first and last timestamp of each entity. Entities that were
+    # only seen once cannot have changed.
+    df_stamps = hp.get_first_last_timestamp(db_path, table, identifier_col)
+    df_stamps = df_stamps[df_stamps['first_ts'] != df_stamps['last_ts']]
+
+    # Read the rows of every entity from the snapshots of its first and last
+    # timestamps. The snapshots are read with hp.read_snapshot, so that
+    # tables in 'delta' mode include the rows that did not change.
+    states = dict()
+    for col in ['first_ts', 'last_ts']:
+        frames = list()
+        for ts, group in df_stamps.groupby(col):
+            df_snapshot = hp.read_snapshot(con, table, ts, read_cols)
+            entities = group[identifier_col]
+            frames.append(df_snapshot[
+                df_snapshot[identifier_col].isin(entities)])
+        if frames:
+            states[col] = pd.concat(frames, ignore_index=True)
+        else:
+            states[col] = pd.DataFrame(columns=read_cols)
+    con.close()
+
+    # Match the original and most recent states on the key columns. Every
+    # row whose validation column changed is a status transition.
+    df_first = states['first_ts'][columns]
+    df_last = states['last_ts'][key_cols + [validation_col]]
+    df_last = df_last.rename(columns={validation_col: f'new_{validation_col}'})
+
+    df_diff = df_first.merge(df_last, on=key_cols, how='inner')
+    changed = df_diff[validation_col].fillna('') != \
+        df_diff[f'new_{validation_col}'].fillna('')
+    df_diff = df_diff[changed].reset_index(drop=True)
 
     # Rename the validation column to 'original_{validation_col}'
     df_diff.rename(columns={validation_col: f'original_{validation_col}'},
                    inplace=True)
 
-    # Drop NaNs (empty columns were created by wrapping 'columns' in quotes)
-    df_diff = df_diff.dropna(axis=1, how='all')
-
     # Move the original and new validation columns to the last two columns
     if len(df_diff) >= 1:  # To keep empty dataframe from causing an exception
         cols = [f'original_{validation_col}', f'new_{validation_col}']
-        hp.move_cols_to_end(df_diff, cols)
+        df_diff = hp.move_cols_to_end(df_diff, cols)
 
     return df_diff